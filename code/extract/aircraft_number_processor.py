@@ -6,7 +6,7 @@
 - Извлекает номера вертолетов из значений RA-XXXXX (5 цифр)
 - Создает поле aircraft_number (UInt32)
 - Очищает location от не-вертолетных значений
-- Поддерживает работу с DataFrame (in-memory) и ClickHouse (SQL)
+- Поддерживает работу с DataFrame (in-memory, по умолчанию в ETL) и ClickHouse (SQL: Join-таблица + joinGet)
 - Валидация и статистика обработки
 
 Использование:
@@ -31,36 +31,50 @@ def setup_logging() -> logging.Logger:
     )
     return logging.getLogger(__name__)
 
-def extract_aircraft_numbers_from_dataframe(df: pd.DataFrame) -> Tuple[Dict[str, int], int]:
+def build_aircraft_mapping(locations) -> Tuple[Dict[str, int], List[str]]:
     """
-    Извлекает номера вертолетов из DataFrame
+    Разбирает RA- значения location в номера вертолетов
     
     Args:
-        df: DataFrame с полем location
+        locations: уникальные значения location, начинающиеся с 'RA-'
         
     Returns:
-        Tuple[Dict[str, int], int]: (mapping location->aircraft_number, invalid_count)
+        Tuple[Dict[str, int], List[str]]: (mapping location->aircraft_number, невалидные значения)
     """
-    # Ищем все RA- значения в location
-    ra_mask = df['location'].str.startswith('RA-', na=False)
-    ra_locations = df[ra_mask]['location'].unique()
-    
     aircraft_mapping = {}
-    invalid_count = 0
+    invalid_locations = []
     
-    for location in ra_locations:
+    for location in locations:
         # Убираем префикс 'RA-'
         digits_part = location[3:]
         
         # Проверяем что это 5 цифр
         if len(digits_part) == 5 and digits_part.isdigit():
-            aircraft_number = int(digits_part)
-            aircraft_mapping[location] = aircraft_number
+            aircraft_mapping[location] = int(digits_part)
         else:
-            invalid_count += 1
-            print(f"⚠️ Неправильный формат: {location}")
+            invalid_locations.append(location)
+    
+    return aircraft_mapping, invalid_locations
+
+def extract_aircraft_numbers_from_dataframe(df: pd.DataFrame) -> Tuple[Dict[str, int], int]:
+    """
+    Извлекает номера вертолетов из DataFrame
+    
+    Args:
+        df: DataFrame с полем location
+        
+    Returns:
+        Tuple[Dict[str, int], int]: (mapping location->aircraft_number, invalid_count)
+    """
+    # Ищем все RA- значения в location
+    ra_mask = df['location'].str.startswith('RA-', na=False)
+    ra_locations = df.loc[ra_mask, 'location'].unique()
     
-    return aircraft_mapping, invalid_count
+    aircraft_mapping, invalid_locations = build_aircraft_mapping(ra_locations)
+    for location in invalid_locations:
+        print(f"⚠️ Неправильный формат: {location}")
+    
+    return aircraft_mapping, len(invalid_locations)
 
 def process_aircraft_numbers_in_memory(df: pd.DataFrame) -> Tuple[pd.DataFrame, int, int]:
     """
@@ -74,9 +88,6 @@ def process_aircraft_numbers_in_memory(df: pd.DataFrame) -> Tuple[pd.DataFrame,
     """
     print("🔍 Извлечение номеров вертолетов из RA- значений...")
     
-    # Добавляем колонку aircraft_number со значением по умолчанию
-    df['aircraft_number'] = 0
-    
     # Извлекаем номера вертолетов
     aircraft_mapping, invalid_count = extract_aircraft_numbers_from_dataframe(df)
     
@@ -84,20 +95,11 @@ def process_aircraft_numbers_in_memory(df: pd.DataFrame) -> Tuple[pd.DataFrame,
     if invalid_count > 0:
         print(f"⚠️ Найдено {invalid_count} значений неправильного формата")
     
-    # Обновляем aircraft_number для соответствующих записей
-    for location, aircraft_number in aircraft_mapping.items():
-        mask = df['location'] == location
-        df.loc[mask, 'aircraft_number'] = aircraft_number
+    # aircraft_number одним проходом по словарю (не-RA и невалидные RA- → 0)
+    df['aircraft_number'] = df['location'].map(aircraft_mapping).fillna(0).astype('int64')
     
     # Очищаем location для не-RA значений И для невалидных RA- форматов
-    # 1. Очищаем все не-RA значения
-    non_ra_mask = ~df['location'].str.startswith('RA-', na=False)
-    df.loc[non_ra_mask, 'location'] = ''
-    
-    # 2. Очищаем невалидные RA- форматы (которые не попали в aircraft_mapping)
-    valid_ra_locations = set(aircraft_mapping.keys())
-    invalid_ra_mask = (df['location'].str.startswith('RA-', na=False)) & (~df['location'].isin(valid_ra_locations))
-    df.loc[invalid_ra_mask, 'location'] = ''
+    df.loc[~df['location'].isin(list(aircraft_mapping)), 'location'] = ''
     
     aircraft_count = (df['aircraft_number'] > 0).sum()
     print(f"✅ Обогащено {aircraft_count} записей номерами вертолетов")
@@ -153,6 +155,10 @@ def process_aircraft_numbers_in_clickhouse(client, table_name: str = 'heli_panda
     """
     Обрабатывает aircraft_number в ClickHouse (SQL подход)
     
+    Маппинг location → aircraft_number строится один раз в Join-таблице
+    и применяется одной мутацией через joinGet (aircraft_number и очистка location).
+    Для DataFrame в памяти используйте process_aircraft_numbers_in_memory.
+    
     Args:
         client: ClickHouse client
         table_name: имя таблицы для обработки
@@ -162,6 +168,7 @@ def process_aircraft_numbers_in_clickhouse(client, table_name: str = 'heli_panda
     """
     logger = setup_logging()
     logger.info(f"🚀 Обработка aircraft_number в таблице {table_name}")
+    join_table = f"{table_name}__aircraft_number_join"
     
     try:
         # 1. Добавляем колонку aircraft_number если её нет
@@ -179,115 +186,61 @@ def process_aircraft_numbers_in_clickhouse(client, table_name: str = 'heli_panda
             ORDER BY location
         """)
         
-        aircraft_mapping = {}
-        invalid_count = 0
-        
-        for row in ra_result:
-            location = row[0]
-            digits_part = location[3:]  # Убираем 'RA-'
-            
-            if len(digits_part) == 5 and digits_part.isdigit():
-                aircraft_number = int(digits_part)
-                aircraft_mapping[location] = aircraft_number
-            else:
-                invalid_count += 1
-                logger.warning(f"⚠️ Неправильный формат: {location}")
+        aircraft_mapping, invalid_locations = build_aircraft_mapping(row[0] for row in ra_result)
+        for location in invalid_locations:
+            logger.warning(f"⚠️ Неправильный формат: {location}")
         
         logger.info(f"✅ Извлечено {len(aircraft_mapping)} номеров вертолетов")
-        if invalid_count > 0:
-            logger.warning(f"⚠️ Найдено {invalid_count} значений неправильного формата")
+        if invalid_locations:
+            logger.warning(f"⚠️ Найдено {len(invalid_locations)} значений неправильного формата")
         
-        # 3. Обновляем aircraft_number батчами
-        logger.info("🔢 Обновление поля aircraft_number...")
+        # 3. Маппинг → Join-таблица (значения передаются параметрами, без интерполяции в SQL)
+        client.execute(f"DROP TABLE IF EXISTS {join_table}")
+        client.execute(f"""
+            CREATE TABLE {join_table} (
+                location String,
+                aircraft_number UInt32
+            ) ENGINE = Join(ANY, LEFT, location)
+        """)
+        if aircraft_mapping:
+            client.execute(f"INSERT INTO {join_table} (location, aircraft_number) VALUES",
+                           list(aircraft_mapping.items()))
         
-        # Сначала очищаем поле
-        client.execute(f"ALTER TABLE {table_name} UPDATE aircraft_number = 0 WHERE 1=1")
+        aircraft_expr = f"joinGet('{join_table}', 'aircraft_number', ifNull(location, ''))"
         
-        # Обновляем батчами для производительности
-        batch_size = 50
-        mapping_items = list(aircraft_mapping.items())
+        # 4. Статистика одним агрегатом (до мутации, по тому же маппингу)
+        total_count, before_count, enriched_count, cleared_count = client.execute(f"""
+            SELECT
+                count(),
+                countIf(location != ''),
+                countIf({aircraft_expr} > 0),
+                countIf(location != '' AND {aircraft_expr} = 0)
+            FROM {table_name}
+        """)[0]
         
-        for i in range(0, len(mapping_items), batch_size):
-            batch = mapping_items[i:i + batch_size]
-            
-            # Строим CASE WHEN для батча
-            case_when_parts = []
-            locations_list = []
-            
-            for location, aircraft_number in batch:
-                case_when_parts.append(f"WHEN location = '{location}' THEN {aircraft_number}")
-                locations_list.append(f"'{location}'")
-            
-            case_when_sql = " ".join(case_when_parts)
-            locations_sql = ",".join(locations_list)
-            
-            update_query = f"""
+        # 5. Одна мутация: aircraft_number по маппингу, location очищается
+        #    для не-RA значений и невалидных RA- форматов (NULL остаётся NULL)
+        logger.info("🔢 Обновление aircraft_number и очистка location (одна мутация)...")
+        client.execute(f"""
             ALTER TABLE {table_name}
-            UPDATE aircraft_number = CASE {case_when_sql} ELSE 0 END
-            WHERE location IN ({locations_sql})
-            """
-            
-            client.execute(update_query)
-            logger.info(f"  📊 Обработано {min(i + batch_size, len(mapping_items))}/{len(mapping_items)} значений")
-        
-        # 4. Очищаем location для не-вертолетов
-        logger.info("🧹 Очистка location для не-вертолетов...")
-        
-        # Получаем статистику до очистки
-        before_count = client.execute(f"SELECT COUNT(*) FROM {table_name} WHERE location IS NOT NULL AND location != ''")[0][0]
-        
-        # Очищаем location для записей которые НЕ являются валидными вертолетами
-        # 1. Очищаем все не-RA значения
-        clear_non_ra_query = f"""
-        ALTER TABLE {table_name}
-        UPDATE location = ''
-        WHERE location IS NOT NULL 
-          AND location != '' 
-          AND NOT (location LIKE 'RA-%')
-        """
-        
-        client.execute(clear_non_ra_query)
+            UPDATE
+                aircraft_number = {aircraft_expr},
+                location = if(location IS NULL OR location = '' OR {aircraft_expr} > 0, location, '')
+            WHERE 1
+        """, settings={'mutations_sync': 1})
         
-        # 2. Очищаем невалидные RA- форматы (которые не имеют aircraft_number)
-        clear_invalid_ra_query = f"""
-        ALTER TABLE {table_name}
-        UPDATE location = ''
-        WHERE location IS NOT NULL 
-          AND location != '' 
-          AND location LIKE 'RA-%'
-          AND aircraft_number = 0
-        """
-        
-        clear_query = clear_invalid_ra_query  # Для статистики ниже
-        
-        client.execute(clear_query)
-        
-        # Получаем статистику после очистки
-        after_count = client.execute(f"SELECT COUNT(*) FROM {table_name} WHERE location IS NOT NULL AND location != ''")[0][0]
-        
-        cleared_count = before_count - after_count
+        after_count = before_count - cleared_count
         logger.info(f"✅ Очищено {cleared_count} записей не-вертолетов")
         logger.info(f"📊 Осталось {after_count} записей с location (только RA- значения)")
         
-        # 5. Проверяем результат
-        enriched_count = client.execute(f"SELECT COUNT(*) FROM {table_name} WHERE aircraft_number > 0")[0][0]
-        total_count = client.execute(f"SELECT COUNT(*) FROM {table_name}")[0][0]
-        
         logger.info(f"✅ Обогащено {enriched_count} записей номерами вертолетов")
-        logger.info(f"📊 Покрытие: {enriched_count/total_count*100:.1f}% записей")
+        if total_count:
+            logger.info(f"📊 Покрытие: {enriched_count/total_count*100:.1f}% записей")
         
-        # Показываем примеры
-        sample_result = client.execute(f"""
-            SELECT location, aircraft_number 
-            FROM {table_name}
-            WHERE aircraft_number > 0 
-            ORDER BY aircraft_number 
-            LIMIT 5
-        """)
-        
-        logger.info("📋 Примеры обработанных записей:")
-        for row in sample_result:
-            logger.info(f"   location: '{row[0]}' → aircraft_number: {row[1]}")
+        # Показываем примеры (из маппинга, без доп. сканов таблицы)
+        logger.info("📋 Примеры маппинга:")
+        for location, aircraft_number in sorted(aircraft_mapping.items(), key=lambda item: item[1])[:5]:
+            logger.info(f"   location: '{location}' → aircraft_number: {aircraft_number}")
         
         logger.info("🎯 Обработка aircraft_number завершена успешно!")
         return True
@@ -295,6 +248,11 @@ def process_aircraft_numbers_in_clickhouse(client, table_name: str = 'heli_panda
     except Exception as e:
         logger.error(f"❌ Ошибка обработки aircraft_number: {e}")
         return False
+    finally:
+        try:
+            client.execute(f"DROP TABLE IF EXISTS {join_table}")
+        except Exception:
+            pass
 
 def main():
     """Основная функция для standalone использования"""
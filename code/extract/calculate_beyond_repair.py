@@ -2,27 +2,172 @@
 """
 Расчет полей Beyond Repair по типам в таблице md_components: br_mi8, br_mi17
 Поле br (единое) более не используется и не заполняется.
+
+Расчёт выполняется одним векторным проходом NumPy по md_components
+(формула BR + переопределения «невыгодный ремонт» и «ll = oh») и записывается
+обратно одной атомарной заменой партиций через staging (staging_loader).
+Прежняя цепочка из пяти ALTER UPDATE сохранена как эталон для --parity-check.
 """
 
 import sys
+import argparse
 import logging
 from pathlib import Path
-from typing import Dict, List, Tuple, Any
+from typing import Dict, List, Tuple, Any, Optional
+
+import numpy as np
+import pandas as pd
 
 # Добавляем пути к utils и общему коду
 code_root = Path(__file__).resolve().parents[1]
 sys.path.append(str(code_root / 'utils'))
 sys.path.append(str(code_root))
 from config_loader import get_clickhouse_client
+from staging_loader import load_version_slice
+from dataframe_writer import insert_dataframe
+
+BR_TYPES = ('mi8', 'mi17')
+
+# Эталонный расчёт (5 мутаций подряд) — используется только в --parity-check
+LEGACY_BR_MUTATIONS = [
+    # Ми-8 / Ми-17 → минуты (ll/oh уже в минутах; считаем BR в минутах без доп. умножения)
+    *[
+        f"""
+        ALTER TABLE {{table}} UPDATE
+          br_{t} = if(
+            ll_{t} > 0 AND oh_{t} > 0 AND purchase_price > 0 AND repair_price > 0,
+            toUInt32(
+              round(
+                greatest(
+                  0.0,
+                  least(
+                    ( toFloat64(ll_{t}) - (
+                      toFloat64(repair_price) / greatest(
+                        ((toFloat64(purchase_price) - toFloat64(repair_price)) / toFloat64(ll_{t}))
+                        + (toFloat64(repair_price) / toFloat64(oh_{t})),
+                        1e-6
+                      )
+                    ) ),
+                    toFloat64(ll_{t})
+                  )
+                )
+              )
+            ),
+            NULL
+          )
+        WHERE 1
+        """
+        for t in BR_TYPES
+    ],
+    # Невыгодный ремонт → 0
+    """
+    ALTER TABLE {table} UPDATE
+      br_mi8  = if(repair_price >= purchase_price AND ll_mi8  > 0 AND oh_mi8  > 0, toUInt32(0), br_mi8),
+      br_mi17 = if(repair_price >= purchase_price AND ll_mi17 > 0 AND oh_mi17 > 0, toUInt32(0), br_mi17)
+    WHERE 1
+    """,
+    # Неремонтопригодные компоненты: ll = oh и br ещё не заполнен → br = 0
+    *[
+        f"""
+        ALTER TABLE {{table}} UPDATE
+          br_{t} = 0
+        WHERE ll_{t} > 0 AND ll_{t} = oh_{t} AND br_{t} IS NULL
+        """
+        for t in BR_TYPES
+    ],
+]
+
+PARITY_TABLE = 'md_components__br_parity'
+
+# Граничные случаи для --parity-check: (ll_mi8, oh_mi8, ll_mi17, oh_mi17, repair_price, purchase_price)
+PARITY_EDGE_ROWS = [
+    (1000, 1000, None, None, 100.0, 50.0),       # невыгодный ремонт + ll = oh
+    (1000, 500, 1000, 1000, 0.0, 100.0),         # repair_price = 0 → нет формулы; ll = oh у Ми-17
+    (60000, 21000, 120000, 42000, 50.0, 100.0),  # штатный расчёт
+    (None, 500, 0, 0, 50.0, 100.0),              # NULL/нулевые ресурсы
+    (1000, 500, 1000, 300, 100.0, 100.0),        # repair_price = purchase_price → 0
+    (1000, 500, 1000, 300, 100.0, None),         # purchase_price NULL
+    (1001, 333, 7, 3, 1.5, 2.5),                 # округление
+    (5, 5, 5, 5, 0.0, 0.0),                      # нулевые цены при ll = oh
+]
+
+
+def _to_float_array(values) -> np.ndarray:
+    """Колонка из ClickHouse (None = NULL) → float64 с NaN"""
+    return pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(dtype=np.float64)
+
+
+def compute_br_minutes(ll: np.ndarray, oh: np.ndarray,
+                       purchase_price: np.ndarray, repair_price: np.ndarray) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """
+    BR одного типа ВС одним векторным проходом (NaN = NULL)
+
+    Повторяет семантику SQL-цепочки: формула BR (только при ll, oh, ценах > 0),
+    затем «невыгодный ремонт» (repair >= purchase) → 0, затем ll = oh при пустом BR → 0.
+    Сравнения с NaN ложны, как и условия с NULL в ClickHouse.
+
+    Returns:
+        (br: float64, NaN = NULL; счётчики по типу)
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        has_resources = (ll > 0) & (oh > 0)
+        calculated = has_resources & (purchase_price > 0) & (repair_price > 0)
+
+        rate = np.maximum(
+            (purchase_price - repair_price) / ll + repair_price / oh,
+            1e-6
+        )
+        raw = np.maximum(0.0, np.minimum(ll - repair_price / rate, ll))
+        # round() ClickHouse для Float64 — банковское округление, как np.round
+        br = np.where(calculated, np.round(raw), np.nan)
+
+        unprofitable = has_resources & (repair_price >= purchase_price)
+        br[unprofitable] = 0.0
+
+        non_repairable = (ll > 0) & (ll == oh) & np.isnan(br)
+        br[non_repairable] = 0.0
+
+        filled = ~np.isnan(br)
+        violations = int(np.count_nonzero(filled & (br > ll)))
+
+    counts = {
+        'total': int(br.size),
+        'filled': int(np.count_nonzero(filled)),
+        'formula': int(np.count_nonzero(calculated & ~unprofitable)),
+        'unprofitable_zero': int(np.count_nonzero(unprofitable)),
+        'non_repairable_zero': int(np.count_nonzero(non_repairable)),
+        'null': int(np.count_nonzero(~filled)),
+        'min': int(np.nanmin(br)) if filled.any() else None,
+        'max': int(np.nanmax(br)) if filled.any() else None,
+        'violations': violations,
+    }
+    return br, counts
+
+
+def compute_br_frame(df: pd.DataFrame) -> Tuple[Dict[str, np.ndarray], Dict[str, Dict[str, Any]]]:
+    """BR для всех типов по DataFrame с колонками ll_*/oh_*/purchase_price/repair_price"""
+    purchase_price = _to_float_array(df['purchase_price'])
+    repair_price = _to_float_array(df['repair_price'])
+    results, stats = {}, {}
+    for br_type in BR_TYPES:
+        results[br_type], stats[br_type] = compute_br_minutes(
+            _to_float_array(df[f'll_{br_type}']),
+            _to_float_array(df[f'oh_{br_type}']),
+            purchase_price,
+            repair_price,
+        )
+    return results, stats
+
 
 class BeyondRepairCalculator:
     """Калькулятор Beyond Repair для md_components"""
-    
+
     def __init__(self):
         """Инициализация калькулятора"""
         self.logger = self._setup_logging()
         self.client = None
-    
+        self.br_stats: Optional[Dict[str, Dict[str, Any]]] = None
+
     def _setup_logging(self) -> logging.Logger:
         """Настройка логирования"""
         logging.basicConfig(
@@ -30,7 +175,7 @@ class BeyondRepairCalculator:
             format='%(asctime)s - %(levelname)s - %(message)s'
         )
         return logging.getLogger(__name__)
-    
+
     def connect_to_database(self) -> bool:
         """Подключение к ClickHouse"""
         try:
@@ -54,146 +199,114 @@ class BeyondRepairCalculator:
             self.logger.error(f"❌ Ошибка добавления колонок: {e}")
             return False
 
+    def _read_frame(self, query: str) -> pd.DataFrame:
+        """Результат запроса в DataFrame (md_components — справочник, тысячи строк)"""
+        rows, columns = self.client.execute(query, with_column_types=True)
+        return pd.DataFrame(rows, columns=[name for name, _ in columns])
+
     def update_br_in_database(self) -> bool:
-        """Массовое обновление полей br_mi8/br_mi17 в md_components"""
-        self.logger.info("💾 Массовое обновление br_mi8/br_mi17 в md_components...")
+        """Расчёт br_mi8/br_mi17 в памяти и атомарная запись в md_components"""
+        self.logger.info("💾 Расчёт br_mi8/br_mi17 (NumPy) и запись в md_components...")
         try:
-            # Ми-8 → минуты (ll/oh уже в минутах; считаем BR в минутах без доп. умножения)
-            self.client.execute(
-                """
-                ALTER TABLE md_components UPDATE
-                  br_mi8 = if(
-                    ll_mi8 > 0 AND oh_mi8 > 0 AND purchase_price > 0 AND repair_price > 0,
-                    toUInt32(
-                      round(
-                        greatest(
-                          0.0,
-                          least(
-                            ( toFloat64(ll_mi8) - (
-                              toFloat64(repair_price) / greatest(
-                                ((toFloat64(purchase_price) - toFloat64(repair_price)) / toFloat64(ll_mi8))
-                                + (toFloat64(repair_price) / toFloat64(oh_mi8)),
-                                1e-6
-                              )
-                            ) ),
-                            toFloat64(ll_mi8)
-                          )
-                        )
-                      )
-                    ),
-                    NULL
-                  )
-                WHERE 1
-                """
-            )
-
-            # Ми-17 → минуты (ll/oh уже в минутах)
-            self.client.execute(
-                """
-                ALTER TABLE md_components UPDATE
-                  br_mi17 = if(
-                    ll_mi17 > 0 AND oh_mi17 > 0 AND purchase_price > 0 AND repair_price > 0,
-                    toUInt32(
-                      round(
-                        greatest(
-                          0.0,
-                          least(
-                            ( toFloat64(ll_mi17) - (
-                              toFloat64(repair_price) / greatest(
-                                ((toFloat64(purchase_price) - toFloat64(repair_price)) / toFloat64(ll_mi17))
-                                + (toFloat64(repair_price) / toFloat64(oh_mi17)),
-                                1e-6
-                              )
-                            ) ),
-                            toFloat64(ll_mi17)
-                          )
-                        )
-                      )
-                    ),
-                    NULL
-                  )
-                WHERE 1
-                """
-            )
-
-            # Невыгодный ремонт → 0
-            self.client.execute(
-                """
-                ALTER TABLE md_components UPDATE
-                  br_mi8  = if(repair_price >= purchase_price AND ll_mi8  > 0 AND oh_mi8  > 0, toUInt32(0), br_mi8),
-                  br_mi17 = if(repair_price >= purchase_price AND ll_mi17 > 0 AND oh_mi17 > 0, toUInt32(0), br_mi17)
-                WHERE 1
-                """
-            )
+            df = self._read_frame('SELECT * FROM md_components')
+            br_values, self.br_stats = compute_br_frame(df)
+            for br_type in BR_TYPES:
+                df[f'br_{br_type}'] = br_values[br_type]
 
-            # Неремонтопригодные компоненты: ll = oh → br = 0
-            # Такие компоненты не ремонтируются, при поломке сразу в хранение
-            self.logger.info("🔧 Обработка неремонтопригодных компонентов (ll = oh)...")
-            
-            # Ми-8: если ll = oh и br ещё не заполнен → br = 0
-            self.client.execute(
-                """
-                ALTER TABLE md_components UPDATE
-                  br_mi8 = 0
-                WHERE ll_mi8 > 0 AND ll_mi8 = oh_mi8 AND br_mi8 IS NULL
-                """
-            )
-            
-            # Ми-17: если ll = oh и br ещё не заполнен → br = 0
-            self.client.execute(
-                """
-                ALTER TABLE md_components UPDATE
-                  br_mi17 = 0
-                WHERE ll_mi17 > 0 AND ll_mi17 = oh_mi17 AND br_mi17 IS NULL
-                """
+            # Одна замена всех партиций вместо пяти мутаций, переписывающих таблицу
+            rows = load_version_slice(
+                self.client,
+                'md_components',
+                lambda staging: insert_dataframe(
+                    self.client, df, staging, schema_table='md_components', quiet=True
+                )['rows'],
+                slice_where='1',
             )
-            
-            self.logger.info("✅ Неремонтопригодные компоненты обработаны (br = 0)")
 
-            self.logger.info("✅ Массовое обновление br_mi8/br_mi17 выполнено (единицы: минуты)")
+            for br_type in BR_TYPES:
+                stats = self.br_stats[br_type]
+                self.logger.info(
+                    f"   br_{br_type}: формула {stats['formula']}, невыгодный ремонт → 0: {stats['unprofitable_zero']}, "
+                    f"ll = oh → 0: {stats['non_repairable_zero']}, NULL: {stats['null']}"
+                )
+            self.logger.info(f"✅ br_mi8/br_mi17 записаны одной операцией ({rows:,} строк, единицы: минуты)")
             return True
         except Exception as e:
             self.logger.error(f"❌ Ошибка обновления: {e}")
             return False
 
     def verify_br_calculation(self) -> bool:
-        """Проверка качества расчёта BR по типам"""
+        """Проверка качества расчёта BR по типам (по статистике прохода, без доп. сканов)"""
         self.logger.info("🔍 Проверка качества расчёта BR (br_mi8/br_mi17)...")
+        if not self.br_stats:
+            self.logger.error("❌ Нет статистики расчёта: сначала update_br_in_database()")
+            return False
+
+        mi8, mi17 = self.br_stats['mi8'], self.br_stats['mi17']
+        self.logger.info(f"📊 Статистика BR (в минутах):")
+        self.logger.info(f"   Всего компонентов: {mi8['total']}")
+        self.logger.info(f"   br_mi8: рассчитано {mi8['filled']}, диапазон [{mi8['min']}, {mi8['max']}]")
+        self.logger.info(f"   br_mi17: рассчитано {mi17['filled']}, диапазон [{mi17['min']}, {mi17['max']}]")
+
+        # Проверка инвариантов br <= ll (все в минутах)
+        self.logger.info(f"   Инварианты: mi8_viol={mi8['violations']}, mi17_viol={mi17['violations']}")
+        return True
+
+    def run_parity_check(self) -> bool:
+        """
+        Сверка NumPy-расчёта с эталонной цепочкой из 5 ALTER UPDATE
+
+        Фикстура: ресурсы/цены всех строк md_components + граничные случаи
+        (PARITY_EDGE_ROWS) во временной таблице md_components__br_parity.
+        """
+        self.logger.info("🧪 Parity-check: NumPy BR vs 5 мутаций ClickHouse...")
+        columns = ['ll_mi8', 'oh_mi8', 'll_mi17', 'oh_mi17', 'repair_price', 'purchase_price']
         try:
-            stats_result = self.client.execute(
-                """
-                SELECT 
-                    COUNT(*) as total_components,
-                    countIf(br_mi8 IS NOT NULL)  as with_br_mi8,
-                    countIf(br_mi17 IS NOT NULL) as with_br_mi17,
-                    MIN(br_mi8)  as mi8_min,
-                    MAX(br_mi8)  as mi8_max,
-                    MIN(br_mi17) as mi17_min,
-                    MAX(br_mi17) as mi17_max
-                FROM md_components 
-                """
+            self.client.execute(f"DROP TABLE IF EXISTS {PARITY_TABLE}")
+            self.client.execute(f"""
+                CREATE TABLE {PARITY_TABLE} (
+                    row_id UInt32,
+                    ll_mi8 Nullable(UInt32), oh_mi8 Nullable(UInt32),
+                    ll_mi17 Nullable(UInt32), oh_mi17 Nullable(UInt32),
+                    repair_price Nullable(Float32), purchase_price Nullable(Float32),
+                    br_mi8 Nullable(UInt32) DEFAULT NULL, br_mi17 Nullable(UInt32) DEFAULT NULL
+                ) ENGINE = MergeTree() ORDER BY row_id
+            """)
+            self.client.execute(f"""
+                INSERT INTO {PARITY_TABLE} (row_id, {', '.join(columns)})
+                SELECT toUInt32(rowNumberInAllBlocks()), {', '.join(columns)} FROM md_components
+            """)
+            offset = self.client.execute(f"SELECT count() FROM {PARITY_TABLE}")[0][0]
+            self.client.execute(
+                f"INSERT INTO {PARITY_TABLE} (row_id, {', '.join(columns)}) VALUES",
+                [(offset + i, *row) for i, row in enumerate(PARITY_EDGE_ROWS)]
             )
 
-            total, with_mi8, with_mi17, mi8_min, mi8_max, mi17_min, mi17_max = stats_result[0]
-            self.logger.info(f"📊 Статистика BR (в минутах):")
-            self.logger.info(f"   Всего компонентов: {total}")
-            self.logger.info(f"   br_mi8: рассчитано {with_mi8}, диапазон [{mi8_min}, {mi8_max}]")
-            self.logger.info(f"   br_mi17: рассчитано {with_mi17}, диапазон [{mi17_min}, {mi17_max}]")
-
-            # Проверка инвариантов br <= ll (все в минутах)
-            inv = self.client.execute(
-                """
-                SELECT 
-                  sum(br_mi8  > ll_mi8)  as mi8_viol,
-                  sum(br_mi17 > ll_mi17) as mi17_viol
-                FROM md_components
-                """
-            )[0]
-            self.logger.info(f"   Инварианты: mi8_viol={inv[0]}, mi17_viol={inv[1]}")
-            return True
+            for mutation in LEGACY_BR_MUTATIONS:
+                self.client.execute(mutation.format(table=PARITY_TABLE), settings={'mutations_sync': 2})
+
+            df = self._read_frame(f"SELECT * FROM {PARITY_TABLE} ORDER BY row_id")
+            br_values, _ = compute_br_frame(df)
+
+            all_ok = True
+            for br_type in BR_TYPES:
+                expected = _to_float_array(df[f'br_{br_type}'])
+                actual = br_values[br_type]
+                mismatch = ~((expected == actual) | (np.isnan(expected) & np.isnan(actual)))
+                mismatches = int(np.count_nonzero(mismatch))
+                if mismatches:
+                    all_ok = False
+                    sample = df.loc[mismatch, ['row_id', f'br_{br_type}']].head(5).copy()
+                    sample['numpy'] = actual[mismatch][:len(sample)]
+                    self.logger.error(f"❌ br_{br_type}: {mismatches} расхождений из {len(df)}:\n{sample}")
+                else:
+                    self.logger.info(f"✅ br_{br_type}: {len(df)} строк совпадают с эталоном")
+            return all_ok
         except Exception as e:
-            self.logger.error(f"❌ Ошибка проверки: {e}")
+            self.logger.error(f"❌ Ошибка parity-check: {e}")
             return False
+        finally:
+            self.client.execute(f"DROP TABLE IF EXISTS {PARITY_TABLE}")
 
     def run_calculation(self) -> bool:
         """Запуск полного расчета Beyond Repair"""
@@ -217,8 +330,19 @@ class BeyondRepairCalculator:
 
 def main():
     """Основная функция"""
+    parser = argparse.ArgumentParser(description='Расчёт Beyond Repair (br_mi8/br_mi17) в md_components')
+    parser.add_argument('--version-date', type=str, help='Дата версии (не используется: md_components — единый справочник)')
+    parser.add_argument('--version-id', type=int, help='ID версии (не используется)')
+    parser.add_argument('--parity-check', action='store_true',
+                        help='Сверить NumPy-расчёт с эталонной SQL-цепочкой на фикстуре, без записи в md_components')
+    args = parser.parse_args()
+
     calculator = BeyondRepairCalculator()
+    if args.parity_check:
+        if not calculator.connect_to_database():
+            return 1
+        return 0 if calculator.run_parity_check() else 1
     return 0 if calculator.run_calculation() else 1
 
 if __name__ == "__main__":
-    exit(main()) 
\ No newline at end of file
+    exit(main())
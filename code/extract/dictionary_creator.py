@@ -24,6 +24,7 @@ code_root = Path(__file__).resolve().parents[1]
 sys.path.append(str(code_root / 'utils'))
 sys.path.append(str(code_root))
 from config_loader import load_clickhouse_config
+from schema_snapshot import get_schema_snapshot
 import clickhouse_connect
 
 class DictionaryCreator:
@@ -86,13 +87,20 @@ class DictionaryCreator:
             self.logger.error(f"❌ Ошибка подключения к ClickHouse: {e}")
             return False
     
+    # Таблицы, схемы которых читаются одним снимком system.columns
+    SCHEMA_TABLES = ['heli_pandas', 'md_components', 'dict_aircraft_number_flat']
+    
+    def _schema(self):
+        """Кэшированный снимок схем (один запрос на все таблицы)"""
+        return get_schema_snapshot(self.client, self.SCHEMA_TABLES)
+    
     def get_version_from_heli_pandas(self) -> Tuple[str, int]:
         """Получает актуальные версионные параметры из таблицы heli_pandas"""
         try:
             self.logger.info("📅 Получение версионных параметров из heli_pandas...")
             
             # Проверяем существование таблицы heli_pandas
-            table_exists = self.client.query("EXISTS TABLE heli_pandas").result_rows[0][0]
+            table_exists = self._schema().exists('heli_pandas')
             if not table_exists:
                 self.logger.error("❌ Таблица heli_pandas не существует!")
                 self.logger.error("💡 Словари создаются ПОСЛЕ загрузки данных в heli_pandas")
@@ -131,7 +139,7 @@ class DictionaryCreator:
         
         try:
             # Сначала проверяем существование таблицы heli_pandas
-            table_exists = self.client.query("EXISTS TABLE heli_pandas").result_rows[0][0]
+            table_exists = self._schema().exists('heli_pandas')
             if not table_exists:
                 self.logger.error("❌ Таблица heli_pandas не существует!")
                 self.logger.error("💡 Словари создаются ПОСЛЕ загрузки данных в heli_pandas")
@@ -704,7 +712,7 @@ class DictionaryCreator:
         
         try:
             # Проверяем существование таблицы heli_pandas
-            table_exists = self.client.query("EXISTS TABLE heli_pandas").result_rows[0][0]
+            table_exists = self._schema().exists('heli_pandas')
             if not table_exists:
                 self.logger.error("❌ Таблица heli_pandas не существует!")
                 self.logger.error("💡 Словарь номеров ВС создается ПОСЛЕ загрузки данных в heli_pandas")
@@ -800,13 +808,14 @@ class DictionaryCreator:
             
             # Проверяем и добавляем поле ac_type_mask если его нет в существующей таблице
             try:
-                structure_result = self.client.query("DESCRIBE dict_aircraft_number_flat")
-                columns = [row[0] for row in structure_result.result_rows]
+                schema = self._schema()
+                schema.invalidate()  # таблица могла быть только что создана
                 
-                if 'ac_type_mask' not in columns:
+                if not schema.has_column('dict_aircraft_number_flat', 'ac_type_mask'):
                     self.logger.info("🔧 Добавляем поле ac_type_mask к существующей таблице...")
                     alter_sql = "ALTER TABLE dict_aircraft_number_flat ADD COLUMN ac_type_mask UInt8 DEFAULT 0"
                     self.client.query(alter_sql)
+                    schema.invalidate()
                     self.logger.info("✅ Поле ac_type_mask добавлено к существующей таблице")
                 else:
                     self.logger.info("💡 Поле ac_type_mask уже существует в таблице")
@@ -27,6 +27,7 @@ project_root = Path(__file__).parent.parent
 sys.path.append(str(project_root))
 
 from utils.config_loader import get_clickhouse_client, load_clickhouse_config
+from utils.schema_snapshot import get_schema_snapshot
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -249,16 +250,16 @@ class DigitalValuesDictionaryCreator:
                      'dict_partno_flat', 'dict_serialno_flat', 'dict_owner_flat', 
                      'dict_ac_type_flat', 'dict_aircraft_number_flat']
         
-        # Получаем реальные типы из ClickHouse
+        # Реальные типы из ClickHouse: схемы всех таблиц одним запросом к system.columns
+        schema = get_schema_snapshot(self.client, etl_tables, validate=True)
+        
         for table_name in etl_tables:
             try:
-                # Получаем схему таблицы из ClickHouse
-                describe_result = self.client.execute(f"DESCRIBE TABLE {table_name}")
+                if not schema.exists(table_name):
+                    self.logger.warning(f"⚠️ Таблица {table_name} недоступна: не существует")
+                    continue
                 
-                for row in describe_result:
-                    field_name = row[0]
-                    data_type = row[1]
-                    
+                for field_name, data_type in schema.columns(table_name):
                     # Определяем nullable и очищаем тип
                     is_nullable = data_type.startswith('Nullable')
                     clean_type = data_type.replace('Nullable(', '').replace(')', '') if is_nullable else data_type
@@ -12,8 +12,17 @@
 Улучшения v2.1:
 - lease_restricted оптимизировано до UInt8 (Y/1→1, остальное→0)
 
+Потоковая загрузка (по умолчанию):
+- Status_Components.xlsx читается блоками (openpyxl read_only / python-calamine,
+  utils.excel_stream); каждый блок приводится prepare_data и сразу пишется в staging heli_raw;
+- для heli_pandas копятся только строки с партномерами из MD_Components;
+- если вывод типов pandas по целой колонке дал бы другой результат (профиль колонок),
+  staging отбрасывается и загрузка повторяется прежним путём через pd.read_excel.
+
 Использование:
     python3 code/extract/dual_loader.py
+    python3 code/extract/dual_loader.py --no-stream          # прежнее чтение pd.read_excel
+    python3 code/extract/dual_loader.py --parity-check       # сверка потокового и прежнего чтения
 """
 
 import pandas as pd
@@ -83,21 +92,25 @@ def get_md_partnos(client):
         print("💡 Убедитесь что данные загружены: python3 code/extract/md_components_loader.py")
         sys.exit(1)
 
+def get_status_components_path():
+    """Путь к Status_Components.xlsx текущего датасета"""
+    from utils.version_utils import get_dataset_path
+    dataset_path = get_dataset_path()
+    
+    if dataset_path:
+        status_path = dataset_path / 'Status_Components.xlsx'
+    else:
+        status_path = Path('data_input/source_data/Status_Components.xlsx')
+    
+    if not status_path.exists():
+        print(f"❌ Файл {status_path} не найден")
+        sys.exit(1)
+    return status_path
+
 def load_status_components():
     """Загружает Status_Components.xlsx из текущего датасета"""
     try:
-        # Получаем путь к датасету из version_utils
-        from utils.version_utils import get_dataset_path
-        dataset_path = get_dataset_path()
-        
-        if dataset_path:
-            status_path = dataset_path / 'Status_Components.xlsx'
-        else:
-            status_path = Path('data_input/source_data/Status_Components.xlsx')
-        
-        if not status_path.exists():
-            print(f"❌ Файл {status_path} не найден")
-            sys.exit(1)
+        status_path = get_status_components_path()
         
         print(f"📖 Загружаем {status_path}...")
         
@@ -307,11 +320,9 @@ def prepare_data(df, version_date, version_id=1, filter_partnos=None, table_name
         # Дополнительные поля (status, aircraft_number) будут добавлены отдельными скриптами
         
         # Обработка дат для ClickHouse - как в рабочем архивном проекте
+        from utils.date_parsing import coerce_dayfirst_date_columns
         date_columns = ['mfg_date', 'removal_date', 'target_date', 'oh_at_date']
-        for col in date_columns:
-            if col in df.columns:
-                df[col] = pd.to_datetime(df[col], dayfirst=True, errors='coerce').dt.date
-                df[col] = df[col].where(df[col].notnull(), None)
+        coerce_dayfirst_date_columns(df, date_columns)
         
         # Специальная обработка version_date для ClickHouse
         if 'version_date' in df.columns:
@@ -537,32 +548,21 @@ def check_version_conflicts(client, version_date, version_id, auto_replace=False
             print(f"   heli_pandas: {pandas_count:,} записей")
             
             # В ETL-режиме автоматически заменяем
+            # Замена выполняется при вставке: срез подменяется атомарно через staging (insert_data)
             if auto_replace:
-                print(f"🔄 [AUTO] Автоматическая замена данных (ETL-режим)...")
-                if raw_count > 0:
-                    client.execute(f"DELETE FROM heli_raw WHERE version_date = '{version_date}' AND version_id = {version_id}")
-                    print(f"✅ Удалено {raw_count:,} записей из heli_raw")
-                if pandas_count > 0:
-                    client.execute(f"DELETE FROM heli_pandas WHERE version_date = '{version_date}' AND version_id = {version_id}")
-                    print(f"✅ Удалено {pandas_count:,} записей из heli_pandas")
+                print(f"🔄 [AUTO] Автоматическая замена данных (ETL-режим, атомарно при вставке)")
                 return True
             
             # Интерактивный режим
             print(f"\nВыберите действие:")
-            print(f"   1. ЗАМЕНИТЬ существующие данные (DELETE + INSERT)")
+            print(f"   1. ЗАМЕНИТЬ существующие данные (атомарная замена через staging)")
             print(f"   2. ОТМЕНИТЬ загрузку")
             
             while True:
                 try:
                     choice = input(f"\nВаш выбор (1-2): ").strip()
                     if choice == '1':
-                        print(f"🔄 Удаляем существующие данные за {version_date} v{version_id}...")
-                        if raw_count > 0:
-                            client.execute(f"DELETE FROM heli_raw WHERE version_date = '{version_date}' AND version_id = {version_id}")
-                            print(f"✅ Удалено {raw_count:,} записей из heli_raw")
-                        if pandas_count > 0:
-                            client.execute(f"DELETE FROM heli_pandas WHERE version_date = '{version_date}' AND version_id = {version_id}")
-                            print(f"✅ Удалено {pandas_count:,} записей из heli_pandas")
+                        print(f"🔄 Данные за {version_date} v{version_id} будут заменены при вставке")
                         return True
                     elif choice == '2':
                         print(f"❌ Загрузка отменена пользователем")
@@ -581,27 +581,14 @@ def check_version_conflicts(client, version_date, version_id, auto_replace=False
         return False
 
 def insert_data(client, df, table_name, description):
-    """Загружает данные в указанную таблицу с защитой от дублей"""
+    """Загружает данные в указанную таблицу с защитой от дублей
+    
+    Срез version_date пишется через staging-таблицу и подменяется атомарно
+    (REPLACE PARTITION), без ALTER DELETE и ожидания мутации.
+    """
     try:
         print(f"🚀 Загружаем {len(df):,} записей в {table_name} ({description})...")
         
-        # === ЗАЩИТА ОТ ДУБЛЕЙ ===
-        # Извлекаем version_date из данных
-        if 'version_date' in df.columns:
-            version_date = df['version_date'].iloc[0]
-            
-            # Проверяем есть ли уже данные с такой version_date
-            existing_count = client.execute(
-                f"SELECT COUNT(*) FROM {table_name} WHERE version_date = '{version_date}'"
-            )[0][0]
-            
-            if existing_count > 0:
-                print(f"🧹 Удаляем {existing_count:,} существующих записей с version_date={version_date}...")
-                client.execute(f"ALTER TABLE {table_name} DELETE WHERE version_date = '{version_date}'")
-                # Ждём завершения мутации
-                time.sleep(1)
-                print(f"✅ Старые данные удалены")
-        
         # Простая диагностика ресурсных полей (как в рабочих загрузчиках)
         resource_cols = ['oh', 'oh_threshold', 'll', 'sne', 'ppr']
         for col in resource_cols:
@@ -611,19 +598,191 @@ def insert_data(client, df, table_name, description):
                 none_count = df[col].isnull().sum()
                 print(f"🔍 {col}: примеры={sample_vals} типы={sample_types} null={none_count}")
         
-        # Простой рабочий подход - как в успешных загрузчиках
-        data_tuples = [tuple(row) for row in df.values]
+        # Типизированная колоночная вставка по схеме таблицы (без боксинга строк в tuple)
+        from utils.dataframe_writer import insert_dataframe
         
-        # Загружаем
-        client.execute(f'INSERT INTO {table_name} VALUES', data_tuples)
+        def insert_into(target_table):
+            return insert_dataframe(client, df, target_table, schema_table=table_name)['rows']
         
-        print(f"✅ Загружено {len(data_tuples):,} записей в {table_name}")
-        return len(data_tuples)
+        # === ЗАЩИТА ОТ ДУБЛЕЙ: атомарная замена среза version_date ===
+        if 'version_date' in df.columns and len(df) > 0:
+            from utils.staging_loader import load_version_slice
+            version_date = df['version_date'].iloc[0]
+            loaded = load_version_slice(client, table_name, insert_into, version_date=version_date)
+        else:
+            loaded = insert_into(table_name)
+        
+        print(f"✅ Загружено {loaded:,} записей в {table_name}")
+        return loaded
         
     except Exception as e:
         print(f"❌ Ошибка загрузки в {table_name}: {e}")
         return 0
 
+# Строк в блоке потокового чтения Status_Components.xlsx
+STREAM_CHUNK_ROWS = 50_000
+
+# Порядок колонок heli_raw согласно схеме
+RAW_COLUMN_ORDER = [
+    'partno', 'serialno', 'ac_typ', 'location',
+    'mfg_date', 'removal_date', 'target_date',
+    'condition', 'owner', 'lease_restricted',
+    'oh', 'oh_threshold', 'll', 'sne', 'ppr',
+    'version_date', 'version_id',
+    # Встроенные ID поля
+    'partseqno_i', 'psn', 'address_i', 'ac_type_i',
+    # Дополнительные поля
+    'oh_at_date', 'shop_visit_counter'
+]
+
+# prepare_data приводит их через astype(str): результат зависит от вывода типов по целой колонке
+STREAM_TEXT_COLUMNS = ['partno', 'serialno', 'ac_typ', 'location', 'condition', 'owner']
+# pd.to_datetime по строкам выводит формат по первому значению массива (целая колонка vs блок)
+STREAM_DATE_COLUMNS = ['mfg_date', 'removal_date', 'target_date', 'oh_at_date']
+# Колонки, которые prepare_data передаёт без приведения типов
+STREAM_UNCOERCED_COLUMNS = ['status_id', 'aircraft_number']
+
+
+class StreamParityError(Exception):
+    """Потоковое чтение дало бы результат, отличный от pd.read_excel по целому листу"""
+
+
+def stream_parity_issues(profile):
+    """Причины, по которым блоки не совпадут с pd.read_excel (пусто — совпадут)"""
+    issues = []
+    for col in STREAM_TEXT_COLUMNS:
+        if col in profile.types and not profile.is_text(col):
+            kinds = sorted(t.__name__ for t in profile.kinds(col))
+            issues.append(f"{col}: pandas выведет не-строковый тип ({', '.join(kinds)})")
+    for col in STREAM_DATE_COLUMNS:
+        if str in profile.kinds(col):
+            issues.append(f"{col}: даты строками")
+    for col in STREAM_UNCOERCED_COLUMNS:
+        if col in profile.types:
+            issues.append(f"{col}: колонка без приведения типов в prepare_data")
+    if profile.overflow_rows:
+        issues.append(f"{profile.overflow_rows} строк с данными правее заголовка")
+    return issues
+
+
+# Строки вывода prepare_data с предупреждениями о качестве данных — печатаются для каждого блока
+CHUNK_WARNING_MARKS = ('⚠️', '❌')
+
+
+def _prepare_chunk(index, chunk, version_date, version_id, **kwargs):
+    """prepare_data для блока; подробный вывод — для первого блока, для остальных — только предупреждения"""
+    if index == 0:
+        return prepare_data(chunk, version_date, version_id=version_id, **kwargs)
+    import contextlib
+    import io
+    captured = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(captured):
+            prepared = prepare_data(chunk, version_date, version_id=version_id, **kwargs)
+    except SystemExit:
+        print(captured.getvalue(), end='')
+        raise
+    for line in captured.getvalue().splitlines():
+        if line.lstrip().startswith(CHUNK_WARNING_MARKS):
+            print(f"   [блок {index + 1}] {line.strip()}")
+    return prepared
+
+
+def iter_status_components_chunks(status_path, chunk_rows=STREAM_CHUNK_ROWS, profile=None):
+    """Блоки Status_Components.xlsx (dtype object, индекс — номер строки как у pd.read_excel)"""
+    from utils.excel_stream import iter_excel_chunks
+    return iter_excel_chunks(status_path, chunk_rows=chunk_rows, drop_columns=['Счет'], profile=profile)
+
+
+def stream_heli_raw(client, status_path, version_date, version_id, md_partnos, chunk_rows=STREAM_CHUNK_ROWS):
+    """
+    Потоковая загрузка heli_raw: блок читается, приводится и пишется в staging
+    
+    Returns:
+        (строк в Excel, загружено в heli_raw, исходные строки для heli_pandas)
+    
+    Raises:
+        StreamParityError: профиль колонок несовместим с блочным приведением
+                           (staging отброшен, heli_raw не изменена)
+    """
+    from utils.dataframe_writer import insert_dataframe
+    from utils.excel_stream import ColumnProfile
+    from utils.staging_loader import load_version_slice
+    
+    profile = ColumnProfile()
+    md_set = set(md_partnos)
+    candidates = []
+    
+    def insert_into(staging_table):
+        total = 0
+        for i, chunk in enumerate(iter_status_components_chunks(status_path, chunk_rows, profile)):
+            block_start = time.time()
+            # Для heli_pandas нужны только строки с партномерами MD_Components (без фильтра — все)
+            candidates.append(chunk[chunk['partno'].isin(md_set)] if md_set else chunk)
+            raw_chunk = _prepare_chunk(i, chunk, version_date, version_id, table_name='heli_raw')
+            raw_chunk = raw_chunk[[col for col in RAW_COLUMN_ORDER if col in raw_chunk.columns]]
+            total += insert_dataframe(client, raw_chunk, staging_table, schema_table='heli_raw', quiet=True)['rows']
+            print(f"   📦 Блок {i + 1}: {len(chunk):,} строк → heli_raw (всего {total:,}) за {time.time() - block_start:.2f}с")
+        
+        issues = stream_parity_issues(profile)
+        if issues:
+            raise StreamParityError('; '.join(issues))
+        return total
+    
+    raw_loaded = load_version_slice(client, 'heli_raw', insert_into, version_date=version_date)
+    pandas_source = pd.concat(candidates) if candidates else pd.DataFrame()
+    return profile.rows, raw_loaded, pandas_source
+
+
+def run_stream_parity_check(client, chunk_rows=STREAM_CHUNK_ROWS):
+    """Сверка: блоки + prepare_data == pd.read_excel + prepare_data для heli_raw и heli_pandas"""
+    from datetime import date
+    from utils.excel_stream import ColumnProfile
+    
+    print("🧪 === СВЕРКА ПОТОКОВОГО ЧТЕНИЯ STATUS_COMPONENTS ===")
+    status_path = get_status_components_path()
+    md_partnos = get_md_partnos(client)
+    version_date, version_id = date.today(), 1
+    
+    start = time.time()
+    legacy_df = load_status_components()
+    print(f"⏱️ pd.read_excel: {time.time() - start:.2f}с")
+    
+    import contextlib
+    import io
+    with contextlib.redirect_stdout(io.StringIO()):
+        legacy_raw = prepare_data(legacy_df.copy(), version_date, version_id=version_id, table_name='heli_raw')
+        legacy_pandas = prepare_data(legacy_df.copy(), version_date, version_id=version_id,
+                                     filter_partnos=md_partnos, table_name='heli_pandas')
+    
+    start = time.time()
+    profile = ColumnProfile()
+    md_set = set(md_partnos)
+    raw_chunks, candidates = [], []
+    for i, chunk in enumerate(iter_status_components_chunks(status_path, chunk_rows, profile)):
+        candidates.append(chunk[chunk['partno'].isin(md_set)] if md_set else chunk)
+        raw_chunks.append(_prepare_chunk(i + 1, chunk, version_date, version_id, table_name='heli_raw'))
+    print(f"⏱️ Потоковое чтение + приведение блоков: {time.time() - start:.2f}с ({len(raw_chunks)} блоков)")
+    stream_raw = pd.concat(raw_chunks)
+    with contextlib.redirect_stdout(io.StringIO()):
+        stream_pandas = prepare_data(pd.concat(candidates), version_date, version_id=version_id,
+                                     filter_partnos=md_partnos, table_name='heli_pandas')
+    
+    ok = True
+    issues = stream_parity_issues(profile)
+    for issue in issues:
+        print(f"⚠️ Профиль колонок: {issue} (загрузка вернётся к pd.read_excel)")
+    for name, legacy, streamed in (('heli_raw', legacy_raw, stream_raw), ('heli_pandas', legacy_pandas, stream_pandas)):
+        try:
+            pd.testing.assert_frame_equal(legacy, streamed, check_dtype=True)
+            print(f"✅ {name}: {len(legacy):,} строк совпадают")
+        except AssertionError as e:
+            ok = False
+            print(f"❌ {name}: расхождение — {e}")
+    print("✅ Потоковое чтение совпадает с pd.read_excel" if ok else "❌ Потоковое чтение расходится с pd.read_excel")
+    return ok
+
+
 def validate_data_counts(client, version_date, version_id, original_count, raw_count, pandas_count, filtered_partnos_count):
     """Минимальная проверка количества записей"""
     print(f"\n🔍 === ПРОВЕРКА КОЛИЧЕСТВА ЗАПИСЕЙ ===")
@@ -674,8 +833,13 @@ def validate_data_counts(client, version_date, version_id, original_count, raw_c
 
 # Функция add_status_in_memory удалена - заменена на status_processor.py
 
-def main(version_date=None, version_id=None):
-    """Основная функция с поддержкой версионирования"""
+def main(version_date=None, version_id=None, stream=True, chunk_rows=STREAM_CHUNK_ROWS):
+    """Основная функция с поддержкой версионирования
+    
+    Args:
+        stream: Потоковое чтение Status_Components.xlsx блоками с вставкой heli_raw по мере чтения
+        chunk_rows: Строк в блоке потокового чтения
+    """
     print("🚀 === ДВОЙНОЙ ЗАГРУЗЧИК STATUS_COMPONENTS ===")
     start_time = time.time()
     
@@ -699,12 +863,16 @@ def main(version_date=None, version_id=None):
         create_tables(client)
         print(f"✅ [ЭТАП 2] Таблицы созданы за {time.time() - step_start:.2f}с")
         
-        # 3. Загрузка исходных данных
-        print(f"📖 [ЭТАП 3] Загрузка Excel файла...")
-        step_start = time.time()
-        df = load_status_components()
-        original_count = len(df)
-        print(f"✅ [ЭТАП 3] Excel загружен за {time.time() - step_start:.2f}с: {original_count:,} записей")
+        # 3. Загрузка исходных данных (в потоковом режиме — при записи heli_raw, ЭТАП 7a)
+        if stream:
+            status_path = get_status_components_path()
+            print(f"📖 [ЭТАП 3] Потоковое чтение {status_path} (блоки по {chunk_rows:,} строк) — на ЭТАПЕ 7a")
+        else:
+            print(f"📖 [ЭТАП 3] Загрузка Excel файла...")
+            step_start = time.time()
+            df = load_status_components()
+            original_count = len(df)
+            print(f"✅ [ЭТАП 3] Excel загружен за {time.time() - step_start:.2f}с: {original_count:,} записей")
         
         # 4. Определение версии данных
         print(f"🗓️ [ЭТАП 4] Определение версии...")
@@ -741,29 +909,34 @@ def main(version_date=None, version_id=None):
         print(f"\n📦 [ЭТАП 7] Подготовка данных для загрузки...")
         step_start = time.time()
         
-        # Все данные для RAW
-        print(f"🔧 [ЭТАП 7a] Подготовка данных для heli_raw...")
-        raw_start = time.time()
-        raw_df = prepare_data(df.copy(), version_date, version_id=version_id, table_name='heli_raw')
-        print(f"✅ [ЭТАП 7a] heli_raw подготовлен за {time.time() - raw_start:.2f}с: {len(raw_df):,} записей")
-        
-        # КРИТИЧНО: Упорядочиваем колонки для heli_raw согласно схеме
-        raw_column_order = [
-            'partno', 'serialno', 'ac_typ', 'location',
-            'mfg_date', 'removal_date', 'target_date',
-            'condition', 'owner', 'lease_restricted',
-            'oh', 'oh_threshold', 'll', 'sne', 'ppr',
-            'version_date', 'version_id',
-            # Встроенные ID поля
-            'partseqno_i', 'psn', 'address_i', 'ac_type_i',
-            # Дополнительные поля
-            'oh_at_date', 'shop_visit_counter'
-        ]
-        
-        # Проверяем и упорядочиваем колонки для raw (пропускаем отсутствующие)
-        available_raw_columns = [col for col in raw_column_order if col in raw_df.columns]
-        raw_df = raw_df[available_raw_columns]
-        print(f"✅ heli_raw: порядок колонок установлен ({len(raw_df.columns)} полей)")
+        raw_loaded = None
+        if stream:
+            # Чтение, приведение и запись heli_raw блоками; для heli_pandas копятся строки MD_Components
+            print(f"🔧 [ЭТАП 7a] Потоковая загрузка heli_raw...")
+            raw_start = time.time()
+            try:
+                original_count, raw_loaded, df = stream_heli_raw(
+                    client, status_path, version_date, version_id, md_partnos, chunk_rows=chunk_rows
+                )
+                print(f"✅ [ЭТАП 7a] heli_raw загружена потоково за {time.time() - raw_start:.2f}с: "
+                      f"{raw_loaded:,} из {original_count:,} записей Excel")
+            except StreamParityError as e:
+                print(f"⚠️ [ЭТАП 7a] Потоковое чтение несовместимо с pd.read_excel ({e}); "
+                      f"heli_raw не изменена, повтор через pd.read_excel")
+                df = load_status_components()
+                original_count = len(df)
+        
+        if raw_loaded is None:
+            # Все данные для RAW
+            print(f"🔧 [ЭТАП 7a] Подготовка данных для heli_raw...")
+            raw_start = time.time()
+            raw_df = prepare_data(df.copy(), version_date, version_id=version_id, table_name='heli_raw')
+            print(f"✅ [ЭТАП 7a] heli_raw подготовлен за {time.time() - raw_start:.2f}с: {len(raw_df):,} записей")
+            
+            # КРИТИЧНО: Упорядочиваем колонки для heli_raw согласно схеме (пропускаем отсутствующие)
+            available_raw_columns = [col for col in RAW_COLUMN_ORDER if col in raw_df.columns]
+            raw_df = raw_df[available_raw_columns]
+            print(f"✅ heli_raw: порядок колонок установлен ({len(raw_df.columns)} полей)")
         
         # Фильтрованные данные для PANDAS (САМЫЙ ТЯЖЕЛЫЙ ЭТАП!)
         print(f"🔧 [ЭТАП 7b] Подготовка данных для heli_pandas (фильтрация)...")
@@ -777,11 +950,14 @@ def main(version_date=None, version_id=None):
         step_start = time.time()
         
         # 8.1 Сразу записываем heli_raw (архивная копия - больше не нужна)
-        print(f"💾 [ЭТАП 8.1] Загрузка heli_raw в ClickHouse...")
-        raw_insert_start = time.time()
-        raw_loaded = insert_data(client, raw_df, 'heli_raw', 'все данные')
-        print(f"✅ [ЭТАП 8.1] heli_raw записана за {time.time() - raw_insert_start:.2f}с, освобождаем память")
-        del raw_df  # Освобождаем память
+        if stream and raw_loaded is not None:
+            print(f"✅ [ЭТАП 8.1] heli_raw уже записана потоково (ЭТАП 7a)")
+        else:
+            print(f"💾 [ЭТАП 8.1] Загрузка heli_raw в ClickHouse...")
+            raw_insert_start = time.time()
+            raw_loaded = insert_data(client, raw_df, 'heli_raw', 'все данные')
+            print(f"✅ [ЭТАП 8.1] heli_raw записана за {time.time() - raw_insert_start:.2f}с, освобождаем память")
+            del raw_df  # Освобождаем память
         
         # 8.2 Обрабатываем pandas_df В ПАМЯТИ для оптимальной производительности
         print(f"\n🔧 [ЭТАП 8.2] ОБРАБОТКА PANDAS_DF В ПАМЯТИ")
@@ -958,6 +1134,12 @@ if __name__ == "__main__":
     parser.add_argument('--version-date', type=str, help='Дата версии (YYYY-MM-DD)')
     parser.add_argument('--version-id', type=int, help='ID версии')
     parser.add_argument('--dataset-path', type=str, help='Путь к папке датасета (v_YYYY-MM-DD)')
+    parser.add_argument('--no-stream', action='store_true',
+                        help='Читать Status_Components.xlsx целиком через pd.read_excel (прежний путь)')
+    parser.add_argument('--chunk-rows', type=int, default=STREAM_CHUNK_ROWS,
+                        help=f'Строк в блоке потокового чтения (по умолчанию {STREAM_CHUNK_ROWS:,})')
+    parser.add_argument('--parity-check', action='store_true',
+                        help='Сверить потоковое чтение с pd.read_excel (без записи в ClickHouse)')
     
     args = parser.parse_args()
     
@@ -966,11 +1148,19 @@ if __name__ == "__main__":
         from utils.version_utils import set_dataset_path
         set_dataset_path(args.dataset_path)
     
+    if args.parity_check:
+        code_root = Path(__file__).resolve().parents[1]
+        sys.path.append(str(code_root))
+        sys.path.append(str(code_root / 'utils'))
+        from utils.config_loader import get_clickhouse_client
+        sys.exit(0 if run_stream_parity_check(get_clickhouse_client(), chunk_rows=args.chunk_rows) else 1)
+    
     # Передаем параметры версионирования в main, если они заданы
+    stream_kwargs = {'stream': not args.no_stream, 'chunk_rows': args.chunk_rows}
     if args.version_date and args.version_id:
         from datetime import datetime
         version_date = datetime.strptime(args.version_date, '%Y-%m-%d').date()
-        main(version_date=version_date, version_id=args.version_id)
+        main(version_date=version_date, version_id=args.version_id, **stream_kwargs)
     else:
-        main()
+        main(**stream_kwargs)
  
\ No newline at end of file
@@ -17,15 +17,27 @@ Extract Master - Оркестратор Extract этапа
 - Поддержка выбора датасета из папок v_YYYY-MM-DD
 - Передача пути датасета загрузчикам через --dataset-path
 - md_components универсальна для всех датасетов
+
+Инкрементальный режим (--incremental):
+- Для каждого шага в logs/extract_manifests/ (на version_date/version_id) пишется отпечаток:
+  sha256 скрипта и исходных файлов + токены upstream-таблиц
+- Шаг с неизменным отпечатком и валидным результатом пропускается,
+  перезапуск шага меняет отпечатки всех зависимых шагов (грязный под-DAG)
+- --force STEP — принудительный перезапуск шага (и зависимых); в режиме ТЕСТ таблицы не удаляются
+
+Профилирование (по умолчанию, --no-profile отключает):
+- wall/CPU/пиковый RSS каждого шага, строки/байты и мутации из system.query_log (log_comment шага)
+- logs/extract_profiles/: profile_<run_id>.json + history.csv, регрессии относительно прошлого прогона датасета
 """
 
+import argparse
 import subprocess
 import sys
 import time
 import logging
 from pathlib import Path
 from datetime import date, datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 
 # Добавляем пути для utils и общего кода (code/)
 code_root = Path(__file__).resolve().parents[1]
@@ -34,6 +46,8 @@ sys.path.append(str(code_root))
 from config_loader import get_clickhouse_client
 from etl_version_manager import ETLVersionManager
 from dataset_manager import DatasetManager, DatasetInfo
+from extract_manifest import ExtractManifest, file_sha256, combine_fingerprint, table_token
+from etl_profiler import ETLRunProfiler, run_profiled, LOG_COMMENT_ENV, DEFAULT_REGRESSION_THRESHOLD
 import openpyxl
 import os
 
@@ -138,12 +152,15 @@ class ExtractMaster:
     """Главный оркестратор Extract этапа"""
     
     # Конфигурация Extract пайплайна в правильном порядке
+    # inputs: исходные файлы шага ({dataset} — папка выбранного датасета) для инкрементального режима
+    # also_writes: таблицы, которые шаг пишет помимо result_table
     EXTRACT_PIPELINE = [
         {
             'script': 'md_components_loader.py',
             'description': 'MD Components - мастер-данные компонентов',
             'dependencies': [],
             'result_table': 'md_components',
+            'inputs': ['data_input/master_data/MD_Сomponents.xlsx'],
             'critical': True  # Критичен для фильтрации
         },
         {
@@ -151,6 +168,7 @@ class ExtractMaster:
             'description': 'Status & Overhaul - статусы и капремонт',
             'dependencies': [],
             'result_table': 'status_overhaul',
+            'inputs': ['{dataset}/Status_Overhaul.xlsx'],
             'critical': True
         },
         {
@@ -158,6 +176,7 @@ class ExtractMaster:
             'description': 'Program AC - связка программ и ВС',
             'dependencies': [],
             'result_table': 'program_ac', 
+            'inputs': ['{dataset}/Program_AC.xlsx'],
             'critical': True
         },
         {
@@ -165,6 +184,7 @@ class ExtractMaster:
             'description': 'Status Components - основные данные + процессинг',
             'dependencies': ['md_components', 'status_overhaul', 'program_ac'],
             'result_table': 'heli_pandas',
+            'inputs': ['{dataset}/Status_Components.xlsx'],
             'critical': True
         },
         {
@@ -179,6 +199,7 @@ class ExtractMaster:
             'description': 'Все справочники (статусы, партномера, серийники, владельцы, типы ВС, номера ВС)',
             'dependencies': ['heli_pandas', 'md_components'],
             'result_table': 'dict_aircraft_number_flat',
+            'also_writes': ['dict_partno_flat', 'dict_serialno_flat', 'dict_owner_flat', 'dict_ac_type_flat', 'dict_status_flat'],
             'critical': False,
             # На этом шаге словарь может быть временно пуст (до генерации новых ВС в AC/FL)
             # Предупреждение валидации для пустой таблицы по текущей версии подавляем осознанно
@@ -211,6 +232,7 @@ class ExtractMaster:
             'description': 'Flight Program AC Direct - прямой тензор операций ВС на 4000 дней с постпроцессингом',
             'dependencies': ['heli_pandas', 'md_components'],
             'result_table': 'flight_program_ac',
+            'inputs': ['{dataset}/Program_heli.xlsx'],
             'critical': False
         },
         {
@@ -218,6 +240,7 @@ class ExtractMaster:
             'description': 'Flight Program FL Direct - прямой тензор программ полетов на 4000 дней',
             'dependencies': ['dict_aircraft_number_flat'],
             'result_table': 'flight_program_fl',
+            'inputs': ['{dataset}/Program.xlsx'],
             'critical': False
         },
         {
@@ -299,6 +322,12 @@ class ExtractMaster:
         self.mode = None  # 'test' или 'prod'
         self.dataset: DatasetInfo = None  # Выбранный датасет
         self.dataset_path: str = None  # Путь к папке датасета
+        self.incremental = False  # Пропуск шагов с неизменным отпечатком входов
+        self.force_steps: set = set()  # Шаги для принудительного перезапуска (--force)
+        self.manifest: Optional[ExtractManifest] = None
+        self.profile_enabled = True  # Профиль шагов в logs/extract_profiles/
+        self.regression_threshold = DEFAULT_REGRESSION_THRESHOLD
+        self.profiler: Optional[ETLRunProfiler] = None
         
     def initialize(self) -> bool:
         """Инициализация подключений и менеджеров"""
@@ -389,6 +418,14 @@ class ExtractMaster:
     def prepare_test_mode(self) -> bool:
         """Подготовка тестового режима - удаление всех таблиц"""
         try:
+            if self.incremental:
+                # Инкрементальный режим: таблицы сохраняются, шаги заменяют свои срезы сами
+                self.version_date = extract_unified_version_date(self.dataset_path)
+                self.version_id = 1
+                logger.info("🧪 === РЕЖИМ ТЕСТ (ИНКРЕМЕНТАЛЬНЫЙ): таблицы НЕ удаляются ===")
+                logger.info(f"🎯 Единая версия для всех загрузчиков: {self.version_date} (version_id=1)")
+                return True
+            
             logger.info("🧪 === РЕЖИМ ТЕСТ: ПОЛНАЯ ОЧИСТКА ===")
             
             # Список ТОЛЬКО таблиц которые создаются текущим Extract пайплайном
@@ -513,7 +550,34 @@ class ExtractMaster:
             return False
     
     def run_microservice(self, step: Dict) -> bool:
-        """Запуск отдельного Extract микросервиса"""
+        """Запуск отдельного Extract микросервиса (с профилированием шага, если включено)"""
+        if not self.profiler:
+            return self._run_microservice(step, {})
+        
+        usage: Dict = {}
+        query_tag = self.profiler.query_tag(step['script'])
+        start_time = time.time()
+        success = self._run_microservice(step, usage, query_tag)
+        self.profiler.record_step(
+            step['script'],
+            'success' if success else 'failed',
+            time.time() - start_time,
+            usage or None,
+            self.profiler.collect_query_stats(query_tag),
+        )
+        return success
+    
+    @staticmethod
+    def _accumulate_usage(total: Dict, usage: Dict) -> None:
+        """Суммирует CPU и берёт максимум RSS по запускам скрипта шага"""
+        if usage.get('cpu_user_sec') is None:
+            return
+        total['cpu_user_sec'] = round(total.get('cpu_user_sec', 0.0) + usage['cpu_user_sec'], 2)
+        total['cpu_sys_sec'] = round(total.get('cpu_sys_sec', 0.0) + usage['cpu_sys_sec'], 2)
+        total['peak_rss_mb'] = max(total.get('peak_rss_mb', 0.0), usage['peak_rss_mb'])
+    
+    def _run_microservice(self, step: Dict, usage: Dict, query_tag: Optional[str] = None) -> bool:
+        """Запуск скрипта шага; ресурсы дочерних процессов накапливаются в usage"""
         script_name = step['script']
         description = step['description']
         
@@ -556,16 +620,18 @@ class ExtractMaster:
             # Поддержка импорта utils при запуске скрипта из code/extract
             env = os.environ.copy()
             env["PYTHONPATH"] = f"{str(code_root)}{os.pathsep}{env.get('PYTHONPATH', '')}"
+            # Метка запросов шага в system.query_log (профилирование)
+            if query_tag:
+                env[LOG_COMMENT_ENV] = query_tag
 
             # Сначала пробуем с параметрами версионирования
-            result = subprocess.run(
+            result, run_usage = run_profiled(
                 cmd_with_params,
-                capture_output=True,
-                text=True,
                 timeout=1800,  # 30 минут максимум
                 cwd=Path.cwd(),  # Запускаем из корневой директории
                 env=env
             )
+            self._accumulate_usage(usage, run_usage)
             
             # Если скрипт не поддерживает версионирование, пробуем без параметров
             if result.returncode != 0 and ("unrecognized arguments" in result.stderr or "unknown option" in result.stderr):
@@ -573,19 +639,23 @@ class ExtractMaster:
                 
                 cmd_without_params = [sys.executable, str(script_path), *extra_args]
                 
-                result = subprocess.run(
+                result, run_usage = run_profiled(
                     cmd_without_params,
-                    capture_output=True,
-                    text=True,
                     timeout=1800,
                     cwd=Path.cwd(),
                     env=env
                 )
+                self._accumulate_usage(usage, run_usage)
             
             execution_time = time.time() - start_time
             
             if result.returncode == 0:
                 logger.info(f"✅ Микросервис {script_name} завершен успешно за {execution_time:.1f}с")
+                if usage:
+                    logger.info(
+                        f"⏱️ CPU {usage['cpu_user_sec'] + usage['cpu_sys_sec']:.1f}с, "
+                        f"пиковый RSS {usage['peak_rss_mb']:.0f} MB"
+                    )
                 
                 # Показываем последние строки вывода
                 if result.stdout:
@@ -739,6 +809,114 @@ class ExtractMaster:
         )
         return True
     
+    @staticmethod
+    def _step_name(script: str) -> str:
+        """Имя шага без расширения (для --force)"""
+        return script[:-3] if script.endswith('.py') else script
+    
+    def resolve_force_steps(self, names: List[str]) -> bool:
+        """Проверяет имена шагов из --force и сохраняет их"""
+        known = {self._step_name(step['script']) for step in self.EXTRACT_PIPELINE}
+        requested = {self._step_name(name) for name in names}
+        unknown = sorted(requested - known)
+        if unknown:
+            logger.error(f"❌ --force: неизвестные шаги {unknown}")
+            logger.info(f"💡 Доступные шаги: {', '.join(sorted(known))}")
+            return False
+        self.force_steps = requested
+        return True
+    
+    def _step_input_paths(self, step: Dict) -> List[Path]:
+        """Исходные файлы шага с подстановкой папки датасета"""
+        dataset = self.dataset_path or 'data_input/source_data'
+        return [Path(path.replace('{dataset}', dataset)) for path in step.get('inputs', [])]
+    
+    def _external_table_state(self, table: str) -> str:
+        """Состояние таблицы, не производимой пайплайном: активные парты из system.parts"""
+        try:
+            parts, rows, modified = self.client.execute(
+                "SELECT count(), sum(rows), toString(max(modification_time)) FROM system.parts "
+                "WHERE database = currentDatabase() AND table = %(table)s AND active",
+                {'table': table}
+            )[0]
+            return f"parts={parts};rows={rows};modified={modified}"
+        except Exception as e:
+            logger.debug(f"Не удалось прочитать system.parts для {table}: {e}")
+            return 'unknown'
+    
+    def compute_step_fingerprint(self, step: Dict, table_tokens: Dict[str, str]) -> Tuple[str, Dict]:
+        """
+        Отпечаток входов шага: скрипт, аргументы, исходные файлы, токены upstream-таблиц
+        
+        Токен upstream-таблицы берётся от последнего шага-производителя в этом прогоне
+        (выполненного или пропущенного); собственная result_table учитывается, если её
+        уже писал предыдущий шаг (цепочки обогащения heli_pandas).
+        """
+        result_table = step.get('result_table')
+        upstream = {}
+        for table in [*step.get('dependencies', []), result_table]:
+            if not table or table in upstream:
+                continue
+            if table in table_tokens:
+                upstream[table] = table_tokens[table]
+            elif table != result_table:
+                upstream[table] = self._external_table_state(table)
+        
+        details = {
+            'script_sha256': file_sha256(Path(__file__).parent / step['script']),
+            'args': step.get('args', []),
+            'inputs': {str(path): file_sha256(path) for path in self._step_input_paths(step)},
+            'upstream': upstream,
+        }
+        return combine_fingerprint(details), details
+    
+    @staticmethod
+    def _describe_fingerprint_changes(old: Dict, new: Dict) -> str:
+        """Человекочитаемый список изменившихся компонентов отпечатка"""
+        changes = []
+        if old.get('script_sha256') != new['script_sha256']:
+            changes.append('скрипт')
+        if old.get('args') != new['args']:
+            changes.append('аргументы')
+        old_inputs = old.get('inputs', {})
+        changes.extend(
+            f"файл {Path(path).name}" for path, digest in new['inputs'].items()
+            if old_inputs.get(path) != digest
+        )
+        old_upstream = old.get('upstream', {})
+        changes.extend(
+            f"таблица {table}" for table, token in new['upstream'].items()
+            if old_upstream.get(table) != token
+        )
+        return ', '.join(changes) or 'состав отпечатка'
+    
+    def check_step_unchanged(self, step: Dict, fingerprint: str, details: Dict) -> Tuple[bool, str]:
+        """Решение инкрементального режима: (можно пропустить, причина)"""
+        if self._step_name(step['script']) in self.force_steps:
+            return False, 'принудительный перезапуск (--force)'
+        
+        entry = self.manifest.get_step(step['script'])
+        if entry is None:
+            return False, 'шаг не выполнялся для этой версии'
+        if entry.get('status') != 'success':
+            return False, f"предыдущий запуск: {entry.get('status')}"
+        if entry.get('fingerprint') != fingerprint:
+            changes = self._describe_fingerprint_changes(entry.get('details', {}), details)
+            return False, f"изменились входы: {changes}"
+        
+        validation = self.validate_result(step)
+        if not validation['success']:
+            return False, f"результат невалиден: {validation['message']}"
+        return True, validation['message']
+    
+    @staticmethod
+    def _update_table_tokens(step: Dict, table_tokens: Dict[str, str], entry: Dict) -> None:
+        """Таблицы шага получают токен его последнего выполнения"""
+        token = table_token(entry['fingerprint'], entry.get('executed_at'))
+        for table in [step.get('result_table'), *step.get('also_writes', [])]:
+            if table:
+                table_tokens[table] = token
+    
     def run_pipeline(self) -> bool:
         """Запуск полного Extract пайплайна"""
         logger.info("🚀 === ЗАПУСК EXTRACT ПАЙПЛАЙНА ===")
@@ -747,6 +925,26 @@ class ExtractMaster:
         success_count = 0
         failed_steps = []
         
+        # Инкрементальный режим: манифест отпечатков для текущей версии
+        table_tokens: Dict[str, str] = {}
+        unchanged_count = 0
+        if self.incremental:
+            self.manifest = ExtractManifest(self.version_date, self.version_id)
+            logger.info(f"📒 Инкрементальный режим: манифест {self.manifest.path}")
+            if self.force_steps:
+                logger.info(f"🔨 Принудительный перезапуск: {', '.join(sorted(self.force_steps))}")
+        
+        # Профиль шагов прогона (wall/CPU/RSS, статистика system.query_log)
+        if self.profile_enabled:
+            self.profiler = ETLRunProfiler(
+                self.client,
+                dataset=self.dataset.name if self.dataset else 'source_data',
+                version_date=self.version_date,
+                version_id=self.version_id,
+                mode=self.mode,
+                regression_threshold=self.regression_threshold,
+            )
+        
         for i, step in enumerate(self.EXTRACT_PIPELINE, 1):
             logger.info(f"\n📋 ЭТАП {i}/{total_steps}: {step['script']}")
             
@@ -754,16 +952,40 @@ class ExtractMaster:
                 reason = step.get('skip_reason', 'skip requested')
                 logger.warning(f"⏭️ ЭТАП {i}/{total_steps} пропущен: {step['script']}")
                 logger.warning(f"⚠️ Причина: {reason}")
+                if self.profiler:
+                    self.profiler.record_step(step['script'], 'skipped')
                 success_count += 1
                 continue
             
+            # Инкрементальный режим: пропуск шага с неизменным отпечатком
+            if self.incremental:
+                fingerprint, fingerprint_details = self.compute_step_fingerprint(step, table_tokens)
+                unchanged, reason = self.check_step_unchanged(step, fingerprint, fingerprint_details)
+                if unchanged:
+                    logger.info(f"⏭️ ЭТАП {i}/{total_steps} без изменений, пропущен: {reason}")
+                    self._update_table_tokens(step, table_tokens, self.manifest.get_step(step['script']))
+                    if self.profiler:
+                        self.profiler.record_step(step['script'], 'skipped')
+                    success_count += 1
+                    unchanged_count += 1
+                    continue
+                logger.info(f"🔄 ЭТАП {i}/{total_steps} будет выполнен: {reason}")
+            
             # Проверка зависимостей
             if not self.validate_dependencies(step):
                 logger.warning(f"⚠️ Проблемы с зависимостями для {step['script']}, но продолжаем")
             
             # Запуск микросервиса
+            step_start = time.time()
             success = self.run_microservice(step)
             
+            if self.incremental:
+                entry = self.manifest.record_step(
+                    step['script'], fingerprint, fingerprint_details, success, time.time() - step_start
+                )
+                self.manifest.save()
+                self._update_table_tokens(step, table_tokens, entry)
+            
             if success:
                 success_count += 1
                 
@@ -788,10 +1010,19 @@ class ExtractMaster:
         logger.info(f"✅ Успешно: {success_count}/{total_steps} этапов")
         logger.info(f"🎯 Версия данных: {self.version_date} (version_id={self.version_id})")
         logger.info(f"🔧 Режим: {self.mode.upper()}")
+        if self.incremental:
+            logger.info(f"⏭️ Пропущено без изменений: {unchanged_count}, выполнено: {success_count - unchanged_count}")
         
         if failed_steps:
             logger.warning(f"⚠️ Проваленные этапы: {', '.join(failed_steps)}")
         
+        # Профиль шагов и сравнение с предыдущим прогоном датасета
+        if self.profiler:
+            try:
+                self.profiler.save()
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось сохранить профиль прогона: {e}")
+        
         # Финальная проверка системы
         final_ok = self.final_validation()
         
@@ -865,7 +1096,26 @@ class ExtractMaster:
 
 def main():
     """Главная функция Extract Master"""
+    parser = argparse.ArgumentParser(description='Extract Master - оркестратор Extract этапа')
+    parser.add_argument('--mode', type=str.upper, choices=['TEST', 'PROD'], default=None,
+                        help='Режим без интерактивного выбора: TEST - полная перезагрузка, PROD - версионирование')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Пропускать шаги с неизменным отпечатком входов (манифест на version_date/version_id)')
+    parser.add_argument('--force', action='append', default=[], metavar='STEP',
+                        help='Принудительно перезапустить шаг и зависимые от него (имя скрипта; можно повторять). '
+                             'Включает --incremental')
+    parser.add_argument('--no-profile', action='store_true',
+                        help='Не профилировать шаги (logs/extract_profiles/)')
+    parser.add_argument('--regression-threshold', type=float, default=DEFAULT_REGRESSION_THRESHOLD,
+                        help='Порог замедления шага относительно прошлого прогона датасета (0.2 = +20%%)')
+    args = parser.parse_args()
+    
     master = ExtractMaster()
+    master.incremental = args.incremental or bool(args.force)
+    master.profile_enabled = not args.no_profile
+    master.regression_threshold = args.regression_threshold
+    if args.force and not master.resolve_force_steps(args.force):
+        sys.exit(2)
     
     try:
         # Выбор датасета
@@ -876,8 +1126,11 @@ def main():
         if not master.initialize():
             sys.exit(1)
         
-        # Выбор режима
-        if not master.select_mode():
+        # Выбор режима (--mode — без интерактивного выбора)
+        if args.mode:
+            master.mode = args.mode.lower()
+            logger.info(f"🔧 Режим из --mode: {args.mode}")
+        elif not master.select_mode():
             sys.exit(0)
         
         # Подготовка в зависимости от режима
@@ -6,7 +6,8 @@ SSoT: data_input/master_data/MD_Сomponents.xlsx → таблица md_component
 
 Функционал:
 1. Пустая md_components (после DROP) — полная загрузка всех строк из Excel
-2. Непустая md_components — INSERT новых partno + UPDATE существующих из Excel SSoT
+2. Непустая md_components — новые partno + значения существующих из Excel SSoT
+   (одна атомарная замена через staging-таблицу, без ALTER UPDATE)
 3. Проверяет качество и целостность данных
 """
 
@@ -379,124 +380,98 @@ def check_version_conflicts(client, version_date, version_id):
         if total_count == 0:
             print("   ℹ️ Таблица пуста — будет полная загрузка из Excel SSoT")
         else:
-            print("   ℹ️ SSoT sync: INSERT новых partno + UPDATE существующих из Excel")
+            print("   ℹ️ SSoT sync: новые partno + значения существующих из Excel (атомарно через staging)")
         return True
             
     except Exception as e:
         print(f"❌ Ошибка проверки md_components: {e}")
         return False
 
-NULLABLE_INSERT_COLUMNS = {
-    'sne_new', 'ppr_new', 'br_mi8', 'br_mi17', 'br2_mi17', 'partseqno_i', 'repair_number',
-}
-
-
 def _escape_partno(partno: str) -> str:
     return str(partno).replace("'", "''")
 
 
-def _format_ch_value(val, col_name: str) -> str:
-    if val is None or (isinstance(val, float) and math.isnan(val)) or pd.isna(val):
-        if col_name in NULLABLE_INSERT_COLUMNS:
-            return "NULL"
-        if col_name == 'restrictions_mask':
-            return "0"
-        if col_name == 'psn_spawn_start':
-            return "0"
-        return "NULL"
-    if col_name == 'version_date':
-        return f"toDate('{val}')"
-    if isinstance(val, (np.integer, int)):
-        return str(int(val))
-    if isinstance(val, (np.floating, float)):
-        return str(float(val))
-    escaped = str(val).replace("'", "''")
-    return f"'{escaped}'"
-
-
-def _prepare_insert_rows(df: pd.DataFrame) -> list[tuple]:
-    data_tuples = []
-    for _, row in df.iterrows():
-        row_list = [None if pd.isna(val) else val for val in row]
-        data_tuples.append(tuple(row_list))
-
-    prepared_data = []
-    for row in data_tuples:
-        prepared_row = []
-        for i, val in enumerate(row):
-            col_name = df.columns[i]
-            if val is None and col_name in NULLABLE_INSERT_COLUMNS:
-                prepared_row.append(None)
-            else:
-                prepared_row.append(val)
-        prepared_data.append(tuple(prepared_row))
-    return prepared_data
-
-
-def _insert_rows(client, df: pd.DataFrame) -> int:
+def _insert_rows(client, df: pd.DataFrame, table: str = 'md_components') -> int:
     if df.empty:
         return 0
 
-    prepared_data = _prepare_insert_rows(df)
-    columns = list(df.columns)
-    insert_query = f"INSERT INTO md_components ({', '.join(columns)}) VALUES"
-    client.execute(insert_query, prepared_data)
-    return len(prepared_data)
+    # Типизированная колоночная вставка: пропуски в Nullable-колонках → NULL, в остальных → 0/''
+    from utils.dataframe_writer import insert_dataframe
+    return insert_dataframe(client, df, table, schema_table='md_components')['rows']
 
 
-def _sync_ssot_rows(client, df: pd.DataFrame) -> int:
-    """UPDATE существующих partno значениями из Excel SSoT (без дублирования строк)."""
-    if df.empty:
-        return 0
+def _with_existing_version_keys(df: pd.DataFrame, existing_keys: list) -> pd.DataFrame:
+    """Строки Excel для уже известных partno получают их текущие version_date/version_id.
 
-    partnos_sql = ", ".join(f"'{_escape_partno(partno)}'" for partno in df['partno'])
-    # version_date/version_id — ключи ORDER BY MergeTree, UPDATE запрещён ClickHouse
-    sync_columns = [
-        col for col in df.columns if col not in {'partno', 'version_date', 'version_id'}
-    ]
-
-    for col in sync_columns:
-        cases = []
-        for _, row in df.iterrows():
-            partno = _escape_partno(row['partno'])
-            value_sql = _format_ch_value(row[col], col)
-            cases.append(f"WHEN partno = '{partno}' THEN {value_sql}")
-        update_sql = (
-            f"ALTER TABLE md_components UPDATE {col} = CASE {' '.join(cases)} ELSE {col} END "
-            f"WHERE partno IN ({partnos_sql})"
-        )
-        client.execute(update_sql, settings={"mutations_sync": 1})
+    version_date/version_id — ключи ORDER BY, SSoT sync их не меняет.
+    Новые partno сохраняют версию текущей загрузки.
+    """
+    if not existing_keys:
+        return df.copy()
+
+    keys_df = pd.DataFrame(existing_keys, columns=['partno', 'version_date', 'version_id'])
+    merged = df.merge(keys_df, on='partno', how='left', suffixes=('', '_existing'))
+    has_existing = merged['version_date_existing'].notna()
+    merged.loc[has_existing, 'version_date'] = merged.loc[has_existing, 'version_date_existing']
+    merged.loc[has_existing, 'version_id'] = merged.loc[has_existing, 'version_id_existing']
+    merged['version_id'] = merged['version_id'].astype('int64')
+    return merged[list(df.columns)]
 
-    return len(df)
+
+def _with_preserved_columns(client, df: pd.DataFrame, slice_where: str) -> pd.DataFrame:
+    """Колонки md_components вне Excel (br_mi8/br_mi17 и др.) сохраняют текущие значения.
+
+    Staging заменяет строки среза целиком — без переноса такие колонки обнулялись бы
+    (прежний ALTER UPDATE менял только колонки Excel). Новые partno получают NULL/DEFAULT.
+    """
+    from utils.dataframe_writer import get_table_schema
+
+    preserved = [name for name, _ in get_table_schema(client, 'md_components') if name not in df.columns]
+    if not preserved:
+        return df
+    rows = client.execute(f"SELECT partno, {', '.join(preserved)} FROM md_components WHERE {slice_where}")
+    if not rows:
+        return df
+    current = pd.DataFrame(rows, columns=['partno'] + preserved).drop_duplicates('partno', keep='last')
+    print(f"   🔒 Сохраняем колонки вне Excel: {', '.join(preserved)}")
+    return df.merge(current, on='partno', how='left')
 
 
 def insert_md_data(client, df):
     """Синхронизирует md_components с Excel SSoT.
 
     - Пустая таблица (после DROP): полный INSERT всех строк Excel.
-    - Иначе: INSERT только новых partno + UPDATE существующих из Excel.
+    - Иначе: новые partno добавляются, существующие получают значения из Excel.
+
+    Обе ветки выполняются одной атомарной заменой через staging (utils.staging_loader):
+    срез — строки с partno из Excel, строки прочих partno сохраняются. Колонки вне Excel
+    (br_mi8/br_mi17 из calculate_beyond_repair.py) переносятся в срез без изменений.
     """
     try:
         print("📚 Синхронизация md_components с Excel SSoT...")
+        from utils.staging_loader import load_version_slice
 
-        result = client.execute("SELECT DISTINCT partno FROM md_components WHERE partno IS NOT NULL")
-        existing_partnos = {row[0] for row in result}
+        existing_keys = client.execute(
+            "SELECT partno, version_date, version_id FROM md_components WHERE partno IS NOT NULL"
+        )
+        existing_partnos = {row[0] for row in existing_keys}
         print(f"   📋 В таблице уже есть {len(existing_partnos)} уникальных partno")
 
-        if not existing_partnos:
-            print(f"🚀 md_components пуста — полная загрузка {len(df):,} номенклатур из Excel SSoT")
-            inserted = _insert_rows(client, df)
-            print(f"✅ Загружено {inserted:,} записей в md_components")
-            return inserted
+        staged_df = _with_existing_version_keys(df, existing_keys)
 
-        df_new = df[~df['partno'].isin(existing_partnos)].copy()
-        df_existing = df[df['partno'].isin(existing_partnos)].copy()
+        partnos_sql = ", ".join(f"'{_escape_partno(partno)}'" for partno in df['partno'].dropna().unique())
+        slice_where = f"partno IN ({partnos_sql})" if partnos_sql else "0"
+        staged_df = _with_preserved_columns(client, staged_df, slice_where)
 
-        inserted = _insert_rows(client, df_new)
-        synced = _sync_ssot_rows(client, df_existing)
+        load_version_slice(
+            client, 'md_components',
+            lambda target_table: _insert_rows(client, staged_df, target_table),
+            slice_where=slice_where
+        )
 
+        inserted = int((~df['partno'].isin(existing_partnos)).sum())
         print(
-            f"✅ SSoT sync завершён: inserted={inserted:,}, updated={synced:,}, "
+            f"✅ SSoT sync завершён: inserted={inserted:,}, updated={len(df) - inserted:,}, "
             f"excel_total={len(df):,}"
         )
         return len(df)
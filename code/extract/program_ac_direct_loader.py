@@ -17,6 +17,11 @@ Program AC Direct Loader - Прямое создание тензора прог
 - Период: 4000 дней от базовой даты
 - Группировка: по ac_type_mask (типы ВС)
 
+ВЕКТОРНЫЙ ДВИЖОК (по умолчанию):
+- таблицы (год, месяц) → значение считаются один раз на поле и разворачиваются на календарь gather-ом;
+- ops_counter_total и trigger_program* считаются локально (np.diff), тензор пишется одним INSERT;
+- прежний путь с ALTER UPDATE постпроцессингом доступен через --legacy-engine.
+
 РЕЗУЛЬТАТ: таблица flight_program_ac
 
 Автор: AI Assistant
@@ -47,11 +52,22 @@ def round_half_up_nonneg(value: Any) -> int:
         return 0
     return int(math.floor(numeric + 0.5))
 
+
+def round_half_up_nonneg_array(values: Any) -> np.ndarray:
+    """Векторный аналог round_half_up_nonneg: half-up для неотрицательных, иначе 0."""
+    raw = np.asarray(values, dtype=object)
+    # None и нечисловые строки → NaN → 0, как в скалярной версии
+    arr = pd.to_numeric(raw.ravel(), errors='coerce').astype(np.float64).reshape(raw.shape)
+    valid = np.isfinite(arr) & (arr >= 0)
+    rounded = np.floor(np.where(valid, arr, 0.0) + 0.5)
+    return np.where(valid, rounded, 0.0).astype(np.int64)
+
 # Добавляем пути к utils и общему коду
 code_root = Path(__file__).resolve().parents[1]
 sys.path.append(str(code_root / 'utils'))
 sys.path.append(str(code_root))
 from config_loader import get_clickhouse_client
+from staging_loader import load_version_slice
 
 class ProgramHeliAnalyzer:
     """Анализирует структуру Excel файла Program_heli.xlsx"""
@@ -355,6 +371,52 @@ class ACTensorEngine:
             self.logger.error(f"❌ Ошибка поиска последнего известного значения: {e}")
             return 0.0
 
+    def calendar_to_arrays(self, calendar_data: List[Tuple[date, int, int, bool]]) -> Dict[str, np.ndarray]:
+        """Раскладывает календарь в массивы month/year/day для векторных gather-операций"""
+        months = np.fromiter((item[1] for item in calendar_data), dtype=np.int32, count=len(calendar_data))
+        years = np.fromiter((item[2] for item in calendar_data), dtype=np.int32, count=len(calendar_data))
+        days = np.fromiter((item[0].day for item in calendar_data), dtype=np.int32, count=len(calendar_data))
+        return {'month': months, 'year': years, 'day': days}
+
+    def build_month_value_table(self, month_keys: np.ndarray, column_data: Dict[str, float],
+                                distribution_type: str,
+                                year_mapping: Dict[str, Tuple[int, int]]) -> np.ndarray:
+        """
+        Таблица (год, месяц) → округлённое значение поля
+        
+        Считается один раз на уникальный месяц календаря (~132 месяца на 4000 дней)
+        теми же правилами, что и distribute_column_value, поэтому результат совпадает
+        с подневным расчётом.
+        month_keys: year * 12 + (month - 1)
+        """
+        if distribution_type == 'daily_equal':
+            lookup = self.find_last_known_column_value
+        elif distribution_type == 'last_day_only':
+            lookup = self.find_exact_column_value
+        else:
+            raise ValueError(f"Неизвестный тип распределения: {distribution_type}")
+        
+        raw_values = [
+            lookup(int(key % 12) + 1, int(key // 12), column_data, year_mapping)
+            for key in month_keys
+        ]
+        return round_half_up_nonneg_array(raw_values)
+
+    def expand_field(self, calendar_arrays: Dict[str, np.ndarray], column_data: Dict[str, float],
+                     distribution_type: str,
+                     year_mapping: Dict[str, Tuple[int, int]]) -> np.ndarray:
+        """Разворачивает таблицу (год, месяц) → значение на все дни календаря (gather по индексу месяца)"""
+        keys = calendar_arrays['year'] * 12 + (calendar_arrays['month'] - 1)
+        month_keys, inverse = np.unique(keys, return_inverse=True)
+        table = self.build_month_value_table(month_keys, column_data, distribution_type, year_mapping)
+        values = table[inverse]
+        
+        if distribution_type == 'last_day_only':
+            # new_counter: значение только на 15-е число месяца
+            values = np.where(calendar_arrays['day'] == 15, values, 0)
+        
+        return values
+
     def distribute_column_value(self, target_date: date, target_month: int, target_year: int, 
                                column_data: Dict[str, float], distribution_type: str, 
                                year_mapping: Dict[str, Tuple[int, int]]) -> float:
@@ -449,7 +511,10 @@ class ProgramACDirectLoader:
             return []
     
     def create_flight_program_ac_table(self, version_date: date) -> bool:
-        """Создание таблицы flight_program_ac (если не существует) и очистка данных для version_date"""
+        """Создание таблицы flight_program_ac (если не существует)
+        
+        Срез version_date не удаляется: он подменяется атомарно при вставке через staging.
+        """
         try:
             # Создаем таблицу если не существует (не удаляем!)
             create_table_sql = """
@@ -470,13 +535,7 @@ class ProgramACDirectLoader:
             """
             
             self.client.execute(create_table_sql)
-            
-            # Удаляем только записи с текущим version_date (rewrite policy)
-            delete_sql = f"ALTER TABLE flight_program_ac DELETE WHERE version_date = '{version_date}'"
-            self.client.execute(delete_sql)
-            # Ждём завершения мутации
-            self.client.execute("OPTIMIZE TABLE flight_program_ac FINAL")
-            self.logger.info(f"✅ Таблица flight_program_ac: удалены записи для version_date={version_date}")
+            self.logger.info(f"✅ Таблица flight_program_ac готова (срез version_date={version_date} заменится при вставке)")
             return True
             
         except Exception as e:
@@ -566,8 +625,8 @@ class ProgramACDirectLoader:
             self.logger.error(f"❌ Ошибка генерации тензора: {e}")
             raise
     
-    def insert_tensor_data(self, insert_data: List[List]) -> bool:
-        """Массовая вставка оптимизированного тензора в ClickHouse"""
+    def insert_tensor_data(self, insert_data: List[List], version_date: date) -> bool:
+        """Массовая вставка оптимизированного тензора в ClickHouse (атомарная замена среза version_date)"""
         try:
             self.logger.info(f"💾 Начинаем вставку {len(insert_data):,} записей в flat структуру...")
             
@@ -578,12 +637,16 @@ class ProgramACDirectLoader:
                 'trigger_program', 'version_date', 'version_id'
             ]
             
-            # Вставляем батчами
-            batch_size = 100000
-            for i in range(0, len(insert_data), batch_size):
-                batch = insert_data[i:i + batch_size]
-                self.client.execute('INSERT INTO flight_program_ac VALUES', batch)
-                self.logger.info(f"📦 Вставлено {i + len(batch):,} / {len(insert_data):,} записей")
+            def insert_into(target_table: str) -> int:
+                # Вставляем батчами
+                batch_size = 100000
+                for i in range(0, len(insert_data), batch_size):
+                    batch = insert_data[i:i + batch_size]
+                    self.client.execute(f'INSERT INTO {target_table} VALUES', batch)
+                    self.logger.info(f"📦 Вставлено {i + len(batch):,} / {len(insert_data):,} записей")
+                return len(insert_data)
+            
+            load_version_slice(self.client, 'flight_program_ac', insert_into, version_date=version_date)
             
             self.logger.info("✅ Оптимизированные данные успешно загружены в flight_program_ac")
             return True
@@ -592,6 +655,119 @@ class ProgramACDirectLoader:
             self.logger.error(f"❌ Ошибка вставки данных: {e}")
             return False
     
+    def get_status2_component_counts(self) -> Tuple[int, int]:
+        """Количество компонентов МИ-8 (group_by=1) и МИ-17 (group_by=2) в статусе 2 одним запросом"""
+        query = """
+        SELECT
+            countIf(hp.partseqno_i IN (SELECT partseqno_i FROM md_components WHERE group_by = 1)) AS mi8_count,
+            countIf(hp.partseqno_i IN (SELECT partseqno_i FROM md_components WHERE group_by = 2)) AS mi17_count
+        FROM heli_pandas hp
+        WHERE hp.status_id = 2
+        """
+        result = self.client.execute(query)
+        mi8_count, mi17_count = result[0]
+        self.logger.info(f"   Компонентов в статусе 2: МИ-8={mi8_count}, МИ-17={mi17_count}")
+        return int(mi8_count), int(mi17_count)
+    
+    def generate_tensor_columns(self, ops_data: List[Dict], new_data: List[Dict],
+                                tensor_engine: ACTensorEngine, calendar: List[Tuple],
+                                year_mapping: Dict[str, Tuple[int, int]],
+                                base_date: date, version_id: int = 1,
+                                status2_counts: Optional[Tuple[int, int]] = None) -> Dict[str, List]:
+        """
+        Векторная генерация готового тензора (колоночный формат)
+        
+        В отличие от generate_tensor_data сразу считает вычисляемые поля:
+        - ops_counter_total = ops_counter_mi8 + ops_counter_mi17;
+        - trigger_program_* = np.diff с нулём в начале (аналог lagInFrame(..., 1, 0));
+        - корректировку первого дня по компонентам в статусе 2
+          (аналог correct_first_trigger_values).
+        Поэтому постпроцессинг через ALTER UPDATE не нужен.
+        """
+        try:
+            self.logger.info("🔄 Векторная генерация тензора...")
+            
+            records_by_field = {record['field_name']: record for record in ops_data}
+            records_by_field.update({record['field_name']: record for record in new_data})
+            
+            calendar_arrays = tensor_engine.calendar_to_arrays(calendar)
+            days_count = len(calendar)
+            
+            def field_values(field_name: str) -> np.ndarray:
+                record = records_by_field.get(field_name)
+                if record is None:
+                    return np.zeros(days_count, dtype=np.int64)
+                return tensor_engine.expand_field(
+                    calendar_arrays, record['column_data'], record['distribution_type'], year_mapping
+                )
+            
+            ops_mi8 = field_values('ops_counter_mi8')
+            ops_mi17 = field_values('ops_counter_mi17')
+            new_mi17 = field_values('new_counter_mi17')
+            
+            # Приведение к типам колонок (с тем же переполнением, что и CAST в ClickHouse)
+            ops_mi8_u16 = ops_mi8.astype(np.uint16)
+            ops_mi17_u16 = ops_mi17.astype(np.uint16)
+            ops_total = (ops_mi8_u16.astype(np.int64) + ops_mi17_u16.astype(np.int64)).astype(np.uint16)
+            
+            trigger_mi8 = np.diff(ops_mi8_u16.astype(np.int64), prepend=0)
+            trigger_mi17 = np.diff(ops_mi17_u16.astype(np.int64), prepend=0)
+            
+            if status2_counts is not None and days_count > 0:
+                mi8_count, mi17_count = status2_counts
+                trigger_mi8[0] = mi8_count - int(ops_mi8_u16[0])
+                trigger_mi17[0] = mi17_count - int(ops_mi17_u16[0])
+                self.logger.info(f"   Корректировка первого дня: МИ-8={trigger_mi8[0]}, МИ-17={trigger_mi17[0]}")
+            
+            trigger_mi8_i8 = trigger_mi8.astype(np.int8)
+            trigger_mi17_i8 = trigger_mi17.astype(np.int8)
+            trigger_total = (trigger_mi8_i8.astype(np.int16) + trigger_mi17_i8.astype(np.int16)).astype(np.int8)
+            
+            columns = {
+                'dates': [item[0] for item in calendar],
+                'ops_counter_mi8': ops_mi8_u16.tolist(),
+                'ops_counter_mi17': ops_mi17_u16.tolist(),
+                'ops_counter_total': ops_total.tolist(),
+                'new_counter_mi17': new_mi17.astype(np.uint8).tolist(),
+                'trigger_program_mi8': trigger_mi8_i8.tolist(),
+                'trigger_program_mi17': trigger_mi17_i8.tolist(),
+                'trigger_program': trigger_total.tolist(),
+                'version_date': [base_date] * days_count,
+                'version_id': [version_id] * days_count,
+            }
+            
+            self.logger.info(f"✅ Сгенерировано {days_count:,} записей тензора "
+                             f"(ops_counter_total > 0: {int(np.count_nonzero(ops_total)):,})")
+            return columns
+            
+        except Exception as e:
+            self.logger.error(f"❌ Ошибка векторной генерации тензора: {e}")
+            raise
+    
+    def insert_tensor_columns(self, columns: Dict[str, List], version_date: date) -> bool:
+        """Вставка готового тензора одним колоночным INSERT (атомарная замена среза version_date)"""
+        try:
+            column_names = list(columns.keys())
+            rows_count = len(columns['dates'])
+            self.logger.info(f"💾 Колоночная вставка {rows_count:,} записей в flight_program_ac...")
+            
+            def insert_into(target_table: str) -> int:
+                self.client.execute(
+                    f"INSERT INTO {target_table} ({', '.join(column_names)}) VALUES",
+                    [columns[name] for name in column_names],
+                    columnar=True
+                )
+                return rows_count
+            
+            load_version_slice(self.client, 'flight_program_ac', insert_into, version_date=version_date)
+            
+            self.logger.info("✅ Тензор загружен в flight_program_ac")
+            return True
+            
+        except Exception as e:
+            self.logger.error(f"❌ Ошибка вставки данных: {e}")
+            return False
+    
     def validate_tensor(self) -> bool:
         """Валидация оптимизированного тензора flight_program_ac"""
         try:
@@ -902,8 +1078,14 @@ class ProgramACDirectLoader:
             return False
     
     def create_final_tensor(self, excel_path: str = None,
-                          version_date: Optional[date] = None, version_id: int = 1) -> bool:
-        """Главная функция создания финального тензора"""
+                          version_date: Optional[date] = None, version_id: int = 1,
+                          vectorized: bool = True) -> bool:
+        """
+        Главная функция создания финального тензора
+        
+        vectorized=True: векторный движок, вычисляемые поля считаются локально, один INSERT.
+        vectorized=False: прежний подневный расчёт + постпроцессинг через ALTER UPDATE.
+        """
         try:
             # Определяем путь к Excel
             if excel_path is None:
@@ -930,28 +1112,43 @@ class ProgramACDirectLoader:
             tensor_engine = ACTensorEngine(excel_data['year_mapping'])
             calendar = tensor_engine.generate_4000_day_calendar(version_date)
             
-            # 4. Создание таблицы (и очистка данных для текущей version_date)
+            # 4. Создание таблицы (срез version_date заменяется атомарно при вставке)
             if not self.create_flight_program_ac_table(version_date):
                 return False
             
-            # 5. Генерация данных тензора
-            insert_data = self.generate_tensor_data(
-                excel_data['ops_data'], excel_data['new_data'],
-                tensor_engine, calendar, excel_data['year_mapping'], 
-                version_date, version_id
-            )
-            
-            # 6. Вставка данных
-            if not self.insert_tensor_data(insert_data):
-                return False
-            
-            # 7. Постпроцессинг - добавление вычисляемых полей
-            if not self.add_calculated_fields(version_date):
-                self.logger.warning("⚠️ Ошибка постпроцессинга, но основные данные загружены")
-            
-            # 8. Корректировка первых значений trigger полей (ПОСЛЕ загрузки heli_pandas)
-            if not self.correct_first_trigger_values():
-                self.logger.warning("⚠️ Ошибка корректировки trigger полей, но основные данные загружены")
+            if vectorized:
+                # 5. Векторная генерация готового тензора (с вычисляемыми полями и корректировкой)
+                status2_counts = self.get_status2_component_counts()
+                columns = self.generate_tensor_columns(
+                    excel_data['ops_data'], excel_data['new_data'],
+                    tensor_engine, calendar, excel_data['year_mapping'],
+                    version_date, version_id, status2_counts
+                )
+                records_count = len(columns['dates'])
+                
+                # 6. Вставка одним INSERT, постпроцессинг не требуется
+                if not self.insert_tensor_columns(columns, version_date):
+                    return False
+            else:
+                # 5. Генерация данных тензора
+                insert_data = self.generate_tensor_data(
+                    excel_data['ops_data'], excel_data['new_data'],
+                    tensor_engine, calendar, excel_data['year_mapping'], 
+                    version_date, version_id
+                )
+                records_count = len(insert_data)
+                
+                # 6. Вставка данных
+                if not self.insert_tensor_data(insert_data, version_date):
+                    return False
+                
+                # 7. Постпроцессинг - добавление вычисляемых полей
+                if not self.add_calculated_fields(version_date):
+                    self.logger.warning("⚠️ Ошибка постпроцессинга, но основные данные загружены")
+                
+                # 8. Корректировка первых значений trigger полей (ПОСЛЕ загрузки heli_pandas)
+                if not self.correct_first_trigger_values():
+                    self.logger.warning("⚠️ Ошибка корректировки trigger полей, но основные данные загружены")
             
             # 9. Валидация
             validation_success = self.validate_tensor()
@@ -959,7 +1156,7 @@ class ProgramACDirectLoader:
             if validation_success:
                 self.logger.info("🎉 === ТЕНЗОР FLIGHT_PROGRAM_AC ГОТОВ ===")
                 self.logger.info(f"📅 Версия данных: {version_date} (version_id={version_id})")
-                self.logger.info(f"📊 Размер тензора: {len(insert_data):,} записей")
+                self.logger.info(f"📊 Размер тензора: {records_count:,} записей")
                 self.logger.info(f"🔥 Готов для использования!")
             else:
                 self.logger.warning("⚠️ Тензор создан, но есть проблемы с валидацией")
@@ -971,7 +1168,8 @@ class ProgramACDirectLoader:
             return False
 
 
-def main(version_date: Optional[str] = None, version_id: Optional[int] = None):
+def main(version_date: Optional[str] = None, version_id: Optional[int] = None,
+         legacy_engine: bool = False):
     """Главная функция с поддержкой версионирования"""
     print("🚀 === PROGRAM AC DIRECT LOADER ===")
     print("Прямое создание тензора flight_program_ac из Program_heli.xlsx")
@@ -1000,7 +1198,8 @@ def main(version_date: Optional[str] = None, version_id: Optional[int] = None):
     # Создание тензора
     success = loader.create_final_tensor(
         version_date=parsed_version_date,
-        version_id=parsed_version_id
+        version_id=parsed_version_id,
+        vectorized=not legacy_engine
     )
     
     if success:
@@ -1018,6 +1217,8 @@ if __name__ == "__main__":
     parser.add_argument('--version-date', type=str, help='Дата версии (YYYY-MM-DD)')
     parser.add_argument('--version-id', type=int, help='ID версии')
     parser.add_argument('--dataset-path', type=str, help='Путь к папке датасета (v_YYYY-MM-DD)')
+    parser.add_argument('--legacy-engine', action='store_true',
+                        help='Подневный расчёт + постпроцессинг через ALTER UPDATE (для сверки)')
     
     args = parser.parse_args()
     
@@ -1026,5 +1227,6 @@ if __name__ == "__main__":
         from utils.version_utils import set_dataset_path
         set_dataset_path(args.dataset_path)
     
-    success = main(version_date=args.version_date, version_id=args.version_id)
+    success = main(version_date=args.version_date, version_id=args.version_id,
+                   legacy_engine=args.legacy_engine)
     sys.exit(0 if success else 1) 
\ No newline at end of file
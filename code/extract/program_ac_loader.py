@@ -32,6 +32,8 @@ sys.path.append(str(code_root / 'utils'))
 sys.path.append(str(code_root))
 
 from config_loader import get_clickhouse_client
+from staging_loader import load_version_slice
+from dataframe_writer import insert_dataframe
 from excel_utils import clean_excel_data
 
 # Функция extract_version_date_from_excel удалена - используется общая utils.version_utils.extract_unified_version_date()
@@ -215,16 +217,14 @@ def check_version_conflicts(client, version_date, version_id):
             print(f"   Дата версии: {version_date}, version_id: {version_id}")
             print(f"   program_ac: {count:,} записей")
             print(f"\nВыберите действие:")
-            print(f"   1. ЗАМЕНИТЬ существующие данные (DELETE + INSERT)")
+            print(f"   1. ЗАМЕНИТЬ существующие данные (атомарная замена через staging)")
             print(f"   2. ОТМЕНИТЬ загрузку")
             
             while True:
                 try:
                     choice = input(f"\nВаш выбор (1-2): ").strip()
                     if choice == '1':
-                        print(f"🔄 Удаляем существующие данные за {version_date} v{version_id}...")
-                        client.execute(f"DELETE FROM program_ac WHERE version_date = '{version_date}' AND version_id = {version_id}")
-                        print(f"✅ Удалено {count:,} записей из program_ac")
+                        print(f"🔄 Данные за {version_date} v{version_id} будут заменены атомарно при вставке")
                         return True
                     elif choice == '2':
                         print(f"❌ Загрузка отменена пользователем")
@@ -247,38 +247,18 @@ def insert_program_ac_data(client, df):
     try:
         print(f"🚀 Загружаем {len(df):,} записей в program_ac...")
         
-        # Конвертируем в список кортежей с правильными типами
-        data_tuples = []
-        for _, row in df.iterrows():
-            # Ручная конвертация каждого значения в правильный Python тип
-            row_tuple = []
-            for i, (col_name, value) in enumerate(row.items()):
-                if col_name == 'ac_registr':
-                    # UInt32
-                    row_tuple.append(int(value) if pd.notna(value) else 0)
-                elif col_name in ['ac_typ', 'object_type', 'description', 'owner', 'operator', 
-                                'homebase', 'homebase_name', 'directorate']:
-                    # Строки
-                    row_tuple.append(str(value) if pd.notna(value) else '')
-                else:
-                    # Остальные (дата version_date)
-                    row_tuple.append(value)
-            
-            data_tuples.append(tuple(row_tuple))
-        
-        # Проверяем первый кортеж
-        if data_tuples:
-            sample = data_tuples[0]
-            print(f"🔍 Проверка типов в кортеже:")
-            print(f"   ac_registr: {sample[0]} ({type(sample[0])})")
-            print(f"   ac_typ: {sample[1]} ({type(sample[1])})")
-            print(f"   owner: {sample[4]} ({type(sample[4])})")
+        # Типы колонок приводятся по схеме program_ac (DESCRIBE TABLE, кэш на процесс)
+        def insert_into(target_table):
+            return insert_dataframe(client, df, target_table, schema_table='program_ac')['rows']
         
-        # Загружаем
-        client.execute('INSERT INTO program_ac VALUES', data_tuples)
+        # Загружаем через staging: срез (version_date, version_id) подменяется атомарно
+        loaded = load_version_slice(
+            client, 'program_ac', insert_into,
+            version_date=df['version_date'].iloc[0], version_id=int(df['version_id'].iloc[0])
+        )
         
-        print(f"✅ Загружено {len(data_tuples):,} записей в program_ac")
-        return len(data_tuples)
+        print(f"✅ Загружено {loaded:,} записей в program_ac")
+        return loaded
         
     except Exception as e:
         print(f"❌ Ошибка загрузки в program_ac: {e}")
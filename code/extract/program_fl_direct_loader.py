@@ -55,6 +55,7 @@ code_root = Path(__file__).resolve().parents[1]
 sys.path.append(str(code_root / 'utils'))
 sys.path.append(str(code_root))
 from config_loader import get_clickhouse_client
+from staging_loader import load_version_slice
 
 class ExcelStructureAnalyzer:
     """Анализирует новую структуру Excel файла Program.xlsx"""
@@ -301,7 +302,10 @@ class FlightProgramDirectLoader:
             return []
     
     def create_flight_program_fl_table(self, version_date: date) -> bool:
-        """Создание таблицы flight_program_fl (если не существует) и очистка данных для version_date"""
+        """Создание таблицы flight_program_fl (если не существует)
+        
+        Срез version_date не удаляется: он подменяется атомарно при вставке через staging.
+        """
         try:
             # Создаем таблицу если не существует (не удаляем!)
             create_table_sql = """
@@ -318,13 +322,7 @@ class FlightProgramDirectLoader:
             """
             
             self.client.execute(create_table_sql)
-            
-            # Удаляем только записи с текущим version_date (rewrite policy)
-            delete_sql = f"ALTER TABLE flight_program_fl DELETE WHERE version_date = '{version_date}'"
-            self.client.execute(delete_sql)
-            # Ждём завершения мутации
-            self.client.execute("OPTIMIZE TABLE flight_program_fl FINAL")
-            self.logger.info(f"✅ Таблица flight_program_fl: удалены записи для version_date={version_date}")
+            self.logger.info(f"✅ Таблица flight_program_fl готова (срез version_date={version_date} заменится при вставке)")
             return True
             
         except Exception as e:
@@ -498,8 +496,8 @@ class FlightProgramDirectLoader:
             self.logger.error(f"❌ Ошибка дополнения словаря новыми Ми‑17: {e}")
             return aircraft_list
     
-    def insert_tensor_data(self, insert_data: List[List]) -> bool:
-        """Массовая вставка тензора в ClickHouse"""
+    def insert_tensor_data(self, insert_data: List[List], version_date: date) -> bool:
+        """Массовая вставка тензора в ClickHouse (атомарная замена среза version_date)"""
         try:
             self.logger.info(f"💾 Начинаем вставку {len(insert_data):,} записей...")
             
@@ -508,12 +506,16 @@ class FlightProgramDirectLoader:
                 'ac_type_mask', 'version_date', 'version_id'
             ]
             
-            # Вставляем батчами для лучшей производительности  
-            batch_size = 100000
-            for i in range(0, len(insert_data), batch_size):
-                batch = insert_data[i:i + batch_size]
-                self.client.execute('INSERT INTO flight_program_fl VALUES', batch)
-                self.logger.info(f"📦 Вставлено {i + len(batch):,} / {len(insert_data):,} записей")
+            def insert_into(target_table: str) -> int:
+                # Вставляем батчами для лучшей производительности  
+                batch_size = 100000
+                for i in range(0, len(insert_data), batch_size):
+                    batch = insert_data[i:i + batch_size]
+                    self.client.execute(f'INSERT INTO {target_table} VALUES', batch)
+                    self.logger.info(f"📦 Вставлено {i + len(batch):,} / {len(insert_data):,} записей")
+                return len(insert_data)
+            
+            load_version_slice(self.client, 'flight_program_fl', insert_into, version_date=version_date)
             
             self.logger.info("✅ Данные успешно загружены в flight_program_fl")
             return True
@@ -681,7 +683,7 @@ class FlightProgramDirectLoader:
                 self.logger.error("❌ Нет данных о планерах")
                 return False
             
-            # 5. Создание таблицы (и очистка данных для текущей version_date)
+            # 5. Создание таблицы (срез version_date заменяется атомарно при вставке)
             if not self.create_flight_program_fl_table(version_date):
                 return False
             
@@ -692,7 +694,7 @@ class FlightProgramDirectLoader:
             )
             
             # 7. Вставка данных
-            if not self.insert_tensor_data(insert_data):
+            if not self.insert_tensor_data(insert_data, version_date):
                 return False
             
             # 8. Валидация
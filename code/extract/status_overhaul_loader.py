@@ -10,6 +10,9 @@ code_root = Path(__file__).resolve().parents[1]
 sys.path.append(str(code_root))
 sys.path.append(str(code_root / 'utils'))
 from utils.config_loader import get_clickhouse_client
+from utils.staging_loader import load_version_slice
+from utils.dataframe_writer import insert_dataframe
+from utils.date_parsing import parse_russian_date_columns
 
 # Функция extract_version_date_from_excel удалена - используется общая utils.version_utils.extract_unified_version_date()
 
@@ -87,52 +90,10 @@ def prepare_status_overhaul_data(df, version_date, version_id=1):
             # ac_registr - серийный номер ВС (UInt32)
             result_df['ac_registr'] = pd.to_numeric(result_df['ac_registr'], errors='coerce').fillna(0).astype('int64')
 
-        # Обработка дат для ClickHouse (надежный парсер для русских дат)
-        def parse_russian_date(date_str):
-            """Парсит русские даты формата '05.февр..2024'"""
-            if pd.isna(date_str) or date_str == '' or date_str == 'nan':
-                return None
-            
-            try:
-                date_str = str(date_str).strip()
-                # Словарь русских месяцев
-                month_mapping = {
-                    'янв': '01', 'февр': '02', 'мар': '03', 'апр': '04',
-                    'мая': '05', 'май': '05', 'июн': '06', 'июл': '07', 
-                    'авг': '08', 'сент': '09', 'окт': '10', 'нояб': '11', 'дек': '12'
-                }
-                
-                # Ищем паттерн: день.месяц..год
-                parts = date_str.split('.')
-                if len(parts) >= 3:
-                    day = parts[0].zfill(2)
-                    month_ru = parts[1].lower().rstrip('.')
-                    year = parts[-1]
-                    
-                    # Находим соответствие месяца
-                    month_num = None
-                    for ru_month, num in month_mapping.items():
-                        if month_ru.startswith(ru_month):
-                            month_num = num
-                            break
-                    
-                    if month_num:
-                        # Формируем ISO дату и парсим
-                        iso_date = f'{year}-{month_num}-{day}'
-                        return pd.to_datetime(iso_date).date()
-                
-                # Если не удалось, пробуем стандартный парсер
-                return pd.to_datetime(date_str, errors='coerce').date()
-                
-            except:
-                return None
-        
+        # Обработка дат для ClickHouse: векторный парсер русских дат ('05.февр..2024')
         date_columns = ['sched_start_date', 'sched_end_date', 'act_start_date', 'act_end_date']
-        for col in date_columns:
-            if col in result_df.columns:
-                print(f"   Обрабатываем даты в колонке {col}...")
-                # Применяем парсер к каждой дате
-                result_df[col] = result_df[col].apply(parse_russian_date)
+        print(f"   Обрабатываем даты в колонках {', '.join(c for c in date_columns if c in result_df.columns)}...")
+        parse_russian_date_columns(result_df, date_columns)
 
         # Специальная обработка version_date
         if 'version_date' in result_df.columns:
@@ -211,16 +172,14 @@ def check_version_conflicts(client, version_date, version_id):
             print(f"   Дата версии: {version_date}, version_id: {version_id}")
             print(f"   status_overhaul: {count:,} записей")
             print(f"\nВыберите действие:")
-            print(f"   1. ЗАМЕНИТЬ существующие данные (DELETE + INSERT)")
+            print(f"   1. ЗАМЕНИТЬ существующие данные (атомарная замена через staging)")
             print(f"   2. ОТМЕНИТЬ загрузку")
             
             while True:
                 try:
                     choice = input(f"\nВаш выбор (1-2): ").strip()
                     if choice == '1':
-                        print(f"🔄 Удаляем существующие данные за {version_date} v{version_id}...")
-                        client.execute(f"DELETE FROM status_overhaul WHERE version_date = '{version_date}' AND version_id = {version_id}")
-                        print(f"✅ Удалено {count:,} записей из status_overhaul")
+                        print(f"🔄 Данные за {version_date} v{version_id} будут заменены атомарно при вставке")
                         return True
                     elif choice == '2':
                         print(f"❌ Загрузка отменена пользователем")
@@ -243,40 +202,18 @@ def insert_status_overhaul_data(client, df):
     try:
         print(f"🚀 Загружаем {len(df):,} записей в status_overhaul...")
         
-        # Конвертируем в список кортежей с правильными типами
-        data_tuples = []
-        for _, row in df.iterrows():
-            # Ручная конвертация каждого значения в правильный Python тип
-            row_tuple = []
-            for i, (col_name, value) in enumerate(row.items()):
-                if col_name == 'ac_registr':
-                    # UInt32
-                    row_tuple.append(int(value) if pd.notna(value) else 0)
-                elif col_name in ['ac_typ', 'wpno', 'description', 'status', 'owner', 'operator']:
-                    # Строки
-                    row_tuple.append(str(value) if pd.notna(value) else '')
-                elif col_name in ['sched_start_date', 'sched_end_date', 'act_start_date', 'act_end_date']:
-                    # Nullable Date
-                    row_tuple.append(value if value is not None else None)
-                else:
-                    # Остальные (даты и т.д.)
-                    row_tuple.append(value)
-            
-            data_tuples.append(tuple(row_tuple))
-        
-        # Проверяем первый кортеж
-        if data_tuples:
-            sample = data_tuples[0]
-            print(f"🔍 Проверка типов в кортеже:")
-            print(f"   ac_registr: {sample[0]} ({type(sample[0])})")
-            print(f"   ac_typ: {sample[1]} ({type(sample[1])})")
-            print(f"   sched_start_date: {sample[4]} ({type(sample[4])})")
+        # Типы колонок приводятся по схеме status_overhaul (DESCRIBE TABLE, кэш на процесс)
+        def insert_into(target_table):
+            return insert_dataframe(client, df, target_table, schema_table='status_overhaul')['rows']
         
-        # Загружаем
-        client.execute('INSERT INTO status_overhaul VALUES', data_tuples)
+        # Загружаем через staging: срез (version_date, version_id) подменяется атомарно
+        loaded = load_version_slice(
+            client, 'status_overhaul', insert_into,
+            version_date=df['version_date'].iloc[0], version_id=int(df['version_id'].iloc[0])
+        )
         
-        print(f"✅ Загружено {len(data_tuples):,} записей в status_overhaul")
-        return len(data_tuples)
+        print(f"✅ Загружено {loaded:,} записей в status_overhaul")
+        return loaded
         
     except Exception as e:
         print(f"❌ Ошибка загрузки в status_overhaul: {e}")
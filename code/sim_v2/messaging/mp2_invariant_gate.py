@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+MP2 Invariant Gate — проверка дешёвых инвариантов на host-массивах MP2 до INSERT.
+
+После HF_MP2_Drain (и постпроцессинга промоутов) поля MP2 уже лежат в NumPy-массивах
+(num_steps × num_agents), поэтому построчные инварианты считаются векторно, без
+INSERT в sim_masterv2_v9, витрины daily и отдельного прогона валидаторов:
+
+- INV-1:  sne <= ll
+- INV-12: ppr <= oh
+- INV-10 (переходы): (pre_status_id, status_id) из разрешённого набора
+- Один переход за шаг: pre_status_id[s] == status_id[s-1]
+  (иначе за шаг произошло больше одного перехода, и баланс INV-10 не сойдётся)
+
+Учитываются строки, которые попадут в таблицу: status_id != 0, group_by IN (1, 2) —
+те же фильтры, что у SQL-валидаторов. Балансовые и агрегатные проверки
+(INV-2, INV-3, INV-10 balance, INV-11) остаются за валидаторами.
+
+Режимы (--invariant-gate): off | warn (отчёт, INSERT выполняется) |
+abort (отчёт, при нарушениях INSERT отменяется, RuntimeError).
+"""
+
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+import numpy as np
+
+GATE_MODES = ('off', 'warn', 'abort')
+
+# Переходы, разрешённые INV-10 (pre_status_id, status_id) — как в code/validation/slice_engine.py
+ALLOWED_TRANSITIONS = {
+    (0, 2), (0, 3), (1, 2), (1, 4), (2, 3), (2, 6),
+    (2, 7), (3, 2), (4, 2), (4, 3), (7, 2), (7, 4),
+}
+SAMPLE_LIMIT = 5
+
+
+@dataclass
+class GateReport:
+    """Результат гейта: число нарушений и примеры по каждой проверке"""
+    rows: int = 0
+    elapsed: float = 0.0
+    violations: Dict[str, int] = field(default_factory=dict)
+    samples: Dict[str, List[str]] = field(default_factory=dict)
+
+    @property
+    def passed(self) -> bool:
+        return not any(self.violations.values())
+
+    def lines(self) -> List[str]:
+        status = 'PASS' if self.passed else 'FAIL'
+        lines = [f"🛡️ MP2 invariant gate: {status} (строк={self.rows:,}, {self.elapsed:.2f}с)"]
+        for name, count in self.violations.items():
+            mark = '✅' if count == 0 else '❌'
+            lines.append(f"   {mark} {name}: violations={count}")
+            lines.extend(f"      {sample}" for sample in self.samples.get(name, []))
+        return lines
+
+    def print(self) -> None:
+        for line in self.lines():
+            print(line)
+
+
+def _allowed_lut() -> np.ndarray:
+    lut = np.zeros((256, 256), dtype=bool)
+    for pre, status in ALLOWED_TRANSITIONS:
+        lut[pre, status] = True
+    return lut
+
+
+def _collect(report: GateReport, name: str, mask: np.ndarray, describe) -> None:
+    """Число нарушений и первые SAMPLE_LIMIT примеров (по шагам, затем агентам)"""
+    report.violations[name] = int(mask.sum())
+    steps, agents = np.nonzero(mask)
+    report.samples[name] = [
+        describe(int(s), int(a)) for s, a in zip(steps[:SAMPLE_LIMIT], agents[:SAMPLE_LIMIT])
+    ]
+
+
+def evaluate_mp2_invariants(fields: Dict[str, np.ndarray], days, num_steps: int, num_agents: int) -> GateReport:
+    """
+    Векторная проверка INV-1 / INV-12 / переходов INV-10 / одного перехода за шаг
+
+    Args:
+        fields: Поля MP2 (dynamic: (steps, agents), static: (agents,)) после постпроцессинга
+        days: day_u16 для каждого шага
+        num_steps: Число шагов
+        num_agents: Число экспортируемых агентов
+    """
+    t0 = time.perf_counter()
+
+    def dyn(name):
+        return fields[name][:num_steps, :num_agents]
+
+    def static(name):
+        return fields[name][:num_agents]
+
+    status = dyn('mp2_status_id') & 0xFF
+    pre_status = dyn('mp2_pre_status_id') & 0xFF
+    sne, ppr = dyn('mp2_sne'), dyn('mp2_ppr')
+    ll, oh = static('mp2_ll'), static('mp2_oh')
+    acn = static('mp2_aircraft_number')
+    day_arr = np.asarray(days[:num_steps], dtype=np.int64)
+
+    live = (status != 0) & np.isin(static('mp2_group_by') & 0xFF, (1, 2))[None, :]
+    report = GateReport(rows=int(live.sum()))
+
+    _collect(report, 'INV-1 sne<=ll', live & (sne > ll[None, :]), lambda s, a: (
+        f"acn={acn[a]}, day={day_arr[s]}, sne={sne[s, a]}, ll={ll[a]}"))
+    _collect(report, 'INV-12 ppr<=oh', live & (ppr > oh[None, :]), lambda s, a: (
+        f"acn={acn[a]}, day={day_arr[s]}, ppr={ppr[s, a]}, oh={oh[a]}"))
+
+    illegal = live & (pre_status != status) & ~_allowed_lut()[pre_status, status]
+    _collect(report, 'INV-10 transitions', illegal, lambda s, a: (
+        f"acn={acn[a]}, day={day_arr[s]}, {pre_status[s, a]}->{status[s, a]}"))
+
+    # Шаг 0 не с чем сравнивать; пустой слот до spawn имеет status 0 и сверяется с pre=0
+    chain = np.zeros_like(live)
+    chain[1:] = live[1:] & (pre_status[1:] != status[:-1])
+    _collect(report, 'single transition per step', chain, lambda s, a: (
+        f"acn={acn[a]}, day={day_arr[s]}, prev_status={status[s - 1, a]}, "
+        f"pre_status={pre_status[s, a]}, status={status[s, a]}"))
+
+    report.elapsed = time.perf_counter() - t0
+    return report
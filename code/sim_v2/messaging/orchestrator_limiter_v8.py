@@ -340,6 +340,7 @@ import rtc_limiter_v8            # V8: deterministic_dates!
 import rtc_mp2_export
 import rtc_repairline_export
 import sim_daily_materializer
+import mp2_invariant_gate
 from components.agent_population import AgentPopulationBuilder
 from model_build import REPAIR_LINES_MAX
 
@@ -358,11 +359,14 @@ class LimiterV8Orchestrator:
     """
     
     def __init__(self, version_date: str, end_day: int = 3650,
-                 enable_mp2: bool = False, clickhouse_client=None):
+                 enable_mp2: bool = False, clickhouse_client=None,
+                 invariant_gate: str = 'off'):
         self.version_date = version_date
         self.end_day = end_day
         self.enable_mp2 = enable_mp2
         self.clickhouse_client = clickhouse_client
+        # Гейт инвариантов на MP2 до INSERT: off | warn | abort
+        self.invariant_gate = invariant_gate
         
         self.model = None
         self.simulation = None
@@ -844,6 +848,19 @@ class LimiterV8Orchestrator:
         if pp_count > 0:
             print(f"   📦 Постпроцессинг: {pp_count} записей модифицировано ({pp_time:.2f}с)")
         
+        # Гейт инвариантов: INV-1/INV-12/переходы проверяются на MP2 до INSERT
+        if self.invariant_gate != 'off':
+            gate_report = mp2_invariant_gate.evaluate_mp2_invariants(
+                fields, days, num_steps, total_export_agents
+            )
+            gate_report.print()
+            if not gate_report.passed and self.invariant_gate == 'abort':
+                self._print_final_stats()
+                raise RuntimeError(
+                    f"MP2 invariant gate: нарушения инвариантов ({version_date_int}, {version_id}), "
+                    f"INSERT в sim_masterv2_v9 отменён"
+                )
+        
         # Построение колонок для INSERT
         t_build = time.perf_counter()
         columns = [
@@ -1643,6 +1660,9 @@ def main():
     parser.add_argument("--end-day", type=int, default=3650, help="Последний день симуляции")
     parser.add_argument("--max-steps", type=int, default=10000, help="Максимум шагов")
     parser.add_argument("--drop-table", action="store_true", help="Пересоздать таблицу")
+    parser.add_argument("--invariant-gate", choices=mp2_invariant_gate.GATE_MODES, default="off",
+                        help="Проверка INV-1/INV-12/переходов на MP2 до INSERT: "
+                             "warn — отчёт, abort — отчёт и отмена INSERT при нарушениях")
     
     args = parser.parse_args()
 
@@ -1774,7 +1794,8 @@ Run simulation requires Agent KG traceability. Options:
         args.version_date, 
         args.end_day,
         enable_mp2=True,
-        clickhouse_client=client
+        clickhouse_client=client,
+        invariant_gate=args.invariant_gate
     )
     orchestrator.prepare_data()
     orchestrator.build_model()
@@ -6,13 +6,25 @@
   --scope etl (по умолчанию) — только конвейер экстракта и словари (см. ETL_SNAPSHOT_TABLES).
   --scope all        — все MergeTree-таблицы в рабочей базе (может быть очень долго и тяжело).
 
-Структура: CREATE TABLE backup_db.t AS source_db.t, затем INSERT SELECT.
+Структура: CREATE TABLE backup_db.t AS source_db.t, затем по партициям источника:
+  --mode fast (по умолчанию) — ALTER TABLE backup_db.t ATTACH PARTITION ID … FROM source_db.t
+                 (жёсткие ссылки на парты, без перечитывания и пересжатия); проверка —
+                 суммы rows активных партов в system.parts;
+  --mode copy  — INSERT … SELECT по партиции с проверкой count() (прежнее поведение; также
+                 fallback, если структура/движок существующей таблицы снимка отличается).
+
+Таблицы обрабатываются параллельно (--workers). Инкрементальный снимок в существующую БД:
+--tables (подмножество) и/или --since-version YYYY-MM-DD (только партиции с max_date >= даты;
+таблицы без version_date в ключе партиционирования копируются целиком). Партиции, уже
+присутствующие в снимке, заменяются (REPLACE PARTITION / DROP + INSERT).
 
 Примеры:
   python code/utils/backup_clickhouse_etl_snapshot.py --dry-run
   python code/utils/backup_clickhouse_etl_snapshot.py --execute
   python code/utils/backup_clickhouse_etl_snapshot.py --execute --suffix 2026_04_12_pre_extract
-  python code/utils/backup_clickhouse_etl_snapshot.py --execute --scope all
+  python code/utils/backup_clickhouse_etl_snapshot.py --execute --scope all --workers 8
+  python code/utils/backup_clickhouse_etl_snapshot.py --execute --suffix 2026_04_12_pre_extract \\
+      --since-version 2026-04-01 --tables heli_pandas,heli_raw
 """
 
 from __future__ import annotations
@@ -20,8 +32,13 @@ from __future__ import annotations
 import argparse
 import re
 import sys
-from datetime import date
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date, datetime
 from pathlib import Path
+from typing import Optional
 
 code_root = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(code_root / "utils"))
@@ -31,6 +48,8 @@ from config_loader import get_clickhouse_client, load_clickhouse_config  # noqa:
 
 _SAFE_SUFFIX = re.compile(r"^[a-zA-Z0-9_]+$")
 
+DEFAULT_WORKERS = 4
+
 # Снимок для сравнения после экстракта (без sim_*, Olap*, тестовых бэкапов таблиц)
 ETL_SNAPSHOT_TABLES = [
     "heli_pandas",
@@ -49,6 +68,30 @@ ETL_SNAPSHOT_TABLES = [
     "dict_status_flat",
 ]
 
+_local = threading.local()
+
+
+@dataclass
+class TableTask:
+    """Что копировать из таблицы: партиции источника и строки по system.parts"""
+
+    table: str
+    partitions: dict[str, int] = field(default_factory=dict)  # partition_id -> rows
+    bytes_on_disk: int = 0
+
+    @property
+    def rows(self) -> int:
+        return sum(self.partitions.values())
+
+
+@dataclass
+class TableResult:
+    table: str
+    rows: int = 0
+    method: str = ""
+    elapsed: float = 0.0
+    error: Optional[str] = None
+
 
 def parse_args() -> argparse.Namespace:
     p = argparse.ArgumentParser(
@@ -81,6 +124,30 @@ def parse_args() -> argparse.Namespace:
         default="etl",
         help="etl: только таблицы конвейера экстракта; all: все MergeTree в базе",
     )
+    p.add_argument(
+        "--mode",
+        choices=("fast", "copy"),
+        default="fast",
+        help="fast: ATTACH PARTITION FROM (жёсткие ссылки); copy: INSERT SELECT",
+    )
+    p.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f"Параллельных таблиц (по умолчанию {DEFAULT_WORKERS})",
+    )
+    p.add_argument(
+        "--tables",
+        type=str,
+        default=None,
+        help="Только эти таблицы (через запятую)",
+    )
+    p.add_argument(
+        "--since-version",
+        type=str,
+        default=None,
+        help="YYYY-MM-DD: только партиции с version_date >= даты (инкрементальный снимок)",
+    )
     return p.parse_args()
 
 
@@ -97,11 +164,120 @@ def list_merge_tree_tables(client, database: str) -> list[str]:
     return [r[0] for r in rows]
 
 
-def table_row_count(client, database: str, table: str) -> int:
-    r = client.execute(f"SELECT count() FROM `{database}`.`{table}`")
+def table_row_count(client, database: str, table: str, partitions: Optional[list[str]] = None) -> int:
+    where = ""
+    if partitions is not None:
+        if not partitions:
+            return 0
+        where = " WHERE _partition_id IN (" + ", ".join(f"'{pid}'" for pid in partitions) + ")"
+    r = client.execute(f"SELECT count() FROM `{database}`.`{table}`{where}")
     return int(r[0][0])
 
 
+def parts_row_count(client, database: str, table: str, partitions: list[str]) -> int:
+    """Строки активных партов (system.parts) без сканирования данных"""
+    if not partitions:
+        return 0
+    r = client.execute(
+        """
+        SELECT sum(rows) FROM system.parts
+        WHERE database = %(db)s AND table = %(t)s AND active AND has(%(p)s, partition_id)
+        """,
+        {"db": database, "t": table, "p": partitions},
+    )
+    return int(r[0][0] or 0)
+
+
+def table_signature(client, database: str, table: str) -> Optional[tuple]:
+    """(engine_full, [(column, type)]) — для проверки совместимости ATTACH PARTITION FROM"""
+    eng = client.execute(
+        "SELECT engine_full FROM system.tables WHERE database = %(db)s AND name = %(n)s",
+        {"db": database, "n": table},
+    )
+    if not eng:
+        return None
+    cols = client.execute(
+        """
+        SELECT name, type FROM system.columns
+        WHERE database = %(db)s AND table = %(n)s
+        ORDER BY position
+        """,
+        {"db": database, "n": table},
+    )
+    return eng[0][0], [tuple(c) for c in cols]
+
+
+def plan_tasks(client, database: str, tables: list[str], since: Optional[date]) -> dict[str, TableTask]:
+    """Партиции к копированию по активным партам источника — один запрос на все таблицы"""
+    rows = client.execute(
+        """
+        SELECT p.table, p.partition_id, sum(p.rows), sum(p.bytes_on_disk),
+               max(p.max_date), any(position(t.partition_key, 'version_date') > 0)
+        FROM system.parts AS p
+        INNER JOIN system.tables AS t ON t.database = p.database AND t.name = p.table
+        WHERE p.database = %(db)s AND p.active AND has(%(tables)s, p.table)
+        GROUP BY p.table, p.partition_id
+        """,
+        {"db": database, "tables": tables},
+    )
+    tasks = {t: TableTask(table=t) for t in tables}
+    for table, pid, n, nbytes, max_date, by_version_date in rows:
+        if since is not None and by_version_date and max_date < since:
+            continue
+        tasks[table].partitions[pid] = int(n)
+        tasks[table].bytes_on_disk += int(nbytes)
+    return tasks
+
+
+def _thread_client():
+    """Клиент ClickHouse текущего потока (clickhouse_driver.Client не потокобезопасен)"""
+    if getattr(_local, "client", None) is None:
+        _local.client = get_clickhouse_client()
+        # Долгие INSERT SELECT / ATTACH
+        _local.client.execute("SET max_execution_time = 0")
+    return _local.client
+
+
+def snapshot_table(task: TableTask, src_db: str, backup_db: str, mode: str) -> TableResult:
+    """Копирует партиции задачи в снимок и сверяет строки; выполняется в пуле потоков"""
+    started = time.time()
+    result = TableResult(table=task.table)
+    client = _thread_client()
+    src = f"`{src_db}`.`{task.table}`"
+    dst = f"`{backup_db}`.`{task.table}`"
+    pids = sorted(task.partitions)
+    try:
+        dst_signature = table_signature(client, backup_db, task.table)
+        created = dst_signature is None
+        if created:
+            client.execute(f"CREATE TABLE {dst} AS {src}")
+        compatible = created or dst_signature == table_signature(client, src_db, task.table)
+
+        if mode == "fast" and compatible:
+            result.method = "ATTACH" if created else "REPLACE"
+            for pid in pids:
+                client.execute(f"ALTER TABLE {dst} {result.method} PARTITION ID '{pid}' FROM {src}")
+            result.rows = parts_row_count(client, backup_db, task.table, pids)
+            expected = parts_row_count(client, src_db, task.table, pids)
+        else:
+            if mode == "fast":
+                print(f"⚠️ {task.table}: структура снимка отличается от источника — INSERT SELECT")
+            result.method = "INSERT"
+            for pid in pids:
+                if not created:
+                    client.execute(f"ALTER TABLE {dst} DROP PARTITION ID '{pid}'")
+                client.execute(f"INSERT INTO {dst} SELECT * FROM {src} WHERE _partition_id = '{pid}'")
+            result.rows = table_row_count(client, backup_db, task.table, pids)
+            expected = table_row_count(client, src_db, task.table, pids)
+
+        if result.rows != expected:
+            result.error = f"ожидалось {expected}, в снимке {result.rows}"
+    except Exception as e:
+        result.error = str(e)
+    result.elapsed = time.time() - started
+    return result
+
+
 def main() -> int:
     args = parse_args()
     if args.execute and args.dry_run:
@@ -122,34 +298,36 @@ def main() -> int:
 
     client = get_clickhouse_client()
 
+    since: Optional[date] = None
+    if args.since_version:
+        since = datetime.strptime(args.since_version, "%Y-%m-%d").date()
+    only = {t.strip() for t in args.tables.split(",") if t.strip()} if args.tables else None
+
     if args.scope == "all":
         tables = list_merge_tree_tables(client, src_db)
     else:
+        engines = dict(
+            client.execute(
+                "SELECT name, engine FROM system.tables WHERE database = %(db)s AND has(%(names)s, name)",
+                {"db": src_db, "names": ETL_SNAPSHOT_TABLES},
+            )
+        )
         tables = []
         missing: list[str] = []
         for name in ETL_SNAPSHOT_TABLES:
-            ex = int(
-                client.execute(
-                    "SELECT count() FROM system.tables WHERE database = %(db)s AND name = %(n)s",
-                    {"db": src_db, "n": name},
-                )[0][0]
-            )
-            if ex:
-                eng = client.execute(
-                    """
-                    SELECT engine FROM system.tables
-                    WHERE database = %(db)s AND name = %(n)s
-                    """,
-                    {"db": src_db, "n": name},
-                )[0][0]
-                if "MergeTree" not in eng:
-                    print(f"⚠️ {name}: движок {eng!r} — пропуск (не MergeTree)")
-                    continue
-                tables.append(name)
-            else:
+            if name not in engines:
                 missing.append(name)
+            elif "MergeTree" not in engines[name]:
+                print(f"⚠️ {name}: движок {engines[name]!r} — пропуск (не MergeTree)")
+            else:
+                tables.append(name)
         if missing:
             print(f"ℹ️ Нет в базе (пропуск): {', '.join(missing)}")
+    if only is not None:
+        unknown = sorted(only - set(tables))
+        if unknown:
+            print(f"⚠️ --tables: нет среди MergeTree-таблиц области {args.scope!r}: {', '.join(unknown)}")
+        tables = [t for t in tables if t in only]
     if not tables:
         print(f"⚠️ Нечего копировать в режиме {args.scope!r}")
         return 1
@@ -160,55 +338,55 @@ def main() -> int:
             {"n": backup_db},
         )[0][0]
     )
+    incremental = since is not None or only is not None
 
     print(f"📂 Источник: {src_db}")
     print(f"📂 Снимок:   {backup_db}")
-    print(f"📋 Таблиц:   {len(tables)}")
+    print(f"📋 Таблиц:   {len(tables)} (режим {args.mode}, workers={args.workers})")
+    if since is not None:
+        print(f"📅 Только партиции с version_date >= {since}")
 
-    total_rows = 0
-    counts: list[tuple[str, int]] = []
-    for t in tables:
-        n = table_row_count(client, src_db, t)
-        counts.append((t, n))
-        total_rows += n
+    tasks = plan_tasks(client, src_db, tables, since)
+    total_rows = sum(task.rows for task in tasks.values())
+    total_bytes = sum(task.bytes_on_disk for task in tasks.values())
 
-    for t, n in counts:
-        print(f"   {t}: {n:,} строк")
-    print(f"📊 Всего строк (оценка): {total_rows:,}")
+    for t in tables:
+        task = tasks[t]
+        print(f"   {t}: {task.rows:,} строк, партиций {len(task.partitions)}, {task.bytes_on_disk / 1024 ** 2:,.1f} MiB")
+    print(f"📊 Всего строк (по system.parts): {total_rows:,}, {total_bytes / 1024 ** 2:,.1f} MiB")
 
     if args.dry_run:
         print("📝 DRY-RUN: копирование не выполнялось")
         return 0
 
-    if exists and not args.replace:
+    if exists and not args.replace and not incremental:
         print(
             f"❌ База {backup_db!r} уже существует. "
-            f"Удалите вручную или запустите с --replace"
+            f"Удалите вручную, запустите с --replace или инкрементально (--tables / --since-version)"
         )
         return 3
 
-    # Долгие INSERT SELECT
-    client.execute("SET max_execution_time = 0")
-
     if exists and args.replace:
         client.execute(f"DROP DATABASE IF EXISTS `{backup_db}` SYNC")
 
     client.execute(f"CREATE DATABASE IF NOT EXISTS `{backup_db}`")
 
-    for i, t in enumerate(tables, 1):
-        n = dict(counts)[t]
-        print(f"⏳ [{i}/{len(tables)}] {t} ({n:,} строк) …")
-        client.execute(f"CREATE TABLE `{backup_db}`.`{t}` AS `{src_db}`.`{t}`")
-        client.execute(
-            f"INSERT INTO `{backup_db}`.`{t}` SELECT * FROM `{src_db}`.`{t}`"
-        )
-        got = table_row_count(client, backup_db, t)
-        if got != n:
-            print(f"❌ {t}: ожидалось {n}, в снимке {got}")
-            return 4
-        print(f"   ✅ {t}: {got:,}")
-
-    print(f"✅ Снимок готов: `{backup_db}` (строк: {total_rows:,})")
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        results = list(pool.map(lambda t: snapshot_table(tasks[t], src_db, backup_db, args.mode), tables))
+
+    failed = 0
+    for r in results:
+        if r.error:
+            failed += 1
+            print(f"❌ {r.table}: {r.error}")
+        else:
+            print(f"   ✅ {r.table}: {r.rows:,} ({r.method}, {r.elapsed:.1f}с)")
+    if failed:
+        print(f"❌ Ошибок: {failed} из {len(results)} таблиц")
+        return 4
+
+    print(f"✅ Снимок готов: `{backup_db}` (строк: {total_rows:,}, {time.time() - started:.1f}с)")
     return 0
 
 
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+ClickHouse Session - общая фабрика клиентов clickhouse_driver с метками и статистикой
+
+Одна точка создания native-клиентов для ETL (config_loader.get_clickhouse_client),
+симуляции (sim_env_setup.get_client) и валидации (code/validation/ch_client.py):
+- клиент кэшируется на (процесс, поток, параметры подключения) — повторные
+  get_client() не перечитывают YAML-подключение и не открывают новое соединение;
+- сжатие native-протокола LZ4, если установлен clickhouse-driver[lz4]
+  (settings.compression в database_config.yaml переопределяет, false — выключить);
+- размеры блоков (max_block_size / insert_block_size) из settings конфига;
+- каждый запрос помечается модулем-вызывателем: query_id '<модуль>-<uuid>',
+  log_comment = CH_LOG_COMMENT (метка шага etl_profiler) или имя модуля;
+- по каждому запросу копятся время, прочитанные строки/байты, записанные строки
+  (progress/profile_info драйвера) — сводка по модулям печатается при выходе.
+
+Сводка при выходе (stderr) включается переменной окружения CH_SESSION_SUMMARY:
+    CH_SESSION_SUMMARY=1          — время, строки, байты по модулям
+    CH_SESSION_SUMMARY=query_log  — плюс пиковая память запросов из system.query_log
+CH_SESSION_STATS_FILE=<путь> — при выходе записать статистику и query_id процесса в JSON
+(профиль прогона валидаторов, code/validation/run_profiler.py).
+
+Использование:
+    from ch_session import get_session_client
+    client = get_session_client()              # параметры из config/database_config.yaml
+    client.execute("SELECT 1")
+"""
+
+import atexit
+import importlib.util
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+SUMMARY_ENV = 'CH_SESSION_SUMMARY'
+STATS_FILE_ENV = 'CH_SESSION_STATS_FILE'
+LOG_COMMENT_ENV = 'CH_LOG_COMMENT'
+CONFIG_PATH = Path(__file__).resolve().parents[2] / 'config' / 'database_config.yaml'
+
+# Клиентские/серверные настройки из settings конфига, которые передаются драйверу
+PASSTHROUGH_SETTINGS = ('max_threads', 'max_block_size', 'insert_block_size')
+
+_CLIENTS: Dict[Tuple, 'SessionClient'] = {}
+_CLIENTS_LOCK = threading.Lock()
+_STATS: Dict[str, Dict[str, float]] = {}
+_QUERY_IDS: List[Tuple[str, str]] = []
+_STATS_LOCK = threading.Lock()
+_SUMMARY_REGISTERED = False
+# Не больше стольких query_id для сводки памяти по system.query_log
+MAX_TRACKED_QUERY_IDS = 20000
+
+
+def load_connection_params(config_path: Path = CONFIG_PATH) -> Dict[str, Any]:
+    """Параметры подключения из database_config.yaml + CLICKHOUSE_* env, без вывода в stdout"""
+    import yaml
+
+    with open(config_path, 'r', encoding='utf-8') as f:
+        cfg = yaml.safe_load(f).get('database', {})
+    env_names = cfg.get('env', {})
+    return {
+        'host': os.getenv(env_names.get('host_var', 'CLICKHOUSE_HOST'), cfg.get('host', '10.95.19.132')),
+        'port': int(os.getenv(env_names.get('port_var', 'CLICKHOUSE_PORT'), cfg.get('port', 9000))),
+        'user': os.getenv(env_names.get('user_var', 'CLICKHOUSE_USER'), cfg.get('user', 'default')),
+        'password': os.getenv(env_names.get('password_var', 'CLICKHOUSE_PASSWORD'), ''),
+        'database': cfg.get('database', 'default'),
+        'settings': cfg.get('settings', {}) or {},
+    }
+
+
+def default_compression(config_settings: Dict[str, Any]):
+    """settings.compression из конфига, иначе 'lz4' при установленных lz4 + clickhouse_cityhash"""
+    if 'compression' in config_settings:
+        return config_settings['compression'] or False
+    has_lz4 = importlib.util.find_spec('lz4') is not None
+    has_cityhash = importlib.util.find_spec('clickhouse_cityhash') is not None
+    return 'lz4' if has_lz4 and has_cityhash else False
+
+
+def _caller_tag(depth: int = 2) -> str:
+    """Имя модуля, вызвавшего метод клиента (для __main__ — имя файла скрипта)"""
+    frame = sys._getframe(depth)
+    module = frame.f_globals.get('__name__', 'unknown')
+    if module == '__main__':
+        module = Path(frame.f_globals.get('__file__') or 'main').stem
+    return module.rsplit('.', 1)[-1]
+
+
+def _record(tag: str, query_id: str, elapsed: float, info) -> None:
+    progress = getattr(info, 'progress', None)
+    profile = getattr(info, 'profile_info', None)
+    with _STATS_LOCK:
+        stats = _STATS.setdefault(tag, {
+            'queries': 0, 'seconds': 0.0, 'max_seconds': 0.0,
+            'read_rows': 0, 'read_bytes': 0, 'written_rows': 0, 'result_rows': 0,
+        })
+        stats['queries'] += 1
+        stats['seconds'] += elapsed
+        stats['max_seconds'] = max(stats['max_seconds'], elapsed)
+        if progress is not None:
+            stats['read_rows'] += getattr(progress, 'rows', 0) or 0
+            stats['read_bytes'] += getattr(progress, 'bytes', 0) or 0
+            stats['written_rows'] += getattr(progress, 'written_rows', 0) or 0
+        if profile is not None:
+            stats['result_rows'] += getattr(profile, 'rows', 0) or 0
+        if len(_QUERY_IDS) < MAX_TRACKED_QUERY_IDS:
+            _QUERY_IDS.append((query_id, tag))
+
+
+class SessionClient:
+    """
+    Обёртка clickhouse_driver.Client: метки query_id/log_comment и учёт времени запросов
+
+    execute / execute_iter / query_dataframe / insert_dataframe помечаются и учитываются;
+    остальные атрибуты проксируются в исходный Client (доступен как .client).
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def _tagged(self, kwargs: Dict[str, Any], tag: str) -> str:
+        settings = dict(kwargs.get('settings') or {})
+        settings.setdefault('log_comment', os.getenv(LOG_COMMENT_ENV) or tag)
+        kwargs['settings'] = settings
+        kwargs.setdefault('query_id', f"{tag}-{uuid.uuid4().hex}")
+        return kwargs['query_id']
+
+    def _run(self, method: str, args, kwargs, tag: str):
+        query_id = self._tagged(kwargs, tag)
+        start = time.perf_counter()
+        try:
+            return getattr(self.client, method)(*args, **kwargs)
+        finally:
+            _record(tag, query_id, time.perf_counter() - start, getattr(self.client, 'last_query', None))
+
+    def execute(self, *args, **kwargs):
+        return self._run('execute', args, kwargs, _caller_tag())
+
+    def query_dataframe(self, *args, **kwargs):
+        return self._run('query_dataframe', args, kwargs, _caller_tag())
+
+    def insert_dataframe(self, *args, **kwargs):
+        return self._run('insert_dataframe', args, kwargs, _caller_tag())
+
+    def execute_iter(self, *args, **kwargs):
+        """Потоковое чтение: время учитывается до исчерпания итератора"""
+        tag = _caller_tag()
+        query_id = self._tagged(kwargs, tag)
+
+        def rows():
+            start = time.perf_counter()
+            try:
+                yield from self.client.execute_iter(*args, **kwargs)
+            finally:
+                _record(tag, query_id, time.perf_counter() - start, getattr(self.client, 'last_query', None))
+
+        return rows()
+
+
+def get_session_client(params: Optional[Dict[str, Any]] = None,
+                       extra_settings: Optional[Dict[str, Any]] = None) -> SessionClient:
+    """
+    Клиент ClickHouse для текущего процесса и потока (кэш по параметрам подключения)
+
+    Args:
+        params: host/port/user/password/database/settings (по умолчанию load_connection_params())
+        extra_settings: Дополнительные настройки клиента (strings_encoding и т.п.)
+    """
+    from clickhouse_driver import Client
+
+    params = params or load_connection_params()
+    config_settings = params.get('settings', {}) or {}
+    settings = {name: config_settings[name] for name in PASSTHROUGH_SETTINGS if name in config_settings}
+    settings.update(extra_settings or {})
+    compression = default_compression(config_settings)
+
+    key = (
+        os.getpid(), threading.get_ident(),
+        params.get('host'), int(params.get('port', 9000)), params.get('user', 'default'),
+        params.get('password', ''), params.get('database', 'default'),
+        json.dumps(settings, sort_keys=True, default=str), str(compression),
+    )
+    with _CLIENTS_LOCK:
+        session = _CLIENTS.get(key)
+        if session is None:
+            session = SessionClient(Client(
+                host=params.get('host'),
+                port=int(params.get('port', 9000)),
+                user=params.get('user', 'default'),
+                password=params.get('password', ''),
+                database=params.get('database', 'default'),
+                settings=settings,
+                compression=compression,
+            ))
+            _CLIENTS[key] = session
+            _register_summary()
+    return session
+
+
+def session_stats() -> Dict[str, Dict[str, float]]:
+    """Копия накопленной статистики {модуль: {queries, seconds, read_rows, ...}}"""
+    with _STATS_LOCK:
+        return {tag: dict(stats) for tag, stats in _STATS.items()}
+
+
+def _query_log_memory() -> Dict[str, int]:
+    """Пиковая memory_usage по модулям из system.query_log (best effort)"""
+    with _STATS_LOCK:
+        tags = dict(_QUERY_IDS)
+    if not tags or not _CLIENTS:
+        return {}
+    client = next(iter(_CLIENTS.values())).client
+    try:
+        try:
+            client.execute("SYSTEM FLUSH LOGS")
+        except Exception:
+            pass
+        rows = client.execute(
+            "SELECT query_id, memory_usage FROM system.query_log "
+            "WHERE type = 'QueryFinish' AND event_date >= yesterday() AND query_id IN %(ids)s",
+            {'ids': list(tags)},
+        )
+    except Exception as exc:
+        print(f"⚠️ system.query_log недоступен для сводки памяти: {exc}", file=sys.stderr)
+        return {}
+    memory: Dict[str, int] = {}
+    for query_id, usage in rows:
+        tag = tags.get(query_id)
+        if tag is not None:
+            memory[tag] = max(memory.get(tag, 0), int(usage))
+    return memory
+
+
+def print_session_summary(with_memory: bool = False, stream=None) -> None:
+    """Сводка запросов ClickHouse по модулям (по убыванию суммарного времени)"""
+    stream = stream or sys.stderr
+    stats = session_stats()
+    if not stats:
+        return
+    memory = _query_log_memory() if with_memory else {}
+    print("CLICKHOUSE SESSION SUMMARY", file=stream)
+    header = f"  {'module':<32} {'queries':>8} {'seconds':>9} {'max_s':>7} {'read_rows':>13} {'read_MB':>9} {'written_rows':>13}"
+    if with_memory:
+        header += f" {'peak_mem_MB':>11}"
+    print(header, file=stream)
+    for tag, item in sorted(stats.items(), key=lambda kv: -kv[1]['seconds']):
+        line = (
+            f"  {tag[:32]:<32} {int(item['queries']):>8} {item['seconds']:>9.2f} {item['max_seconds']:>7.2f} "
+            f"{int(item['read_rows']):>13,} {item['read_bytes'] / 1024 / 1024:>9.1f} {int(item['written_rows']):>13,}"
+        )
+        if with_memory:
+            line += f" {memory.get(tag, 0) / 1024 / 1024:>11.1f}"
+        print(line, file=stream)
+
+
+def dump_session_stats(path: str) -> None:
+    """Статистика процесса и query_id запросов в JSON (для профиля родительского раннера)"""
+    with _STATS_LOCK:
+        query_ids = [query_id for query_id, _tag in _QUERY_IDS]
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'stats': session_stats(), 'query_ids': query_ids}, f)
+
+
+def _summary_at_exit() -> None:
+    stats_file = os.getenv(STATS_FILE_ENV)
+    if stats_file:
+        try:
+            dump_session_stats(stats_file)
+        except OSError as exc:
+            print(f"⚠️ Не удалось записать {stats_file}: {exc}", file=sys.stderr)
+    mode = os.getenv(SUMMARY_ENV, '').strip().lower()
+    if mode in ('', '0', 'false', 'no'):
+        return
+    print_session_summary(with_memory=(mode == 'query_log'))
+
+
+def _register_summary() -> None:
+    global _SUMMARY_REGISTERED
+    if not _SUMMARY_REGISTERED:
+        atexit.register(_summary_at_exit)
+        _SUMMARY_REGISTERED = True
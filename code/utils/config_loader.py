@@ -17,6 +17,9 @@ from typing import Dict, Any, List, Optional
 import logging
 import sys
 
+# ch_session импортируется напрямую и при импорте как utils.config_loader
+sys.path.append(str(Path(__file__).parent))
+
 logger = logging.getLogger(__name__)
 
 def auto_load_env_file():
@@ -211,21 +214,13 @@ def get_clickhouse_client():
         Client: Настроенный клиент ClickHouse
     """
     try:
-        from clickhouse_driver import Client
+        from ch_session import get_session_client
         
         config = load_clickhouse_config()
         
-        client = Client(
-            host=config['host'],
-            port=config['port'],
-            user=config['user'],
-            password=config['password'],
-            database=config['database'],
-            settings={
-                'strings_encoding': 'utf-8',
-                'max_threads': config['settings']['max_threads']
-            }
-        )
+        # Общая фабрика: кэш клиента на процесс/поток, LZ4 (если установлен), метки и статистика
+        # запросов; log_comment = CH_LOG_COMMENT (extract_master при профилировании) или модуль
+        client = get_session_client(config, extra_settings={'strings_encoding': 'utf-8'})
         
         return client
         
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+DataFrame Writer - типизированная колоночная вставка DataFrame в ClickHouse
+
+Заменяет схему "[tuple(row) for row in df.values]" (боксинг каждой ячейки в object)
+и построчные конверторы в загрузчиках:
+- схема целевой таблицы читается DESCRIBE TABLE один раз и кэшируется;
+- каждая колонка приводится к типу схемы векторно (pandas/NumPy) и отдаётся
+  драйверу колонкой (columnar=True), блоками по block_size строк;
+- возвращается статистика: строки, байты, время, строк/с.
+
+Сжатие трафика включается на уровне клиента (compression в database_config.yaml).
+
+Использование:
+    from utils.dataframe_writer import insert_dataframe
+    stats = insert_dataframe(client, df, 'heli_raw')
+"""
+
+import logging
+import time
+import uuid
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BLOCK_SIZE = 500_000
+
+# Кэш схем: table -> [(name, type)]
+_SCHEMA_CACHE: Dict[str, List[Tuple[str, str]]] = {}
+
+_INT_TYPES = ('Int8', 'Int16', 'Int32', 'Int64', 'UInt8', 'UInt16', 'UInt32', 'UInt64')
+_FLOAT_TYPES = ('Float32', 'Float64')
+
+
+def get_table_schema(client, table: str, refresh: bool = False) -> List[Tuple[str, str]]:
+    """Схема таблицы [(name, type)] из DESCRIBE TABLE (кэшируется на процесс)"""
+    if refresh or table not in _SCHEMA_CACHE:
+        rows = client.execute(f"DESCRIBE TABLE {table}")
+        # DESCRIBE: name, type, default_type, default_expression, ...
+        _SCHEMA_CACHE[table] = [
+            (row[0], row[1]) for row in rows if row[2] not in ('MATERIALIZED', 'ALIAS')
+        ]
+    return _SCHEMA_CACHE[table]
+
+
+def invalidate_schema_cache(table: Optional[str] = None) -> None:
+    """Сбрасывает кэш схем (после ALTER TABLE ADD/MODIFY COLUMN)"""
+    if table is None:
+        _SCHEMA_CACHE.clear()
+    else:
+        _SCHEMA_CACHE.pop(table, None)
+
+
+def _unwrap_type(ch_type: str) -> Tuple[str, bool]:
+    """LowCardinality(Nullable(X)) -> (X, nullable)"""
+    nullable = False
+    changed = True
+    while changed:
+        changed = False
+        for wrapper in ('LowCardinality(', 'Nullable('):
+            if ch_type.startswith(wrapper) and ch_type.endswith(')'):
+                nullable = nullable or wrapper == 'Nullable('
+                ch_type = ch_type[len(wrapper):-1]
+                changed = True
+    return ch_type, nullable
+
+
+def _with_nulls(values: np.ndarray, mask: np.ndarray, fill) -> list:
+    """ndarray -> list Python-значений, позиции mask заменяются на fill"""
+    if not mask.any():
+        return values.tolist()
+    result = values.astype(object)
+    result[mask] = fill
+    return result.tolist()
+
+
+def _to_numeric_strict(series: pd.Series, ch_type: str) -> pd.Series:
+    """pd.to_numeric без тихой подмены: нечисловые значения (не NULL/NaN) — ValueError"""
+    numeric = pd.to_numeric(series, errors='coerce')
+    malformed = numeric.isna().to_numpy() & ~series.isna().to_numpy()
+    if malformed.any():
+        examples = series[malformed].head(3).tolist()
+        raise ValueError(
+            f"Колонка {series.name} ({ch_type}): {int(malformed.sum())} нечисловых значений, "
+            f"например {examples!r}"
+        )
+    return numeric
+
+
+def _to_datetime_strict(series: pd.Series, ch_type: str, fmt: str) -> pd.Series:
+    """pd.to_datetime без тихой подмены: строки — только в формате fmt (без угадывания
+    порядка день/месяц), прочие значения — date/datetime; остальное (не NULL) — ValueError"""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    values = series.astype(object)
+    blank = values.map(lambda v: isinstance(v, str) and not v.strip()).to_numpy(dtype=bool)
+    values[blank] = None
+    is_str = values.map(lambda v: isinstance(v, str)).to_numpy(dtype=bool)
+    is_date = values.map(lambda v: isinstance(v, (date, np.datetime64))).to_numpy(dtype=bool)
+    parsed = pd.Series(pd.NaT, index=series.index, dtype='datetime64[ns]')
+    if is_str.any():
+        parsed[is_str] = pd.to_datetime(values[is_str].str.strip(), format=fmt, errors='coerce')
+    if is_date.any():
+        parsed[is_date] = pd.to_datetime(values[is_date], errors='coerce')
+    malformed = parsed.isna().to_numpy() & ~values.isna().to_numpy()
+    if malformed.any():
+        examples = series[malformed].head(3).tolist()
+        raise ValueError(
+            f"Колонка {series.name} ({ch_type}): {int(malformed.sum())} значений не распознано как "
+            f"дата (строки — только {fmt}), например {examples!r}"
+        )
+    return parsed
+
+
+def _string_values(series: pd.Series, ch_type: str, nullable: bool) -> Tuple[list, int]:
+    """Значения String-колонки: str/bytes как есть, целые — str(); прочее (не NULL) — ValueError"""
+    accepted = (str, bytes, uuid.UUID) if ch_type.endswith('UUID') else (str, bytes)
+    values = series.to_numpy(dtype=object)
+    mask = series.isna().to_numpy()
+    result = []
+    bad = []
+    for value, missing in zip(values, mask):
+        if missing:
+            result.append(None if nullable else '')
+        elif isinstance(value, accepted):
+            result.append(value)
+        elif isinstance(value, (int, np.integer)) and not isinstance(value, (bool, np.bool_)):
+            result.append(str(value))
+        else:
+            bad.append(value)
+    if bad:
+        raise ValueError(
+            f"Колонка {series.name} ({ch_type}): {len(bad)} значений не строкового типа, "
+            f"например {bad[:3]!r} — приведите явно перед вставкой"
+        )
+    return result, sum(len(value) for value in result if value is not None)
+
+
+def coerce_column(series: pd.Series, ch_type: str) -> Tuple[list, int]:
+    """
+    Приводит колонку DataFrame к типу ClickHouse
+
+    NULL/NaN в не-Nullable числовых колонках заменяются на 0; нечисловые строки и
+    дробные значения для целых типов — ValueError (как ошибка типа драйвера раньше).
+    Даты — date/datetime или строки ISO, нераспознанные значения — ValueError; в
+    String-колонках — str/bytes/целые, прочие типы (например, float) — ValueError.
+
+    Returns:
+        (значения для columnar-вставки, оценка размера в байтах)
+    """
+    base, nullable = _unwrap_type(ch_type)
+
+    if base in _INT_TYPES:
+        numeric = _to_numeric_strict(series, ch_type)
+        mask = numeric.isna().to_numpy()
+        present = numeric[~mask]
+        fractional = present[present != np.floor(present.astype(np.float64))]
+        if len(fractional):
+            raise ValueError(
+                f"Колонка {series.name} ({ch_type}): {len(fractional)} дробных значений "
+                f"(например {fractional.iloc[0]!r}) — округлите явно перед вставкой"
+            )
+        values = numeric.fillna(0).to_numpy(dtype=np.int64)
+        fill = None if nullable else 0
+        return _with_nulls(values, mask, fill), values.nbytes
+
+    if base in _FLOAT_TYPES:
+        numeric = _to_numeric_strict(series, ch_type)
+        mask = numeric.isna().to_numpy()
+        values = numeric.fillna(0.0).to_numpy(dtype=np.float64)
+        if not nullable:
+            return values.tolist(), values.nbytes
+        return _with_nulls(values, mask, None), values.nbytes
+
+    if base in ('Date', 'Date32'):
+        parsed = _to_datetime_strict(series, ch_type, '%Y-%m-%d')
+        mask = parsed.isna().to_numpy()
+        values = parsed.dt.date.to_numpy(dtype=object)
+        return _with_nulls(values, mask, None), len(values) * 2
+
+    if base.startswith('DateTime'):
+        parsed = _to_datetime_strict(series, ch_type, '%Y-%m-%d %H:%M:%S')
+        mask = parsed.isna().to_numpy()
+        values = np.array(parsed.dt.to_pydatetime(), dtype=object)
+        return _with_nulls(values, mask, None), len(values) * 4
+
+    if base in ('String', 'UUID') or base.startswith('FixedString'):
+        return _string_values(series, base, nullable)
+
+    # Прочие типы (Decimal, Array, ...) — как есть, NaN -> None
+    values = series.astype(object).where(series.notna(), None)
+    return values.tolist(), 0
+
+
+def insert_dataframe(client, df: pd.DataFrame, table: str, schema_table: Optional[str] = None,
+                     block_size: int = DEFAULT_BLOCK_SIZE, settings: Optional[dict] = None,
+                     quiet: bool = False) -> Dict[str, float]:
+    """
+    Колоночная вставка DataFrame в таблицу ClickHouse
+
+    Args:
+        client: ClickHouse client (clickhouse_driver)
+        df: Данные; колонки сопоставляются со схемой по имени
+        table: Таблица для INSERT
+        schema_table: Таблица-источник схемы (например, целевая для staging); по умолчанию table
+        block_size: Строк в одном INSERT-блоке
+        settings: Дополнительные settings для INSERT
+        quiet: Не печатать итоговую строку статистики
+
+    Returns:
+        {'rows', 'bytes', 'seconds', 'rows_per_sec'}
+    """
+    schema = get_table_schema(client, schema_table or table)
+    schema_types = dict(schema)
+
+    unknown = [col for col in df.columns if col not in schema_types]
+    if unknown:
+        raise ValueError(f"Колонки отсутствуют в схеме {schema_table or table}: {unknown}")
+
+    columns = [name for name, _ in schema if name in df.columns]
+    insert_settings = {'max_insert_block_size': block_size}
+    if settings:
+        insert_settings.update(settings)
+
+    start = time.time()
+    total_rows = len(df)
+    total_bytes = 0
+    query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES"
+
+    for offset in range(0, total_rows, block_size):
+        block = df.iloc[offset:offset + block_size]
+        column_data = []
+        for name in columns:
+            values, nbytes = coerce_column(block[name], schema_types[name])
+            column_data.append(values)
+            total_bytes += nbytes
+        client.execute(query, column_data, columnar=True, settings=insert_settings)
+
+    elapsed = time.time() - start
+    rows_per_sec = total_rows / elapsed if elapsed > 0 else float(total_rows)
+    stats = {
+        'rows': total_rows,
+        'bytes': total_bytes,
+        'seconds': elapsed,
+        'rows_per_sec': rows_per_sec,
+    }
+    if not quiet:
+        print(
+            f"📈 {table}: {total_rows:,} строк за {elapsed:.2f}с "
+            f"({rows_per_sec:,.0f} строк/с, ~{total_bytes / 1024 / 1024:.1f} MB)"
+        )
+    return stats
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Date Parsing - общий векторный разбор дат для ETL загрузчиков
+
+Русские даты из выгрузок AMOS ('05.февр..2024', '5.марта.2024'):
+1. str.extract по регулярному выражению: день / токен месяца / год
+   (семантика split('.'): первая часть, вторая часть, часть после последней точки);
+2. токены месяца -> номер через категориальный справочник (префиксы, первый совпавший);
+3. один pd.to_datetime(format='%Y-%m-%d') по собранным ISO-строкам;
+4. остаток (не распознано регуляркой / строгим форматом) — поэлементным эталонным
+   парсером parse_russian_date по уникальным значениям.
+
+Результат — даты (datetime.date) или None; нераспознанные непустые значения
+подсчитываются по колонкам.
+
+Использование:
+    from utils.date_parsing import parse_russian_date_columns, coerce_dayfirst_date_columns
+    unparsed = parse_russian_date_columns(df, ['sched_start_date', 'act_end_date'])
+
+Проверка совпадения с эталонным парсером по всем написаниям месяцев:
+    python3 code/utils/date_parsing.py --self-check
+"""
+
+import argparse
+import random
+import sys
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# Префиксы русских месяцев; порядок важен (первый совпавший, как в исходном парсере)
+RU_MONTH_PREFIXES = (
+    ('янв', '01'), ('февр', '02'), ('мар', '03'), ('апр', '04'),
+    ('мая', '05'), ('май', '05'), ('июн', '06'), ('июл', '07'),
+    ('авг', '08'), ('сент', '09'), ('окт', '10'), ('нояб', '11'), ('дек', '12'),
+)
+
+# split('.') -> parts[0], parts[1], parts[-1] при len(parts) >= 3
+_RU_DATE_RE = r'^(?P<day>[^.]*)\.(?P<month>[^.]*)\.(?:.*\.)?(?P<year>[^.]*)$'
+
+
+def _month_number(token: str) -> Optional[str]:
+    """Номер месяца по токену (lower), None — не русский месяц"""
+    for prefix, num in RU_MONTH_PREFIXES:
+        if token.startswith(prefix):
+            return num
+    return None
+
+
+def parse_russian_date(date_str):
+    """Парсит русские даты формата '05.февр..2024' (эталонный поэлементный парсер)"""
+    if pd.isna(date_str) or date_str == '' or date_str == 'nan':
+        return None
+
+    try:
+        date_str = str(date_str).strip()
+
+        # Ищем паттерн: день.месяц..год
+        parts = date_str.split('.')
+        if len(parts) >= 3:
+            day = parts[0].zfill(2)
+            month_ru = parts[1].lower().rstrip('.')
+            year = parts[-1]
+
+            month_num = _month_number(month_ru)
+            if month_num:
+                # Формируем ISO дату и парсим
+                iso_date = f'{year}-{month_num}-{day}'
+                return pd.to_datetime(iso_date).date()
+
+        # Если не удалось, пробуем стандартный парсер
+        return pd.to_datetime(date_str, errors='coerce').date()
+
+    except Exception:
+        return None
+
+
+def _as_date_or_none(value):
+    """NaT -> None (эталонный парсер возвращает NaT при неудаче стандартного разбора)"""
+    return None if value is None or pd.isna(value) else value
+
+
+def parse_russian_date_series(series: pd.Series) -> pd.Series:
+    """
+    Векторный аналог series.apply(parse_russian_date)
+
+    Returns:
+        pd.Series (object) с datetime.date или None, индекс как у series
+    """
+    result = np.full(len(series), None, dtype=object)
+    is_null = (series.isna() | series.isin(['', 'nan'])).to_numpy()
+    positions = np.flatnonzero(~is_null)
+    if positions.size == 0:
+        return pd.Series(result, index=series.index, dtype=object)
+
+    raw = series.to_numpy(dtype=object)[positions]
+    text = pd.Series(raw, dtype=object).astype(str).str.strip()
+    parts = text.str.extract(_RU_DATE_RE)
+
+    # Категориальный справочник токенов месяца: код категории -> номер месяца
+    tokens = pd.Categorical(parts['month'].str.lower())
+    month_by_code = np.array([_month_number(t) for t in tokens.categories] + [None], dtype=object)
+    month = month_by_code[tokens.codes]
+    matched = np.flatnonzero(pd.notna(month))
+
+    parsed = np.zeros(positions.size, dtype=bool)
+    if matched.size:
+        iso = (parts['year'].to_numpy(dtype=object)[matched] + '-' + month[matched] + '-'
+               + parts['day'].str.zfill(2).to_numpy(dtype=object)[matched])
+        strict = pd.to_datetime(pd.Series(iso, dtype=object), format='%Y-%m-%d', errors='coerce')
+        ok = strict.notna().to_numpy()
+        result[positions[matched[ok]]] = strict[ok].dt.date.to_numpy()
+        parsed[matched[ok]] = True
+
+    # Остаток: месяц не распознан, либо ISO не прошла строгий формат — эталонный парсер
+    cache = {}
+    for i in np.flatnonzero(~parsed):
+        value = raw[i]
+        key = (type(value), value)
+        if key not in cache:
+            cache[key] = _as_date_or_none(parse_russian_date(value))
+        result[positions[i]] = cache[key]
+    return pd.Series(result, index=series.index, dtype=object)
+
+
+def _report_unparsed(label: str, unparsed: Dict[str, int], total: int) -> None:
+    for col, count in unparsed.items():
+        mark = '⚠️' if count else '✅'
+        print(f"   {mark} {label}{col}: нераспознано {count}/{total}")
+
+
+def parse_russian_date_columns(df: pd.DataFrame, columns: Iterable[str], label: str = '') -> Dict[str, int]:
+    """
+    Разбирает колонки с русскими датами на месте
+
+    Returns:
+        {колонка: число непустых значений, не распознанных как дата}
+    """
+    unparsed = {}
+    for col in columns:
+        if col not in df.columns:
+            continue
+        source = df[col]
+        parsed = parse_russian_date_series(source)
+        unparsed[col] = int((parsed.isna() & source.notna() & ~source.isin(['', 'nan'])).sum())
+        df[col] = parsed
+    _report_unparsed(label, unparsed, len(df))
+    return unparsed
+
+
+def coerce_dayfirst_date_columns(df: pd.DataFrame, columns: Iterable[str], label: str = '') -> Dict[str, int]:
+    """
+    Даты Excel / 'дд.мм.гггг' -> datetime.date или None (pd.to_datetime(dayfirst=True)) на месте
+
+    Returns:
+        {колонка: число непустых значений, не распознанных как дата}
+    """
+    unparsed = {}
+    for col in columns:
+        if col not in df.columns:
+            continue
+        source = df[col]
+        parsed = pd.to_datetime(source, dayfirst=True, errors='coerce')
+        unparsed[col] = int((parsed.isna() & source.notna() & (source.astype(str).str.strip() != '')).sum())
+        dates = parsed.dt.date
+        df[col] = dates.where(dates.notnull(), None)
+    _report_unparsed(label, unparsed, len(df))
+    return unparsed
+
+
+def _self_check_values(seed: int, samples: int) -> List:
+    """Все написания месяцев (полные, сокращённые, регистр, точки) + мусор и граничные значения"""
+    spellings = [
+        'янв', 'янв.', 'января', 'январь', 'ЯНВ', 'Янв.',
+        'февр', 'февр.', 'февраля', 'февраль', 'фев', 'ФЕВР.',
+        'мар', 'мар.', 'марта', 'март', 'МАРТА',
+        'апр', 'апр.', 'апреля', 'апрель',
+        'мая', 'май', 'МАЙ', 'Мая',
+        'июн', 'июн.', 'июня', 'июнь',
+        'июл', 'июл.', 'июля', 'июль',
+        'авг', 'авг.', 'августа', 'август',
+        'сен', 'сент', 'сент.', 'сентября', 'сентябрь',
+        'окт', 'окт.', 'октября', 'октябрь',
+        'ноя', 'нояб', 'нояб.', 'ноября', 'ноябрь',
+        'дек', 'дек.', 'декабря', 'декабрь',
+        'jan', 'feb', '02', '', 'xyz',
+    ]
+    rng = random.Random(seed)
+    values: List = [None, np.nan, '', 'nan', 'NaT', '   ', 'мусор', '2024', '05.02', '05..2024',
+                    '05.02.2024', '2024-02-05', '31.04.2024', pd.Timestamp('2024-02-05'),
+                    pd.Timestamp('2023-12-31 13:45'), 45000, 1.5]
+    for token in spellings:
+        for day in ('1', '05', '29', '31', '0', '32', ' 7', 'x'):
+            for year in ('2024', '2023', '1999', '24', '2024 ', ''):
+                values.append(f'{day}.{token}.{year}')
+                values.append(f'{day}.{token}..{year}')
+    for _ in range(samples):
+        token = rng.choice(spellings)
+        values.append(f'{rng.randint(0, 33):0{rng.choice((1, 2))}d}.{token}.{rng.choice(("", "."))}'
+                      f'{rng.randint(1990, 2035)}')
+    return values
+
+
+def run_self_check(seed: int = 42, samples: int = 5000) -> bool:
+    """Сверяет parse_russian_date_series с эталоном parse_russian_date (NaT и None равны)"""
+    values = _self_check_values(seed, samples)
+    series = pd.Series(values, dtype=object)
+    expected = series.apply(lambda v: _as_date_or_none(parse_russian_date(v)))
+    actual = parse_russian_date_series(series)
+
+    mismatches = [(v, e, a) for v, e, a in zip(values, expected, actual) if e != a]
+    print(f"🧪 Проверено значений: {len(values)}, расхождений: {len(mismatches)}")
+    for value, exp, act in mismatches[:20]:
+        print(f"   ❌ {value!r}: эталон={exp!r}, векторный={act!r}")
+    return not mismatches
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Векторный разбор русских дат ETL')
+    parser.add_argument('--self-check', action='store_true', help='Сверка с эталонным парсером')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--samples', type=int, default=5000, help='Случайных значений сверх полного перебора')
+    args = parser.parse_args()
+    if not args.self_check:
+        parser.print_help()
+        return 0
+    return 0 if run_self_check(args.seed, args.samples) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
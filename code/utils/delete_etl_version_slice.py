@@ -3,26 +3,42 @@
 Удаление одного среза ETL в ClickHouse: строки с заданными version_date и version_id.
 
 Обходит таблицы из известного списка (ETL + версионные dict_* + dict_digital_values_flat),
-для каждой проверяет наличие колонок version_date и version_id и выполняет DELETE только
-если обе есть. Таблицы без версионирования (например dict_status_flat) не трогает.
+для каждой проверяет наличие колонок version_date и version_id (один снимок system.columns)
+и удаляет срез только если обе есть. Таблицы без версионирования (например dict_status_flat)
+не трогает.
+
+Способ удаления выбирается по таблице:
+- DROP PARTITION — если ключ партиционирования содержит version_date и все строки
+  затронутых партиций принадлежат срезу (ключ version_date / (version_date, version_id),
+  либо месяц toYYYYMM(version_date) содержит только этот срез). Место освобождается сразу;
+- DELETE (lightweight) — иначе; строки скрываются, физически вычищаются merge'ами.
+
+Таблицы обрабатываются параллельно (--workers, свой клиент на поток). DRY-RUN показывает
+строки, способ и объём на диске по system.parts (для DELETE — оценка пропорционально строкам).
 
 Использование:
   python code/utils/delete_etl_version_slice.py --version-date 2026-04-08 --version-id 1 --dry-run
-  python code/utils/delete_etl_version_slice.py --version-date 2026-04-08 --version-id 1 --execute
+  python code/utils/delete_etl_version_slice.py --version-date 2026-04-08 --version-id 1 --execute --workers 8
 """
 
 from __future__ import annotations
 
 import argparse
 import sys
-from datetime import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date, datetime
 from pathlib import Path
+from typing import List, Optional
 
 code_root = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(code_root / "utils"))
 sys.path.insert(0, str(code_root))
 
 from config_loader import get_clickhouse_client  # noqa: E402
+from schema_snapshot import get_schema_snapshot  # noqa: E402
 
 # ETL + словари с версионированием (см. etl_version_manager, dictionary_creator, digital_values_dictionary_creator)
 CANDIDATE_TABLES = [
@@ -41,6 +57,24 @@ CANDIDATE_TABLES = [
     "dict_aircraft_number_flat",
 ]
 
+DEFAULT_WORKERS = 4
+
+_local = threading.local()
+
+
+@dataclass
+class SlicePlan:
+    """План удаления среза в одной таблице"""
+
+    table: str
+    rows: int = 0
+    method: str = "skip"  # drop_partition | delete | skip
+    partitions: List[str] = field(default_factory=list)
+    bytes_on_disk: int = 0
+    note: str = ""
+    error: Optional[str] = None
+    elapsed: float = 0.0
+
 
 def parse_args() -> argparse.Namespace:
     p = argparse.ArgumentParser(description="Удаление среза ETL по version_date + version_id")
@@ -54,21 +88,110 @@ def parse_args() -> argparse.Namespace:
     p.add_argument(
         "--execute",
         action="store_true",
-        help="Выполнить DELETE (требуется явно)",
+        help="Выполнить удаление (требуется явно)",
+    )
+    p.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f"Параллельных таблиц (по умолчанию {DEFAULT_WORKERS})",
     )
     return p.parse_args()
 
 
-def table_has_version_columns(client, table: str) -> bool:
-    q = """
-    SELECT count()
-    FROM system.columns
-    WHERE database = currentDatabase()
-      AND table = %(t)s
-      AND name IN ('version_date', 'version_id')
+def _thread_client():
+    """Клиент ClickHouse текущего потока (clickhouse_driver.Client не потокобезопасен)"""
+    if getattr(_local, "client", None) is None:
+        _local.client = get_clickhouse_client()
+    return _local.client
+
+
+def _format_bytes(n: int) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if n < 1024:
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} TiB"
+
+
+def plan_table(client, table: str, vd: date, vid: int) -> SlicePlan:
     """
-    n = int(client.execute(q, {"t": table})[0][0])
-    return n == 2
+    Строки среза по партициям и способ удаления.
+
+    Партиции-кандидаты берутся из активных партов system.parts: при ключе с version_date —
+    только те, где min_date <= vd <= max_date; затем один GROUP BY _partition_id даёт
+    всего строк и строк среза в каждой партиции.
+    """
+    plan = SlicePlan(table=table)
+    rows = client.execute(
+        """
+        SELECT p.partition_id, sum(p.rows), sum(p.bytes_on_disk), any(t.partition_key)
+        FROM system.parts AS p
+        INNER JOIN system.tables AS t ON t.database = p.database AND t.name = p.table
+        WHERE p.database = currentDatabase() AND p.table = %(t)s AND p.active
+          AND (position(t.partition_key, 'version_date') = 0
+               OR (p.min_date <= %(vd)s AND p.max_date >= %(vd)s))
+        GROUP BY p.partition_id
+        """,
+        {"t": table, "vd": vd},
+    )
+    if not rows:
+        plan.note = "нет партов за дату"
+        return plan
+
+    partition_bytes = {pid: int(b) for pid, _, b, _ in rows}
+    by_version_date = "version_date" in rows[0][3]
+
+    ids = ", ".join(f"'{pid}'" for pid in partition_bytes)
+    counts = client.execute(
+        f"""
+        SELECT _partition_id, count(), countIf(version_date = %(vd)s AND version_id = %(vid)s) AS slice_rows
+        FROM {table}
+        WHERE _partition_id IN ({ids})
+        GROUP BY _partition_id
+        HAVING slice_rows > 0
+        """,
+        {"vd": vd, "vid": vid},
+    )
+    plan.rows = sum(int(n) for _, _, n in counts)
+    if plan.rows == 0:
+        return plan
+
+    plan.partitions = sorted(pid for pid, _, _ in counts)
+    if by_version_date and all(int(total) == int(n) for _, total, n in counts):
+        plan.method = "drop_partition"
+        plan.bytes_on_disk = sum(partition_bytes[pid] for pid in plan.partitions)
+    else:
+        plan.method = "delete"
+        # Оценка: доля строк среза от объёма партиции
+        plan.bytes_on_disk = int(sum(partition_bytes[pid] * int(n) / int(total) for pid, total, n in counts))
+        plan.note = (
+            "партиции содержат другие срезы" if by_version_date else "ключ партиционирования без version_date"
+        )
+    return plan
+
+
+def process_table(table: str, vd: date, vid: int, execute: bool) -> SlicePlan:
+    """Планирует и (при execute) удаляет срез в таблице; выполняется в пуле потоков"""
+    started = time.time()
+    client = _thread_client()
+    try:
+        plan = plan_table(client, table, vd, vid)
+        if execute and plan.method == "drop_partition":
+            for pid in plan.partitions:
+                client.execute(f"ALTER TABLE {table} DROP PARTITION ID '{pid}'")
+        elif execute and plan.method == "delete":
+            client.execute(
+                f"""
+                DELETE FROM {table}
+                WHERE version_date = %(vd)s AND version_id = %(vid)s
+                """,
+                {"vd": vd, "vid": vid},
+            )
+    except Exception as e:
+        plan = SlicePlan(table=table, error=str(e))
+    plan.elapsed = time.time() - started
+    return plan
 
 
 def main() -> int:
@@ -87,52 +210,56 @@ def main() -> int:
 
     print(
         f"📅 Срез: version_date={vd}, version_id={vid} "
-        f"({'DRY-RUN' if args.dry_run else 'DELETE'})"
+        f"({'DRY-RUN' if args.dry_run else 'EXECUTE'}, workers={args.workers})"
     )
 
-    total_before = 0
-    total_deleted = 0
-
+    schema = get_schema_snapshot(client, CANDIDATE_TABLES, validate=True)
+    tables = []
     for table in CANDIDATE_TABLES:
-        exists = int(client.execute(f"EXISTS TABLE {table}")[0][0])
-        if not exists:
+        if not schema.exists(table):
             print(f"⏭️  {table}: таблицы нет")
-            continue
-        if not table_has_version_columns(client, table):
+        elif not (schema.has_column(table, "version_date") and schema.has_column(table, "version_id")):
             print(f"⏭️  {table}: нет version_date+version_id — пропуск")
-            continue
+        else:
+            tables.append(table)
 
-        count_sql = f"""
-        SELECT count()
-        FROM {table}
-        WHERE version_date = %(vd)s AND version_id = %(vid)s
-        """
-        n = int(
-            client.execute(
-                count_sql,
-                {"vd": vd, "vid": vid},
-            )[0][0]
-        )
-        total_before += n
-        if n == 0:
-            print(f"   {table}: 0 строк")
-            continue
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        plans = list(pool.map(lambda t: process_table(t, vd, vid, args.execute), tables))
 
-        print(f"   {table}: {n} строк")
-        if args.execute:
-            delete_sql = f"""
-            DELETE FROM {table}
-            WHERE version_date = %(vd)s AND version_id = %(vid)s
-            """
-            client.execute(delete_sql, {"vd": vd, "vid": vid})
-            total_deleted += n
+    total_rows = 0
+    total_bytes = 0
+    failed = 0
+    methods = {"drop_partition": "DROP PARTITION", "delete": "DELETE"}
+    for plan in plans:
+        if plan.error:
+            failed += 1
+            print(f"❌ {plan.table}: {plan.error}")
+            continue
+        if plan.rows == 0:
+            print(f"   {plan.table}: 0 строк")
+            continue
+        total_rows += plan.rows
+        total_bytes += plan.bytes_on_disk
+        approx = "~" if plan.method == "delete" else ""
+        note = f" ({plan.note})" if plan.note else ""
+        print(
+            f"   {plan.table}: {plan.rows} строк, {methods[plan.method]} "
+            f"[{', '.join(plan.partitions)}], {approx}{_format_bytes(plan.bytes_on_disk)}{note}, "
+            f"{plan.elapsed:.2f}с"
+        )
 
-    print(f"📊 Итого строк в срезе: {total_before}")
+    print(f"📊 Итого строк в срезе: {total_rows}, на диске: {_format_bytes(total_bytes)} ({time.time() - started:.2f}с)")
+    if failed:
+        print(f"❌ Ошибок по таблицам: {failed}")
     if args.execute:
-        print(f"✅ DELETE отправлен; удалено по учёту до вызова: {total_deleted} (проверьте финальные count в CH)")
+        print(
+            f"✅ Удаление выполнено; удалено по учёту до вызова: {total_rows} "
+            f"(DROP PARTITION освобождает место сразу, DELETE — после merge; проверьте финальные count в CH)"
+        )
     else:
-        print("📝 DRY-RUN: DELETE не выполнялся")
-    return 0
+        print("📝 DRY-RUN: удаление не выполнялось")
+    return 1 if failed else 0
 
 
 if __name__ == "__main__":
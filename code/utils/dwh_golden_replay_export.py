@@ -1,20 +1,49 @@
 #!/usr/bin/env python3
-"""Экспорт из DWH ClickHouse в Excel для сравнения с golden v_YYYY-MM-DD (replay / direct load)."""
+"""Экспорт из DWH ClickHouse в Excel для сравнения с golden v_YYYY-MM-DD (replay / direct load).
+
+Выгрузки идут параллельно (--jobs, свой клиент на поток), результат запроса читается блоками
+(query_df_stream), даты преобразуются векторно; --format parquet/csv пропускает запись openpyxl.
+
+Сравнение: векторная нормализация колонок, хэш строки по общим колонкам, поячеечный
+разбор только для несовпавших ключей; различия — в output/<каталог>/compare_*_diff_cells.csv.
+"""
 from __future__ import annotations
 
 import argparse
+import hashlib
 import os
 import sys
+import time
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import numpy as np
 import pandas as pd
+from pandas.api.types import is_datetime64_any_dtype, is_numeric_dtype
 
 from prep_source_dataset import LEASE_RESTRICTED_OWNERS
 
 DEFAULT_REPORT_DATE = "2026-04-08"
 AMOS_DAY_ORIGIN = pd.Timestamp("1971-12-31")
+# Строк в блоке потоковой выборки из DWH
+QUERY_BLOCK_ROWS = 65536
+OUTPUT_FORMATS = ("xlsx", "parquet", "csv")
+EXPORT_STEPS = ("status_components", "program_ac", "status_overhaul")
+WP_STATUS_MAP = {-1: "Открыто", -2: "Закрыто", -3: "В процессе"}
+STATUS_OVERHAUL_COLUMNS = [
+    "ac_registr",
+    "ac_typ",
+    "wpno",
+    "description",
+    "sched_start_date",
+    "sched_end_date",
+    "act_start_date",
+    "act_end_date",
+    "status",
+    "owner",
+    "operator",
+]
 
 
 def _as_of_end(report_date: str) -> str:
@@ -54,12 +83,16 @@ def _env_bool(name: str, default: bool = False) -> bool:
     return v.strip().lower() in ("1", "true", "yes", "y")
 
 
-def dwh_client():
-    import clickhouse_connect
-
+def _check_env() -> None:
     for k in REQUIRED_ENV:
         if not os.getenv(k):
             _fail(f"Отсутствует переменная окружения {k}")
+
+
+def dwh_client():
+    import clickhouse_connect
+
+    _check_env()
     kwargs = dict(
         host=os.environ["DWH_CLICKHOUSE_HOST"],
         port=int(os.environ["DWH_CLICKHOUSE_PORT"]),
@@ -81,34 +114,78 @@ def _lease_col(owners: pd.Series) -> pd.Series:
 
 
 def _fmt_dmY_series(s: pd.Series) -> pd.Series:
-    def one(v):
-        if v is None or (isinstance(v, float) and np.isnan(v)):
-            return ""
-        if pd.isna(v):
-            return ""
-        if hasattr(v, "strftime"):
-            return v.strftime("%d.%m.%Y")
-        ts = pd.to_datetime(v, errors="coerce")
-        if pd.isna(ts):
-            return ""
-        return ts.strftime("%d.%m.%Y")
-
-    return s.map(one)
+    """Дата -> 'дд.мм.гггг' ('' для пустых/нераспознанных), векторно."""
+    ts = pd.to_datetime(s, errors="coerce")
+    return ts.dt.strftime("%d.%m.%Y").fillna("")
 
 
 def _amos_int_to_timestamp(s: pd.Series) -> pd.Series:
-    def one(v):
-        if v is None or (isinstance(v, float) and np.isnan(v)):
-            return pd.NaT
-        try:
-            iv = int(v)
-        except (TypeError, ValueError):
-            return pd.NaT
-        if iv <= 0:
-            return pd.NaT
-        return AMOS_DAY_ORIGIN + pd.Timedelta(days=iv)
+    """Дни AMOS (от 1971-12-31) -> Timestamp; <= 0 и нечисловые -> NaT, векторно."""
+    days = np.trunc(pd.to_numeric(s, errors="coerce"))
+    return AMOS_DAY_ORIGIN + pd.to_timedelta(days.where(days > 0), unit="D")
+
 
-    return s.map(one)
+def _map_wp_status(s: pd.Series) -> pd.Series:
+    """wp_status -> текст (Открыто/Закрыто/В процессе), прочие коды строкой, NULL -> ''."""
+    num = pd.to_numeric(s, errors="coerce")
+    out = num.map(WP_STATUS_MAP)
+    other_num = num.notna() & out.isna()
+    out[other_num] = num[other_num].astype(np.int64).astype(str)
+    other = num.isna() & s.notna()
+    out[other] = s[other].astype(str)
+    return out.fillna("")
+
+
+def _status_overhaul_post(df: pd.DataFrame) -> pd.DataFrame:
+    """Постобработка выборки WP: статус текстом, даты AMOS -> Timestamp, колонки как в golden."""
+    df["status"] = _map_wp_status(df["status_code"])
+    df["sched_start_date"] = _amos_int_to_timestamp(df["start_date"])
+    df["sched_end_date"] = _amos_int_to_timestamp(df["end_date"])
+    df["act_start_date"] = _amos_int_to_timestamp(df["act_start_date"])
+    df["act_end_date"] = _amos_int_to_timestamp(df["act_end_date"])
+    return df[STATUS_OVERHAUL_COLUMNS]
+
+
+def _status_components_post(df: pd.DataFrame) -> pd.DataFrame:
+    """Постобработка витрины компонентов: lease_restricted, даты как в golden Excel."""
+    df["lease_restricted"] = _lease_col(df["owner"])
+    df["removal_date"] = _fmt_dmY_series(df["removal_date"])
+    df["target_date"] = _fmt_dmY_series(df["target_date"])
+    # oh_at_date: Date/datetime для Excel как у pandas read_excel
+    df["oh_at_date"] = pd.to_datetime(df["oh_at_date"], errors="coerce")
+    return df
+
+
+def _query_df(client, sql: str, post=None) -> pd.DataFrame:
+    """
+    Результат запроса блоками (query_df_stream, max_block_size = QUERY_BLOCK_ROWS);
+    post(block) применяется к каждому блоку до склейки.
+    """
+    frames = []
+    with client.query_df_stream(sql, settings={"max_block_size": QUERY_BLOCK_ROWS}) as stream:
+        for block in stream:
+            frames.append(post(block) if post else block)
+    if not frames:
+        # Пустой результат: схема колонок без строк
+        empty = client.query_df(f"SELECT * FROM ({sql}) LIMIT 0")
+        return post(empty) if post else empty
+    return pd.concat(frames, ignore_index=True)
+
+
+def _write_output(df: pd.DataFrame, out_dir: Path, stem: str, fmt: str = "xlsx") -> Path:
+    """Запись выгрузки: xlsx (openpyxl), parquet (нужен pyarrow) или csv (utf-8-sig)."""
+    path = out_dir / f"{stem}.{fmt}"
+    if fmt == "xlsx":
+        df.to_excel(path, index=False, engine="openpyxl")
+    elif fmt == "parquet":
+        try:
+            df.to_parquet(path, index=False)
+        except ImportError as e:
+            _fail(f"--format parquet: {e}")
+    else:
+        df.to_csv(path, index=False, encoding="utf-8-sig")
+    _remember_export(df, path)
+    return path
 
 
 def _ac_typ_case_sql(col: str) -> str:
@@ -119,7 +196,9 @@ def _ac_typ_case_sql(col: str) -> str:
 )"""
 
 
-def export_status_components(client, out_dir: Path, report_date: str = DEFAULT_REPORT_DATE) -> Path:
+def export_status_components(
+    client, out_dir: Path, report_date: str = DEFAULT_REPORT_DATE, fmt: str = "xlsx"
+) -> Path:
     sql = f"""
 SELECT
   partno,
@@ -145,18 +224,13 @@ SELECT
 FROM reports.amos_heli_rotables_components_status
 WHERE report_date = toDate('{report_date}')
 """
-    df = client.query_df(sql)
-    df["lease_restricted"] = _lease_col(df["owner"])
-    df["removal_date"] = _fmt_dmY_series(df["removal_date"])
-    df["target_date"] = _fmt_dmY_series(df["target_date"])
-    # oh_at_date: Date/datetime для Excel как у pandas read_excel
-    df["oh_at_date"] = pd.to_datetime(df["oh_at_date"], errors="coerce")
-    path = out_dir / "Status_Components.xlsx"
-    df.to_excel(path, index=False, engine="openpyxl")
-    return path
+    df = _query_df(client, sql, post=_status_components_post)
+    return _write_output(df, out_dir, "Status_Components", fmt)
 
 
-def export_program_ac(client, out_dir: Path, report_date: str = DEFAULT_REPORT_DATE) -> Path:
+def export_program_ac(
+    client, out_dir: Path, report_date: str = DEFAULT_REPORT_DATE, fmt: str = "xlsx"
+) -> Path:
     ae, ast = _as_of_end(report_date), _as_of_start(report_date)
     sql = f"""
 WITH
@@ -210,13 +284,13 @@ WHERE a.ac_typ IN ('МИ8', 'МИ8АМТ', 'МИ8МТВ')
   AND a.non_managed = 'N'
 ORDER BY ac_registr
 """
-    df = client.query_df(sql)
-    path = out_dir / "Program_AC.xlsx"
-    df.to_excel(path, index=False, engine="openpyxl")
-    return path
+    df = _query_df(client, sql)
+    return _write_output(df, out_dir, "Program_AC", fmt)
 
 
-def export_status_overhaul(client, out_dir: Path, report_date: str = DEFAULT_REPORT_DATE) -> Path:
+def export_status_overhaul(
+    client, out_dir: Path, report_date: str = DEFAULT_REPORT_DATE, fmt: str = "xlsx"
+) -> Path:
     ae, ast = _as_of_end(report_date), _as_of_start(report_date)
     sql = f"""
 WITH
@@ -262,42 +336,8 @@ AND a.manual_owner = 'ЮТ-ВУ'
 AND wp.ac_typ IN ('МИ8', 'МИ8АМТ', 'МИ8МТВ')
 ORDER BY ac_registr, wpno
 """
-    df = client.query_df(sql)
-    stmap = {-1: "Открыто", -2: "Закрыто", -3: "В процессе"}
-
-    def _map_wp_st(x):
-        if pd.isna(x):
-            return ""
-        try:
-            xi = int(x)
-        except (TypeError, ValueError):
-            return str(x)
-        return stmap.get(xi, str(xi))
-
-    df["status"] = df["status_code"].map(_map_wp_st)
-    df = df.drop(columns=["status_code"])
-    df["sched_start_date"] = _amos_int_to_timestamp(df["start_date"])
-    df["sched_end_date"] = _amos_int_to_timestamp(df["end_date"])
-    df["act_start_date"] = _amos_int_to_timestamp(df["act_start_date"])
-    df["act_end_date"] = _amos_int_to_timestamp(df["act_end_date"])
-    df = df.drop(columns=["start_date", "end_date"])
-    cols = [
-        "ac_registr",
-        "ac_typ",
-        "wpno",
-        "description",
-        "sched_start_date",
-        "sched_end_date",
-        "act_start_date",
-        "act_end_date",
-        "status",
-        "owner",
-        "operator",
-    ]
-    df = df[cols]
-    path = out_dir / "Status_Overhaul.xlsx"
-    df.to_excel(path, index=False, engine="openpyxl")
-    return path
+    df = _query_df(client, sql, post=_status_overhaul_post)
+    return _write_output(df, out_dir, "Status_Overhaul", fmt)
 
 
 def _status_overhaul_dataframe(client, report_date: str) -> pd.DataFrame:
@@ -346,48 +386,15 @@ AND a.manual_owner = 'ЮТ-ВУ'
 AND wp.ac_typ IN ('МИ8', 'МИ8АМТ', 'МИ8МТВ')
 ORDER BY ac_registr, wpno
 """
-    df = client.query_df(sql)
-    stmap = {-1: "Открыто", -2: "Закрыто", -3: "В процессе"}
-
-    def _map_wp_st(x):
-        if pd.isna(x):
-            return ""
-        try:
-            xi = int(x)
-        except (TypeError, ValueError):
-            return str(x)
-        return stmap.get(xi, str(xi))
-
-    df["status"] = df["status_code"].map(_map_wp_st)
-    df = df.drop(columns=["status_code"])
-    df["sched_start_date"] = _amos_int_to_timestamp(df["start_date"])
-    df["sched_end_date"] = _amos_int_to_timestamp(df["end_date"])
-    df["act_start_date"] = _amos_int_to_timestamp(df["act_start_date"])
-    df["act_end_date"] = _amos_int_to_timestamp(df["act_end_date"])
-    df = df.drop(columns=["start_date", "end_date"])
-    return df[
-        [
-            "ac_registr",
-            "ac_typ",
-            "wpno",
-            "description",
-            "sched_start_date",
-            "sched_end_date",
-            "act_start_date",
-            "act_end_date",
-            "status",
-            "owner",
-            "operator",
-        ]
-    ]
+    return _query_df(client, sql, post=_status_overhaul_post)
 
 
 def export_program_ac_match_golden(
-    client, out_dir: Path, report_date: str, golden_dir: Path
+    client, out_dir: Path, report_date: str, golden_dir: Path, fmt: str = "xlsx"
 ) -> Path:
     """Program_AC: только борта из golden; без фильтра status=0 (восстанавливает 22321 и др.). Порядок строк как в golden."""
     gpath = golden_dir / "Program_AC.xlsx"
-    df_g = pd.read_excel(gpath, engine="openpyxl")
+    df_g = _load_frame(gpath)
     regs = sorted({int(x) for x in df_g["ac_registr"].dropna().unique()})
     in_list = ",".join(str(x) for x in regs)
     ae, ast = _as_of_end(report_date), _as_of_start(report_date)
@@ -443,7 +450,7 @@ WHERE a.ac_typ IN ('МИ8', 'МИ8АМТ', 'МИ8МТВ')
   AND toInt64OrZero(trimBoth(a.ac_registr)) IN ({in_list})
 ORDER BY ac_registr
 """
-    df = client.query_df(sql)
+    df = _query_df(client, sql)
     kg = df_g[["ac_registr"]].copy()
     kg["_ord"] = np.arange(len(kg), dtype=np.int64)
     out = kg.merge(df, on="ac_registr", how="left").sort_values("_ord").drop(columns=["_ord"])
@@ -451,17 +458,15 @@ ORDER BY ac_registr
         if c not in out.columns:
             out[c] = np.nan
     out = out[list(df_g.columns)]
-    path = out_dir / "Program_AC.xlsx"
-    out.to_excel(path, index=False, engine="openpyxl")
-    return path
+    return _write_output(out, out_dir, "Program_AC", fmt)
 
 
 def export_status_components_match_golden(
-    client, out_dir: Path, report_date: str, golden_dir: Path
+    client, out_dir: Path, report_date: str, golden_dir: Path, fmt: str = "xlsx"
 ) -> Path:
     """Status_Components: строки и порядок как в golden; значения из витрины reports по (psn, partno)."""
     gpath = golden_dir / "Status_Components.xlsx"
-    df_g = pd.read_excel(gpath, engine="openpyxl")
+    df_g = _load_frame(gpath)
     sql = f"""
 SELECT
   partno,
@@ -487,7 +492,7 @@ SELECT
 FROM reports.amos_heli_rotables_components_status
 WHERE report_date = toDate('{report_date}')
 """
-    df_q = client.query_df(sql)
+    df_q = _query_df(client, sql)
     df_q["partno"] = df_q["partno"].astype(str).str.strip()
     df_q = df_q.drop_duplicates(subset=["psn", "partno"], keep="first")
     df_g = df_g.copy()
@@ -495,27 +500,21 @@ WHERE report_date = toDate('{report_date}')
     kg = df_g[["psn", "partno"]].copy()
     kg["_ord"] = np.arange(len(kg), dtype=np.int64)
     m = kg.merge(df_q, on=["psn", "partno"], how="left").sort_values("_ord")
-    m = m.drop(columns=["_ord"])
-    m["lease_restricted"] = _lease_col(m["owner"])
-    m["removal_date"] = _fmt_dmY_series(m["removal_date"])
-    m["target_date"] = _fmt_dmY_series(m["target_date"])
-    m["oh_at_date"] = pd.to_datetime(m["oh_at_date"], errors="coerce")
-    col_order = list(pd.read_excel(gpath, engine="openpyxl", nrows=0).columns)
+    m = _status_components_post(m.drop(columns=["_ord"]))
+    col_order = list(df_g.columns)
     for c in col_order:
         if c not in m.columns:
             m[c] = np.nan
     m = m[col_order]
-    path = out_dir / "Status_Components.xlsx"
-    m.to_excel(path, index=False, engine="openpyxl")
-    return path
+    return _write_output(m, out_dir, "Status_Components", fmt)
 
 
 def export_status_overhaul_match_golden(
-    client, out_dir: Path, report_date: str, golden_dir: Path
+    client, out_dir: Path, report_date: str, golden_dir: Path, fmt: str = "xlsx"
 ) -> Path:
     """Status_Overhaul: порядок строк как в golden; ключи (ac_registr, wpno) к данным DWH."""
     gpath = golden_dir / "Status_Overhaul.xlsx"
-    df_g = pd.read_excel(gpath, engine="openpyxl")
+    df_g = _load_frame(gpath)
     df_r = _status_overhaul_dataframe(client, report_date)
     df_r["ac_registr"] = df_r["ac_registr"].astype(np.int64)
     df_r["wpno"] = df_r["wpno"].astype(str).str.strip()
@@ -528,79 +527,184 @@ def export_status_overhaul_match_golden(
         if c not in out.columns:
             out[c] = np.nan
     out = out[list(df_g.columns)]
-    path = out_dir / "Status_Overhaul.xlsx"
-    out.to_excel(path, index=False, engine="openpyxl")
-    return path
-
-
-def _norm_cell(v):
-    if v is None:
-        return None
-    if isinstance(v, float) and np.isnan(v):
-        return None
-    if isinstance(v, (np.floating, float)):
-        if np.isnan(v):
-            return None
-        return round(float(v), 6)
-    if isinstance(v, str):
-        t = v.strip()
-        return None if t == "" else t
-    if pd.isna(v):
-        return None
-    if hasattr(v, "to_pydatetime"):
-        return pd.Timestamp(v).normalize()
-    if isinstance(v, pd.Timestamp):
-        return v.normalize()
-    return v
-
-
-def _row_key_psn(row: pd.Series) -> str:
-    psn = row.get("psn")
-    if psn is not None and not (isinstance(psn, float) and np.isnan(psn)) and str(psn).strip() != "":
-        return str(psn).strip()
-    p = row.get("partno")
-    s = row.get("serialno")
-    return f"{p}|{s}"
-
-
-def compare_status_components(gold: pd.DataFrame, replay: pd.DataFrame) -> None:
-    kg = gold.apply(_row_key_psn, axis=1)
-    kr = replay.apply(_row_key_psn, axis=1)
+    return _write_output(out, out_dir, "Status_Overhaul", fmt)
+
+
+# Кэш прочитанных Excel для сравнения: pickle рядом с output/, ключ — путь + размер + mtime
+COMPARE_CACHE_DIR = "output/.compare_cache"
+_NULL_STR = "\x00"
+# Выгруженные в этом процессе таблицы: путь -> (mtime_ns, DataFrame) — сравнение без перечитывания
+_EXPORTED: dict[Path, tuple[int, pd.DataFrame]] = {}
+
+
+def _remember_export(df: pd.DataFrame, path: Path) -> None:
+    _EXPORTED[path.resolve()] = (path.stat().st_mtime_ns, df)
+
+
+def _load_frame(path: Path) -> pd.DataFrame:
+    """Таблица для сравнения: из памяти (если выгружена сейчас), из pickle-кэша или из файла (xlsx/parquet/csv)."""
+    path = path.resolve()
+    st = path.stat()
+    mem = _EXPORTED.get(path)
+    if mem is not None and mem[0] == st.st_mtime_ns:
+        return mem[1]
+    cache_dir = _repo_root() / COMPARE_CACHE_DIR
+    tag = hashlib.sha1(f"{path}|{st.st_size}|{st.st_mtime_ns}".encode("utf-8")).hexdigest()[:16]
+    prefix = f"{path.parent.name}_{path.stem}"
+    cached = cache_dir / f"{prefix}_{tag}.pkl"
+    if cached.exists():
+        return pd.read_pickle(cached)
+    print(f"  чтение {path.name} ({path.parent.name})...", flush=True)
+    if path.suffix == ".parquet":
+        df = pd.read_parquet(path)
+    elif path.suffix == ".csv":
+        df = pd.read_csv(path, encoding="utf-8-sig")
+    else:
+        df = pd.read_excel(path, engine="openpyxl")
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    for old in cache_dir.glob(f"{prefix}_*.pkl"):
+        old.unlink()
+    df.to_pickle(cached)
+    return df
+
+
+def _column_kind(a: pd.Series, b: pd.Series) -> str:
+    """Общий тип нормализации пары колонок: num / date / str."""
+    if is_numeric_dtype(a) and is_numeric_dtype(b):
+        return "num"
+    if is_datetime64_any_dtype(a) or is_datetime64_any_dtype(b):
+        return "date"
+    return "str"
+
+
+def _norm_column(s: pd.Series, kind: str) -> pd.Series:
+    """Векторная нормализация колонки: числа round(6), даты normalize(), строки strip ('' = NULL)."""
+    if kind == "num":
+        return pd.to_numeric(s, errors="coerce").astype("float64").round(6)
+    if kind == "date":
+        return pd.to_datetime(s, errors="coerce").dt.normalize()
+    t = s.astype(object).where(s.notna(), None)
+    t = t.astype(str).str.strip().where(t.notna(), "")
+    return t.where(t != "", _NULL_STR)
+
+
+def _is_same(a: pd.Series, b: pd.Series) -> np.ndarray:
+    """Поэлементное равенство нормализованных колонок (NULL == NULL)."""
+    return ((a.to_numpy() == b.to_numpy()) | (a.isna().to_numpy() & b.isna().to_numpy()))
+
+
+def _psn_keys(df: pd.DataFrame) -> pd.Series:
+    """Ключ строки Status_Components: psn, иначе partno|serialno."""
+    psn = df["psn"] if "psn" in df.columns else pd.Series(np.nan, index=df.index)
+    psn_s = psn.astype(str).str.strip()
+    fallback = df.get("partno", pd.Series(None, index=df.index)).astype(str) + "|" + df.get(
+        "serialno", pd.Series(None, index=df.index)
+    ).astype(str)
+    return psn_s.where(psn.notna() & (psn_s != ""), fallback)
+
+
+def _join_keys(df: pd.DataFrame, key_cols: list[str]) -> pd.Series:
+    keys = df[key_cols[0]].astype(str)
+    for c in key_cols[1:]:
+        keys = keys + "|" + df[c].astype(str)
+    return keys
+
+
+def compare_keyed(
+    name: str,
+    gold: pd.DataFrame,
+    replay: pd.DataFrame,
+    kg: pd.Series,
+    kr: pd.Series,
+    diff_path: Path | None = None,
+) -> dict:
+    """
+    Сравнение по ключу: векторная нормализация колонок, 64-битный хэш строки по общим
+    колонкам, поячеечный разбор только для ключей с несовпавшим хэшем.
+    Печатает сводку по колонкам; различающиеся ячейки пишет в CSV diff_path.
+    """
     sg, sr = set(kg), set(kr)
-    print(f"  Status_Components keys: golden {len(sg)}, replay {len(sr)}", flush=True)
-    print(f"  only in golden: {len(sg - sr)}  only in replay: {len(sr - sg)}", flush=True)
-    cols_g = set(gold.columns)
-    cols_r = set(replay.columns)
-    print(f"  columns only golden: {sorted(cols_g - cols_r)}", flush=True)
-    print(f"  columns only replay: {sorted(cols_r - cols_g)}", flush=True)
-    shared = sorted(cols_g & cols_r)
-    gi = gold.assign(_k=kg).drop_duplicates("_k", keep="first").set_index("_k")
-    ri = replay.assign(_k=kr).drop_duplicates("_k", keep="first").set_index("_k")
+    print(f"  [{name}] rows golden={len(gold)} replay={len(replay)}", flush=True)
+    print(f"  keys: golden {len(sg)}, replay {len(sr)}", flush=True)
+    print(f"  keys only golden: {len(sg - sr)}  only replay: {len(sr - sg)}", flush=True)
+    print(f"  columns only golden: {sorted(set(gold.columns) - set(replay.columns))}", flush=True)
+    print(f"  columns only replay: {sorted(set(replay.columns) - set(gold.columns))}", flush=True)
+
+    shared = sorted(set(gold.columns) & set(replay.columns))
+    gi = gold.assign(_k=kg.to_numpy()).drop_duplicates("_k", keep="first").set_index("_k")
+    ri = replay.assign(_k=kr.to_numpy()).drop_duplicates("_k", keep="first").set_index("_k")
     common_idx = gi.index.intersection(ri.index)
-    subg = gi.loc[common_idx]
-    subr = ri.loc[common_idx]
+    subg = gi.loc[common_idx, shared]
+    subr = ri.loc[common_idx, shared]
+
+    kinds = {c: _column_kind(subg[c], subr[c]) for c in shared}
+    ng = pd.DataFrame({c: _norm_column(subg[c], kinds[c]) for c in shared}, index=common_idx)
+    nr = pd.DataFrame({c: _norm_column(subr[c], kinds[c]) for c in shared}, index=common_idx)
+    hg = pd.util.hash_pandas_object(ng, index=False).to_numpy()
+    hr = pd.util.hash_pandas_object(nr, index=False).to_numpy()
+    bad = hg != hr
+    n_bad = int(bad.sum())
+
+    mismatch: dict[str, int] = {}
+    diffs = []
+    if n_bad:
+        bg, br = ng[bad], nr[bad]
+        og, orr = subg[bad], subr[bad]
+        for c in shared:
+            neq = ~_is_same(bg[c], br[c])
+            cnt = int(neq.sum())
+            if not cnt:
+                continue
+            mismatch[c] = cnt
+            diffs.append(
+                pd.DataFrame(
+                    {
+                        "key": bg.index[neq],
+                        "column": c,
+                        "golden": og[c].to_numpy()[neq],
+                        "replay": orr[c].to_numpy()[neq],
+                    }
+                )
+            )
+
     total_cells = len(common_idx) * len(shared)
-    match = 0
-    for c in shared:
-        a = subg[c].map(_norm_cell)
-        b = subr[c].map(_norm_cell)
-        match += int((a == b).sum())
+    match = total_cells - sum(mismatch.values())
+    print(f"  rows equal (hash): {len(common_idx) - n_bad}/{len(common_idx)}", flush=True)
     if total_cells:
         print(
-            f"  cell match (normalized) approx: {match}/{total_cells} "
+            f"  cell match (normalized): {match}/{total_cells} "
             f"({100.0 * match / total_cells:.2f}%)",
             flush=True,
         )
+    for c, cnt in sorted(mismatch.items(), key=lambda kv: (-kv[1], kv[0])):
+        print(f"    {c}: {cnt} ({kinds[c]})", flush=True)
+    if diff_path is not None:
+        cells = (
+            pd.concat(diffs, ignore_index=True)
+            if diffs
+            else pd.DataFrame(columns=["key", "column", "golden", "replay"])
+        )
+        cells.to_csv(diff_path, index=False, encoding="utf-8-sig")
+        print(f"  diff cells: {len(cells)} -> {diff_path}", flush=True)
+    return {
+        "keys_only_golden": len(sg - sr),
+        "keys_only_replay": len(sr - sg),
+        "rows_compared": len(common_idx),
+        "rows_mismatched": n_bad,
+        "cells_total": total_cells,
+        "cells_matched": match,
+        "column_mismatches": mismatch,
+    }
 
 
-def compare_frames(name: str, gold: pd.DataFrame, replay: pd.DataFrame, key_cols: list[str]) -> None:
-    print(f"  [{name}] rows golden={len(gold)} replay={len(replay)}", flush=True)
-    print(f"  columns only golden: {sorted(set(gold.columns) - set(replay.columns))}", flush=True)
-    print(f"  columns only replay: {sorted(set(replay.columns) - set(gold.columns))}", flush=True)
-    kg = gold[key_cols].astype(str).agg("|".join, axis=1)
-    kr = replay[key_cols].astype(str).agg("|".join, axis=1)
-    sg, sr = set(kg), set(kr)
-    print(f"  keys only golden: {len(sg - sr)}  only replay: {len(sr - sg)}", flush=True)
+def compare_status_components(gold: pd.DataFrame, replay: pd.DataFrame, diff_path: Path | None = None) -> dict:
+    return compare_keyed("Status_Components", gold, replay, _psn_keys(gold), _psn_keys(replay), diff_path)
+
+
+def compare_frames(
+    name: str, gold: pd.DataFrame, replay: pd.DataFrame, key_cols: list[str], diff_path: Path | None = None
+) -> dict:
+    return compare_keyed(name, gold, replay, _join_keys(gold, key_cols), _join_keys(replay, key_cols), diff_path)
 
 
 def run_compare(
@@ -608,33 +712,48 @@ def run_compare(
     out_dir: Path,
     *,
     steps: set[str] | None = None,
-) -> None:
-    """steps: подмножество {'status_components','program_ac','status_overhaul'}; None = все три."""
+    fmt: str = "xlsx",
+) -> dict:
+    """steps: подмножество {'status_components','program_ac','status_overhaul'}; None = все три.
+
+    fmt: формат файлов выгрузки в out_dir (golden всегда xlsx).
+    Различающиеся ячейки — в out_dir/compare_<Таблица>_diff_cells.csv.
+    """
     warnings.filterwarnings(
         "ignore", message="Workbook contains no default style", category=UserWarning
     )
-    all_steps = {"status_components", "program_ac", "status_overhaul"}
+    all_steps = set(EXPORT_STEPS)
     active = all_steps if steps is None else (steps & all_steps)
     if not active:
-        return
+        return {}
 
     print("\n=== Сравнение с golden ===", flush=True)
+    results = {}
     if "status_components" in active:
-        print("  чтение Status_Components (golden)...", flush=True)
-        sc_g = pd.read_excel(golden_dir / "Status_Components.xlsx", engine="openpyxl")
-        print("  чтение Status_Components (replay)...", flush=True)
-        sc_r = pd.read_excel(out_dir / "Status_Components.xlsx", engine="openpyxl")
-        compare_status_components(sc_g, sc_r)
+        sc_g = _load_frame(golden_dir / "Status_Components.xlsx")
+        sc_r = _load_frame(out_dir / f"Status_Components.{fmt}")
+        results["status_components"] = compare_status_components(
+            sc_g, sc_r, out_dir / "compare_Status_Components_diff_cells.csv"
+        )
 
     if "program_ac" in active:
-        pa_g = pd.read_excel(golden_dir / "Program_AC.xlsx", engine="openpyxl")
-        pa_r = pd.read_excel(out_dir / "Program_AC.xlsx", engine="openpyxl")
-        compare_frames("Program_AC", pa_g, pa_r, ["ac_registr"])
+        pa_g = _load_frame(golden_dir / "Program_AC.xlsx")
+        pa_r = _load_frame(out_dir / f"Program_AC.{fmt}")
+        results["program_ac"] = compare_frames(
+            "Program_AC", pa_g, pa_r, ["ac_registr"], out_dir / "compare_Program_AC_diff_cells.csv"
+        )
 
     if "status_overhaul" in active:
-        so_g = pd.read_excel(golden_dir / "Status_Overhaul.xlsx", engine="openpyxl")
-        so_r = pd.read_excel(out_dir / "Status_Overhaul.xlsx", engine="openpyxl")
-        compare_frames("Status_Overhaul", so_g, so_r, ["ac_registr", "wpno"])
+        so_g = _load_frame(golden_dir / "Status_Overhaul.xlsx")
+        so_r = _load_frame(out_dir / f"Status_Overhaul.{fmt}")
+        results["status_overhaul"] = compare_frames(
+            "Status_Overhaul",
+            so_g,
+            so_r,
+            ["ac_registr", "wpno"],
+            out_dir / "compare_Status_Overhaul_diff_cells.csv",
+        )
+    return results
 
 
 def _parse_args() -> argparse.Namespace:
@@ -679,6 +798,18 @@ def _parse_args() -> argparse.Namespace:
         action="store_true",
         help="Выгрузка по ключам/порядку golden: Program_AC без status=0; SC/WP join к витрине по ключам из Excel.",
     )
+    p.add_argument(
+        "--format",
+        choices=OUTPUT_FORMATS,
+        default="xlsx",
+        help="Формат выгрузки: xlsx (по умолчанию), parquet (pyarrow) или csv — без openpyxl, если нужна только сверка",
+    )
+    p.add_argument(
+        "--jobs",
+        type=int,
+        default=len(EXPORT_STEPS),
+        help=f"Параллельных выгрузок (свой клиент DWH на поток). По умолчанию {len(EXPORT_STEPS)}",
+    )
     return p.parse_args()
 
 
@@ -692,11 +823,11 @@ def main() -> None:
 
     steps_arg = args.step
     if not steps_arg or "all" in steps_arg:
-        export_steps = {"program_ac", "status_overhaul", "status_components"}
+        export_steps = set(EXPORT_STEPS)
     else:
         export_steps = set(steps_arg)
 
-    client = dwh_client()
+    _check_env()
     golden = (
         Path(args.golden_dir).resolve()
         if args.golden_dir
@@ -706,24 +837,28 @@ def main() -> None:
     if use_match and not golden.is_dir():
         _fail(f"--match-golden: нет каталога {golden}")
 
-    if "status_components" in export_steps:
-        print("Экспорт Status_Components...", flush=True)
+    exporters = {
+        "status_components": ("Status_Components", export_status_components, export_status_components_match_golden),
+        "program_ac": ("Program_AC", export_program_ac, export_program_ac_match_golden),
+        "status_overhaul": ("Status_Overhaul", export_status_overhaul, export_status_overhaul_match_golden),
+    }
+
+    def run_export(step: str) -> tuple[str, Path, float]:
+        label, plain, matched = exporters[step]
+        print(f"Экспорт {label}...", flush=True)
+        started = time.time()
+        # clickhouse_connect: одна сессия не выполняет запросы параллельно — клиент на выгрузку
+        client = dwh_client()
         if use_match:
-            export_status_components_match_golden(client, out_dir, report_date, golden)
+            path = matched(client, out_dir, report_date, golden, fmt=args.format)
         else:
-            export_status_components(client, out_dir, report_date=report_date)
-    if "program_ac" in export_steps:
-        print("Экспорт Program_AC...", flush=True)
-        if use_match:
-            export_program_ac_match_golden(client, out_dir, report_date, golden)
-        else:
-            export_program_ac(client, out_dir, report_date=report_date)
-    if "status_overhaul" in export_steps:
-        print("Экспорт Status_Overhaul...", flush=True)
-        if use_match:
-            export_status_overhaul_match_golden(client, out_dir, report_date, golden)
-        else:
-            export_status_overhaul(client, out_dir, report_date=report_date)
+            path = plain(client, out_dir, report_date=report_date, fmt=args.format)
+        return label, path, time.time() - started
+
+    ordered = [step for step in EXPORT_STEPS if step in export_steps]
+    with ThreadPoolExecutor(max_workers=max(1, min(args.jobs, len(ordered) or 1))) as pool:
+        for label, path, elapsed in pool.map(run_export, ordered):
+            print(f"  {label}: {path.name} ({elapsed:.1f}s)", flush=True)
 
     print(f"Готово: {out_dir}", flush=True)
 
@@ -733,7 +868,7 @@ def main() -> None:
         print(f"WARNING: нет каталога golden, сравнение пропущено: {golden}", file=sys.stderr)
         return
     compare_only = export_steps if export_steps else None
-    run_compare(golden, out_dir, steps=compare_only)
+    run_compare(golden, out_dir, steps=compare_only, fmt=args.format)
     if use_match:
         print("\n=== Режим --match-golden: ключи и число строк совпадают с golden; проверьте cell diff выше ===", flush=True)
 
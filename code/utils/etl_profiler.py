@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+ETL Profiler - профилирование шагов Extract пайплайна
+
+Для каждого шага extract_master.py фиксируется:
+- wall / CPU (user+sys) время и пиковый RSS дочернего процесса (os.wait4);
+- статистика ClickHouse из system.query_log по log_comment шага
+  (запросы, прочитано/записано строк и байт, число мутаций ALTER UPDATE/DELETE);
+- статус шага (success / failed / skipped).
+
+Запуск сохраняется в logs/extract_profiles/:
+- profile_<run_id>.json — полный профиль прогона;
+- history.csv — история по шагам всех прогонов.
+Профиль сравнивается с предыдущим прогоном того же датасета: шаги,
+замедлившиеся больше порога, помечаются как регрессии.
+
+Метка log_comment передаётся дочерним скриптам через переменную окружения
+CH_LOG_COMMENT (подхватывается get_clickhouse_client).
+"""
+
+import csv
+import json
+import logging
+import os
+import subprocess
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = Path('logs/extract_profiles')
+LOG_COMMENT_ENV = 'CH_LOG_COMMENT'
+
+# Регрессия: медленнее предыдущего прогона больше чем на threshold и на min_delta_sec
+DEFAULT_REGRESSION_THRESHOLD = 0.2
+DEFAULT_MIN_DELTA_SEC = 2.0
+
+HISTORY_FIELDS = [
+    'run_id', 'dataset', 'version_date', 'version_id', 'mode', 'step', 'status',
+    'wall_sec', 'cpu_user_sec', 'cpu_sys_sec', 'peak_rss_mb',
+    'queries', 'read_rows', 'read_bytes', 'written_rows', 'written_bytes', 'mutations', 'failed_queries',
+]
+
+
+def run_profiled(cmd: List[str], timeout: float, cwd=None, env=None) -> Tuple[subprocess.CompletedProcess, Dict]:
+    """
+    subprocess.run(capture_output=True, text=True) с ресурсами дочернего процесса
+
+    Returns:
+        (CompletedProcess, {'cpu_user_sec', 'cpu_sys_sec', 'peak_rss_mb'})
+        На платформах без os.wait4 ресурсы не собираются (значения None).
+
+    Raises:
+        subprocess.TimeoutExpired: процесс превысил timeout (процесс убивается)
+    """
+    if not hasattr(os, 'wait4'):
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout, cwd=cwd, env=env)
+        return result, {'cpu_user_sec': None, 'cpu_sys_sec': None, 'peak_rss_mb': None}
+
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, cwd=cwd, env=env)
+    streams = {'stdout': [], 'stderr': []}
+
+    def _drain(name):
+        streams[name].append(getattr(proc, name).read())
+
+    readers = [threading.Thread(target=_drain, args=(name,), daemon=True) for name in streams]
+    for reader in readers:
+        reader.start()
+
+    deadline = time.time() + timeout
+    while True:
+        pid, status, rusage = os.wait4(proc.pid, os.WNOHANG)
+        if pid:
+            break
+        if time.time() > deadline:
+            proc.kill()
+            os.wait4(proc.pid, 0)
+            proc.returncode = -9
+            raise subprocess.TimeoutExpired(cmd, timeout)
+        time.sleep(0.1)
+
+    # Процесс уже собран через wait4 — Popen не должен ждать его повторно
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    for reader in readers:
+        reader.join()
+
+    usage = {
+        'cpu_user_sec': round(rusage.ru_utime, 2),
+        'cpu_sys_sec': round(rusage.ru_stime, 2),
+        'peak_rss_mb': round(rusage.ru_maxrss / 1024, 1),  # Linux: ru_maxrss в KB
+    }
+    completed = subprocess.CompletedProcess(
+        cmd, proc.returncode, ''.join(streams['stdout']), ''.join(streams['stderr'])
+    )
+    return completed, usage
+
+
+class ETLRunProfiler:
+    """Профиль одного прогона Extract пайплайна"""
+
+    def __init__(self, client, dataset: str, version_date, version_id: int, mode: str,
+                 profile_dir: Optional[Path] = None,
+                 regression_threshold: float = DEFAULT_REGRESSION_THRESHOLD,
+                 min_delta_sec: float = DEFAULT_MIN_DELTA_SEC):
+        self.client = client
+        self.dataset = dataset
+        self.version_date = version_date
+        self.version_id = version_id
+        self.mode = mode
+        self.profile_dir = Path(profile_dir) if profile_dir else PROFILE_DIR
+        self.regression_threshold = regression_threshold
+        self.min_delta_sec = min_delta_sec
+        self.run_id = datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.started_at = datetime.now().isoformat(timespec='seconds')
+        self.steps: List[Dict] = []
+        self.query_log_available = self._probe_query_log()
+
+    def _probe_query_log(self) -> bool:
+        """Метки log_comment и system.query_log доступны на сервере"""
+        try:
+            has_setting = self.client.execute(
+                "SELECT count() FROM system.settings WHERE name = 'log_comment'"
+            )[0][0] > 0
+            has_log = self.client.execute("EXISTS TABLE system.query_log")[0][0]
+            if not (has_setting and has_log):
+                logger.warning("⚠️ system.query_log/log_comment недоступны — профиль без статистики ClickHouse")
+            return bool(has_setting and has_log)
+        except Exception as e:
+            logger.warning(f"⚠️ Проверка system.query_log не удалась ({e}) — профиль без статистики ClickHouse")
+            return False
+
+    def query_tag(self, step_name: str) -> Optional[str]:
+        """log_comment для запросов шага (None — метки не поддерживаются)"""
+        if not self.query_log_available:
+            return None
+        return f"extract:{self.run_id}:{step_name}"
+
+    def collect_query_stats(self, tag: Optional[str]) -> Dict:
+        """Сводка system.query_log по log_comment шага"""
+        empty = {key: None for key in ('queries', 'read_rows', 'read_bytes', 'written_rows',
+                                       'written_bytes', 'mutations', 'failed_queries')}
+        if not tag:
+            return empty
+        try:
+            try:
+                self.client.execute("SYSTEM FLUSH LOGS")
+            except Exception as e:
+                logger.debug(f"SYSTEM FLUSH LOGS недоступен: {e}")
+            row = self.client.execute(
+                """
+                SELECT
+                    countIf(type = 'QueryFinish'),
+                    sum(read_rows),
+                    sum(read_bytes),
+                    sum(written_rows),
+                    sum(written_bytes),
+                    countIf(type = 'QueryFinish'
+                            AND match(query, '(?is)^\\\\s*(ALTER\\\\s+TABLE\\\\s.+\\\\s(UPDATE|DELETE)\\\\s|DELETE\\\\s+FROM\\\\s)')),
+                    countIf(type != 'QueryFinish')
+                FROM system.query_log
+                WHERE event_date >= yesterday()
+                  AND log_comment = %(tag)s
+                  AND type IN ('QueryFinish', 'ExceptionWhileProcessing')
+                """,
+                {'tag': tag}
+            )[0]
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось прочитать system.query_log: {e}")
+            return empty
+        return dict(zip(empty.keys(), (int(value or 0) for value in row)))
+
+    def record_step(self, step_name: str, status: str, wall_sec: float = 0.0,
+                    usage: Optional[Dict] = None, query_stats: Optional[Dict] = None) -> Dict:
+        """Добавляет шаг в профиль прогона"""
+        entry = {'step': step_name, 'status': status, 'wall_sec': round(wall_sec, 2)}
+        entry.update(usage or {'cpu_user_sec': None, 'cpu_sys_sec': None, 'peak_rss_mb': None})
+        entry.update(query_stats or self.collect_query_stats(None))
+        self.steps.append(entry)
+        return entry
+
+    def _previous_profile(self) -> Optional[Dict]:
+        """Последний сохранённый профиль того же датасета"""
+        candidates = sorted(self.profile_dir.glob('profile_*.json'), reverse=True)
+        for path in candidates:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    profile = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if profile.get('run_id') != self.run_id and profile.get('dataset') == self.dataset:
+                return profile
+        return None
+
+    def find_regressions(self, previous: Optional[Dict]) -> List[Dict]:
+        """Шаги, замедлившиеся относительно предыдущего прогона больше порога"""
+        if not previous:
+            return []
+        previous_steps = {
+            step['step']: step for step in previous.get('steps', []) if step.get('status') == 'success'
+        }
+        regressions = []
+        for step in self.steps:
+            before = previous_steps.get(step['step'])
+            if step['status'] != 'success' or not before or not before.get('wall_sec'):
+                continue
+            delta = step['wall_sec'] - before['wall_sec']
+            ratio = step['wall_sec'] / before['wall_sec']
+            if ratio > 1 + self.regression_threshold and delta > self.min_delta_sec:
+                regressions.append({
+                    'step': step['step'],
+                    'wall_sec': step['wall_sec'],
+                    'previous_wall_sec': before['wall_sec'],
+                    'ratio': round(ratio, 2),
+                })
+        return regressions
+
+    def save(self) -> Dict:
+        """Сохраняет профиль (JSON + history.csv) и сравнивает с предыдущим прогоном"""
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        previous = self._previous_profile()
+        regressions = self.find_regressions(previous)
+
+        profile = {
+            'run_id': self.run_id,
+            'started_at': self.started_at,
+            'finished_at': datetime.now().isoformat(timespec='seconds'),
+            'dataset': self.dataset,
+            'version_date': str(self.version_date),
+            'version_id': self.version_id,
+            'mode': self.mode,
+            'previous_run_id': previous.get('run_id') if previous else None,
+            'regression_threshold': self.regression_threshold,
+            'steps': self.steps,
+            'regressions': regressions,
+        }
+        profile_path = self.profile_dir / f"profile_{self.run_id}.json"
+        with open(profile_path, 'w', encoding='utf-8') as f:
+            json.dump(profile, f, ensure_ascii=False, indent=2)
+
+        history_path = self.profile_dir / 'history.csv'
+        write_header = not history_path.exists()
+        with open(history_path, 'a', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=HISTORY_FIELDS, extrasaction='ignore')
+            if write_header:
+                writer.writeheader()
+            for step in self.steps:
+                writer.writerow({
+                    'run_id': self.run_id, 'dataset': self.dataset, 'version_date': str(self.version_date),
+                    'version_id': self.version_id, 'mode': self.mode, **step,
+                })
+
+        self._log_report(profile, profile_path)
+        return profile
+
+    def _log_report(self, profile: Dict, profile_path: Path) -> None:
+        logger.info("\n⏱️ === ПРОФИЛЬ EXTRACT ПО ШАГАМ ===")
+        logger.info(f"{'Шаг':<42} {'Статус':<8} {'Wall,с':>8} {'CPU,с':>8} {'RSS,MB':>8} "
+                    f"{'Read rows':>12} {'Written':>12} {'Мут.':>5}")
+
+        def _fmt(value, pattern):
+            return pattern.format(value) if value is not None else '—'
+
+        for step in self.steps:
+            cpu = None
+            if step.get('cpu_user_sec') is not None:
+                cpu = step['cpu_user_sec'] + step['cpu_sys_sec']
+            logger.info(
+                f"{step['step']:<42} {step['status']:<8} {step['wall_sec']:>8.1f} "
+                f"{_fmt(cpu, '{:.1f}'):>8} {_fmt(step.get('peak_rss_mb'), '{:.0f}'):>8} "
+                f"{_fmt(step.get('read_rows'), '{:,}'):>12} {_fmt(step.get('written_rows'), '{:,}'):>12} "
+                f"{_fmt(step.get('mutations'), '{}'):>5}"
+            )
+
+        if profile['previous_run_id'] is None:
+            logger.info("📊 Предыдущий прогон этого датасета не найден — сравнение пропущено")
+        elif profile['regressions']:
+            logger.warning(
+                f"🐢 Регрессии относительно прогона {profile['previous_run_id']} "
+                f"(порог +{self.regression_threshold:.0%}):"
+            )
+            for reg in profile['regressions']:
+                logger.warning(
+                    f"   {reg['step']}: {reg['previous_wall_sec']:.1f}с → {reg['wall_sec']:.1f}с (x{reg['ratio']})"
+                )
+        else:
+            logger.info(f"✅ Регрессий относительно прогона {profile['previous_run_id']} нет")
+        logger.info(f"💾 Профиль: {profile_path}")
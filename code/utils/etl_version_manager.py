@@ -9,12 +9,18 @@ ETL Version Manager - централизованное управление ве
 - Новая дата = новый счетчик version_id с 1
 - Та же дата = инкремент version_id
 - Глобальный выбор политики для всех таблиц синхронно
+
+Поиск версий: таблицы без активных партов за дату отсекаются по min_date/max_date
+system.parts (партиции toYYYYMM(version_date)), остальные опрашиваются одним
+UNION ALL; результат кэшируется на дату до записи/удаления версий.
 """
 
 import logging
 from typing import Dict, List, Optional, Tuple
 from datetime import date
 
+from schema_snapshot import get_schema_snapshot, SchemaSnapshot
+
 logger = logging.getLogger(__name__)
 
 class ETLVersionManager:
@@ -45,11 +51,60 @@ class ETLVersionManager:
             client: ClickHouse client
         """
         self.client = client
+        # Кэш найденных версий: version_date -> {table_name: [version_ids]}
+        self._versions_cache: Dict[date, Dict[str, List[int]]] = {}
+    
+    def _schema(self, tables: List[str]) -> SchemaSnapshot:
+        """Снимок схем таблиц одним запросом (сверяется с metadata_modification_time)"""
+        return get_schema_snapshot(self.client, tables, validate=True)
+        
+    def invalidate_version_cache(self) -> None:
+        """Сбрасывает кэш найденных версий (после удаления/загрузки данных)"""
+        self._versions_cache.clear()
+    
+    def _candidate_tables_from_parts(self, version_date: date, tables: List[str]) -> Dict[str, bool]:
+        """
+        Отсечение таблиц по метаданным партиций (без сканирования данных)
         
+        Для таблиц с version_date в ключе партиционирования активные парты хранят
+        min_date/max_date; если ни одна парта не покрывает дату — версий за дату нет.
+        
+        Returns:
+            Dict[table_name, может_содержать_дату] для существующих таблиц
+        """
+        rows = self.client.execute(
+            """
+            SELECT
+                t.name,
+                t.partition_key,
+                countIf(p.name != '' AND p.min_date <= %(d)s AND p.max_date >= %(d)s) AS covering_parts
+            FROM system.tables AS t
+            LEFT JOIN (
+                SELECT table, name, min_date, max_date
+                FROM system.parts
+                WHERE database = currentDatabase() AND active
+            ) AS p ON p.table = t.name
+            WHERE t.database = currentDatabase() AND t.name IN %(tables)s
+            GROUP BY t.name, t.partition_key
+            """,
+            {'d': version_date, 'tables': tuple(tables)}
+        )
+        candidates = {}
+        for table_name, partition_key, covering_parts in rows:
+            if 'version_date' in (partition_key or ''):
+                candidates[table_name] = covering_parts > 0
+            else:
+                # Без version_date в ключе партиций метаданные не помогают — сканируем
+                candidates[table_name] = True
+        return candidates
+    
     def get_existing_versions(self, version_date: date, tables: List[str] = None) -> Dict[str, List[int]]:
         """
         Получает существующие version_id для указанной даты
         
+        Один запрос к system.parts отсекает таблицы без данных за дату,
+        оставшиеся опрашиваются одним UNION ALL. Результат кэшируется в экземпляре.
+        
         Args:
             version_date: Дата для проверки
             tables: Список таблиц (по умолчанию все ETL таблицы)
@@ -59,54 +114,71 @@ class ETLVersionManager:
         """
         if tables is None:
             tables = self.ETL_TABLES
-            
-        existing_versions = {}
         
-        for table_name in tables:
-            try:
-                # Проверяем существование таблицы
-                check_table_sql = f"EXISTS TABLE {table_name}"
-                table_exists = self.client.execute(check_table_sql)[0][0]
-                
-                if not table_exists:
+        cached = self._versions_cache.setdefault(version_date, {})
+        missing = [table_name for table_name in tables if table_name not in cached]
+        
+        if missing:
+            schema = self._schema(missing)
+            versioned = []
+            for table_name in missing:
+                if not schema.exists(table_name):
                     logger.debug(f"Таблица {table_name} не существует")
-                    existing_versions[table_name] = []
-                    continue
-                
-                # Проверяем наличие поля version_id
-                check_column_sql = f"""
-                SELECT count() 
-                FROM system.columns 
-                WHERE table = '{table_name}' AND name = 'version_id'
-                """
-                
-                has_version_id = self.client.execute(check_column_sql)[0][0] > 0
-                
-                if not has_version_id:
+                    cached[table_name] = []
+                elif not schema.has_column(table_name, 'version_id'):
                     logger.debug(f"Таблица {table_name} не имеет поля version_id")
-                    existing_versions[table_name] = []
-                    continue
-                
-                # Получаем существующие version_id для даты
-                query_sql = f"""
-                SELECT DISTINCT version_id 
-                FROM {table_name} 
-                WHERE version_date = '{version_date}'
-                ORDER BY version_id
-                """
-                
-                result = self.client.execute(query_sql)
-                version_ids = [row[0] for row in result] if result else []
-                existing_versions[table_name] = version_ids
-                
-                logger.debug(f"Таблица {table_name}: найдены version_id {version_ids} для даты {version_date}")
-                
-            except Exception as e:
-                logger.warning(f"Ошибка при проверке версий в таблице {table_name}: {e}")
-                existing_versions[table_name] = []
+                    cached[table_name] = []
+                else:
+                    versioned.append(table_name)
+            
+            to_scan = versioned
+            if versioned:
+                try:
+                    candidates = self._candidate_tables_from_parts(version_date, versioned)
+                    to_scan = [table_name for table_name in versioned if candidates.get(table_name, True)]
+                    for table_name in versioned:
+                        if table_name not in to_scan:
+                            cached[table_name] = []
+                    logger.debug(f"system.parts: данные за {version_date} возможны в {to_scan}")
+                except Exception as e:
+                    logger.warning(f"Не удалось прочитать system.parts, сканируем все таблицы: {e}")
+            
+            if to_scan:
+                cached.update(self._scan_versions(version_date, to_scan))
         
+        existing_versions = {table_name: list(cached.get(table_name, [])) for table_name in tables}
+        for table_name, version_ids in existing_versions.items():
+            if version_ids:
+                logger.debug(f"Таблица {table_name}: найдены version_id {version_ids} для даты {version_date}")
         return existing_versions
     
+    def _scan_versions(self, version_date: date, tables: List[str]) -> Dict[str, List[int]]:
+        """DISTINCT version_id за дату по нескольким таблицам одним UNION ALL"""
+        found = {table_name: [] for table_name in tables}
+        union_sql = "\nUNION ALL\n".join(
+            f"SELECT '{table_name}' AS table_name, version_id FROM {table_name} "
+            f"WHERE version_date = %(d)s GROUP BY version_id"
+            for table_name in tables
+        )
+        try:
+            rows = self.client.execute(union_sql, {'d': version_date})
+        except Exception as e:
+            logger.warning(f"Ошибка UNION ALL проверки версий ({e}), проверяем таблицы по одной")
+            rows = []
+            for table_name in tables:
+                try:
+                    result = self.client.execute(
+                        f"SELECT DISTINCT version_id FROM {table_name} WHERE version_date = %(d)s",
+                        {'d': version_date}
+                    )
+                    rows.extend((table_name, row[0]) for row in result)
+                except Exception as table_error:
+                    logger.warning(f"Ошибка при проверке версий в таблице {table_name}: {table_error}")
+        
+        for table_name, version_id in rows:
+            found[table_name].append(version_id)
+        return {table_name: sorted(version_ids) for table_name, version_ids in found.items()}
+    
     def get_next_version_id(self, version_date: date, tables: List[str] = None) -> int:
         """
         Определяет следующий version_id для указанной даты
@@ -229,17 +301,20 @@ class ETLVersionManager:
         logger.info(f"   ℹ️ Аддитивные таблицы ({', '.join(self.ADDITIVE_TABLES)}) НЕ удаляются")
         
         deleted_counts = {}
+        schema = self._schema(tables)
+        existing_versions = self.get_existing_versions(version_date, tables)
         
         for table_name in tables:
             try:
-                # Проверяем существование таблицы
-                check_table_sql = f"EXISTS TABLE {table_name}"
-                table_exists = self.client.execute(check_table_sql)[0][0]
-                
-                if not table_exists:
+                if not schema.exists(table_name):
                     logger.debug(f"Таблица {table_name} не существует, пропускаем")
                     continue
                 
+                # Версий за дату нет (system.parts / UNION ALL) — удалять нечего
+                if schema.has_column(table_name, 'version_id') and not existing_versions[table_name]:
+                    logger.debug(f"В таблице {table_name} нет данных за дату {version_date}")
+                    continue
+                
                 # Считаем записи для удаления
                 count_sql = f"SELECT count() FROM {table_name} WHERE version_date = '{version_date}'"
                 count_to_delete = self.client.execute(count_sql)[0][0]
@@ -257,8 +332,11 @@ class ETLVersionManager:
                 
             except Exception as e:
                 logger.error(f"❌ Ошибка при удалении данных из {table_name}: {e}")
+                self.invalidate_version_cache()
                 return False
         
+        self.invalidate_version_cache()
+        
         total_deleted = sum(deleted_counts.values())
         logger.info(f"✅ Политика ПЕРЕЗАПИСАТЬ выполнена: удалено {total_deleted} записей из {len(deleted_counts)} таблиц")
         
@@ -278,27 +356,15 @@ class ETLVersionManager:
             tables = self.ETL_TABLES
             
         logger.info("🔧 Добавление поля version_id в ETL таблицы...")
+        schema = self._schema(tables)
         
         for table_name in tables:
             try:
-                # Проверяем существование таблицы
-                check_table_sql = f"EXISTS TABLE {table_name}"
-                exists = self.client.execute(check_table_sql)[0][0]
-                
-                if not exists:
+                if not schema.exists(table_name):
                     logger.warning(f"⚠️ Таблица {table_name} не существует, пропускаем")
                     continue
                 
-                # Проверяем наличие поля version_id
-                check_column_sql = f"""
-                SELECT count() 
-                FROM system.columns 
-                WHERE table = '{table_name}' AND name = 'version_id'
-                """
-                
-                column_exists = self.client.execute(check_column_sql)[0][0] > 0
-                
-                if column_exists:
+                if schema.has_column(table_name, 'version_id'):
                     logger.info(f"✅ Поле version_id уже существует в {table_name}")
                     continue
                 
@@ -309,6 +375,8 @@ class ETLVersionManager:
                 """
                 
                 self.client.execute(alter_sql)
+                schema.invalidate()
+                self.invalidate_version_cache()
                 logger.info(f"✅ Поле version_id добавлено в {table_name}")
                 
             except Exception as e:
@@ -333,30 +401,27 @@ class ETLVersionManager:
         if tables is None:
             tables = self.ETL_TABLES
             
-        version_counts = {}
+        # Проверка после загрузки (часто в подпроцессах) — версии читаются заново, не из кэша
+        self.invalidate_version_cache()
+        existing_versions = self.get_existing_versions(version_date, tables)
+        version_counts = {table_name: 0 for table_name in tables}
         
-        for table_name in tables:
-            try:
-                # Проверяем существование таблицы
-                check_table_sql = f"EXISTS TABLE {table_name}"
-                table_exists = self.client.execute(check_table_sql)[0][0]
-                
-                if not table_exists:
-                    version_counts[table_name] = 0
-                    continue
-                
-                # Считаем записи для версии
-                count_sql = f"""
-                SELECT count() 
-                FROM {table_name} 
-                WHERE version_date = '{version_date}' AND version_id = {version_id}
-                """
-                
-                count = self.client.execute(count_sql)[0][0]
+        # Считаем только таблицы, где версия есть (одним UNION ALL)
+        to_count = [table_name for table_name in tables if version_id in existing_versions[table_name]]
+        if not to_count:
+            return version_counts
+        
+        union_sql = "\nUNION ALL\n".join(
+            f"SELECT '{table_name}' AS table_name, count() FROM {table_name} "
+            f"WHERE version_date = %(d)s AND version_id = %(v)s"
+            for table_name in to_count
+        )
+        try:
+            for table_name, count in self.client.execute(union_sql, {'d': version_date, 'v': version_id}):
                 version_counts[table_name] = count
-                
-            except Exception as e:
-                logger.warning(f"Ошибка при проверке консистентности {table_name}: {e}")
+        except Exception as e:
+            logger.warning(f"Ошибка при проверке консистентности {', '.join(to_count)}: {e}")
+            for table_name in to_count:
                 version_counts[table_name] = -1  # Ошибка
         
-        return version_counts 
\ No newline at end of file
+        return version_counts
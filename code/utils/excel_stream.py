@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Excel Stream - потоковое чтение больших .xlsx блоками строк
+
+Вместо pd.read_excel (весь лист в память, затем DataFrame) лист читается
+openpyxl в режиме read_only (iter_rows(values_only=True)), либо python-calamine,
+если он установлен, и отдаётся DataFrame-блоками по chunk_rows строк.
+
+Значения ячеек приводятся так же, как в pandas.read_excel(engine='openpyxl'):
+- целые числа из Excel (float без дробной части) -> int;
+- коды ошибок Excel и строки NA по умолчанию pandas ('', 'NA', 'nan', ...) -> None;
+- полностью пустые строки пропускаются; заголовок — первая строка
+  (пустые имена -> 'Unnamed: i', дубли -> 'имя.1').
+
+Колонки блоков имеют dtype object (без выведения типов по блоку): приведение типов
+делает загрузчик. Профиль колонок (ColumnProfile) накапливается по всем блокам —
+по нему загрузчик проверяет, что вывод типов pandas по целой колонке не изменил бы
+результат.
+
+Использование:
+    profile = ColumnProfile()
+    for chunk in iter_excel_chunks(path, chunk_rows=50_000, profile=profile):
+        ...
+"""
+
+import datetime as dt
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_ROWS = 50_000
+
+try:
+    from pandas._libs.parsers import STR_NA_VALUES as _PANDAS_NA_VALUES
+except ImportError:  # pragma: no cover - старые/новые версии pandas
+    _PANDAS_NA_VALUES = {
+        '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND',
+        '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+    }
+
+_EXCEL_ERROR_CODES = {'#NULL!', '#DIV/0!', '#VALUE!', '#REF!', '#NAME?', '#NUM!', '#N/A', '#GETTING_DATA'}
+_NA_STRINGS = frozenset(_PANDAS_NA_VALUES) | _EXCEL_ERROR_CODES
+
+
+def _convert_cell(value):
+    """Значение ячейки как в pandas OpenpyxlReader + na_values по умолчанию"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return None if value in _NA_STRINGS else value
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else value
+    if type(value) is dt.date:
+        # openpyxl отдаёт даты как datetime; calamine — как date
+        return dt.datetime(value.year, value.month, value.day)
+    return value
+
+
+class ColumnProfile:
+    """Типы значений колонок по всем прочитанным блокам"""
+
+    def __init__(self):
+        self.types: Dict[str, set] = {}
+        # Колонки, где встретилась строка, не приводимая к числу (pandas оставит object)
+        self.non_numeric_str: set = set()
+        self.rows = 0
+        # Строки с непустыми ячейками правее заголовка (pandas добавил бы колонки 'Unnamed: i')
+        self.overflow_rows = 0
+
+    def update(self, chunk: pd.DataFrame) -> None:
+        self.rows += len(chunk)
+        for col in chunk.columns:
+            values = chunk[col]
+            seen = self.types.setdefault(col, set())
+            seen.update({type(v) for v in values if v is not None})
+            if str in seen and col not in self.non_numeric_str:
+                strings = values[values.map(lambda v: isinstance(v, str))]
+                if pd.to_numeric(strings, errors='coerce').isna().any():
+                    self.non_numeric_str.add(col)
+
+    def kinds(self, col: str) -> set:
+        """Множество типов непустых значений колонки"""
+        return self.types.get(col, set())
+
+    def is_text(self, col: str) -> bool:
+        """pandas по всей колонке оставит object со значениями как есть (или колонка пустая)"""
+        return col in self.non_numeric_str or not self.kinds(col)
+
+
+def _header(raw: Iterable) -> List:
+    names: List = []
+    seen: Dict = {}
+    for i, value in enumerate(raw):
+        name = value if value not in (None, '') else f'Unnamed: {i}'
+        if name in seen:
+            seen[name] += 1
+            name = f'{name}.{seen[name]}'
+        else:
+            seen[name] = 0
+        names.append(name)
+    while names and isinstance(names[-1], str) and names[-1].startswith('Unnamed: '):
+        names.pop()
+    return names
+
+
+def _iter_rows_openpyxl(path: Path, sheet_name: Optional[str]) -> Iterator[tuple]:
+    import openpyxl
+
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb[sheet_name] if sheet_name else wb.worksheets[0]
+        yield from ws.iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+
+def _iter_rows_calamine(path: Path, sheet_name: Optional[str]) -> Iterator[tuple]:
+    from python_calamine import CalamineWorkbook
+
+    wb = CalamineWorkbook.from_path(str(path))
+    sheet = wb.get_sheet_by_name(sheet_name) if sheet_name else wb.get_sheet_by_index(0)
+    for row in sheet.iter_rows():
+        yield tuple(None if v == '' else v for v in row)
+
+
+def available_engine(prefer: str = 'auto') -> str:
+    """'calamine', если установлен (и не запрошен openpyxl), иначе 'openpyxl'"""
+    if prefer in ('auto', 'calamine'):
+        try:
+            import python_calamine  # noqa: F401
+            return 'calamine'
+        except ImportError:
+            if prefer == 'calamine':
+                logger.warning("python-calamine не установлен, используем openpyxl read_only")
+    return 'openpyxl'
+
+
+def iter_excel_chunks(path, chunk_rows: int = DEFAULT_CHUNK_ROWS, sheet_name: Optional[str] = None,
+                      drop_columns: Iterable[str] = (), profile: Optional[ColumnProfile] = None,
+                      engine: str = 'auto') -> Iterator[pd.DataFrame]:
+    """
+    Блоки листа Excel по chunk_rows строк (dtype object, индекс — номер строки данных)
+
+    Args:
+        path: Путь к .xlsx
+        chunk_rows: Строк в блоке
+        sheet_name: Лист (по умолчанию первый)
+        drop_columns: Служебные колонки, которые не нужно отдавать
+        profile: ColumnProfile для накопления типов значений
+        engine: 'auto' | 'openpyxl' | 'calamine'
+    """
+    path = Path(path)
+    engine = available_engine(engine)
+    rows = _iter_rows_calamine(path, sheet_name) if engine == 'calamine' else _iter_rows_openpyxl(path, sheet_name)
+    logger.info(f"📖 Потоковое чтение {path.name} ({engine}, блоки по {chunk_rows:,} строк)")
+
+    header_row = next(rows, None)
+    if header_row is None:
+        return
+    columns = _header(header_row)
+    width = len(columns)
+    keep = [i for i, name in enumerate(columns) if name not in set(drop_columns)]
+    names = [columns[i] for i in keep]
+
+    offset = 0
+    buffer: List[list] = []
+
+    def flush() -> pd.DataFrame:
+        data = {name: [row[i] for row in buffer] for name, i in zip(names, keep)}
+        chunk = pd.DataFrame(data, columns=names, dtype=object,
+                             index=pd.RangeIndex(offset, offset + len(buffer)))
+        if profile is not None:
+            profile.update(chunk)
+        return chunk
+
+    for raw in rows:
+        row = [_convert_cell(v) for v in raw[:width]]
+        if profile is not None and len(raw) > width and any(v is not None for v in raw[width:]):
+            profile.overflow_rows += 1
+        if all(v is None for v in row):
+            continue
+        if len(row) < width:
+            row.extend([None] * (width - len(row)))
+        buffer.append(row)
+        if len(buffer) >= chunk_rows:
+            yield flush()
+            offset += len(buffer)
+            buffer = []
+    if buffer:
+        yield flush()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Extract Manifest - отпечатки шагов Extract пайплайна для инкрементального перезапуска
+
+Для каждого шага extract_master.py записывается отпечаток входов:
+- sha256 скрипта шага и его аргументы;
+- sha256 исходных файлов шага (Excel датасета / мастер-данных);
+- токены upstream-таблиц (result_table предыдущих шагов): отпечаток шага-производителя
+  + момент его последнего выполнения. Если производитель перезапускался, меняется
+  токен таблицы и, как следствие, отпечатки всех зависимых шагов (грязный под-DAG).
+
+Манифест хранится отдельно для каждой версии (version_date, version_id):
+    logs/extract_manifests/manifest_YYYY-MM-DD_vN.json
+
+Использование:
+    manifest = ExtractManifest(version_date, version_id)
+    entry = manifest.get_step('dual_loader.py')
+    manifest.record_step('dual_loader.py', fingerprint, details, success=True)
+    manifest.save()
+"""
+
+import hashlib
+import json
+import logging
+from datetime import date, datetime
+from pathlib import Path
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_DIR = Path('logs/extract_manifests')
+
+# Кэш хэшей файлов: (path, size, mtime_ns) -> sha256
+_FILE_HASH_CACHE: Dict[tuple, str] = {}
+
+
+def file_sha256(path: Path, chunk_size: int = 1024 * 1024) -> Optional[str]:
+    """sha256 содержимого файла (None — файл отсутствует)"""
+    path = Path(path)
+    if not path.exists():
+        return None
+    stat = path.stat()
+    key = (str(path.resolve()), stat.st_size, stat.st_mtime_ns)
+    if key not in _FILE_HASH_CACHE:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+        _FILE_HASH_CACHE[key] = digest.hexdigest()
+    return _FILE_HASH_CACHE[key]
+
+
+def combine_fingerprint(parts: Dict) -> str:
+    """Стабильный sha256 от словаря компонентов отпечатка"""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def table_token(fingerprint: str, executed_at: Optional[str]) -> str:
+    """Токен версии таблицы: отпечаток шага-производителя + момент его выполнения"""
+    return hashlib.sha256(f"{fingerprint}|{executed_at or ''}".encode('utf-8')).hexdigest()[:16]
+
+
+class ExtractManifest:
+    """Манифест отпечатков шагов для одной версии (version_date, version_id)"""
+
+    def __init__(self, version_date: date, version_id: int, manifest_dir: Optional[Path] = None):
+        self.version_date = version_date
+        self.version_id = version_id
+        self.manifest_dir = Path(manifest_dir) if manifest_dir else MANIFEST_DIR
+        self.path = self.manifest_dir / f"manifest_{version_date}_v{version_id}.json"
+        self.data = self._load()
+
+    def _load(self) -> Dict:
+        if self.path.exists():
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                logger.info(f"📒 Манифест загружен: {self.path} ({len(data.get('steps', {}))} шагов)")
+                return data
+            except (OSError, ValueError) as e:
+                logger.warning(f"⚠️ Манифест {self.path} не читается ({e}), начинаем с пустого")
+        return {
+            'version_date': str(self.version_date),
+            'version_id': self.version_id,
+            'steps': {},
+        }
+
+    def get_step(self, step_key: str) -> Optional[Dict]:
+        """Запись шага из манифеста (None — шаг ещё не выполнялся для этой версии)"""
+        return self.data['steps'].get(step_key)
+
+    def record_step(self, step_key: str, fingerprint: str, details: Dict, success: bool,
+                    duration: Optional[float] = None) -> Dict:
+        """Фиксирует выполнение шага (момент выполнения меняет токены его таблиц)"""
+        entry = {
+            'fingerprint': fingerprint,
+            'status': 'success' if success else 'failed',
+            'executed_at': datetime.now().isoformat(),
+            'duration_sec': round(duration, 2) if duration is not None else None,
+            'details': details,
+        }
+        self.data['steps'][step_key] = entry
+        return entry
+
+    def save(self) -> None:
+        """Атомарно сохраняет манифест (tmp + rename)"""
+        self.manifest_dir.mkdir(parents=True, exist_ok=True)
+        self.data['updated_at'] = datetime.now().isoformat(timespec='seconds')
+        tmp_path = self.path.with_suffix('.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=2, default=str)
+        tmp_path.replace(self.path)
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Schema Snapshot - кэшированный снимок схем ETL таблиц одним запросом
+
+Вместо DESCRIBE TABLE / EXISTS TABLE / system.columns на каждую таблицу
+схемы всех нужных таблиц читаются одним запросом к system.columns
+(+ metadata_modification_time из system.tables). Снимок кэшируется на процесс
+для клиента и обновляется, если metadata_modification_time таблиц изменилось
+(ALTER/CREATE/DROP) или после явного invalidate().
+
+Работает с clickhouse_driver (client.execute) и clickhouse_connect (client.query).
+
+Использование:
+    snapshot = get_schema_snapshot(client, ['heli_pandas', 'md_components'])
+    if snapshot.exists('heli_pandas') and snapshot.has_column('heli_pandas', 'version_id'):
+        ...
+    for name, ch_type in snapshot.columns('md_components'):
+        ...
+"""
+
+import logging
+from typing import Dict, Iterable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Кэш снимков: id(client) -> SchemaSnapshot
+_SNAPSHOTS: Dict[int, 'SchemaSnapshot'] = {}
+
+
+def _run_query(client, sql: str) -> List[tuple]:
+    """Строки результата для clickhouse_driver и clickhouse_connect"""
+    if hasattr(client, 'execute'):
+        return client.execute(sql)
+    return client.query(sql).result_rows
+
+
+def _sql_list(values: Iterable[str]) -> str:
+    return ', '.join("'" + str(value).replace('\\', '\\\\').replace("'", "\\'") + "'" for value in values)
+
+
+class SchemaSnapshot:
+    """Схемы набора таблиц текущей базы: {table: [(name, type, position, default_kind)]}"""
+
+    def __init__(self, client, tables: Iterable[str]):
+        self.client = client
+        self.tables = set(tables)
+        self._columns: Dict[str, List[Tuple[str, str, int, str]]] = {}
+        self._mtimes: Dict[str, str] = {}
+        self._loaded = False
+
+    def refresh(self) -> 'SchemaSnapshot':
+        """Перечитывает схемы всех таблиц снимка одним запросом"""
+        rows = _run_query(self.client, f"""
+            SELECT c.table, c.name, c.type, c.position, c.default_kind,
+                   toString(t.metadata_modification_time)
+            FROM system.columns AS c
+            INNER JOIN system.tables AS t ON t.database = c.database AND t.name = c.table
+            WHERE c.database = currentDatabase() AND c.table IN ({_sql_list(sorted(self.tables))})
+            ORDER BY c.table, c.position
+        """) if self.tables else []
+
+        self._columns = {}
+        self._mtimes = {}
+        for table, name, ch_type, position, default_kind, mtime in rows:
+            self._columns.setdefault(table, []).append((name, ch_type, position, default_kind))
+            self._mtimes[table] = mtime
+        self._loaded = True
+        logger.debug(f"Снимок схем: {len(self._columns)}/{len(self.tables)} таблиц, {len(rows)} колонок")
+        return self
+
+    def is_stale(self) -> bool:
+        """Изменились ли metadata_modification_time (или состав) таблиц снимка"""
+        if not self._loaded:
+            return True
+        if not self.tables:
+            return False
+        rows = _run_query(self.client, f"""
+            SELECT name, toString(metadata_modification_time)
+            FROM system.tables
+            WHERE database = currentDatabase() AND name IN ({_sql_list(sorted(self.tables))})
+        """)
+        return dict(rows) != self._mtimes
+
+    def ensure_fresh(self) -> 'SchemaSnapshot':
+        """Обновляет снимок, если схемы изменились"""
+        if self.is_stale():
+            self.refresh()
+        return self
+
+    def invalidate(self) -> None:
+        """Помечает снимок устаревшим (после собственных ALTER/CREATE/DROP)"""
+        self._loaded = False
+
+    def _ensure_loaded(self) -> None:
+        if not self._loaded:
+            self.refresh()
+
+    def exists(self, table: str) -> bool:
+        """Таблица существует (по снимку)"""
+        self._ensure_loaded()
+        return table in self._columns
+
+    def columns(self, table: str) -> List[Tuple[str, str]]:
+        """[(name, type)] в порядке position; пусто, если таблицы нет"""
+        self._ensure_loaded()
+        return [(name, ch_type) for name, ch_type, _, _ in self._columns.get(table, [])]
+
+    def has_column(self, table: str, column: str) -> bool:
+        """В таблице есть колонка"""
+        return any(name == column for name, _ in self.columns(table))
+
+
+def get_schema_snapshot(client, tables: Iterable[str], validate: bool = False) -> SchemaSnapshot:
+    """
+    Снимок схем для клиента (кэш на процесс)
+
+    Args:
+        client: ClickHouse client (clickhouse_driver или clickhouse_connect)
+        tables: Нужные таблицы; новые таблицы добавляются в снимок с перечитыванием
+        validate: Сверить metadata_modification_time и обновить снимок при изменениях
+    """
+    tables = set(tables)
+    snapshot = _SNAPSHOTS.get(id(client))
+    if snapshot is None or snapshot.client is not client:
+        snapshot = SchemaSnapshot(client, tables)
+        _SNAPSHOTS[id(client)] = snapshot
+    elif not tables <= snapshot.tables:
+        snapshot.tables |= tables
+        snapshot.invalidate()
+
+    if validate:
+        snapshot.ensure_fresh()
+    return snapshot
+
+
+def invalidate_schema_snapshot(client=None) -> None:
+    """Сбрасывает снимок клиента (или все снимки)"""
+    if client is None:
+        for snapshot in _SNAPSHOTS.values():
+            snapshot.invalidate()
+    elif id(client) in _SNAPSHOTS:
+        _SNAPSHOTS[id(client)].invalidate()
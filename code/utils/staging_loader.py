@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Staging Loader - атомарная замена версионных срезов ETL таблиц
+
+Вместо схемы "COUNT → ALTER/DELETE → sleep → INSERT" срез версии пишется в
+staging-таблицу с той же схемой, проверяется по количеству строк и подменяется
+в целевой таблице одной операцией:
+- таблицы с PARTITION BY: ALTER TABLE ... REPLACE PARTITION ID ... FROM staging
+  (в staging дописываются строки затронутых партиций, не входящие в срез);
+- таблицы без PARTITION BY: EXCHANGE TABLES target AND staging
+  (в staging дописываются все строки вне среза).
+
+Читатели целевой таблицы видят либо старый срез, либо новый — без мутаций
+и без полуудалённой версии. Рассчитано на одного писателя на таблицу (ETL).
+
+Использование:
+    loader = StagingSliceLoader(client, 'heli_raw', version_date, version_id)
+    staging = loader.prepare()
+    client.execute(f'INSERT INTO {staging} VALUES', data)
+    loader.commit(expected_rows=len(data))
+"""
+
+import logging
+from datetime import date
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def version_slice_where(version_date: date, version_id: Optional[int] = None) -> str:
+    """SQL-предикат среза версии: version_date [+ version_id]"""
+    where = f"version_date = '{version_date}'"
+    if version_id is not None:
+        where += f" AND version_id = {int(version_id)}"
+    return where
+
+
+class StagingSliceLoader:
+    """Загрузка среза через staging-таблицу с атомарной подменой в целевой таблице"""
+
+    STAGING_SUFFIX = '__staging'
+
+    def __init__(self, client, table: str, version_date: Optional[date] = None,
+                 version_id: Optional[int] = None, slice_where: Optional[str] = None):
+        """
+        Args:
+            client: ClickHouse client (clickhouse_driver)
+            table: Целевая таблица
+            version_date: Дата версии среза
+            version_id: ID версии (None — срез по всей дате)
+            slice_where: Явный SQL-предикат среза (перекрывает version_date/version_id)
+        """
+        if slice_where is None:
+            if version_date is None:
+                raise ValueError("Нужен version_date или slice_where для определения среза")
+            slice_where = version_slice_where(version_date, version_id)
+
+        self.client = client
+        self.table = table
+        self.staging_table = f"{table}{self.STAGING_SUFFIX}"
+        self.slice_where = slice_where
+        self.partition_key = None
+        self._prepared = False
+
+    def _get_partition_key(self) -> str:
+        result = self.client.execute(
+            "SELECT partition_key FROM system.tables "
+            "WHERE database = currentDatabase() AND name = %(table)s",
+            {'table': self.table}
+        )
+        if not result:
+            raise ValueError(f"Таблица {self.table} не найдена")
+        return result[0][0] or ''
+
+    def prepare(self) -> str:
+        """Создаёт пустую staging-таблицу со схемой целевой. Возвращает её имя."""
+        self.partition_key = self._get_partition_key()
+        self.client.execute(f"DROP TABLE IF EXISTS {self.staging_table}")
+        self.client.execute(f"CREATE TABLE {self.staging_table} AS {self.table}")
+        self._prepared = True
+        logger.info(f"🧱 Staging {self.staging_table} создан (PARTITION BY: {self.partition_key or '—'})")
+        return self.staging_table
+
+    def count_staged(self) -> int:
+        """Количество строк среза в staging"""
+        return self.client.execute(
+            f"SELECT count() FROM {self.staging_table} WHERE {self.slice_where}"
+        )[0][0]
+
+    def _affected_partitions(self) -> List[str]:
+        staged = self.client.execute(
+            "SELECT DISTINCT partition_id FROM system.parts "
+            "WHERE database = currentDatabase() AND table = %(table)s AND active",
+            {'table': self.staging_table}
+        )
+        existing = self.client.execute(
+            f"SELECT DISTINCT _partition_id FROM {self.table} WHERE {self.slice_where}"
+        )
+        return sorted({row[0] for row in staged} | {row[0] for row in existing})
+
+    def commit(self, expected_rows: Optional[int] = None) -> Dict[str, int]:
+        """
+        Проверяет staging и подменяет срез в целевой таблице
+
+        Args:
+            expected_rows: Ожидаемое число строк среза (None — без проверки)
+
+        Returns:
+            {'rows': строк в срезе, 'replaced': строк старого среза, 'partitions': число партиций}
+        """
+        if not self._prepared:
+            raise RuntimeError("Staging не подготовлен: вызовите prepare()")
+
+        try:
+            staged_rows = self.count_staged()
+            if expected_rows is not None and staged_rows != expected_rows:
+                raise ValueError(
+                    f"{self.staging_table}: в срезе {staged_rows:,} строк, ожидалось {expected_rows:,}"
+                )
+
+            old_rows = self.client.execute(
+                f"SELECT count() FROM {self.table} WHERE {self.slice_where}"
+            )[0][0]
+            keep_where = f"NOT ifNull(({self.slice_where}), 0)"
+
+            if self.partition_key:
+                partitions = self._affected_partitions()
+                for partition_id in partitions:
+                    self.client.execute(
+                        f"INSERT INTO {self.staging_table} SELECT * FROM {self.table} "
+                        f"WHERE _partition_id = '{partition_id}' AND {keep_where}"
+                    )
+                for partition_id in partitions:
+                    self.client.execute(
+                        f"ALTER TABLE {self.table} REPLACE PARTITION ID '{partition_id}' FROM {self.staging_table}"
+                    )
+            else:
+                partitions = []
+                self.client.execute(
+                    f"INSERT INTO {self.staging_table} SELECT * FROM {self.table} WHERE {keep_where}"
+                )
+                self.client.execute(f"EXCHANGE TABLES {self.table} AND {self.staging_table}")
+
+            logger.info(
+                f"✅ {self.table}: срез заменён атомарно ({old_rows:,} → {staged_rows:,} строк, "
+                f"партиций: {len(partitions) if self.partition_key else 'EXCHANGE'})"
+            )
+            return {'rows': staged_rows, 'replaced': old_rows, 'partitions': len(partitions)}
+        finally:
+            self.cleanup()
+
+    def cleanup(self) -> None:
+        """Удаляет staging-таблицу"""
+        self.client.execute(f"DROP TABLE IF EXISTS {self.staging_table}")
+        self._prepared = False
+
+
+def load_version_slice(client, table: str, insert_fn: Callable[[str], int],
+                       version_date: Optional[date] = None, version_id: Optional[int] = None,
+                       slice_where: Optional[str] = None, validate_count: bool = True) -> int:
+    """
+    Загружает срез через staging: insert_fn(staging_table) -> число вставленных строк
+
+    При ошибке вставки или несовпадении количества строк целевая таблица не меняется.
+
+    Returns:
+        Число строк в новом срезе
+    """
+    loader = StagingSliceLoader(client, table, version_date, version_id, slice_where)
+    staging = loader.prepare()
+    try:
+        inserted = insert_fn(staging)
+    except Exception:
+        loader.cleanup()
+        raise
+    stats = loader.commit(expected_rows=inserted if validate_count else None)
+    return stats['rows']
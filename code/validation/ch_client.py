@@ -1,19 +1,11 @@
 """Утилита подключения к ClickHouse для скриптов валидации."""
 import os
-import yaml
-from clickhouse_driver import Client
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "utils"))
+from ch_session import get_session_client  # noqa: E402
 
 
 def get_client():
-    base = os.path.dirname(os.path.abspath(__file__))
-    project_root = os.path.join(base, "..", "..")
-    cfg_path = os.path.join(project_root, "config", "database_config.yaml")
-    with open(cfg_path, "r", encoding="utf-8") as f:
-        cfg = yaml.safe_load(f).get("database", {})
-    password = os.environ.get("CLICKHOUSE_PASSWORD", "")
-    return Client(
-        host=cfg.get("host", "10.95.19.132"),
-        port=int(cfg.get("port", 9000)),
-        database=cfg.get("database", "default"),
-        password=password,
-    )
+    """Клиент из общей фабрики (кэш на процесс/поток, сжатие, метки запросов)"""
+    return get_session_client()
@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+"""
+Компилятор expr из config/transitions/invariants.json в одну агрегатную проверку.
+
+Простые построчные формы
+    forall agent [where <cond>]: <pred>
+    forall agent [where <cond>]: if <cond>: <pred>
+(сравнения <, <=, >, >=, ==, != над колонками sim_masterv2_v9 и целыми, +/-,
+`x in {1,2}`, AND/OR/NOT, скобки) компилируются:
+- в countIf(<нарушение>) — все такие инварианты считаются одним SELECT по срезу;
+- в эквивалентный NumPy-предикат (офлайн по ValidationSlice / колоночным массивам).
+
+Срез — как у SQL-валидаторов: version_id, version_date, group_by IN (1, 2).
+Формы с соседними шагами (sne[N+1], next_status), балансы, спаны и прочее
+не компилируются (CompileError) и остаются за скриптами-валидаторами.
+
+Запуск (скомпилированные — одним запросом, остальные — их скриптами):
+    python3 code/validation/expr_compiler.py --version-id <ID> --version-date <YYYYMMDD>
+
+Сверка скомпилированных с валидаторами-скриптами на датасете:
+    python3 code/validation/expr_compiler.py --version-id <ID> --version-date <YYYYMMDD> --parity-check
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from ch_client import get_client
+
+
+# Синонимы из expr -> колонки sim_masterv2_v9
+COLUMN_ALIASES = {
+    "state": "status_id",
+    "status": "status_id",
+    "pre_status": "pre_status_id",
+    "pre_state": "pre_status_id",
+    "dt": "daily_today_u32",
+    "dn": "daily_next_u32",
+    "day": "day_u16",
+}
+# Колонки, доступные предикатам (= SLICE_COLUMNS в slice_engine.py)
+COLUMNS = (
+    "version_date", "group_by", "aircraft_number", "idx", "day_u16",
+    "status_id", "pre_status_id", "sne", "ll", "ppr", "oh",
+    "daily_today_u32", "daily_next_u32", "limiter", "repair_time", "repair_days",
+    "commit_p2", "commit_p3", "repair_claim_source", "repair_claim_line_id",
+    "repair_claim_start_day", "repair_claim_end_day",
+)
+KEYWORDS = {"forall", "agent", "agents", "where", "if", "in", "and", "or", "not"}
+SQL_OPS = {"<": "<", "<=": "<=", ">": ">", ">=": ">=", "==": "=", "!=": "!="}
+
+TOKEN_RE = re.compile(r"\s*(?:(?P<num>\d+)|(?P<name>[A-Za-z_][A-Za-z0-9_]*)|(?P<op><=|>=|==|!=|[<>+\-{}(),:]))")
+
+
+class CompileError(ValueError):
+    """expr не относится к компилируемым формам"""
+
+
+@dataclass
+class CompiledInvariant:
+    inv_id: str
+    expr: str
+    validator: str
+    violation: tuple  # AST условия нарушения
+
+    @property
+    def sql(self) -> str:
+        return to_sql(self.violation)
+
+
+# --- Разбор ---------------------------------------------------------------------------
+
+
+def tokenize(expr: str) -> List[Tuple[str, str]]:
+    tokens = []
+    pos = 0
+    expr = expr.strip()
+    while pos < len(expr):
+        match = TOKEN_RE.match(expr, pos)
+        if not match or match.end() == pos:
+            raise CompileError(f"неподдерживаемый фрагмент: {expr[pos:pos + 12].strip()!r}")
+        pos = match.end()
+        if match.group("num") is not None:
+            tokens.append(("num", match.group("num")))
+        elif match.group("name") is not None:
+            word = match.group("name")
+            if word.lower() in KEYWORDS:
+                tokens.append(("kw", word.lower()))
+            else:
+                tokens.append(("name", word))
+        else:
+            tokens.append(("op", match.group("op")))
+    return tokens
+
+
+class _Parser:
+    def __init__(self, tokens: List[Tuple[str, str]]):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self) -> Optional[Tuple[str, str]]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def accept(self, kind: str, value: Optional[str] = None) -> bool:
+        token = self.peek()
+        if token and token[0] == kind and (value is None or token[1] == value):
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, kind: str, value: Optional[str] = None) -> Tuple[str, str]:
+        token = self.peek()
+        if not self.accept(kind, value):
+            raise CompileError(f"ожидалось {value or kind}, получено {token[1] if token else 'конец'}")
+        return token
+
+    def invariant(self) -> tuple:
+        self.expect("kw", "forall")
+        if not (self.accept("kw", "agent") or self.accept("kw", "agents")):
+            raise CompileError("поддерживается только forall agent")
+        scope = self.condition() if self.accept("kw", "where") else None
+        self.expect("op", ":")
+        if self.accept("kw", "if"):
+            guard = self.condition()
+            self.expect("op", ":")
+            scope = guard if scope is None else ("and", scope, guard)
+        predicate = self.condition()
+        if self.peek() is not None:
+            raise CompileError(f"лишний текст после предиката: {self.peek()[1]}")
+        violation = ("not", predicate)
+        return violation if scope is None else ("and", scope, violation)
+
+    def condition(self) -> tuple:
+        node = self.conjunction()
+        while self.accept("kw", "or"):
+            node = ("or", node, self.conjunction())
+        return node
+
+    def conjunction(self) -> tuple:
+        node = self.negation()
+        while self.accept("kw", "and"):
+            node = ("and", node, self.negation())
+        return node
+
+    def negation(self) -> tuple:
+        if self.accept("kw", "not"):
+            return ("not", self.negation())
+        if self.accept("op", "("):
+            node = self.condition()
+            self.expect("op", ")")
+            return node
+        return self.comparison()
+
+    def comparison(self) -> tuple:
+        left = self.term()
+        if self.accept("kw", "in"):
+            self.expect("op", "{")
+            values = [int(self.expect("num")[1])]
+            while self.accept("op", ","):
+                values.append(int(self.expect("num")[1]))
+            self.expect("op", "}")
+            return ("in", left, tuple(values))
+        token = self.peek()
+        if not token or token[0] != "op" or token[1] not in SQL_OPS:
+            raise CompileError(f"ожидалось сравнение, получено {token[1] if token else 'конец'}")
+        self.pos += 1
+        return ("cmp", token[1], left, self.term())
+
+    def term(self) -> tuple:
+        node = self.atom()
+        while True:
+            if self.accept("op", "+"):
+                node = ("add", node, self.atom())
+            elif self.accept("op", "-"):
+                node = ("sub", node, self.atom())
+            else:
+                return node
+
+    def atom(self) -> tuple:
+        token = self.peek()
+        if token and token[0] == "num":
+            self.pos += 1
+            return ("num", int(token[1]))
+        if token and token[0] == "name":
+            self.pos += 1
+            column = COLUMN_ALIASES.get(token[1], token[1])
+            if column not in COLUMNS:
+                raise CompileError(f"неизвестная колонка: {token[1]}")
+            return ("col", column)
+        raise CompileError(f"ожидалась колонка или число, получено {token[1] if token else 'конец'}")
+
+
+def parse_expr(expr: str) -> tuple:
+    """AST условия нарушения (scope AND NOT predicate)"""
+    return _Parser(tokenize(expr)).invariant()
+
+
+# --- Генерация ------------------------------------------------------------------------
+
+
+def to_sql(node: tuple) -> str:
+    kind = node[0]
+    if kind == "col":
+        return node[1]
+    if kind == "num":
+        return str(node[1])
+    if kind in ("add", "sub"):
+        # UInt - UInt в ClickHouse даёт Int64 — как int64 в NumPy
+        return f"({to_sql(node[1])} {'+' if kind == 'add' else '-'} {to_sql(node[2])})"
+    if kind == "cmp":
+        return f"{to_sql(node[2])} {SQL_OPS[node[1]]} {to_sql(node[3])}"
+    if kind == "in":
+        return f"{to_sql(node[1])} IN ({', '.join(str(v) for v in node[2])})"
+    if kind in ("and", "or"):
+        return f"({to_sql(node[1])} {kind.upper()} {to_sql(node[2])})"
+    if kind == "not":
+        return f"NOT ({to_sql(node[1])})"
+    raise CompileError(f"неизвестный узел: {kind}")
+
+
+def to_numpy(node: tuple, cols: Mapping):
+    """Маска (или int64-массив для термов) по колоночным массивам cols"""
+    import numpy as np
+
+    kind = node[0]
+    if kind == "col":
+        return np.asarray(cols[node[1]]).astype(np.int64)
+    if kind == "num":
+        return np.int64(node[1])
+    if kind == "add":
+        return to_numpy(node[1], cols) + to_numpy(node[2], cols)
+    if kind == "sub":
+        return to_numpy(node[1], cols) - to_numpy(node[2], cols)
+    if kind == "cmp":
+        left, right = to_numpy(node[2], cols), to_numpy(node[3], cols)
+        return {
+            "<": np.less, "<=": np.less_equal, ">": np.greater,
+            ">=": np.greater_equal, "==": np.equal, "!=": np.not_equal,
+        }[node[1]](left, right)
+    if kind == "in":
+        return np.isin(to_numpy(node[1], cols), node[2])
+    if kind == "and":
+        return to_numpy(node[1], cols) & to_numpy(node[2], cols)
+    if kind == "or":
+        return to_numpy(node[1], cols) | to_numpy(node[2], cols)
+    if kind == "not":
+        return ~to_numpy(node[1], cols)
+    raise CompileError(f"неизвестный узел: {kind}")
+
+
+# --- Инварианты -----------------------------------------------------------------------
+
+
+def compile_invariants(invariants_path: str) -> Tuple[List[CompiledInvariant], Dict[str, str]]:
+    """Скомпилированные инварианты и {inv_id: причина} для остальных (fallback на скрипт)"""
+    with open(invariants_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    compiled: List[CompiledInvariant] = []
+    skipped: Dict[str, str] = {}
+    for section in ("global_invariants", "temporal_invariants"):
+        for inv in data.get(section, []):
+            inv_id = inv.get("id", "UNKNOWN")
+            expr = inv.get("expr", "")
+            try:
+                violation = parse_expr(expr)
+            except CompileError as exc:
+                skipped[inv_id] = str(exc)
+                continue
+            compiled.append(CompiledInvariant(inv_id, expr, inv.get("validator", ""), violation))
+    return compiled, skipped
+
+
+def build_combined_query(compiled: List[CompiledInvariant], table: str) -> str:
+    terms = ",\n        ".join(f"countIf({inv.sql})" for inv in compiled)
+    return f"""
+    SELECT
+        count(),
+        {terms}
+    FROM {table}
+    WHERE version_id = %(vid)s AND version_date = %(vdate)s AND group_by IN (1, 2)
+    """
+
+
+def run_combined_query(client, compiled: List[CompiledInvariant], version_id: int, version_date: int,
+                       table: str) -> Tuple[int, Dict[str, int]]:
+    """Один скан среза: (строк, {inv_id: нарушений})"""
+    row = client.execute(
+        build_combined_query(compiled, table), {"vid": int(version_id), "vdate": int(version_date)}
+    )[0]
+    return int(row[0]), {inv.inv_id: int(count) for inv, count in zip(compiled, row[1:])}
+
+
+def evaluate_numpy(compiled: List[CompiledInvariant], cols: Mapping) -> Dict[str, int]:
+    """{inv_id: нарушений} по колоночным массивам среза (ValidationSlice или dict)"""
+    return {inv.inv_id: int(to_numpy(inv.violation, cols).sum()) for inv in compiled}
+
+
+def script_violations(output: str) -> Tuple[Optional[int], Optional[bool]]:
+    """(violations=N, PASS/FAIL) из вывода скрипта-валидатора"""
+    count_match = re.search(r"^violations=(\d+)$", output, re.MULTILINE)
+    verdict_match = re.search(r": (PASS|FAIL)$", output, re.MULTILINE)
+    return (
+        int(count_match.group(1)) if count_match else None,
+        verdict_match.group(1) == "PASS" if verdict_match else None,
+    )
+
+
+def run_parity_check(compiled: List[CompiledInvariant], sql_counts: Dict[str, int], version_id: int,
+                     version_date: int, table_main: str, table_repair: str, project_root: str) -> bool:
+    """Скомпилированные (SQL и NumPy) против скриптов-валидаторов на одном датасете"""
+    from run_all_stream import build_validator_cmd, capture_process
+    from slice_engine import load_slice
+
+    s = load_slice(get_client(), version_id, version_date, table_main, table_repair)
+    numpy_counts = evaluate_numpy(compiled, s)
+    mismatches = 0
+    for inv in compiled:
+        script_path = os.path.join(project_root, inv.validator)
+        rc, output = capture_process(
+            build_validator_cmd(script_path, (version_date, version_id), table_main, table_repair)
+        )
+        script_count, script_passed = script_violations(output)
+        sql_count = sql_counts[inv.inv_id]
+        ok = sql_count == numpy_counts[inv.inv_id] and script_passed == (sql_count == 0)
+        if script_count is not None:
+            ok = ok and script_count == sql_count
+        if not ok:
+            mismatches += 1
+        print(
+            f"PARITY {inv.inv_id}: sql={sql_count} numpy={numpy_counts[inv.inv_id]} "
+            f"script={script_count} (rc={rc}) {'OK' if ok else 'MISMATCH'}"
+        )
+    print(f"PARITY compiled={len(compiled)} mismatches={mismatches}")
+    return mismatches == 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Компиляция expr из invariants.json в одну агрегатную проверку"
+    )
+    parser.add_argument("--version-id", type=int, help="version_id")
+    parser.add_argument("--version-date", type=int, help="version_date (YYYYMMDD)")
+    parser.add_argument("--table-main", default="sim_masterv2_v9")
+    parser.add_argument("--table-repair", default="sim_repairline_v9")
+    parser.add_argument("--list", action="store_true", help="Показать компиляцию и выйти")
+    parser.add_argument(
+        "--compiled-only",
+        action="store_true",
+        help="Не запускать скрипты для нескомпилированных инвариантов",
+    )
+    parser.add_argument(
+        "--parity-check",
+        action="store_true",
+        help="Сверить скомпилированные (SQL и NumPy) со скриптами-валидаторами",
+    )
+    args = parser.parse_args()
+
+    from run_all_stream import load_validators, run_validator, validate_table_name
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    project_root = os.path.abspath(os.path.join(base_dir, "..", ".."))
+    invariants_path = os.path.join(project_root, "config", "transitions", "invariants.json")
+    compiled, skipped = compile_invariants(invariants_path)
+
+    if args.list:
+        for inv in compiled:
+            print(f"COMPILED {inv.inv_id}: {inv.expr}\n  countIf({inv.sql})")
+        for inv_id, reason in skipped.items():
+            print(f"FALLBACK {inv_id}: {reason}")
+        return 0
+
+    if args.version_id is None or args.version_date is None:
+        parser.error("--version-id и --version-date обязательны (кроме --list)")
+    table_main = validate_table_name(args.table_main)
+    table_repair = validate_table_name(args.table_repair)
+
+    start = time.time()
+    rows, counts = run_combined_query(
+        get_client(), compiled, args.version_id, args.version_date, table_main
+    )
+    print("=" * 80)
+    print(
+        f"COMPILED {'/'.join(inv.inv_id for inv in compiled)} "
+        f"(1 query, rows={rows}, {time.time() - start:.2f}s)"
+    )
+    results: Dict[str, bool] = {}
+    for inv in compiled:
+        results[inv.inv_id] = counts[inv.inv_id] == 0
+        print(f"{inv.inv_id}: {'PASS' if results[inv.inv_id] else 'FAIL'}")
+        print(f"violations={counts[inv.inv_id]}")
+    print("=" * 80)
+
+    if args.parity_check:
+        return 0 if run_parity_check(
+            compiled, counts, args.version_id, args.version_date, table_main, table_repair, project_root
+        ) else 1
+
+    if not args.compiled_only:
+        validators, _ = load_validators(invariants_path, project_root)
+        dataset = (args.version_date, args.version_id)
+        for script_path, inv_ids in validators:
+            if all(inv_id in results for inv_id in inv_ids):
+                continue
+            rc, _ = run_validator(script_path, inv_ids, dataset, table_main, table_repair)
+            for inv_id in inv_ids:
+                results.setdefault(inv_id, rc == 0)
+
+    failed = sum(1 for passed in results.values() if not passed)
+    print(f"TOTAL={len(results)} FAIL={failed}")
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""
+Счётчик нарушений и выборка top-K за один проход.
+
+Вместо пары «SELECT count() … / тот же запрос с ORDER BY … LIMIT K» валидатор
+описывает источник строк (подзапрос) и одну или несколько выборок SampleSpec;
+все счётчики и выборки считаются одним агрегатом над источником:
+
+    countIf(where), groupArraySortedIf(K)(tuple(ключ…, колонки…), where)
+
+groupArraySorted держит не больше K элементов на поток (память ограничена,
+в отличие от count() OVER () поверх всех нарушений) и возвращает их по
+возрастанию кортежа — первые элементы кортежа задают ORDER BY. Убывание
+записывается отрицанием ключа: "-exceed", "-abs(diff)". Колонки после ключа
+добивают порядок при равных ключах, поэтому выборка детерминирована.
+
+Требует ClickHouse >= 23.12 (groupArraySorted); рабочая версия — 24.10.
+"""
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+@dataclass
+class SampleSpec:
+    """Выборка нарушений: условие (None — все строки источника), ключ ORDER BY, колонки, LIMIT"""
+    where: Optional[str]
+    key: Sequence[str]
+    columns: Sequence[str]
+    limit: int = 5
+
+    def aggregates(self) -> str:
+        items = ", ".join(list(self.key) + list(self.columns))
+        if self.where is None:
+            return f"count(), groupArraySorted({int(self.limit)})(tuple({items}))"
+        return (
+            f"countIf({self.where}), "
+            f"groupArraySortedIf({int(self.limit)})(tuple({items}), {self.where})"
+        )
+
+
+@dataclass
+class Sample:
+    """Результат выборки: число нарушений и строки (ключ…, колонки…) в порядке ключа"""
+    count: int
+    keyed: List[tuple]
+    key_len: int
+    limit: int
+
+    @property
+    def rows(self) -> List[tuple]:
+        """Строки выборки без колонок ключа — как из исходного SELECT колонки… LIMIT K"""
+        return [tuple(row[self.key_len:]) for row in self.keyed]
+
+
+def build_fused_query(
+    source_sql: str, specs: Sequence[SampleSpec], counts: Sequence[str] = (), group_by: Optional[str] = None
+) -> str:
+    """SELECT [group_by,] доп. счётчики…, (count, выборка) по каждой spec FROM (source_sql) [GROUP BY]"""
+    columns = list(counts) + [spec.aggregates() for spec in specs]
+    if group_by:
+        columns.insert(0, group_by)
+    select = ",\n        ".join(columns)
+    group_sql = f"GROUP BY {group_by}" if group_by else ""
+    return f"""
+    SELECT
+        {select}
+    FROM ({source_sql})
+    {group_sql}
+    """
+
+
+def _parse_row(row, specs: Sequence[SampleSpec], n_counts: int) -> Tuple[List[int], List[Sample]]:
+    extra = [int(value or 0) for value in row[:n_counts]]
+    samples = []
+    for i, spec in enumerate(specs):
+        count, keyed = row[n_counts + 2 * i: n_counts + 2 * i + 2]
+        samples.append(Sample(int(count), [tuple(item) for item in keyed], len(spec.key), spec.limit))
+    return extra, samples
+
+
+def fused_count_sample(
+    client, source_sql: str, params, specs: Sequence[SampleSpec], counts: Sequence[str] = ()
+) -> Tuple[List[int], List[Sample]]:
+    """Один запрос: ([доп. счётчики], [Sample по каждой spec])"""
+    row = client.execute(build_fused_query(source_sql, specs, counts), params)[0]
+    return _parse_row(row, specs, len(counts))
+
+
+def fused_count_sample_by(
+    client, source_sql: str, params, specs: Sequence[SampleSpec], counts: Sequence[str], group_by: str
+) -> Dict[int, Tuple[List[int], List[Sample]]]:
+    """То же с GROUP BY group_by: {значение: ([доп. счётчики], [Sample…])} — только непустые группы"""
+    rows = client.execute(build_fused_query(source_sql, specs, counts, group_by), params)
+    return {int(row[0]): _parse_row(row[1:], specs, len(counts)) for row in rows}
+
+
+def count_and_sample(client, source_sql: str, params, spec: SampleSpec) -> Sample:
+    """Одна выборка без доп. счётчиков"""
+    return fused_count_sample(client, source_sql, params, [spec])[1][0]
+
+
+def merge_samples(parts: Iterable[Sample]) -> Sample:
+    """Слияние выборок частей (чанки, дни): сумма счётчиков, top-K по кортежу, как groupArraySorted"""
+    parts = list(parts)
+    key_len = parts[0].key_len
+    limit = parts[0].limit
+    keyed = sorted(row for part in parts for row in part.keyed)
+    return Sample(sum(part.count for part in parts), keyed[:limit], key_len, limit)
+
+
+def merge_results(
+    parts: Iterable[Tuple[List[int], List[Sample]]], specs: Sequence[SampleSpec], n_counts: int
+) -> Tuple[List[int], List[Sample]]:
+    """Слияние результатов fused_count_sample по частям (доп. счётчики — аддитивные count/countIf)"""
+    extra = [0] * n_counts
+    merged: List[List[Sample]] = [[Sample(0, [], len(spec.key), spec.limit)] for spec in specs]
+    for part_extra, part_samples in parts:
+        extra = [acc + int(value) for acc, value in zip(extra, part_extra)]
+        for bucket, sample in zip(merged, part_samples):
+            bucket.append(sample)
+    return extra, [merge_samples(bucket) for bucket in merged]
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Инкрементальная валидация хвоста симуляции (--from-day D).
+
+Валидаторы из INCREMENTAL_SCRIPTS хранят результат по дням: счётчики и top-K
+выборки нарушений каждого дня (fused_sample с GROUP BY day_u16), а INV-10 —
+матрицу (version_date, pre_status_id, status_id) → count каждого дня. После
+продления прогона (--end-day) или пересчёта хвоста с дня D запуск с --from-day D
+сканирует только дни >= D, дни < D берёт из сохранённого состояния и печатает тот
+же вывод, что полный прогон:
+- построчные проверки (INV-1, INV-6, INV-12) — фильтр day_u16 >= D;
+- проверки с lag-окном (INV-5, INV-7, INV-8) — в окно добавляется последняя строка
+  каждого агента до D (seed), сами проверяются только строки дней >= D;
+- баланс INV-10 — начальные статусы и переходы дней < D из состояния.
+
+Состояние: output/.validation_state/<скрипт>__<таблица>__<version_date>_<version_id>.json,
+пишется только в инкрементальном режиме: --from-day, --until-day или --save-state (полный
+прогон с сохранением). Обычный полный прогон состояние не трогает и считает одну глобальную
+выборку top-K без GROUP BY по дням. Первый --from-day без состояния выполняет полный прогон
+и сохраняет состояние для следующих. Состояние недействительно, если изменился скрипт
+(хэш, как у кэша результатов) или в таблице есть строки между концом состояния и D —
+тогда выполняется полный прогон (сообщение в stderr). Дни < D должны совпадать с
+прогоном, по которому сохранено состояние: пересчёт с более раннего дня требует
+--from-day этого дня.
+
+--until-day D ограничивает скан днями < D (частичный прогон). Сверка «[0, D) + [D, end)
+== полный прогон» по всем инкрементальным валидаторам:
+
+    python3 code/validation/incremental.py --version-id <id> --version-date <YYYYMMDD> \\
+        --from-day <D> --parity-check
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from fused_sample import Sample, SampleSpec, fused_count_sample, fused_count_sample_by, merge_results
+from result_cache import validator_hash
+
+
+INCREMENTAL_SCRIPTS = (
+    "inv1_sne_le_ll.py",
+    "inv5_balance_increments.py",
+    "inv6_dt_only_ops.py",
+    "inv7_dt_eq_mp5.py",
+    "inv8_storage_frozen.py",
+    "inv10_turnover_balance.py",
+    "inv12_ppr_le_oh.py",
+)
+DEFAULT_STATE_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "output", ".validation_state")
+)
+
+
+def add_incremental_args(parser) -> None:
+    parser.add_argument(
+        "--from-day",
+        type=int,
+        default=None,
+        help="Сканировать только дни >= D; дни < D — из сохранённого состояния (нужен --version-date)",
+    )
+    parser.add_argument(
+        "--until-day",
+        type=int,
+        default=None,
+        help="Сканировать только дни < D (частичный прогон)",
+    )
+    parser.add_argument(
+        "--save-state",
+        action="store_true",
+        help="Полный прогон с сохранением подневного состояния для последующих --from-day",
+    )
+    parser.add_argument(
+        "--state-dir",
+        default=DEFAULT_STATE_DIR,
+        help="Каталог подневного состояния (по умолчанию output/.validation_state)",
+    )
+
+
+def state_path(state_dir: str, script_path: str, table: str, version_date: int, version_id: int) -> str:
+    script = os.path.splitext(os.path.basename(script_path))[0]
+    return os.path.join(state_dir, f"{script}__{table}__{int(version_date)}_{int(version_id)}.json")
+
+
+class DayWindow:
+    """
+    Границы скана одного запуска валидатора и его подневное состояние
+
+    base_where — фильтр среза без дней (version_id/version_date/group_by), им же
+    выбираются seed-строки и граница покрытия. В params добавляются from_day/until_day.
+    Вне инкрементального режима (incremental=False) состояние не читается и не пишется.
+    """
+
+    def __init__(self, client, args, script_path: str, table: str, base_where: str, params: Dict):
+        self.client = client
+        self.table = table
+        self.base_where = base_where
+        self.params = params
+        self.from_day: Optional[int] = args.from_day
+        self.until_day: Optional[int] = args.until_day
+        self.script_hash = validator_hash(script_path)
+        self.path: Optional[str] = None
+        self.state: Optional[Dict] = None
+        self.incremental = self.from_day is not None or self.until_day is not None or args.save_state
+
+        if self.incremental:
+            if args.version_date is None:
+                raise SystemExit("--from-day/--until-day/--save-state требуют --version-date")
+            self.path = state_path(args.state_dir, script_path, table, args.version_date, args.version_id)
+        if self.from_day is not None and self.until_day is not None and self.until_day <= self.from_day:
+            raise SystemExit("--until-day должен быть больше --from-day")
+
+        if self.from_day is not None:
+            self.state = self._load()
+            if self.state is None:
+                self.from_day = None
+        if self.from_day is not None:
+            params["from_day"] = self.from_day
+        if self.until_day is not None:
+            params["until_day"] = self.until_day
+
+    def _notice(self, message: str) -> None:
+        # stdout валидатора сверяется с полным прогоном и кэшируется — сообщения только в stderr
+        print(f"{os.path.basename(self.path)}: {message}", file=sys.stderr)
+
+    def _load(self) -> Optional[Dict]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            self._notice("нет сохранённого состояния — полный прогон")
+            return None
+        if state.get("script_hash") != self.script_hash:
+            self._notice("скрипт изменился после сохранения состояния — полный прогон")
+            return None
+        covered_until = int(state["covered_until"])
+        if self.from_day > covered_until:
+            gap = self.client.execute(
+                f"SELECT count() FROM {self.table} WHERE {self.base_where} "
+                f"AND day_u16 >= %(covered)s AND day_u16 < %(from_day_gap)s",
+                {**self.params, "covered": covered_until, "from_day_gap": self.from_day},
+            )[0][0]
+            if gap:
+                self._notice(f"состояние покрывает дни < {covered_until}, а --from-day {self.from_day} — полный прогон")
+                return None
+        return state
+
+    def day_filter(self, column: str = "day_u16") -> str:
+        """Фильтр проверяемых строк: дни в [from_day, until_day)"""
+        sql = ""
+        if self.from_day is not None:
+            sql += f" AND {column} >= %(from_day)s"
+        if self.until_day is not None:
+            sql += f" AND {column} < %(until_day)s"
+        return sql
+
+    def scan_filter(self, partition: Sequence[str], column: str = "day_u16") -> str:
+        """Фильтр строк lag-окна: проверяемые дни плюс последняя строка каждой партиции до from_day"""
+        sql = f" AND {column} < %(until_day)s" if self.until_day is not None else ""
+        if self.from_day is None:
+            return sql
+        keys = ", ".join(partition)
+        return (
+            f"{sql} AND ({column} >= %(from_day)s OR ({keys}, {column}) IN ("
+            f"SELECT {keys}, max({column}) FROM {self.table} "
+            f"WHERE {self.base_where} AND {column} < %(from_day)s GROUP BY {keys}))"
+        )
+
+    def _covered_until(self) -> int:
+        max_day = self.client.execute(
+            f"SELECT max(day_u16) FROM {self.table} WHERE {self.base_where}"
+            + (" AND day_u16 < %(until_day)s" if self.until_day is not None else ""),
+            self.params,
+        )[0][0]
+        covered = int(max_day or 0) + 1
+        return min(covered, self.until_day) if self.until_day is not None else covered
+
+    def merge(self, fresh: Dict[int, object]) -> Dict[int, object]:
+        """Дни < from_day из состояния + свежие дни (по возрастанию); новое состояние сохраняется"""
+        days: Dict[int, object] = {}
+        if self.state is not None:
+            days = {int(day): payload for day, payload in self.state["days"].items() if int(day) < self.from_day}
+        days.update(fresh)
+        days = dict(sorted(days.items()))
+        if self.path is not None:
+            self._save(days)
+        return days
+
+    def _save(self, days: Dict[int, object]) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        state = {
+            "script_hash": self.script_hash,
+            "covered_until": self.until_day if self.until_day is not None else self._covered_until(),
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "days": {str(day): payload for day, payload in days.items()},
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+    def fused_count_sample(
+        self, source_sql: str, specs: Sequence[SampleSpec], counts: Sequence[str] = ()
+    ) -> Tuple[List[int], List[Sample]]:
+        """fused_sample.fused_count_sample по дням окна, слитый с сохранёнными днями"""
+        if not self.incremental:
+            return fused_count_sample(self.client, source_sql, self.params, specs, counts)
+        fresh = fused_count_sample_by(self.client, source_sql, self.params, specs, counts, "day_u16")
+        days = self.merge({
+            day: {"counts": extra, "samples": [[sample.count, sample.keyed] for sample in samples]}
+            for day, (extra, samples) in fresh.items()
+        })
+        parts = (
+            (
+                payload["counts"],
+                [
+                    Sample(int(count), [tuple(row) for row in keyed], len(spec.key), spec.limit)
+                    for spec, (count, keyed) in zip(specs, payload["samples"])
+                ],
+            )
+            for payload in days.values()
+        )
+        return merge_results(parts, specs, len(counts))
+
+
+def run_parity_check(args) -> bool:
+    """[0, D) с --until-day, затем [D, end) с --from-day — вывод и rc должны совпасть с полным прогоном"""
+    from run_all_stream import build_validator_cmd
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    dataset = (args.version_date, args.version_id)
+    env = os.environ.copy()
+    env["PYTHONUNBUFFERED"] = "1"
+
+    def run(cmd: List[str]) -> Tuple[int, str, float]:
+        start = time.time()
+        completed = subprocess.run(cmd, capture_output=True, text=True, env=env, check=False)
+        return completed.returncode, completed.stdout, time.time() - start
+
+    mismatched = 0
+    with tempfile.TemporaryDirectory() as full_dir, tempfile.TemporaryDirectory() as inc_dir:
+        for script in INCREMENTAL_SCRIPTS:
+            cmd = build_validator_cmd(os.path.join(base_dir, script), dataset, args.table_main, args.table_repair)
+            full_rc, full_out, full_seconds = run(cmd + ["--state-dir", full_dir])
+            run(cmd + ["--state-dir", inc_dir, "--until-day", str(args.from_day)])
+            inc_rc, inc_out, inc_seconds = run(cmd + ["--state-dir", inc_dir, "--from-day", str(args.from_day)])
+            ok = full_rc == inc_rc and full_out == inc_out
+            print(f"{script:<32} {'MATCH' if ok else 'MISMATCH':<8} full={full_seconds:.2f}s "
+                  f"tail={inc_seconds:.2f}s ({'PASS' if full_rc == 0 else 'FAIL'})")
+            if not ok:
+                mismatched += 1
+                full_lines, inc_lines = full_out.splitlines(), inc_out.splitlines()
+                diff = [(a, b) for a, b in zip(full_lines, inc_lines) if a != b][:3]
+                for full_line, inc_line in diff:
+                    print(f"    full: {full_line}")
+                    print(f"    inc:  {inc_line}")
+                if len(full_lines) != len(inc_lines):
+                    print(f"    строк: full={len(full_lines)}, inc={len(inc_lines)}")
+    print(f"PARITY: {len(INCREMENTAL_SCRIPTS) - mismatched}/{len(INCREMENTAL_SCRIPTS)} MATCH")
+    return mismatched == 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Инкрементальная валидация: сверка с полным прогоном")
+    parser.add_argument("--version-id", required=True, type=int)
+    parser.add_argument("--version-date", required=True, type=int)
+    parser.add_argument("--from-day", required=True, type=int)
+    parser.add_argument("--table-main", default="sim_masterv2_v9")
+    parser.add_argument("--table-repair", default="sim_repairline_v9")
+    parser.add_argument(
+        "--parity-check",
+        action="store_true",
+        help="Сверить [0, D) + [D, end) с полным прогоном по INCREMENTAL_SCRIPTS",
+    )
+    args = parser.parse_args()
+    if not args.parity_check:
+        print("Инкрементальные валидаторы (--from-day):")
+        for script in INCREMENTAL_SCRIPTS:
+            print(f"  {script}")
+        return 0
+    return 0 if run_parity_check(args) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -19,6 +19,7 @@ import re
 import sys
 
 from ch_client import get_client
+from incremental import DayWindow, add_incremental_args
 
 
 def validate_table_name(table: str) -> str:
@@ -64,121 +65,71 @@ def main() -> int:
     parser.add_argument("--version-id", required=True, type=int)
     parser.add_argument("--version-date", type=int, default=None)
     parser.add_argument("--table", default="sim_masterv2_v9")
+    add_incremental_args(parser)
     args = parser.parse_args()
     table = validate_table_name(args.table)
     client = get_client()
 
     vd_filter = ""
-    vd_filter_m = ""
     params = {"vid": args.version_id}
     if args.version_date is not None:
         vd_filter = " AND version_date = %(vdate)s"
-        vd_filter_m = " AND m.version_date = %(vdate)s"
         params["vdate"] = args.version_date
+    window = DayWindow(
+        client, args, __file__, table, f"version_id = %(vid)s{vd_filter} AND group_by IN (1, 2)", params
+    )
 
-    minmax_query = f"""
-    SELECT version_date, min(day_u16) AS min_day, max(day_u16) AS max_day
+    # Один скан: число строк по (день, version_date, pre_status_id, status_id). Все
+    # слагаемые баланса и таблица переходов — суммы этой матрицы, а подневное хранение
+    # позволяет с --from-day D брать дни < D из состояния (incremental.DayWindow)
+    matrix_query = f"""
+    SELECT day_u16, version_date, pre_status_id, status_id, count() AS cnt
     FROM {table}
     WHERE version_id = %(vid)s{vd_filter}
-      AND group_by IN (1, 2)
-    GROUP BY version_date
-    ORDER BY version_date
+      AND group_by IN (1, 2){window.day_filter()}
+    GROUP BY day_u16, version_date, pre_status_id, status_id
     """
-    minmax_rows = client.execute(minmax_query, params)
+    fresh = {}
+    for day, version_date, pre, st, cnt in client.execute(matrix_query, params):
+        fresh.setdefault(int(day), []).append([int(version_date), int(pre), int(st), int(cnt)])
+    matrix = window.merge(fresh)
+
+    min_days = {}
+    max_days = {}
+    for day, cells in matrix.items():
+        for version_date, _pre, _st, _cnt in cells:
+            min_days.setdefault(version_date, day)
+            max_days[version_date] = day
     day_ranges = [
-        (int(version_date), int(min_day), int(max_day))
-        for version_date, min_day, max_day in minmax_rows
-        if min_day is not None and max_day is not None
+        (version_date, min_days[version_date], max_days[version_date])
+        for version_date in sorted(min_days)
     ]
     has_data = bool(day_ranges)
 
-    # Считаем входы и выходы для каждого статуса
-    # Вход: pre_status_id != status_id (т.е. переход произошёл)
-    entries_query = f"""
-    SELECT version_date, status_id AS s, count() AS entries
-    FROM {table}
-    WHERE version_id = %(vid)s{vd_filter}
-      AND group_by IN (1, 2)
-      AND pre_status_id != status_id
-      AND pre_status_id > 0
-    GROUP BY version_date, status_id
-    ORDER BY version_date, status_id
-    """
-    entries_rows = client.execute(entries_query, params) if has_data else []
-    entries = {(int(r[0]), int(r[1])): int(r[2]) for r in entries_rows}
-
-    spawn_query = f"""
-    SELECT version_date, status_id AS s, count() AS spawn_entries
-    FROM {table}
-    WHERE version_id = %(vid)s{vd_filter}
-      AND group_by IN (1, 2)
-      AND pre_status_id = 0
-    GROUP BY version_date, status_id
-    ORDER BY version_date, status_id
-    """
-    spawn_rows = client.execute(spawn_query, params) if has_data else []
-    spawn_entries = {(int(r[0]), int(r[1])): int(r[2]) for r in spawn_rows}
-
-    # Выходы: pre_status_id = s, status_id != s
-    exits_query = f"""
-    SELECT version_date, pre_status_id AS s, count() AS exits
-    FROM {table}
-    WHERE version_id = %(vid)s{vd_filter}
-      AND group_by IN (1, 2)
-      AND pre_status_id != status_id
-      AND pre_status_id > 0
-    GROUP BY version_date, pre_status_id
-    ORDER BY version_date, pre_status_id
-    """
-    exits_rows = client.execute(exits_query, params) if has_data else []
-    exits = {(int(r[0]), int(r[1])): int(r[2]) for r in exits_rows}
+    def add(counter, key, cnt):
+        counter[key] = counter.get(key, 0) + cnt
 
+    # Вход: pre_status_id != status_id (т.е. переход произошёл); выход: pre_status_id = s, status_id != s
+    entries = {}
+    spawn_entries = {}
+    exits = {}
+    transition_counts = {}
     # Начальные и финальные статусы (по первому/последнему дню)
     initial_counts = {}
     final_counts = {}
-    if has_data:
-        initial_query = f"""
-        WITH minmax AS (
-            SELECT version_date, min(day_u16) AS min_day
-            FROM {table}
-            WHERE version_id = %(vid)s{vd_filter}
-              AND group_by IN (1, 2)
-            GROUP BY version_date
-        )
-        SELECT m.version_date, m.pre_status_id AS s, count() AS cnt
-        FROM {table} m
-        INNER JOIN minmax mm
-            ON m.version_date = mm.version_date
-           AND m.day_u16 = mm.min_day
-        WHERE m.version_id = %(vid)s{vd_filter_m}
-          AND m.group_by IN (1, 2)
-          AND m.pre_status_id > 0
-        GROUP BY m.version_date, m.pre_status_id
-        ORDER BY m.version_date, m.pre_status_id
-        """
-        initial_rows = client.execute(initial_query, params)
-        initial_counts = {(int(r[0]), int(r[1])): int(r[2]) for r in initial_rows}
-
-        final_query = f"""
-        WITH minmax AS (
-            SELECT version_date, max(day_u16) AS max_day
-            FROM {table}
-            WHERE version_id = %(vid)s{vd_filter}
-              AND group_by IN (1, 2)
-            GROUP BY version_date
-        )
-        SELECT m.version_date, m.status_id AS s, count() AS cnt
-        FROM {table} m
-        INNER JOIN minmax mm
-            ON m.version_date = mm.version_date
-           AND m.day_u16 = mm.max_day
-        WHERE m.version_id = %(vid)s{vd_filter_m}
-          AND m.group_by IN (1, 2)
-        GROUP BY m.version_date, m.status_id
-        ORDER BY m.version_date, m.status_id
-        """
-        final_rows = client.execute(final_query, params)
-        final_counts = {(int(r[0]), int(r[1])): int(r[2]) for r in final_rows}
+    for day, cells in matrix.items():
+        for version_date, pre, st, cnt in cells:
+            if pre != st:
+                add(transition_counts, (version_date, pre, st), cnt)
+                if pre > 0:
+                    add(entries, (version_date, st), cnt)
+                    add(exits, (version_date, pre), cnt)
+            if pre == 0:
+                add(spawn_entries, (version_date, st), cnt)
+            if day == min_days[version_date] and pre > 0:
+                add(initial_counts, (version_date, pre), cnt)
+            if day == max_days[version_date]:
+                add(final_counts, (version_date, st), cnt)
 
     # Баланс для каждого статуса
     check_states = [1, 2, 3, 4, 6, 7]
@@ -212,16 +163,10 @@ def main() -> int:
                 violations += 1
 
     # Таблица переходов с LEGAL/ILLEGAL
-    transitions_query = f"""
-    SELECT version_date, pre_status_id AS pre, status_id AS st, count() AS cnt
-    FROM {table}
-    WHERE version_id = %(vid)s{vd_filter}
-      AND group_by IN (1, 2)
-      AND pre_status_id != status_id
-    GROUP BY version_date, pre_status_id, status_id
-    ORDER BY version_date, pre_status_id, status_id
-    """
-    transition_rows = client.execute(transitions_query, params) if has_data else []
+    transition_rows = [
+        (version_date, pre, st, cnt)
+        for (version_date, pre, st), cnt in sorted(transition_counts.items())
+    ]
     allowed = {
         (0, 2),
         (0, 3),
@@ -10,6 +10,8 @@ import re
 import sys
 
 from ch_client import get_client
+from fused_sample import SampleSpec
+from incremental import DayWindow, add_incremental_args
 
 
 def validate_table_name(table: str) -> str:
@@ -43,6 +45,7 @@ def main() -> int:
         default="sim_masterv2_v9",
         help="Таблица ClickHouse (по умолчанию: sim_masterv2_v9)",
     )
+    add_incremental_args(parser)
     args = parser.parse_args()
     table = validate_table_name(args.table)
     client = get_client()
@@ -52,19 +55,11 @@ def main() -> int:
     if args.version_date is not None:
         vd_filter = " AND version_date = %(vdate)s"
         params["vdate"] = args.version_date
+    window = DayWindow(
+        client, args, __file__, table, f"version_id = %(vid)s{vd_filter} AND group_by IN (1, 2)", params
+    )
 
-    count_query = f"""
-    SELECT count()
-    FROM {table}
-    WHERE version_id = %(vid)s{vd_filter}
-      AND sne > ll
-      AND group_by IN (1, 2)
-    """
-    violations = client.execute(count_query, params)[0][0]
-    details = [f"violations={violations}"]
-
-    if violations:
-        sample_query = f"""
+    source_sql = f"""
         SELECT
             aircraft_number,
             day_u16,
@@ -76,13 +71,25 @@ def main() -> int:
         FROM {table}
         WHERE version_id = %(vid)s{vd_filter}
           AND sne > ll
-          AND group_by IN (1, 2)
-        ORDER BY exceed DESC
-        LIMIT 10
-        """
-        rows = client.execute(sample_query, params)
+          AND group_by IN (1, 2){window.day_filter()}
+    """
+    (), (sample,) = window.fused_count_sample(
+        source_sql,
+        [
+            SampleSpec(
+                where=None,
+                key=["-exceed"],
+                columns=["aircraft_number", "day_u16", "sne", "ll", "exceed", "limiter", "daily_today_u32"],
+                limit=10,
+            )
+        ],
+    )
+    violations = sample.count
+    details = [f"violations={violations}"]
+
+    if violations:
         details.append("top10 sample (acn, day, sne, ll, exceed, limiter, dt):")
-        for row in rows:
+        for row in sample.rows:
             acn, day, sne, ll, exceed, limiter, dt = row
             details.append(
                 f"  acn={acn}, day={day}, sne={sne}, ll={ll}, "
@@ -7,6 +7,7 @@ import re
 import sys
 
 from ch_client import get_client
+from fused_sample import SampleSpec, fused_count_sample
 
 
 def validate_table_name(table: str) -> str:
@@ -59,30 +60,27 @@ def main() -> int:
     # aircraft_number в lookback-only экспорте не является признаком занятости линии
     busy_expr = "repair_time > 0 AND free_days < repair_time"
 
-    max_query = f"""
-    SELECT max(n)
-    FROM (
+    # Один проход по дневным загрузкам: максимум, число дней сверх квоты и top5
+    source_sql = f"""
         SELECT version_date, day_u16, countIf({busy_expr}) AS n
         FROM {table}
         WHERE version_id = %(vid)s{vd_filter}
         GROUP BY version_date, day_u16
-    )
     """
-    max_concurrent = client.execute(max_query, params)[0][0]
-    if max_concurrent is None:
-        max_concurrent = 0
-
-    violations_query = f"""
-    SELECT count()
-    FROM (
-        SELECT version_date, day_u16, countIf({busy_expr}) AS n
-        FROM {table}
-        WHERE version_id = %(vid)s{vd_filter}
-        GROUP BY version_date, day_u16
-        HAVING n > %(quota)s
+    (max_concurrent,), (sample,) = fused_count_sample(
+        client,
+        source_sql,
+        params,
+        [
+            SampleSpec(
+                where="n > %(quota)s",
+                key=["-n", "version_date", "day_u16"],
+                columns=["version_date", "day_u16", "n"],
+            )
+        ],
+        counts=["max(n)"],
     )
-    """
-    violations = client.execute(violations_query, params)[0][0]
+    violations = sample.count
     details = [
         f"repair_quota={args.repair_quota}",
         f"max_concurrent_repair={max_concurrent}",
@@ -90,21 +88,8 @@ def main() -> int:
     ]
 
     if violations:
-        sample_query = f"""
-        SELECT version_date, day_u16, n
-        FROM (
-            SELECT version_date, day_u16, countIf({busy_expr}) AS n
-            FROM {table}
-            WHERE version_id = %(vid)s{vd_filter}
-            GROUP BY version_date, day_u16
-            HAVING n > %(quota)s
-        )
-        ORDER BY n DESC, version_date, day_u16
-        LIMIT 5
-        """
-        rows = client.execute(sample_query, params)
         details.append("top5 days (version_date, day, n):")
-        for version_date, day_u16, n in rows:
+        for version_date, day_u16, n in sample.rows:
             details.append(f"  version_date={version_date}, day={day_u16}, n={n}")
 
     passed = violations == 0
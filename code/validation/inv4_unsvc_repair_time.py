@@ -12,6 +12,7 @@ import re
 import sys
 
 from ch_client import get_client
+from fused_sample import SampleSpec, count_and_sample
 
 
 def validate_table_name(table: str) -> str:
@@ -52,7 +53,7 @@ def main() -> int:
     # Шаг 1: все переходы (только момент перехода)
     # Шаг 2: для return-переходов ищем последний exit через window
 
-    query = f"""
+    source_sql = f"""
     WITH transitions AS (
         SELECT
             aircraft_number, group_by, version_date, day_u16,
@@ -77,7 +78,8 @@ def main() -> int:
         FROM transitions
         WHERE status_id = 2 AND pre_status_id IN (4, 7)
     )
-    SELECT count()
+    SELECT e.aircraft_number AS acn, e.exit_day AS exit_day, r.return_day AS return_day,
+           r.return_day - e.exit_day AS gap, r.rt AS repair_time
     FROM exits e
     INNER JOIN returns r
         ON e.aircraft_number = r.aircraft_number
@@ -87,50 +89,22 @@ def main() -> int:
     WHERE r.return_day - e.exit_day < r.rt
       AND r.return_day > e.exit_day
     """
-    violations = client.execute(query, params)[0][0]
+    sample = count_and_sample(
+        client,
+        source_sql,
+        params,
+        SampleSpec(
+            where=None,
+            key=["gap"],
+            columns=["acn", "exit_day", "return_day", "gap", "repair_time"],
+        ),
+    )
+    violations = sample.count
     details = [f"violations={violations}"]
 
     if violations:
-        sample_query = f"""
-        WITH transitions AS (
-            SELECT
-                aircraft_number, group_by, day_u16,
-                version_date,
-                pre_status_id, status_id, repair_time
-            FROM {table}
-            WHERE version_id = %(vid)s{vd_filter}
-              AND group_by IN (1, 2)
-              AND pre_status_id != status_id
-              AND pre_status_id > 0
-        ),
-        exits AS (
-            SELECT aircraft_number, group_by, version_date, day_u16 AS exit_day,
-                   row_number() OVER (PARTITION BY aircraft_number, group_by, version_date ORDER BY day_u16) AS rn
-            FROM transitions
-            WHERE pre_status_id = 2 AND status_id = 7
-        ),
-        returns AS (
-            SELECT aircraft_number, group_by, version_date, day_u16 AS return_day, repair_time AS rt,
-                   row_number() OVER (PARTITION BY aircraft_number, group_by, version_date ORDER BY day_u16) AS rn
-            FROM transitions
-            WHERE status_id = 2 AND pre_status_id IN (4, 7)
-        )
-        SELECT e.aircraft_number, e.exit_day, r.return_day,
-               r.return_day - e.exit_day AS gap, r.rt AS repair_time
-        FROM exits e
-        INNER JOIN returns r
-            ON e.aircraft_number = r.aircraft_number
-            AND e.group_by = r.group_by
-            AND e.version_date = r.version_date
-            AND e.rn = r.rn
-        WHERE r.return_day - e.exit_day < r.rt
-          AND r.return_day > e.exit_day
-        ORDER BY gap ASC
-        LIMIT 5
-        """
-        rows = client.execute(sample_query, params)
         details.append("top5 (acn, exit_day, return_day, gap, repair_time):")
-        for acn, ed, rd, gap, rt in rows:
+        for acn, ed, rd, gap, rt in sample.rows:
             details.append(
                 f"  acn={acn}, exit={ed}, return={rd}, gap={gap}, repair_time={rt}"
             )
@@ -19,6 +19,8 @@ import re
 import sys
 
 from ch_client import get_client
+from fused_sample import SampleSpec
+from incremental import DayWindow, add_incremental_args
 
 
 def validate_table_name(table: str) -> str:
@@ -49,6 +51,7 @@ def main() -> int:
         "--table", default="sim_masterv2_v9",
         help="Таблица ClickHouse (по умолчанию: sim_masterv2_v9)",
     )
+    add_incremental_args(parser)
     args = parser.parse_args()
     table = validate_table_name(args.table)
     client = get_client()
@@ -58,6 +61,12 @@ def main() -> int:
     if args.version_date is not None:
         vd_filter = " AND version_date = %(vdate)s"
         params["vdate"] = args.version_date
+    # Для --from-day в окно попадает последняя строка агента до D — prev_sne/prev_day первой
+    # проверяемой строки те же, что в полном прогоне
+    window = DayWindow(
+        client, args, __file__, table, f"version_id = %(vid)s{vd_filter} AND group_by IN (1, 2)", params
+    )
+    partition = ["aircraft_number", "group_by", "version_date"]
 
     base_subquery = f"""
         SELECT
@@ -66,31 +75,39 @@ def main() -> int:
             lagInFrame(sne, 1, 0) OVER w AS prev_sne,
             lagInFrame(day_u16, 1, 0) OVER w AS prev_day
         FROM {table}
-        WHERE version_id = %(vid)s{vd_filter} AND group_by IN (1, 2)
+        WHERE version_id = %(vid)s{vd_filter} AND group_by IN (1, 2){window.scan_filter(partition)}
         WINDOW w AS (PARTITION BY aircraft_number, group_by, version_date ORDER BY day_u16)
     """
 
-    # Реальные нарушения (не артефакт transition-out)
-    real_query = f"""
-    SELECT count()
-    FROM ({base_subquery})
-    WHERE prev_day > 0
-      AND pre_status_id > 0
-      AND toInt64(sne) - toInt64(prev_sne) != toInt64(dt)
-      AND NOT (pre_status_id = 2 AND status_id != 2 AND dt = 0)
-    """
-    real_violations = client.execute(real_query, params)[0][0]
-
-    # Артефакт transition-out (известный)
-    artifact_query = f"""
-    SELECT count()
-    FROM ({base_subquery})
-    WHERE prev_day > 0
-      AND pre_status_id > 0
-      AND toInt64(sne) - toInt64(prev_sne) != toInt64(dt)
-      AND pre_status_id = 2 AND status_id != 2 AND dt = 0
+    # Все расхождения sne_diff != dt за один проход: реальные нарушения считаются
+    # и выбираются отдельно от известного артефакта transition-out
+    source_sql = f"""
+        SELECT
+            aircraft_number, day_u16, status_id, pre_status_id,
+            sne, prev_sne, dt,
+            toInt64(sne) - toInt64(prev_sne) AS sne_delta,
+            toInt64(sne) - toInt64(prev_sne) - toInt64(dt) AS diff,
+            (pre_status_id = 2 AND status_id != 2 AND dt = 0) AS is_artifact
+        FROM ({base_subquery})
+        WHERE prev_day > 0
+          AND pre_status_id > 0
+          AND toInt64(sne) - toInt64(prev_sne) != toInt64(dt){window.day_filter()}
     """
-    artifact_count = client.execute(artifact_query, params)[0][0]
+    (artifact_count,), (sample,) = window.fused_count_sample(
+        source_sql,
+        [
+            SampleSpec(
+                where="NOT is_artifact",
+                key=["-abs(diff)"],
+                columns=[
+                    "aircraft_number", "day_u16", "status_id", "pre_status_id",
+                    "sne", "prev_sne", "dt", "sne_delta", "diff",
+                ],
+            )
+        ],
+        counts=["countIf(is_artifact)"],
+    )
+    real_violations = sample.count
 
     details = [
         f"real_violations={real_violations}",
@@ -98,23 +115,8 @@ def main() -> int:
     ]
 
     if real_violations > 0:
-        sample_query = f"""
-        SELECT
-            aircraft_number, day_u16, status_id, pre_status_id,
-            sne, prev_sne, dt,
-            toInt64(sne) - toInt64(prev_sne) AS sne_delta,
-            toInt64(sne) - toInt64(prev_sne) - toInt64(dt) AS diff
-        FROM ({base_subquery})
-        WHERE prev_day > 0
-          AND pre_status_id > 0
-          AND toInt64(sne) - toInt64(prev_sne) != toInt64(dt)
-          AND NOT (pre_status_id = 2 AND status_id != 2 AND dt = 0)
-        ORDER BY abs(toInt64(sne) - toInt64(prev_sne) - toInt64(dt)) DESC
-        LIMIT 5
-        """
-        rows = client.execute(sample_query, params)
         details.append("top5 real violations (acn, day, st, pre_st, sne, prev, dt, delta, diff):")
-        for acn, d, st, pst, sne, psne, dt, sd, diff in rows:
+        for acn, d, st, pst, sne, psne, dt, sd, diff in sample.rows:
             details.append(
                 f"  acn={acn}, day={d}, st={st}, pre_st={pst}, "
                 f"sne={sne}, prev={psne}, dt={dt}, delta={sd}, diff={diff}"
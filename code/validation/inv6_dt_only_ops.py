@@ -7,6 +7,8 @@ import re
 import sys
 
 from ch_client import get_client
+from fused_sample import SampleSpec
+from incremental import DayWindow, add_incremental_args
 
 
 def validate_table_name(table: str) -> str:
@@ -38,6 +40,7 @@ def main() -> int:
         default="sim_masterv2_v9",
         help="Таблица ClickHouse (по умолчанию: sim_masterv2_v9)",
     )
+    add_incremental_args(parser)
     args = parser.parse_args()
     table = validate_table_name(args.table)
     client = get_client()
@@ -47,20 +50,11 @@ def main() -> int:
     if args.version_date is not None:
         vd_filter = " AND version_date = %(vdate)s"
         params["vdate"] = args.version_date
+    window = DayWindow(
+        client, args, __file__, table, f"version_id = %(vid)s{vd_filter} AND group_by IN (1, 2)", params
+    )
 
-    count_query = f"""
-    SELECT count()
-    FROM {table}
-    WHERE version_id = %(vid)s{vd_filter}
-      AND status_id != 2
-      AND daily_today_u32 > 0
-      AND group_by IN (1, 2)
-    """
-    violations = client.execute(count_query, params)[0][0]
-    details = [f"violations={violations}"]
-
-    if violations:
-        sample_query = f"""
+    source_sql = f"""
         SELECT
             aircraft_number,
             day_u16,
@@ -71,13 +65,25 @@ def main() -> int:
         WHERE version_id = %(vid)s{vd_filter}
           AND status_id != 2
           AND daily_today_u32 > 0
-          AND group_by IN (1, 2)
-        ORDER BY daily_today_u32 DESC, day_u16
-        LIMIT 10
-        """
-        rows = client.execute(sample_query, params)
+          AND group_by IN (1, 2){window.day_filter()}
+    """
+    (), (sample,) = window.fused_count_sample(
+        source_sql,
+        [
+            SampleSpec(
+                where=None,
+                key=["-daily_today_u32", "day_u16"],
+                columns=["aircraft_number", "day_u16", "status_id", "pre_status_id", "daily_today_u32"],
+                limit=10,
+            )
+        ],
+    )
+    violations = sample.count
+    details = [f"violations={violations}"]
+
+    if violations:
         details.append("top10 sample (acn, day, status, pre_status, dt):")
-        for row in rows:
+        for row in sample.rows:
             acn, day, status_id, pre_status_id, dt = row
             details.append(
                 f"  acn={acn}, day={day}, status_id={status_id}, "
@@ -19,6 +19,8 @@ import re
 import sys
 
 from ch_client import get_client
+from fused_sample import SampleSpec
+from incremental import DayWindow, add_incremental_args
 
 
 def validate_table_name(table: str) -> str:
@@ -43,6 +45,7 @@ def main() -> int:
     parser.add_argument("--version-id", required=True, type=int)
     parser.add_argument("--version-date", type=int, default=None)
     parser.add_argument("--table", default="sim_masterv2_v9")
+    add_incremental_args(parser)
     args = parser.parse_args()
     table = validate_table_name(args.table)
     client = get_client()
@@ -52,31 +55,16 @@ def main() -> int:
     if args.version_date is not None:
         vd_filter = " AND version_date = %(vdate)s"
         params["vdate"] = args.version_date
+    # Для --from-day в окно попадает последняя строка агента до D — lag-колонки первой
+    # проверяемой строки те же, что в полном прогоне
+    window = DayWindow(
+        client, args, __file__, table, f"version_id = %(vid)s{vd_filter} AND group_by IN (1, 2)", params
+    )
+    partition = ["aircraft_number", "group_by", "version_date"]
 
     # Проверка: для последовательных шагов в ops (pre_status=2, status=2),
     # sne должен увеличиться ровно на dt
-    query = f"""
-    SELECT count()
-    FROM (
-        SELECT
-            aircraft_number, version_date, day_u16, status_id, pre_status_id,
-            sne, daily_today_u32 AS dt,
-            lagInFrame(sne, 1, 0) OVER w AS prev_sne,
-            lagInFrame(status_id, 1, 0) OVER w AS lag_st,
-            lagInFrame(day_u16, 1, 0) OVER w AS prev_day
-        FROM {table}
-        WHERE version_id = %(vid)s{vd_filter} AND group_by IN (1, 2)
-        WINDOW w AS (PARTITION BY aircraft_number, group_by, version_date ORDER BY day_u16)
-    )
-    WHERE status_id = 2 AND pre_status_id = 2
-      AND prev_day > 0 AND lag_st = 2
-      AND sne != prev_sne + dt
-    """
-    violations = client.execute(query, params)[0][0]
-    details = [f"violations={violations}"]
-
-    if violations:
-        sample_query = f"""
+    source_sql = f"""
         SELECT aircraft_number, day_u16, sne, prev_sne, dt,
                toInt64(sne) - toInt64(prev_sne) AS actual_delta,
                toInt64(sne) - toInt64(prev_sne) - toInt64(dt) AS diff
@@ -88,18 +76,29 @@ def main() -> int:
                 lagInFrame(status_id, 1, 0) OVER w AS lag_st,
                 lagInFrame(day_u16, 1, 0) OVER w AS prev_day
             FROM {table}
-            WHERE version_id = %(vid)s{vd_filter} AND group_by IN (1, 2)
+            WHERE version_id = %(vid)s{vd_filter} AND group_by IN (1, 2){window.scan_filter(partition)}
             WINDOW w AS (PARTITION BY aircraft_number, group_by, version_date ORDER BY day_u16)
         )
         WHERE status_id = 2 AND pre_status_id = 2
           AND prev_day > 0 AND lag_st = 2
-          AND sne != prev_sne + dt
-        ORDER BY abs(toInt64(sne) - toInt64(prev_sne) - toInt64(dt)) DESC
-        LIMIT 5
-        """
-        rows = client.execute(sample_query, params)
+          AND sne != prev_sne + dt{window.day_filter()}
+    """
+    (), (sample,) = window.fused_count_sample(
+        source_sql,
+        [
+            SampleSpec(
+                where=None,
+                key=["-abs(diff)"],
+                columns=["aircraft_number", "day_u16", "sne", "prev_sne", "dt", "actual_delta", "diff"],
+            )
+        ],
+    )
+    violations = sample.count
+    details = [f"violations={violations}"]
+
+    if violations:
         details.append("top5 (acn, day, sne, prev_sne, dt, actual_delta, diff):")
-        for acn, d, sne, psne, dt, ad, diff in rows:
+        for acn, d, sne, psne, dt, ad, diff in sample.rows:
             details.append(
                 f"  acn={acn}, day={d}, sne={sne}, prev_sne={psne}, "
                 f"dt={dt}, actual_delta={ad}, diff={diff}"
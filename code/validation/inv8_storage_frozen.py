@@ -10,6 +10,8 @@ import re
 import sys
 
 from ch_client import get_client
+from fused_sample import SampleSpec
+from incremental import DayWindow, add_incremental_args
 
 
 def validate_table_name(table: str) -> str:
@@ -38,6 +40,7 @@ def main() -> int:
         "--table", default="sim_masterv2_v9",
         help="Таблица ClickHouse (по умолчанию: sim_masterv2_v9)",
     )
+    add_incremental_args(parser)
     args = parser.parse_args()
     table = validate_table_name(args.table)
     client = get_client()
@@ -47,30 +50,14 @@ def main() -> int:
     if args.version_date is not None:
         vd_filter = " AND version_date = %(vdate)s"
         params["vdate"] = args.version_date
-
-    count_query = f"""
-    SELECT count()
-    FROM (
-        SELECT
-            aircraft_number, version_date, day_u16, status_id, sne, ppr,
-            lagInFrame(sne) OVER w AS prev_sne,
-            lagInFrame(ppr) OVER w AS prev_ppr,
-            lagInFrame(status_id) OVER w AS prev_st,
-            lagInFrame(day_u16, 1, 0) OVER w AS prev_day
-        FROM {table}
-        WHERE version_id = %(vid)s{vd_filter} AND group_by IN (1, 2)
-        WINDOW w AS (PARTITION BY aircraft_number, group_by, version_date ORDER BY day_u16)
+    # Для --from-day в окно попадает последняя строка агента до D — lag-колонки первой
+    # проверяемой строки те же, что в полном прогоне
+    window = DayWindow(
+        client, args, __file__, table, f"version_id = %(vid)s{vd_filter} AND group_by IN (1, 2)", params
     )
-    WHERE status_id = 6
-      AND prev_st = 6
-      AND prev_day > 0
-      AND (sne != prev_sne OR ppr != prev_ppr)
-    """
-    violations = client.execute(count_query, params)[0][0]
-    details = [f"violations={violations}"]
+    partition = ["aircraft_number", "group_by", "version_date"]
 
-    if violations:
-        sample_query = f"""
+    source_sql = f"""
         SELECT aircraft_number, day_u16, sne, prev_sne, ppr, prev_ppr
         FROM (
             SELECT
@@ -80,19 +67,30 @@ def main() -> int:
                 lagInFrame(status_id) OVER w AS prev_st,
                 lagInFrame(day_u16, 1, 0) OVER w AS prev_day
             FROM {table}
-            WHERE version_id = %(vid)s{vd_filter} AND group_by IN (1, 2)
+            WHERE version_id = %(vid)s{vd_filter} AND group_by IN (1, 2){window.scan_filter(partition)}
             WINDOW w AS (PARTITION BY aircraft_number, group_by, version_date ORDER BY day_u16)
         )
         WHERE status_id = 6
           AND prev_st = 6
           AND prev_day > 0
-          AND (sne != prev_sne OR ppr != prev_ppr)
-        ORDER BY day_u16
-        LIMIT 5
-        """
-        rows = client.execute(sample_query, params)
+          AND (sne != prev_sne OR ppr != prev_ppr){window.day_filter()}
+    """
+    (), (sample,) = window.fused_count_sample(
+        source_sql,
+        [
+            SampleSpec(
+                where=None,
+                key=["day_u16"],
+                columns=["aircraft_number", "day_u16", "sne", "prev_sne", "ppr", "prev_ppr"],
+            )
+        ],
+    )
+    violations = sample.count
+    details = [f"violations={violations}"]
+
+    if violations:
         details.append("top5 sample (acn, day, sne/prev_sne, ppr/prev_ppr):")
-        for acn, day, sne, prev_sne, ppr, prev_ppr in rows:
+        for acn, day, sne, prev_sne, ppr, prev_ppr in sample.rows:
             details.append(
                 f"  acn={acn}, day={day}, sne={sne}/{prev_sne}, ppr={ppr}/{prev_ppr}"
             )
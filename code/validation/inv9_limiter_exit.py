@@ -10,6 +10,7 @@ import re
 import sys
 
 from ch_client import get_client
+from fused_sample import SampleSpec, count_and_sample
 
 
 def validate_table_name(table: str) -> str:
@@ -48,30 +49,10 @@ def main() -> int:
         vd_filter = " AND version_date = %(vdate)s"
         params["vdate"] = args.version_date
 
-    count_query = f"""
-    SELECT count()
-    FROM (
-        SELECT
-            idx, aircraft_number, group_by, version_date, day_u16, status_id,
-            sne, ll, ppr, oh, daily_next_u32,
-            leadInFrame(status_id) OVER w AS next_st
-        FROM {table}
-        WHERE version_id = %(vid)s{vd_filter} AND group_by IN (1, 2)
-        WINDOW w AS (PARTITION BY idx, group_by, version_date ORDER BY day_u16)
-    )
-    WHERE status_id = 2
-      AND next_st = 2
-      AND (sne + daily_next_u32 > ll OR ppr + daily_next_u32 > oh)
-    """
-    violations = client.execute(count_query, params)[0][0]
-    details = [f"violations={violations}"]
-
-    if violations:
-        sample_query = f"""
+    source_sql = f"""
         SELECT
             aircraft_number, group_by, version_date, day_u16,
-            sne, daily_next_u32, ll,
-            ppr, daily_next_u32, oh,
+            sne, daily_next_u32, ll, ppr, oh,
             next_st
         FROM (
             SELECT
@@ -85,17 +66,31 @@ def main() -> int:
         WHERE status_id = 2
           AND next_st = 2
           AND (sne + daily_next_u32 > ll OR ppr + daily_next_u32 > oh)
-        ORDER BY day_u16
-        LIMIT 5
-        """
-        rows = client.execute(sample_query, params)
+    """
+    sample = count_and_sample(
+        client,
+        source_sql,
+        params,
+        SampleSpec(
+            where=None,
+            key=["day_u16"],
+            columns=[
+                "aircraft_number", "group_by", "version_date", "day_u16",
+                "sne", "daily_next_u32", "ll", "ppr", "oh", "next_st",
+            ],
+        ),
+    )
+    violations = sample.count
+    details = [f"violations={violations}"]
+
+    if violations:
         details.append(
             "top5 sample (acn, gb, vd, day, sne, dt_next, ll, ppr, dt_next, oh, next_status):"
         )
-        for acn, gb, vd, day, sne, dt_sne, ll, ppr, dt_ppr, oh, next_st in rows:
+        for acn, gb, vd, day, sne, dt_next, ll, ppr, oh, next_st in sample.rows:
             details.append(
                 f"  acn={acn}, group_by={gb}, version_date={vd}, day={day}, "
-                f"sne={sne}+{dt_sne}>{ll}, ppr={ppr}+{dt_ppr}>{oh}, "
+                f"sne={sne}+{dt_next}>{ll}, ppr={ppr}+{dt_next}>{oh}, "
                 f"next_status={next_st}"
             )
 
@@ -0,0 +1,96 @@
+"""
+Чанковое выполнение L2-валидаторов по sim_units_v2.
+
+Окна L2-запросов разбиты по psn (PARTITION BY psn, version_date), поэтому срез
+делится на K непересекающихся частей по modulo(cityHash64(psn), K) без потери
+точности: каждый агрегат считается по частям и суммируется, выборки нарушений
+собираются по частям и сливаются тем же ключом (с добивкой по psn/day), что и
+в монолитном запросе (fused_sample.merge_samples). --chunks 1 — монолитный
+запрос (по умолчанию), --chunks 0 — K по оценке памяти: строк среза ×
+UNITS_ROW_BYTES против доли max_memory_usage.
+"""
+import math
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple
+
+# Оценка памяти окна на строку sim_units_v2 (сортировка + 3-4 оконные колонки)
+UNITS_ROW_BYTES = 256
+# Доля max_memory_usage, которую может занять один чанк
+MEMORY_SHARE = 0.5
+MAX_CHUNKS = 256
+
+
+def add_chunk_args(parser) -> None:
+    parser.add_argument(
+        "--chunks",
+        type=int,
+        default=1,
+        help="Частей по modulo(cityHash64(psn), K): 1 — монолитно, 0 — авто по max_memory_usage",
+    )
+
+
+def chunk_filter(chunks: int, column: str = "psn") -> str:
+    """SQL-условие чанка (пусто для монолитного запроса)"""
+    if chunks <= 1:
+        return ""
+    return f"AND modulo(cityHash64({column}), %(chunks)s) = %(chunk)s"
+
+
+def iter_chunk_params(params: Dict, chunks: int) -> Iterator[Dict]:
+    if chunks <= 1:
+        yield params
+        return
+    for chunk in range(chunks):
+        yield {**params, "chunks": chunks, "chunk": chunk}
+
+
+def auto_chunks(client, table_units: str, params: Dict) -> Tuple[int, str]:
+    """K по числу строк среза и max_memory_usage сервера: (K, пояснение)"""
+    rows = client.execute(
+        f"""
+        SELECT count()
+        FROM {table_units}
+        WHERE version_date = %(uvd)s
+          AND version_id = %(vid)s
+          AND group_by IN (3, 4)
+        """,
+        params,
+    )[0][0]
+    limit = client.execute("SELECT getSetting('max_memory_usage')")[0][0]
+    limit = int(limit or 0)
+    if not limit:
+        return 1, f"rows={rows}, max_memory_usage=0 (без лимита)"
+    estimate = int(rows) * UNITS_ROW_BYTES
+    chunks = max(1, min(MAX_CHUNKS, math.ceil(estimate / (limit * MEMORY_SHARE))))
+    return chunks, f"rows={rows}, est={estimate / 2**20:.0f}MiB, max_memory_usage={limit / 2**20:.0f}MiB"
+
+
+def resolve_chunks(client, requested: int, table_units: str, params: Dict) -> int:
+    """Число чанков: явное --chunks K или авто (--chunks 0); печатает строку CHUNKS при K > 1"""
+    if requested < 0:
+        raise SystemExit("--chunks должен быть >= 0")
+    reason = "--chunks"
+    chunks = requested
+    if requested == 0:
+        chunks, reason = auto_chunks(client, table_units, params)
+    if chunks > 1:
+        print(f"CHUNKS K={chunks} by cityHash64(psn) ({reason})")
+    return chunks
+
+
+def sum_rows(rows: Iterable[Sequence]) -> List[int]:
+    """Поэлементная сумма однострочных счётчиков чанков"""
+    total: List[int] = []
+    for row in rows:
+        if not total:
+            total = [0] * len(row)
+        total = [acc + int(value or 0) for acc, value in zip(total, row)]
+    return total
+
+
+def merge_counts(parts: Iterable[Sequence[tuple]]) -> Dict[tuple, int]:
+    """Сумма (ключ..., count) по чанкам: {ключ: count}"""
+    counts: Dict[tuple, int] = {}
+    for part in parts:
+        for *group, cnt in part:
+            counts[tuple(group)] = counts.get(tuple(group), 0) + int(cnt)
+    return counts
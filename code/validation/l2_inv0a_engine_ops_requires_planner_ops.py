@@ -7,6 +7,7 @@ import re
 import sys
 
 from ch_client import get_client
+from fused_sample import SampleSpec, fused_count_sample
 
 
 TABLE_RE = re.compile(r"^[A-Za-z0-9_]+(\.[A-Za-z0-9_]+)?$")
@@ -66,7 +67,7 @@ def main() -> int:
         "uvd": args.units_version_date_int,
         "vid": args.version_id,
     }
-    query = f"""
+    source_sql = f"""
     WITH engine_ops AS (
         SELECT day_u16, aircraft_number
         FROM {table_units}
@@ -78,9 +79,9 @@ def main() -> int:
           AND aircraft_number > 0
     )
     SELECT
-        count() AS engine_ops_rows,
-        countIf(p.status_id = 2) AS planner_ops_ok,
-        countIf(isNull(p.status_id) OR p.status_id != 2) AS violations
+        e.aircraft_number AS acn,
+        e.day_u16 AS day,
+        p.status_id AS planner_status
     FROM engine_ops e
     ANY LEFT JOIN {table_main} p
         ON p.version_date = %(pvd)s
@@ -88,7 +89,20 @@ def main() -> int:
        AND p.day_u16 = e.day_u16
        AND p.aircraft_number = e.aircraft_number
     """
-    engine_ops_rows, planner_ops_ok, violations = client.execute(query, params)[0]
+    (engine_ops_rows, planner_ops_ok), (sample,) = fused_count_sample(
+        client,
+        source_sql,
+        params,
+        [
+            SampleSpec(
+                where="isNull(planner_status) OR planner_status != 2",
+                key=["day", "acn"],
+                columns=["acn", "day", "planner_status"],
+            )
+        ],
+        counts=["count()", "countIf(planner_status = 2)"],
+    )
+    violations = sample.count
     details = [
         f"engine_ops_rows={engine_ops_rows}",
         f"planner_ops_ok={planner_ops_ok}",
@@ -96,34 +110,8 @@ def main() -> int:
     ]
 
     if violations:
-        sample_query = f"""
-        WITH engine_ops AS (
-            SELECT day_u16, aircraft_number
-            FROM {table_units}
-            WHERE version_date = %(uvd)s
-              AND version_id = %(vid)s
-              AND group_by IN (3, 4)
-              AND state = 2
-              AND day_u16 > 0
-              AND aircraft_number > 0
-        )
-        SELECT
-            e.aircraft_number,
-            e.day_u16,
-            p.status_id
-        FROM engine_ops e
-        ANY LEFT JOIN {table_main} p
-            ON p.version_date = %(pvd)s
-           AND p.version_id = %(vid)s
-           AND p.day_u16 = e.day_u16
-           AND p.aircraft_number = e.aircraft_number
-        WHERE isNull(p.status_id) OR p.status_id != 2
-        ORDER BY e.day_u16
-        LIMIT 5
-        """
-        rows = client.execute(sample_query, params)
         details.append("top5 sample (acn, day, planner_status):")
-        for acn, day, st in rows:
+        for acn, day, st in sample.rows:
             details.append(f"  acn={acn}, day={day}, planner_status={st}")
 
     passed = violations == 0
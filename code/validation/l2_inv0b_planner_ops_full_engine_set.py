@@ -7,6 +7,7 @@ import re
 import sys
 
 from ch_client import get_client
+from fused_sample import SampleSpec, fused_count_sample
 
 
 TABLE_RE = re.compile(r"^[A-Za-z0-9_]+(\.[A-Za-z0-9_]+)?$")
@@ -66,7 +67,7 @@ def main() -> int:
         "uvd": args.units_version_date_int,
         "vid": args.version_id,
     }
-    query = f"""
+    source_sql = f"""
     WITH planner_ops AS (
         SELECT
             day_u16,
@@ -90,13 +91,10 @@ def main() -> int:
         GROUP BY day_u16, aircraft_number, group_by
     )
     SELECT
-        count() AS planner_ops_rows,
-        countIf(p.group_by = 1) AS planner_ops_gb1,
-        countIf(p.group_by = 2) AS planner_ops_gb2,
-        countIf(p.group_by = 1 AND ifNull(e.engine_ops, 0) >= 2) AS fullkit_gb1,
-        countIf(p.group_by = 2 AND ifNull(e.engine_ops, 0) >= 2) AS fullkit_gb2,
-        countIf(p.group_by = 1 AND ifNull(e.engine_ops, 0) < 2) AS violations_gb1,
-        countIf(p.group_by = 2 AND ifNull(e.engine_ops, 0) < 2) AS violations_gb2
+        p.aircraft_number AS acn,
+        p.day_u16 AS day,
+        p.group_by AS planner_gb,
+        ifNull(e.engine_ops, 0) AS engine_ops
     FROM planner_ops p
     LEFT JOIN engines e
         ON e.day_u16 = p.day_u16
@@ -111,7 +109,27 @@ def main() -> int:
         fullkit_gb2,
         violations_gb1,
         violations_gb2,
-    ) = client.execute(query, params)[0]
+    ), (sample,) = fused_count_sample(
+        client,
+        source_sql,
+        params,
+        [
+            SampleSpec(
+                where="engine_ops < 2",
+                key=["engine_ops", "day", "acn", "planner_gb"],
+                columns=["acn", "day", "planner_gb", "engine_ops"],
+            )
+        ],
+        counts=[
+            "count()",
+            "countIf(planner_gb = 1)",
+            "countIf(planner_gb = 2)",
+            "countIf(planner_gb = 1 AND engine_ops >= 2)",
+            "countIf(planner_gb = 2 AND engine_ops >= 2)",
+            "countIf(planner_gb = 1 AND engine_ops < 2)",
+            "countIf(planner_gb = 2 AND engine_ops < 2)",
+        ],
+    )
     violations = int(violations_gb1) + int(violations_gb2)
 
     details = [
@@ -122,46 +140,8 @@ def main() -> int:
     ]
 
     if violations:
-        sample_query = f"""
-        WITH planner_ops AS (
-            SELECT
-                day_u16,
-                aircraft_number,
-                group_by,
-                if(group_by = 1, 3, 4) AS engine_group_by
-            FROM {table_main}
-            WHERE version_date = %(pvd)s
-              AND version_id = %(vid)s
-              AND status_id = 2
-              AND group_by IN (1, 2)
-        ),
-        engines AS (
-            SELECT day_u16, aircraft_number, group_by, count() AS engine_ops
-            FROM {table_units}
-            WHERE version_date = %(uvd)s
-              AND version_id = %(vid)s
-              AND state = 2
-              AND group_by IN (3, 4)
-              AND aircraft_number > 0
-            GROUP BY day_u16, aircraft_number, group_by
-        )
-        SELECT
-            p.aircraft_number,
-            p.day_u16,
-            p.group_by,
-            ifNull(e.engine_ops, 0) AS engine_ops
-        FROM planner_ops p
-        LEFT JOIN engines e
-            ON e.day_u16 = p.day_u16
-           AND e.aircraft_number = p.aircraft_number
-           AND e.group_by = p.engine_group_by
-        WHERE ifNull(e.engine_ops, 0) < 2
-        ORDER BY engine_ops ASC, p.day_u16
-        LIMIT 5
-        """
-        rows = client.execute(sample_query, params)
         details.append("top5 sample (acn, day, planner_gb, engine_ops):")
-        for acn, day, gb, cnt in rows:
+        for acn, day, gb, cnt in sample.rows:
             details.append(f"  acn={acn}, day={day}, planner_gb={gb}, engine_ops={cnt}")
 
     passed = violations == 0
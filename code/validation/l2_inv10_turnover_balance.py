@@ -7,6 +7,7 @@ import re
 import sys
 
 from ch_client import get_client
+from l2_chunking import add_chunk_args, chunk_filter, iter_chunk_params, resolve_chunks
 
 
 TABLE_RE = re.compile(r"^[A-Za-z0-9_]+(\.[A-Za-z0-9_]+)?$")
@@ -45,6 +46,7 @@ def main() -> int:
     parser.add_argument("--version-id", required=True, type=int)
     parser.add_argument("--table-main", default="sim_masterv2_v9")
     parser.add_argument("--table-units", default="sim_units_v2")
+    add_chunk_args(parser)
     args = parser.parse_args()
 
     table_units = validate_table_name(args.table_units)
@@ -79,6 +81,8 @@ def main() -> int:
         return 0
 
     params = {**params, "min_day": int(min_day), "max_day": int(max_day)}
+    chunks = resolve_chunks(client, args.chunks, table_units, params)
+    chunk_sql = chunk_filter(chunks)
     query = f"""
     WITH base AS (
         SELECT
@@ -89,6 +93,7 @@ def main() -> int:
         WHERE version_date = %(uvd)s
           AND version_id = %(vid)s
           AND group_by IN (3, 4)
+          {chunk_sql}
     ),
     initial AS (
         SELECT pre_state_id AS state, count() AS initial_count
@@ -145,7 +150,21 @@ def main() -> int:
     LEFT JOIN spawn_entries sp USING state
     ORDER BY state
     """
-    rows = client.execute(query, params)
+    # Счётчики по состоянию аддитивны: initial/entries/spawn/exits/final суммируются по чанкам
+    totals = {}
+    for chunk_params in iter_chunk_params(params, chunks):
+        for state, initial, entries, spawn, exits, final, _, _, _ in client.execute(query, chunk_params):
+            acc = totals.setdefault(state, [0, 0, 0, 0, 0])
+            for i, value in enumerate((initial, entries, spawn, exits, final)):
+                acc[i] += int(value)
+    rows = []
+    for state in sorted(totals):
+        initial, entries, spawn, exits, final = totals[state]
+        left_total = initial + entries + spawn
+        right_total = exits + final
+        rows.append(
+            (state, initial, entries, spawn, exits, final, left_total, right_total, left_total - right_total)
+        )
 
     details = [
         f"min_day={min_day}, max_day={max_day}",
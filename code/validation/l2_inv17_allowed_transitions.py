@@ -7,6 +7,8 @@ import re
 import sys
 
 from ch_client import get_client
+from fused_sample import SampleSpec, count_and_sample, merge_samples
+from l2_chunking import add_chunk_args, chunk_filter, iter_chunk_params, merge_counts, resolve_chunks
 
 
 TABLE_RE = re.compile(r"^[A-Za-z0-9_]+(\.[A-Za-z0-9_]+)?$")
@@ -45,6 +47,7 @@ def main() -> int:
     parser.add_argument("--version-id", required=True, type=int)
     parser.add_argument("--table-main", default="sim_masterv2_v9")
     parser.add_argument("--table-units", default="sim_units_v2")
+    add_chunk_args(parser)
     args = parser.parse_args()
 
     table_units = validate_table_name(args.table_units)
@@ -64,7 +67,9 @@ def main() -> int:
     )
 
     params = {"uvd": args.units_version_date_int, "vid": args.version_id}
-    query = f"""
+    chunks = resolve_chunks(client, args.chunks, table_units, params)
+    chunk_sql = chunk_filter(chunks)
+    source_sql = f"""
     WITH base AS (
         SELECT
             psn,
@@ -76,8 +81,9 @@ def main() -> int:
           AND version_id = %(vid)s
           AND group_by IN (3, 4)
           AND pre_state_id > 0
+          {chunk_sql}
     )
-    SELECT count()
+    SELECT psn, day_u16, prev_state, cur_state
     FROM base
     WHERE (prev_state, cur_state) NOT IN (
           (2, 2), (2, 3), (2, 4), (2, 6),
@@ -87,38 +93,23 @@ def main() -> int:
           (6, 6)
       )
     """
-    violations = client.execute(query, params)[0][0]
+    spec = SampleSpec(
+        where=None,
+        key=["day_u16", "psn", "prev_state", "cur_state"],
+        columns=["psn", "day_u16", "prev_state", "cur_state"],
+    )
+    chunk_samples = [
+        (chunk_params, count_and_sample(client, source_sql, chunk_params, spec))
+        for chunk_params in iter_chunk_params(params, chunks)
+    ]
+    sample = merge_samples(chunk_sample for _, chunk_sample in chunk_samples)
+    violations = sample.count
+    violating_chunks = [chunk_params for chunk_params, chunk_sample in chunk_samples if chunk_sample.count]
     details = [f"violations={violations}"]
 
     if violations:
-        sample_query = f"""
-        WITH base AS (
-            SELECT
-                psn,
-                day_u16,
-                pre_state_id AS prev_state,
-                state AS cur_state
-            FROM {table_units}
-            WHERE version_date = %(uvd)s
-              AND version_id = %(vid)s
-              AND group_by IN (3, 4)
-              AND pre_state_id > 0
-        )
-        SELECT psn, day_u16, prev_state, cur_state
-        FROM base
-        WHERE (prev_state, cur_state) NOT IN (
-              (2, 2), (2, 3), (2, 4), (2, 6),
-              (3, 2), (3, 3),
-              (4, 4), (4, 5),
-              (5, 5), (5, 2),
-              (6, 6)
-          )
-        ORDER BY day_u16
-        LIMIT 5
-        """
-        rows = client.execute(sample_query, params)
         details.append("top5 sample (psn, day, prev_state, cur_state):")
-        for psn, day, prev_state, cur_state in rows:
+        for psn, day, prev_state, cur_state in sample.rows:
             details.append(
                 f"  psn={psn}, day={day}, prev_state={prev_state}, cur_state={cur_state}"
             )
@@ -133,6 +124,7 @@ def main() -> int:
               AND version_id = %(vid)s
               AND group_by IN (3, 4)
               AND pre_state_id > 0
+              {chunk_sql}
         )
         SELECT prev_state, cur_state, count() AS cnt
         FROM base
@@ -144,10 +136,15 @@ def main() -> int:
               (6, 6)
         )
         GROUP BY prev_state, cur_state
-        ORDER BY cnt DESC
-        LIMIT 10
+        ORDER BY cnt DESC, prev_state, cur_state
         """
-        rows = client.execute(breakdown_query, params)
+        counts = merge_counts(
+            client.execute(breakdown_query, chunk_params) for chunk_params in violating_chunks
+        )
+        rows = sorted(
+            ((prev_state, cur_state, cnt) for (prev_state, cur_state), cnt in counts.items()),
+            key=lambda row: (-row[2], row[0], row[1]),
+        )[:10]
         details.append("top transitions (prev_state -> cur_state, cnt):")
         for prev_state, cur_state, cnt in rows:
             details.append(
@@ -7,6 +7,7 @@ import re
 import sys
 
 from ch_client import get_client
+from fused_sample import SampleSpec, fused_count_sample
 
 
 TABLE_RE = re.compile(r"^[A-Za-z0-9_]+(\.[A-Za-z0-9_]+)?$")
@@ -63,7 +64,7 @@ def main() -> int:
     )
 
     params = {"uvd": args.units_version_date_int, "vid": args.version_id}
-    query = f"""
+    source_sql = f"""
     WITH joined AS (
         SELECT
             u.psn,
@@ -79,11 +80,24 @@ def main() -> int:
           AND u.group_by IN (3, 4)
     )
     SELECT
-        countIf(ll_expected IS NULL OR ll_expected <= 0) AS skipped_no_norm,
-        countIf(ll_expected > 0 AND sne > ll_expected) AS violations
+        psn, group_by, sne, ll_expected,
+        toInt64(sne) - toInt64(ll_expected) AS exceed
     FROM joined
     """
-    skipped_no_norm, violations = client.execute(query, params)[0]
+    (skipped_no_norm,), (sample,) = fused_count_sample(
+        client,
+        source_sql,
+        params,
+        [
+            SampleSpec(
+                where="ll_expected > 0 AND sne > ll_expected",
+                key=["-exceed"],
+                columns=["psn", "group_by", "sne", "ll_expected", "exceed"],
+            )
+        ],
+        counts=["countIf(ll_expected IS NULL OR ll_expected <= 0)"],
+    )
+    violations = sample.count
 
     details = [
         f"count_skipped_no_norm={skipped_no_norm}",
@@ -91,32 +105,8 @@ def main() -> int:
     ]
 
     if violations:
-        sample_query = f"""
-        WITH joined AS (
-            SELECT
-                u.psn,
-                u.group_by,
-                u.sne,
-                u.partseqno_i,
-                if(u.group_by = 3, m.ll_mi8, m.ll_mi17) AS ll_expected
-            FROM {table_units} u
-            LEFT JOIN {table_md} m
-                ON u.partseqno_i = m.partseqno_i
-            WHERE u.version_date = %(uvd)s
-              AND u.version_id = %(vid)s
-              AND u.group_by IN (3, 4)
-        )
-        SELECT
-            psn, group_by, sne, ll_expected,
-            toInt64(sne) - toInt64(ll_expected) AS exceed
-        FROM joined
-        WHERE ll_expected > 0 AND sne > ll_expected
-        ORDER BY exceed DESC
-        LIMIT 5
-        """
-        rows = client.execute(sample_query, params)
         details.append("top5 sample (psn, gb, sne, ll_expected, exceed):")
-        for psn, gb, sne, ll_expected, exceed in rows:
+        for psn, gb, sne, ll_expected, exceed in sample.rows:
             details.append(
                 f"  psn={psn}, gb={gb}, sne={sne}, ll_expected={ll_expected}, exceed={exceed}"
             )
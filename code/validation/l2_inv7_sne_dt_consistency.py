@@ -7,6 +7,8 @@ import re
 import sys
 
 from ch_client import get_client
+from fused_sample import SampleSpec, fused_count_sample, merge_samples
+from l2_chunking import add_chunk_args, chunk_filter, iter_chunk_params, resolve_chunks, sum_rows
 
 
 TABLE_RE = re.compile(r"^[A-Za-z0-9_]+(\.[A-Za-z0-9_]+)?$")
@@ -45,6 +47,7 @@ def main() -> int:
     parser.add_argument("--version-id", required=True, type=int)
     parser.add_argument("--table-main", default="sim_masterv2_v9")
     parser.add_argument("--table-units", default="sim_units_v2")
+    add_chunk_args(parser)
     args = parser.parse_args()
 
     table_main = validate_table_name(args.table_main)
@@ -84,7 +87,9 @@ def main() -> int:
         "uvd": args.units_version_date_int,
         "vid": args.version_id,
     }
-    query = f"""
+    chunks = resolve_chunks(client, args.chunks, table_units, params)
+    chunk_sql = chunk_filter(chunks)
+    source_sql = f"""
     WITH base AS (
         SELECT
             psn,
@@ -103,6 +108,7 @@ def main() -> int:
         WHERE version_date = %(uvd)s
           AND version_id = %(vid)s
           AND group_by IN (3, 4)
+          {chunk_sql}
         WINDOW w AS (PARTITION BY psn, version_date ORDER BY day_u16)
     ),
     ops_steps AS (
@@ -125,14 +131,15 @@ def main() -> int:
           AND aircraft_number > 0
     )
     SELECT
-        count() AS checked_rows,
-        countIf(NOT is_consecutive) AS skipped_non_consecutive,
-        countIf(is_consecutive AND isNull(p.daily_today_u32)) AS skipped_no_planner_dt,
-        countIf(
-            is_consecutive
-            AND NOT isNull(p.daily_today_u32)
-            AND (sne_delta != p.daily_today_u32 OR ppr_delta != p.daily_today_u32)
-        ) AS violations
+        psn,
+        day_u16,
+        aircraft_number,
+        sne_delta,
+        ppr_delta,
+        is_consecutive,
+        p.daily_today_u32 AS planner_dt,
+        sne_delta - toInt64(p.daily_today_u32) AS diff_sne,
+        ppr_delta - toInt64(p.daily_today_u32) AS diff_ppr
     FROM ops_steps s
     ANY LEFT JOIN {table_main} p
         ON p.version_date = %(pvd)s
@@ -140,12 +147,31 @@ def main() -> int:
        AND p.day_u16 = s.day_u16
        AND p.aircraft_number = s.aircraft_number
     """
-    (
-        checked_rows,
-        skipped_non_consecutive,
-        skipped_no_planner_dt,
-        violations,
-    ) = client.execute(query, params)[0]
+    spec = SampleSpec(
+        where=(
+            "is_consecutive AND NOT isNull(planner_dt) "
+            "AND (sne_delta != planner_dt OR ppr_delta != planner_dt)"
+        ),
+        key=["-abs(diff_sne)", "psn", "day_u16"],
+        columns=[
+            "psn", "day_u16", "aircraft_number", "sne_delta", "ppr_delta",
+            "planner_dt", "diff_sne", "diff_ppr",
+        ],
+    )
+    counts = [
+        "count()",
+        "countIf(NOT is_consecutive)",
+        "countIf(is_consecutive AND isNull(planner_dt))",
+    ]
+    chunk_results = [
+        fused_count_sample(client, source_sql, chunk_params, [spec], counts)
+        for chunk_params in iter_chunk_params(params, chunks)
+    ]
+    checked_rows, skipped_non_consecutive, skipped_no_planner_dt = sum_rows(
+        extra for extra, _ in chunk_results
+    )
+    sample = merge_samples(samples[0] for _, samples in chunk_results)
+    violations = sample.count
 
     details = [
         f"checked_rows={checked_rows}",
@@ -155,70 +181,8 @@ def main() -> int:
     ]
 
     if violations:
-        sample_query = f"""
-        WITH base AS (
-            SELECT
-                psn,
-                version_date,
-                group_by,
-                day_u16,
-                aircraft_number,
-                state,
-                pre_state_id,
-                sne,
-                ppr,
-                lagInFrame(sne, 1, 0) OVER w AS prev_sne,
-                lagInFrame(ppr, 1, 0) OVER w AS prev_ppr,
-                lagInFrame(day_u16, 1, 0) OVER w AS prev_day
-            FROM {table_units}
-            WHERE version_date = %(uvd)s
-              AND version_id = %(vid)s
-              AND group_by IN (3, 4)
-            WINDOW w AS (PARTITION BY psn, version_date ORDER BY day_u16)
-        ),
-        ops_steps AS (
-            SELECT
-                psn,
-                group_by,
-                day_u16,
-                aircraft_number,
-                sne,
-                ppr,
-                prev_sne,
-                prev_ppr,
-                prev_day,
-                toInt64(sne) - toInt64(prev_sne) AS sne_delta,
-                toInt64(ppr) - toInt64(prev_ppr) AS ppr_delta,
-                (prev_day = day_u16 - 1) AS is_consecutive
-            FROM base
-            WHERE state = 2
-              AND pre_state_id = 2
-              AND aircraft_number > 0
-        )
-        SELECT
-            psn,
-            day_u16,
-            aircraft_number,
-            sne_delta,
-            ppr_delta,
-            p.daily_today_u32 AS planner_dt,
-            sne_delta - toInt64(p.daily_today_u32) AS diff_sne,
-            ppr_delta - toInt64(p.daily_today_u32) AS diff_ppr
-        FROM ops_steps s
-        ANY LEFT JOIN {table_main} p
-            ON p.version_date = %(pvd)s
-           AND p.version_id = %(vid)s
-           AND p.day_u16 = s.day_u16
-           AND p.aircraft_number = s.aircraft_number
-        WHERE is_consecutive
-          AND NOT isNull(p.daily_today_u32)
-          AND (sne_delta != p.daily_today_u32 OR ppr_delta != p.daily_today_u32)
-        ORDER BY abs(diff_sne) DESC
-        LIMIT 5
-        """
-        rows = client.execute(sample_query, params)
         details.append("top5 sample (psn, day, acn, delta_sne/ppr, planner_dt, diff_sne/ppr):")
-        for psn, day, acn, ds, dp, dt, diff_sne, diff_ppr in rows:
+        for psn, day, acn, ds, dp, dt, diff_sne, diff_ppr in sample.rows:
             details.append(
                 f"  psn={psn}, day={day}, acn={acn}, "
                 f"delta_sne={ds}, delta_ppr={dp}, planner_dt={dt}, "
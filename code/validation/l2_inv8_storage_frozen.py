@@ -7,6 +7,7 @@ import re
 import sys
 
 from ch_client import get_client
+from fused_sample import SampleSpec, count_and_sample
 
 
 TABLE_RE = re.compile(r"^[A-Za-z0-9_]+(\.[A-Za-z0-9_]+)?$")
@@ -54,37 +55,7 @@ def main() -> int:
     )
 
     params = {"uvd": args.units_version_date_int, "vid": args.version_id}
-    count_query = f"""
-    SELECT count()
-    FROM (
-        SELECT
-            psn,
-            version_date,
-            group_by,
-            day_u16,
-            state,
-            sne,
-            ppr,
-            lagInFrame(sne) OVER w AS prev_sne,
-            lagInFrame(ppr) OVER w AS prev_ppr,
-            lagInFrame(state) OVER w AS prev_state,
-            lagInFrame(day_u16, 1, 0) OVER w AS prev_day
-        FROM {table_units}
-        WHERE version_date = %(uvd)s
-          AND version_id = %(vid)s
-          AND group_by IN (3, 4)
-        WINDOW w AS (PARTITION BY psn, version_date ORDER BY day_u16)
-    )
-    WHERE state = 6
-      AND prev_state = 6
-      AND prev_day > 0
-      AND (sne != prev_sne OR ppr != prev_ppr)
-    """
-    violations = client.execute(count_query, params)[0][0]
-    details = [f"violations={violations}"]
-
-    if violations:
-        sample_query = f"""
+    source_sql = f"""
         SELECT psn, day_u16, sne, prev_sne, ppr, prev_ppr
         FROM (
             SELECT
@@ -109,12 +80,23 @@ def main() -> int:
           AND prev_state = 6
           AND prev_day > 0
           AND (sne != prev_sne OR ppr != prev_ppr)
-        ORDER BY day_u16
-        LIMIT 5
-        """
-        rows = client.execute(sample_query, params)
+    """
+    sample = count_and_sample(
+        client,
+        source_sql,
+        params,
+        SampleSpec(
+            where=None,
+            key=["day_u16"],
+            columns=["psn", "day_u16", "sne", "prev_sne", "ppr", "prev_ppr"],
+        ),
+    )
+    violations = sample.count
+    details = [f"violations={violations}"]
+
+    if violations:
         details.append("top5 sample (psn, day, sne/prev_sne, ppr/prev_ppr):")
-        for psn, day, sne, prev_sne, ppr, prev_ppr in rows:
+        for psn, day, sne, prev_sne, ppr, prev_ppr in sample.rows:
             details.append(
                 f"  psn={psn}, day={day}, sne={sne}/{prev_sne}, ppr={ppr}/{prev_ppr}"
             )
@@ -7,6 +7,8 @@ import re
 import sys
 
 from ch_client import get_client
+from fused_sample import SampleSpec, fused_count_sample, merge_samples
+from l2_chunking import add_chunk_args, chunk_filter, iter_chunk_params, resolve_chunks, sum_rows
 
 
 TABLE_RE = re.compile(r"^[A-Za-z0-9_]+(\.[A-Za-z0-9_]+)?$")
@@ -46,6 +48,7 @@ def main() -> int:
     parser.add_argument("--table-main", default="sim_masterv2_v9")
     parser.add_argument("--table-units", default="sim_units_v2")
     parser.add_argument("--table-md", default="md_components")
+    add_chunk_args(parser)
     args = parser.parse_args()
 
     table_units = validate_table_name(args.table_units)
@@ -71,7 +74,9 @@ def main() -> int:
     )
 
     params = {"uvd": args.units_version_date_int, "vid": args.version_id}
-    query = f"""
+    chunks = resolve_chunks(client, args.chunks, table_units, params)
+    chunk_sql = chunk_filter(chunks)
+    source_sql = f"""
     WITH base1 AS (
         SELECT
             psn,
@@ -87,6 +92,7 @@ def main() -> int:
         WHERE version_date = %(uvd)s
           AND version_id = %(vid)s
           AND group_by IN (3, 4)
+          {chunk_sql}
         WINDOW w AS (PARTITION BY psn, version_date ORDER BY day_u16)
     ),
     base2 AS (
@@ -120,13 +126,32 @@ def main() -> int:
         GROUP BY psn, version_date, group_by, span_id
     )
     SELECT
-        countIf(has_exit = 1) AS spans_ended,
-        countIf(has_exit = 1 AND (m.repair_time IS NULL OR m.repair_time <= 0)) AS skipped_no_norm,
-        countIf(has_exit = 1 AND m.repair_time > 0 AND span < m.repair_time) AS violations
+        psn,
+        group_by,
+        enter_day,
+        last_day,
+        span,
+        has_exit,
+        m.repair_time AS repair_time
     FROM spans s
     LEFT JOIN {table_md} m ON s.partseqno_i = m.partseqno_i
     """
-    spans_ended, skipped_no_norm, violations = client.execute(query, params)[0]
+    spec = SampleSpec(
+        where="has_exit = 1 AND repair_time > 0 AND span < repair_time",
+        key=["-(toInt64(repair_time) - span)", "psn", "enter_day"],
+        columns=["psn", "group_by", "enter_day", "last_day", "span", "repair_time"],
+    )
+    counts = [
+        "countIf(has_exit = 1)",
+        "countIf(has_exit = 1 AND (repair_time IS NULL OR repair_time <= 0))",
+    ]
+    chunk_results = [
+        fused_count_sample(client, source_sql, chunk_params, [spec], counts)
+        for chunk_params in iter_chunk_params(params, chunks)
+    ]
+    spans_ended, skipped_no_norm = sum_rows(extra for extra, _ in chunk_results)
+    sample = merge_samples(samples[0] for _, samples in chunk_results)
+    violations = sample.count
 
     details = [
         f"spans_ended={spans_ended}",
@@ -135,70 +160,8 @@ def main() -> int:
     ]
 
     if violations:
-        sample_query = f"""
-        WITH base1 AS (
-            SELECT
-                psn,
-                version_date,
-                group_by,
-                day_u16,
-                state,
-                partseqno_i,
-                lagInFrame(state, 1, 0) OVER w AS prev_state,
-                leadInFrame(state, 1, 0) OVER w AS next_state,
-                leadInFrame(day_u16, 1, 0) OVER w AS next_day
-            FROM {table_units}
-            WHERE version_date = %(uvd)s
-              AND version_id = %(vid)s
-              AND group_by IN (3, 4)
-            WINDOW w AS (PARTITION BY psn, version_date ORDER BY day_u16)
-        ),
-        base2 AS (
-            SELECT
-                psn,
-                version_date,
-                group_by,
-                day_u16,
-                state,
-                partseqno_i,
-                prev_state,
-                next_state,
-                next_day,
-                sum(if(state = 4 AND prev_state != 4, 1, 0)) OVER w AS span_id
-            FROM base1
-            WINDOW w AS (PARTITION BY psn, version_date ORDER BY day_u16)
-        ),
-        spans AS (
-            SELECT
-                psn,
-                version_date,
-                group_by,
-                span_id,
-                min(day_u16) AS enter_day,
-                max(day_u16) AS last_day,
-                max(day_u16) - min(day_u16) AS span,
-                any(partseqno_i) AS partseqno_i,
-                max(if(state = 4 AND next_state != 4 AND next_day > 0, 1, 0)) AS has_exit
-            FROM base2
-            WHERE state = 4
-            GROUP BY psn, version_date, group_by, span_id
-        )
-        SELECT
-            psn,
-            group_by,
-            enter_day,
-            last_day,
-            span,
-            m.repair_time
-        FROM spans s
-        LEFT JOIN {table_md} m ON s.partseqno_i = m.partseqno_i
-        WHERE has_exit = 1 AND m.repair_time > 0 AND span < m.repair_time
-        ORDER BY (m.repair_time - span) DESC
-        LIMIT 5
-        """
-        rows = client.execute(sample_query, params)
         details.append("top5 sample (psn, gb, enter, last, span, repair_time):")
-        for psn, gb, enter_day, last_day, span, rt in rows:
+        for psn, gb, enter_day, last_day, span, rt in sample.rows:
             details.append(
                 f"  psn={psn}, gb={gb}, enter={enter_day}, last={last_day}, "
                 f"span={span}, repair_time={rt}"
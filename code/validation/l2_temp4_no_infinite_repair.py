@@ -7,6 +7,7 @@ import re
 import sys
 
 from ch_client import get_client
+from fused_sample import SampleSpec, count_and_sample
 
 
 TABLE_RE = re.compile(r"^[A-Za-z0-9_]+(\.[A-Za-z0-9_]+)?$")
@@ -66,7 +67,7 @@ def main() -> int:
         "vid": args.version_id,
         "max_days": args.max_repair_days,
     }
-    query = f"""
+    source_sql = f"""
     WITH base1 AS (
         SELECT
             psn,
@@ -106,66 +107,29 @@ def main() -> int:
         WHERE state = 4
         GROUP BY psn, version_date, group_by, span_id
     )
-    SELECT count()
+    SELECT psn, enter_day, last_day, span
     FROM spans
     WHERE span > %(max_days)s
     """
-    violations = client.execute(query, params)[0][0]
+    sample = count_and_sample(
+        client,
+        source_sql,
+        params,
+        SampleSpec(
+            where=None,
+            key=["-span", "psn", "enter_day"],
+            columns=["psn", "enter_day", "last_day", "span"],
+        ),
+    )
+    violations = sample.count
     details = [
         f"max_repair_days={args.max_repair_days}",
         f"violations={violations}",
     ]
 
     if violations:
-        sample_query = f"""
-        WITH base1 AS (
-            SELECT
-                psn,
-                version_date,
-                group_by,
-                day_u16,
-                state,
-                lagInFrame(state, 1, 0) OVER w AS prev_state
-            FROM {table_units}
-            WHERE version_date = %(uvd)s
-              AND version_id = %(vid)s
-              AND group_by IN (3, 4)
-            WINDOW w AS (PARTITION BY psn, version_date ORDER BY day_u16)
-        ),
-        base2 AS (
-            SELECT
-                psn,
-                version_date,
-                group_by,
-                day_u16,
-                state,
-                prev_state,
-                sum(if(state = 4 AND prev_state != 4, 1, 0)) OVER w AS span_id
-            FROM base1
-            WINDOW w AS (PARTITION BY psn, version_date ORDER BY day_u16)
-        ),
-        spans AS (
-            SELECT
-                psn,
-                version_date,
-                group_by,
-                span_id,
-                min(day_u16) AS enter_day,
-                max(day_u16) AS last_day,
-                max(day_u16) - min(day_u16) AS span
-            FROM base2
-            WHERE state = 4
-            GROUP BY psn, version_date, group_by, span_id
-        )
-        SELECT psn, enter_day, last_day, span
-        FROM spans
-        WHERE span > %(max_days)s
-        ORDER BY span DESC
-        LIMIT 5
-        """
-        rows = client.execute(sample_query, params)
         details.append("top5 sample (psn, enter, last, span):")
-        for psn, enter_day, last_day, span in rows:
+        for psn, enter_day, last_day, span in sample.rows:
             details.append(
                 f"  psn={psn}, enter={enter_day}, last={last_day}, span={span}"
             )
@@ -0,0 +1,136 @@
+"""Кэш результатов валидаторов по содержимому датасета и хэшу скрипта.
+
+Ключ записи: sha256 от
+- хэша скрипта валидатора (+ ch_client.py, fused_sample.py, incremental.py; для --in-memory ещё
+  slice_engine.py);
+- имён таблиц и (version_date, version_id);
+- отпечатка содержимого датасета: count() и groupBitXor(cityHash64(*)) по срезам
+  sim_masterv2_v9 (group_by IN (1, 2)), sim_repairline_v9 и flight_program_ac
+  (таргеты MP4) — один запрос на датасет.
+
+Совпал ключ — сохранённые rc и stdout воспроизводятся без запуска валидатора.
+Валидаторы, читающие данные вне отпечатка (UNCACHEABLE_SCRIPTS: INV-11 — справочники
+окружения MP1/MP3), не кэшируются и запускаются всегда.
+"""
+import hashlib
+import json
+import os
+import sys
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+
+DEFAULT_CACHE_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "output", ".validation_cache")
+)
+# Зависимости, общие для всех SQL-валидаторов
+COMMON_DEPENDENCIES = ("ch_client.py", "fused_sample.py", "incremental.py")
+# Валидаторы с входами вне dataset_fingerprint — всегда запускаются заново
+UNCACHEABLE_SCRIPTS = ("inv11_spawn_limit_saturation.py",)
+# Зависимости векторного движка (--in-memory)
+ENGINE_DEPENDENCIES = ("slice_engine.py", "inv2_ops_vs_target.py", "inv10_turnover_balance.py")
+
+
+def _file_digest(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def is_cacheable(script_path: str) -> bool:
+    """Результат валидатора определяется отпечатком датасета и хэшем скрипта"""
+    return os.path.basename(script_path) not in UNCACHEABLE_SCRIPTS
+
+
+def validator_hash(script_path: str, in_memory: bool = False) -> str:
+    """Хэш скрипта валидатора и файлов, от которых зависит его результат"""
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    dependencies: Iterable[str] = COMMON_DEPENDENCIES + (ENGINE_DEPENDENCIES if in_memory else ())
+    digest = hashlib.sha256(_file_digest(script_path).encode())
+    for name in dependencies:
+        path = os.path.join(base_dir, name)
+        if os.path.exists(path):
+            digest.update(f"{name}:{_file_digest(path)}".encode())
+    return digest.hexdigest()
+
+
+def dataset_fingerprint(
+    client, dataset: Tuple[int, int], table_main: str, table_repair: str
+) -> Optional[str]:
+    """count() + groupBitXor(cityHash64(*)) по срезам датасета; None — отпечаток недоступен"""
+    version_date, version_id = dataset
+    query = f"""
+    SELECT 'main' AS part, count(), groupBitXor(cityHash64(*))
+    FROM {table_main}
+    WHERE version_id = %(vid)s AND version_date = %(vdate)s AND group_by IN (1, 2)
+    UNION ALL
+    SELECT 'repair' AS part, count(), groupBitXor(cityHash64(*))
+    FROM {table_repair}
+    WHERE version_id = %(vid)s AND version_date = %(vdate)s
+    UNION ALL
+    SELECT 'mp4' AS part, count(), groupBitXor(cityHash64(*))
+    FROM flight_program_ac
+    WHERE version_date = toDate(toString(%(vdate)s))
+    """
+    try:
+        rows = client.execute(query, {"vid": int(version_id), "vdate": int(version_date)})
+    except Exception as exc:
+        print(f"Кэш недоступен для {version_date}:{version_id}: {exc}", file=sys.stderr)
+        return None
+    return ";".join(f"{part}={count}/{xor}" for part, count, xor in sorted(rows))
+
+
+class ResultCache:
+    """Файловый кэш {ключ: (rc, вывод)} в cache_dir (один JSON на запись)"""
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self._hashes: Dict[Tuple[str, bool], str] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def key(
+        self,
+        script_path: str,
+        dataset: Tuple[int, int],
+        fingerprint: str,
+        table_main: str,
+        table_repair: str,
+        in_memory: bool = False,
+    ) -> str:
+        hash_key = (script_path, in_memory)
+        if hash_key not in self._hashes:
+            self._hashes[hash_key] = validator_hash(script_path, in_memory)
+        payload = json.dumps(
+            [self._hashes[hash_key], table_main, table_repair, list(dataset), fingerprint]
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Tuple[int, str]]:
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return int(entry["rc"]), entry["output"]
+
+    def put(self, key: str, rc: int, output: str, script_path: str, dataset: Tuple[int, int]) -> None:
+        """Сохраняет только завершённые проверки (есть блок PASS/FAIL) — не сбои подключения"""
+        if not any(line.endswith((": PASS", ": FAIL")) for line in output.splitlines()):
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entry = {
+            "rc": rc,
+            "output": output,
+            "script": os.path.basename(script_path),
+            "dataset": list(dataset),
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        tmp_path = self._path(key) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, self._path(key))
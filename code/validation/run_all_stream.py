@@ -1,6 +1,28 @@
 #!/usr/bin/env python3
 """
 Потоковый раннер всех валидаторов из invariants.json.
+
+С --in-memory срез датасета читается один раз (slice_engine.py), и валидаторы,
+у которых есть векторный аналог, считаются в памяти; остальные запускаются
+отдельными процессами, как обычно.
+
+С --jobs N валидаторы (и датасеты) выполняются параллельно, до N процессов
+одновременно; вывод каждого буферизуется и печатается целым блоком в исходном
+порядке, итоговая таблица и код возврата не меняются.
+
+Результаты кэшируются (result_cache.py) по отпечатку содержимого датасета и хэшу
+скрипта валидатора: неизменившиеся пары (датасет, валидатор) не перезапускаются,
+их stdout воспроизводится с пометкой (cached). --only-changed скрывает вывод
+кэшированных проверок, --no-cache отключает кэш. Валидаторы с входами вне отпечатка
+(result_cache.UNCACHEABLE_SCRIPTS) запускаются всегда.
+
+С --from-day D валидаторы с подневным состоянием (incremental.INCREMENTAL_SCRIPTS)
+сканируют только дни >= D, дни < D берут из состояния прошлого прогона; остальные
+запускаются полностью.
+
+В конце прогона печатается таблица COST (wall-время, запросы, прочитанные строки/байты,
+пиковая память по валидаторам) и дописывается output/.validation_profile/history.csv
+(run_profiler.py); --no-profile отключает.
 """
 import argparse
 import json
@@ -8,13 +30,19 @@ import os
 import re
 import subprocess
 import sys
-from typing import Dict, List, Tuple
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
 
 from ch_client import get_client
+from incremental import INCREMENTAL_SCRIPTS
+from run_profiler import ValidationRunProfiler, add_profile_args, timed
 
 
 DATASET_RE = re.compile(r"^(?P<date>\d{8}):(?P<id>\d+)$")
 TABLE_RE = re.compile(r"^[A-Za-z0-9_]+(\.[A-Za-z0-9_]+)?$")
+# Чтение среза --in-memory учитывается в профиле отдельной строкой
+SLICE_ENGINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "slice_engine.py")
 
 
 def validate_table_name(table: str) -> str:
@@ -107,39 +135,56 @@ def print_datasets(datasets: List[Tuple[int, int]]) -> None:
         print(f"  {format_dataset(version_date, version_id)}")
 
 
-def stream_process(cmd: List[str]) -> int:
+def stream_process(cmd: List[str], env_extra: Optional[Dict[str, str]] = None) -> Tuple[int, str]:
+    """Запуск с построчным выводом; возвращает rc и собранный stdout (для кэша), stderr — сразу в терминал"""
     env = os.environ.copy()
     env["PYTHONUNBUFFERED"] = "1"
+    env.update(env_extra or {})
     process = subprocess.Popen(
         cmd,
         stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
         text=True,
         bufsize=1,
         env=env,
     )
+    lines: List[str] = []
     if process.stdout is not None:
         for line in process.stdout:
             print(line, end="")
-    return process.wait()
+            lines.append(line)
+    return process.wait(), "".join(lines)
 
 
-def run_validator(
+def capture_process(cmd: List[str], env_extra: Optional[Dict[str, str]] = None) -> Tuple[int, str]:
+    """
+    Запуск с буферизацией stdout для печати одним блоком; stderr (уведомления, трейсбеки)
+    печатается сразу и в кэш результатов не попадает
+    """
+    env = os.environ.copy()
+    env["PYTHONUNBUFFERED"] = "1"
+    env.update(env_extra or {})
+    completed = subprocess.run(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        env=env,
+        check=False,
+    )
+    if completed.stderr:
+        print(completed.stderr, end="", file=sys.stderr, flush=True)
+    return completed.returncode, completed.stdout
+
+
+def build_validator_cmd(
     script_path: str,
-    inv_ids: List[str],
     dataset: Tuple[int, int],
     table_main: str,
     table_repair: str,
-) -> int:
+    from_day: Optional[int] = None,
+) -> List[str]:
     version_date, version_id = dataset
-    dataset_key = format_dataset(version_date, version_id)
     script_name = os.path.basename(script_path)
-    inv_label = "/".join(inv_ids)
-
-    print("\n" + "=" * 80)
-    print(f"DATASET {dataset_key} | {inv_label} -> {script_name}")
-    print("=" * 80)
-
     cmd = [
         sys.executable,
         script_path,
@@ -154,7 +199,285 @@ def run_validator(
         cmd.extend(["--table-main", table_main, "--table-repair", table_repair])
     else:
         cmd.extend(["--table", table_main])
-    return stream_process(cmd)
+    if from_day is not None and script_name in INCREMENTAL_SCRIPTS:
+        cmd.extend(["--from-day", str(from_day)])
+    return cmd
+
+
+def format_validator_header(
+    script_path: str, inv_ids: List[str], dataset: Tuple[int, int], cached: bool = False
+) -> str:
+    suffix = " (cached)" if cached else ""
+    return (
+        "\n" + "=" * 80 + "\n"
+        f"DATASET {format_dataset(*dataset)} | {'/'.join(inv_ids)} -> {os.path.basename(script_path)}{suffix}\n"
+        + "=" * 80 + "\n"
+    )
+
+
+def is_engine_script(script_path: str, in_memory: bool) -> bool:
+    if not in_memory:
+        return False
+    from slice_engine import CHECKS
+
+    return os.path.basename(script_path) in CHECKS
+
+
+def run_validator(
+    script_path: str,
+    inv_ids: List[str],
+    dataset: Tuple[int, int],
+    table_main: str,
+    table_repair: str,
+    dataset_slice=None,
+    from_day: Optional[int] = None,
+    env_extra: Optional[Dict[str, str]] = None,
+) -> Tuple[int, str]:
+    """Запуск валидатора с выводом по мере выполнения: (rc, вывод без заголовка)"""
+    print(format_validator_header(script_path, inv_ids, dataset), end="")
+    if dataset_slice is not None:
+        from slice_engine import CHECKS, run_check
+
+        script_name = os.path.basename(script_path)
+        if script_name in CHECKS:
+            result = run_check(dataset_slice, script_name)
+            output = result.render()
+            print(output, end="")
+            return (0 if result.passed else 1), output
+    cmd = build_validator_cmd(script_path, dataset, table_main, table_repair, from_day)
+    return stream_process(cmd, env_extra)
+
+
+def load_dataset_slice(dataset: Tuple[int, int], table_main: str, table_repair: str):
+    """Срез датасета для --in-memory и строка с временем чтения"""
+    from slice_engine import load_slice
+
+    slice_start = time.time()
+    dataset_slice = load_slice(get_client(), dataset[1], dataset[0], table_main, table_repair)
+    line = (
+        f"SLICE {format_dataset(*dataset)} rows={dataset_slice.n} "
+        f"read={time.time() - slice_start:.2f}s"
+    )
+    return dataset_slice, line
+
+
+def run_validator_buffered(
+    script_path: str,
+    dataset: Tuple[int, int],
+    table_main: str,
+    table_repair: str,
+    from_day: Optional[int] = None,
+    env_extra: Optional[Dict[str, str]] = None,
+) -> Tuple[int, str]:
+    return capture_process(
+        build_validator_cmd(script_path, dataset, table_main, table_repair, from_day), env_extra
+    )
+
+
+def run_slice_checks_buffered(
+    scripts: List[str],
+    dataset: Tuple[int, int],
+    table_main: str,
+    table_repair: str,
+) -> Tuple[str, Dict[str, Tuple[int, str]], Dict[str, float]]:
+    """
+    Одно чтение среза и все векторные проверки датасета:
+    (строка SLICE, {script_path: (rc, вывод)}, {script_path или "": секунды}; "" — чтение среза)
+    """
+    from slice_engine import run_check
+
+    (dataset_slice, slice_line), slice_seconds = timed(load_dataset_slice, dataset, table_main, table_repair)
+    outputs: Dict[str, Tuple[int, str]] = {}
+    seconds: Dict[str, float] = {"": slice_seconds}
+    for script_path in scripts:
+        result, seconds[script_path] = timed(run_check, dataset_slice, os.path.basename(script_path))
+        outputs[script_path] = (0 if result.passed else 1), result.render()
+    return slice_line, outputs, seconds
+
+
+def profile_env(
+    profiler: Optional[ValidationRunProfiler], script_path: str, dataset: Tuple[int, int]
+) -> Optional[Dict[str, str]]:
+    if profiler is None:
+        return None
+    return profiler.child_env(script_path, format_dataset(*dataset))
+
+
+def profile_record(
+    profiler: Optional[ValidationRunProfiler],
+    script_path: str,
+    dataset: Tuple[int, int],
+    rc: int,
+    seconds: float,
+    inv_ids: Optional[List[str]] = None,
+    mode: str = "sql",
+) -> None:
+    if profiler is not None:
+        profiler.record(script_path, format_dataset(*dataset), rc, seconds, inv_ids, mode)
+
+
+class CachePolicy:
+    """Кэш результатов на прогон: ключи датасетов, воспроизведение и запись"""
+
+    def __init__(self, cache, table_main: str, table_repair: str, in_memory: bool, only_changed: bool):
+        self.cache = cache
+        self.table_main = table_main
+        self.table_repair = table_repair
+        self.in_memory = in_memory
+        self.only_changed = only_changed
+        self._fingerprints: Dict[Tuple[int, int], object] = {}
+
+    def key(self, script_path: str, dataset: Tuple[int, int]):
+        """Ключ записи; None — кэш выключен, валидатор некэшируем или отпечаток датасета недоступен"""
+        from result_cache import is_cacheable
+
+        if self.cache is None or not is_cacheable(script_path):
+            return None
+        if dataset not in self._fingerprints:
+            from result_cache import dataset_fingerprint
+
+            self._fingerprints[dataset] = dataset_fingerprint(
+                get_client(), dataset, self.table_main, self.table_repair
+            )
+        fingerprint = self._fingerprints[dataset]
+        if fingerprint is None:
+            return None
+        return self.cache.key(
+            script_path,
+            dataset,
+            fingerprint,
+            self.table_main,
+            self.table_repair,
+            in_memory=is_engine_script(script_path, self.in_memory),
+        )
+
+    def lookup(self, key):
+        """(rc, вывод) из кэша или None"""
+        if key is None:
+            return None
+        return self.cache.get(key)
+
+    def show_cached(self, script_path: str, inv_ids: List[str], dataset: Tuple[int, int], output: str) -> None:
+        """Вывод записи кэша (с --only-changed — только в сводке)"""
+        if not self.only_changed:
+            print(format_validator_header(script_path, inv_ids, dataset, cached=True) + output, end="")
+
+    def store(self, key, rc: int, output: str, script_path: str, dataset: Tuple[int, int]) -> None:
+        if key is not None:
+            self.cache.put(key, rc, output, script_path, dataset)
+
+
+def iter_sequential(
+    selected: List[Tuple[int, int]],
+    validators: List[Tuple[str, List[str]]],
+    table_main: str,
+    table_repair: str,
+    in_memory: bool,
+    policy: CachePolicy,
+    from_day: Optional[int] = None,
+    profiler: Optional[ValidationRunProfiler] = None,
+) -> Iterator[Tuple[Tuple[int, int], List[str], int, bool]]:
+    for dataset in selected:
+        dataset_slice = None
+        for script_path, inv_ids in validators:
+            key = policy.key(script_path, dataset)
+            hit = policy.lookup(key)
+            if hit is not None:
+                policy.show_cached(script_path, inv_ids, dataset, hit[1])
+                yield dataset, inv_ids, hit[0], True
+                continue
+            if dataset_slice is None and is_engine_script(script_path, in_memory):
+                # Срез читается только если хотя бы одна векторная проверка не из кэша
+                (dataset_slice, slice_line), seconds = timed(
+                    load_dataset_slice, dataset, table_main, table_repair
+                )
+                print(slice_line)
+                profile_record(profiler, SLICE_ENGINE_PATH, dataset, 0, seconds, mode="slice")
+            (rc, output), seconds = timed(
+                run_validator,
+                script_path,
+                inv_ids,
+                dataset,
+                table_main=table_main,
+                table_repair=table_repair,
+                dataset_slice=dataset_slice,
+                from_day=from_day,
+                env_extra=profile_env(profiler, script_path, dataset),
+            )
+            in_memory_check = dataset_slice is not None and is_engine_script(script_path, in_memory)
+            profile_record(
+                profiler, script_path, dataset, rc, seconds, inv_ids, "in-memory" if in_memory_check else "sql"
+            )
+            policy.store(key, rc, output, script_path, dataset)
+            yield dataset, inv_ids, rc, False
+
+
+def iter_parallel(
+    selected: List[Tuple[int, int]],
+    validators: List[Tuple[str, List[str]]],
+    table_main: str,
+    table_repair: str,
+    in_memory: bool,
+    policy: CachePolicy,
+    jobs: int,
+    from_day: Optional[int] = None,
+    profiler: Optional[ValidationRunProfiler] = None,
+) -> Iterator[Tuple[Tuple[int, int], List[str], int, bool]]:
+    """Все (датасет, валидатор) сразу в пул; вывод — блоками в исходном порядке"""
+    executor = ThreadPoolExecutor(max_workers=jobs)
+    try:
+        plan = []
+        for dataset in selected:
+            keys = {path: policy.key(path, dataset) for path, _ in validators}
+            cached = {path: policy.lookup(keys[path]) for path, _ in validators}
+            cached = {path: hit for path, hit in cached.items() if hit is not None}
+            engine_scripts = [
+                path for path, _ in validators
+                if path not in cached and is_engine_script(path, in_memory)
+            ]
+            slice_future = None
+            if engine_scripts:
+                slice_future = executor.submit(
+                    run_slice_checks_buffered, engine_scripts, dataset, table_main, table_repair
+                )
+            dataset_jobs = []
+            for script_path, inv_ids in validators:
+                future = None
+                if script_path not in cached and script_path not in engine_scripts:
+                    future = executor.submit(
+                        timed, run_validator_buffered, script_path, dataset, table_main, table_repair,
+                        from_day, profile_env(profiler, script_path, dataset),
+                    )
+                dataset_jobs.append((script_path, inv_ids, future))
+            plan.append((dataset, keys, cached, slice_future, dataset_jobs))
+
+        for dataset, keys, cached, slice_future, dataset_jobs in plan:
+            slice_outputs: Dict[str, Tuple[int, str]] = {}
+            slice_seconds: Dict[str, float] = {}
+            if slice_future is not None:
+                slice_line, slice_outputs, slice_seconds = slice_future.result()
+                print(slice_line)
+                profile_record(profiler, SLICE_ENGINE_PATH, dataset, 0, slice_seconds[""], mode="slice")
+            for script_path, inv_ids, future in dataset_jobs:
+                if script_path in cached:
+                    rc, output = cached[script_path]
+                    policy.show_cached(script_path, inv_ids, dataset, output)
+                    yield dataset, inv_ids, rc, True
+                    continue
+                if future is not None:
+                    (rc, output), seconds = future.result()
+                    profile_record(profiler, script_path, dataset, rc, seconds, inv_ids)
+                else:
+                    rc, output = slice_outputs[script_path]
+                    profile_record(
+                        profiler, script_path, dataset, rc, slice_seconds[script_path], inv_ids, "in-memory"
+                    )
+                print(format_validator_header(script_path, inv_ids, dataset) + output, end="", flush=True)
+                policy.store(keys[script_path], rc, output, script_path, dataset)
+                yield dataset, inv_ids, rc, False
+    finally:
+        # --fail-fast: ещё не начатые задачи отменяются, запущенные дорабатывают
+        executor.shutdown(wait=True, cancel_futures=True)
 
 
 def main() -> int:
@@ -192,8 +515,48 @@ def main() -> int:
         action="store_true",
         help="Остановиться при первом FAIL",
     )
+    parser.add_argument(
+        "--in-memory",
+        action="store_true",
+        help="Читать срез датасета один раз и считать INV/TEMP векторно (slice_engine.py)",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Параллельных валидаторов (по умолчанию 1 — последовательно, потоковый вывод)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Не читать и не писать кэш результатов (output/.validation_cache)",
+    )
+    parser.add_argument(
+        "--only-changed",
+        action="store_true",
+        help="Не печатать вывод валидаторов, взятых из кэша (только строка в SUMMARY)",
+    )
+    parser.add_argument(
+        "--from-day",
+        type=int,
+        default=None,
+        help="Инкрементально: дни < D из сохранённого состояния (incremental.py), скан только дней >= D",
+    )
+    add_profile_args(parser)
     args = parser.parse_args()
 
+    if args.only_changed and args.no_cache:
+        print("--only-changed не имеет смысла вместе с --no-cache.")
+        return 2
+
+    if args.from_day is not None and args.in_memory:
+        print("--from-day не поддерживается вместе с --in-memory (срез читается целиком).")
+        return 2
+
+    if args.jobs < 1:
+        print("--jobs должен быть >= 1.")
+        return 2
+
     if args.dataset and args.all_datasets:
         print("Нельзя одновременно указывать --dataset и --all-datasets.")
         return 2
@@ -251,36 +614,47 @@ def main() -> int:
         print_datasets(datasets)
         return 2
 
-    results: Dict[str, Dict[str, Tuple[str, int]]] = {}
+    results: Dict[str, Dict[str, Tuple[str, int, bool]]] = {}
     total = 0
     passed = 0
     failed = 0
     stopped_early = False
 
-    for dataset in selected:
+    cache = None
+    if not args.no_cache:
+        from result_cache import ResultCache
+
+        cache = ResultCache()
+    policy = CachePolicy(cache, table_main, table_repair, args.in_memory, args.only_changed)
+    profiler = None if args.no_profile else ValidationRunProfiler("run_all_stream")
+
+    if args.jobs > 1:
+        outcomes = iter_parallel(
+            selected, validators, table_main, table_repair, args.in_memory, policy, args.jobs,
+            from_day=args.from_day,
+            profiler=profiler,
+        )
+    else:
+        outcomes = iter_sequential(
+            selected, validators, table_main, table_repair, args.in_memory, policy,
+            from_day=args.from_day,
+            profiler=profiler,
+        )
+
+    for dataset, inv_ids, rc, cached in outcomes:
         dataset_key = format_dataset(*dataset)
-        results[dataset_key] = {}
-        for script_path, inv_ids in validators:
-            rc = run_validator(
-                script_path,
-                inv_ids,
-                dataset,
-                table_main=table_main,
-                table_repair=table_repair,
-            )
-            status = "PASS" if rc == 0 else "FAIL"
-            for inv_id in inv_ids:
-                results[dataset_key][inv_id] = (status, rc)
-                total += 1
-                if rc == 0:
-                    passed += 1
-                else:
-                    failed += 1
-            if rc != 0 and args.fail_fast:
-                stopped_early = True
-                break
-        if stopped_early:
+        status = "PASS" if rc == 0 else "FAIL"
+        for inv_id in inv_ids:
+            results.setdefault(dataset_key, {})[inv_id] = (status, rc, cached)
+            total += 1
+            if rc == 0:
+                passed += 1
+            else:
+                failed += 1
+        if rc != 0 and args.fail_fast:
+            stopped_early = True
             break
+    outcomes.close()
 
     print("\n" + "=" * 80)
     print("SUMMARY")
@@ -289,14 +663,18 @@ def main() -> int:
         dataset_results = results.get(dataset_key, {})
         for inv_id in inv_id_order:
             if inv_id in dataset_results:
-                status, rc = dataset_results[inv_id]
-                print(f"  {inv_id}: {status} (rc={rc})")
+                status, rc, cached = dataset_results[inv_id]
+                print(f"  {inv_id}: {status} (rc={rc}{', cached' if cached else ''})")
             else:
                 print("  {0}: SKIPPED (rc=NA)".format(inv_id))
     if stopped_early:
         print("\nStopped early due to --fail-fast.")
     print(f"\nTOTAL={total} PASSED={passed} FAILED={failed}")
+    if cache is not None:
+        print(f"CACHE hits={cache.hits} misses={cache.misses}")
     print("=" * 80)
+    if profiler is not None:
+        profiler.finish(get_client())
 
     return 0 if failed == 0 else 1
 
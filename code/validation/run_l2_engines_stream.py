@@ -1,16 +1,38 @@
 #!/usr/bin/env python3
 """
 Потоковый раннер L2-валидаций engines (group_by 3/4).
+
+С --jobs N валидаторы выполняются параллельно (до N процессов); вывод каждого
+печатается целым блоком в исходном порядке.
+
+С --chunks K тяжёлые оконные валидаторы (CHUNKED_SCRIPTS) считаются по K частям
+modulo(cityHash64(psn), K) (l2_chunking.py; 0 — K по max_memory_usage).
+--chunk-parity сверяет их вывод с монолитным запуском.
+
+В конце прогона печатается таблица COST по валидаторам и дописывается
+output/.validation_profile/history.csv (run_profiler.py); --no-profile отключает.
 """
 import argparse
 import os
 import re
 import subprocess
 import sys
-from typing import List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from run_profiler import ValidationRunProfiler, add_profile_args, timed
 
 
 TABLE_RE = re.compile(r"^[A-Za-z0-9_]+(\.[A-Za-z0-9_]+)?$")
+# Валидаторы с поддержкой --chunks (окна по psn на всём sim_units_v2)
+CHUNKED_SCRIPTS = {
+    "l2_inv7_sne_dt_consistency.py",
+    "l2_inv17_allowed_transitions.py",
+    "l2_temp1_repair_duration.py",
+    "l2_inv10_turnover_balance.py",
+}
+# K для --chunk-parity без явного --chunks
+PARITY_CHUNKS = 8
 
 
 def validate_table_name(table: str) -> str:
@@ -19,9 +41,10 @@ def validate_table_name(table: str) -> str:
     return table
 
 
-def stream_process(cmd: List[str]) -> int:
+def stream_process(cmd: List[str], env_extra: Optional[Dict[str, str]] = None) -> int:
     env = os.environ.copy()
     env["PYTHONUNBUFFERED"] = "1"
+    env.update(env_extra or {})
     process = subprocess.Popen(
         cmd,
         stdout=subprocess.PIPE,
@@ -36,18 +59,35 @@ def stream_process(cmd: List[str]) -> int:
     return process.wait()
 
 
-def run_validator(
+def capture_process(cmd: List[str], env_extra: Optional[Dict[str, str]] = None) -> Tuple[int, str]:
+    """Запуск с буферизацией вывода (stdout+stderr) для печати одним блоком"""
+    env = os.environ.copy()
+    env["PYTHONUNBUFFERED"] = "1"
+    env.update(env_extra or {})
+    completed = subprocess.run(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        env=env,
+        check=False,
+    )
+    return completed.returncode, completed.stdout
+
+
+def format_run_header(script_path: str) -> str:
+    return "\n" + "=" * 80 + f"\nRUN {os.path.basename(script_path)}\n" + "=" * 80 + "\n"
+
+
+def build_validator_cmd(
     script_path: str,
     planner_version_date: int,
     units_version_date_int: int,
     version_id: int,
     table_main: str,
     table_units: str,
-) -> int:
-    script_name = os.path.basename(script_path)
-    print("\n" + "=" * 80)
-    print(f"RUN {script_name}")
-    print("=" * 80)
+    chunks: Optional[int] = None,
+) -> List[str]:
     cmd = [
         sys.executable,
         script_path,
@@ -62,7 +102,47 @@ def run_validator(
         "--table-units",
         table_units,
     ]
-    return stream_process(cmd)
+    if chunks is not None and os.path.basename(script_path) in CHUNKED_SCRIPTS:
+        cmd.extend(["--chunks", str(chunks)])
+    return cmd
+
+
+def run_validator(script_path: str, env_extra: Optional[Dict[str, str]] = None, **kwargs) -> int:
+    print(format_run_header(script_path), end="")
+    return stream_process(build_validator_cmd(script_path, **kwargs), env_extra)
+
+
+def run_validator_buffered(
+    script_path: str, env_extra: Optional[Dict[str, str]] = None, **kwargs
+) -> Tuple[int, str]:
+    rc, output = capture_process(build_validator_cmd(script_path, **kwargs), env_extra)
+    return rc, format_run_header(script_path) + output
+
+
+def result_lines(output: str) -> List[str]:
+    """Вывод валидатора без служебной строки CHUNKS"""
+    return [line for line in output.splitlines() if not line.startswith("CHUNKS ")]
+
+
+def run_chunk_parity(script_paths: List[str], chunks: int, **kwargs) -> int:
+    """Чанковый и монолитный запуск CHUNKED_SCRIPTS должны дать один и тот же вывод"""
+    mismatches = 0
+    for script_path in script_paths:
+        if os.path.basename(script_path) not in CHUNKED_SCRIPTS:
+            continue
+        _, mono = capture_process(build_validator_cmd(script_path, chunks=1, **kwargs))
+        _, chunked = capture_process(build_validator_cmd(script_path, chunks=chunks, **kwargs))
+        chunk_line = next((line for line in chunked.splitlines() if line.startswith("CHUNKS ")), "K=1")
+        same = result_lines(mono) == result_lines(chunked)
+        print(f"PARITY {os.path.basename(script_path)}: {'OK' if same else 'MISMATCH'} ({chunk_line})")
+        if not same:
+            mismatches += 1
+            print("  --- monolithic")
+            print("\n".join(f"  {line}" for line in result_lines(mono)))
+            print("  --- chunked")
+            print("\n".join(f"  {line}" for line in result_lines(chunked)))
+    print(f"PARITY mismatches={mismatches}")
+    return 0 if mismatches == 0 else 1
 
 
 def main() -> int:
@@ -74,8 +154,30 @@ def main() -> int:
     parser.add_argument("--version-id", required=True, type=int)
     parser.add_argument("--table-main", default="sim_masterv2_v9")
     parser.add_argument("--table-units", default="sim_units_v2")
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Параллельных валидаторов (по умолчанию 1 — последовательно, потоковый вывод)",
+    )
+    parser.add_argument(
+        "--chunks",
+        type=int,
+        default=None,
+        help="Частей по cityHash64(psn) для тяжёлых валидаторов (0 — авто по max_memory_usage)",
+    )
+    parser.add_argument(
+        "--chunk-parity",
+        action="store_true",
+        help=f"Сверить чанковый вывод с монолитным (K=--chunks или {PARITY_CHUNKS})",
+    )
+    add_profile_args(parser)
     args = parser.parse_args()
 
+    if args.jobs < 1:
+        print("--jobs должен быть >= 1.")
+        return 2
+
     table_main = validate_table_name(args.table_main)
     table_units = validate_table_name(args.table_units)
 
@@ -110,18 +212,49 @@ def main() -> int:
     results: List[Tuple[str, int]] = []
     failed = 0
 
-    for script_path in script_paths:
-        rc = run_validator(
-            script_path=script_path,
-            planner_version_date=args.planner_version_date,
-            units_version_date_int=args.units_version_date_int,
-            version_id=args.version_id,
-            table_main=table_main,
-            table_units=table_units,
+    run_kwargs = dict(
+        planner_version_date=args.planner_version_date,
+        units_version_date_int=args.units_version_date_int,
+        version_id=args.version_id,
+        table_main=table_main,
+        table_units=table_units,
+    )
+    if args.chunk_parity:
+        return run_chunk_parity(
+            script_paths, args.chunks if args.chunks is not None else PARITY_CHUNKS, **run_kwargs
         )
+    run_kwargs["chunks"] = args.chunks
+    profiler = None if args.no_profile else ValidationRunProfiler("run_l2_engines_stream")
+    dataset = f"{args.planner_version_date}:{args.version_id}/{args.units_version_date_int}"
+
+    def env_extra(script_path: str) -> Optional[Dict[str, str]]:
+        return profiler.child_env(script_path, dataset) if profiler is not None else None
+
+    if args.jobs > 1:
+        with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+            futures = [
+                executor.submit(
+                    timed, run_validator_buffered, script_path, env_extra(script_path), **run_kwargs
+                )
+                for script_path in script_paths
+            ]
+            runs = []
+            for future in futures:
+                (rc, output), seconds = future.result()
+                print(output, end="", flush=True)
+                runs.append((rc, seconds))
+    else:
+        runs = (
+            timed(run_validator, script_path, env_extra(script_path), **run_kwargs)
+            for script_path in script_paths
+        )
+
+    for script_path, (rc, seconds) in zip(script_paths, runs):
         results.append((os.path.basename(script_path), rc))
         if rc != 0:
             failed += 1
+        if profiler is not None:
+            profiler.record(script_path, dataset, rc, seconds)
 
     print("\n" + "=" * 80)
     print("SUMMARY")
@@ -130,6 +263,10 @@ def main() -> int:
         print(f"  {script_name}: {status} (rc={rc})")
     print(f"\nTOTAL={len(results)} FAILED={failed}")
     print("=" * 80)
+    if profiler is not None:
+        from ch_client import get_client
+
+        profiler.finish(get_client())
 
     return 0 if failed == 0 else 1
 
@@ -0,0 +1,212 @@
+"""
+Профиль прогона валидаторов: стоимость каждой пары (датасет, валидатор).
+
+Для каждого запуска валидатора раннером (run_all_stream.py, run_l2_engines_stream.py)
+фиксируются:
+- wall-время процесса (для --in-memory проверок — время векторного расчёта в раннере);
+- число запросов, прочитанные строки/байты и суммарное время запросов — из статистики
+  драйвера (ch_session, файл CH_SESSION_STATS_FILE дочернего процесса);
+- пиковая memory_usage запросов — из system.query_log по query_id (best effort,
+  один запрос в конце прогона).
+
+В конце прогона печатается таблица COST по убыванию wall-времени, строки дописываются
+в output/.validation_profile/history.csv. Каждая строка сравнивается с последним
+прогоном того же (раннер, датасет, валидатор) из истории: замедление больше порога
+помечается SLOWER, изменённый скрипт (хэш как у кэша результатов) — SQL CHANGED.
+"""
+import csv
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from result_cache import validator_hash
+
+
+DEFAULT_PROFILE_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "output", ".validation_profile")
+)
+STATS_FILE_ENV = "CH_SESSION_STATS_FILE"
+# Регрессия: медленнее прошлого прогона больше чем на threshold и на min_delta_sec
+DEFAULT_REGRESSION_THRESHOLD = 0.2
+DEFAULT_MIN_DELTA_SEC = 1.0
+
+HISTORY_FIELDS = [
+    "run_id", "runner", "dataset", "validator", "inv_ids", "mode", "rc", "script_hash",
+    "wall_sec", "queries", "query_sec", "read_rows", "read_bytes", "peak_memory_bytes",
+]
+
+
+def timed(func, *args, **kwargs):
+    """func(*args, **kwargs) и wall-время: (результат, секунды)"""
+    start = time.time()
+    result = func(*args, **kwargs)
+    return result, time.time() - start
+
+
+def add_profile_args(parser) -> None:
+    parser.add_argument(
+        "--no-profile",
+        action="store_true",
+        help="Не профилировать валидаторы (таблица COST, output/.validation_profile/history.csv)",
+    )
+
+
+class ValidationRunProfiler:
+    """Стоимость валидаторов одного прогона раннера"""
+
+    def __init__(self, runner: str, profile_dir: Optional[str] = None,
+                 regression_threshold: float = DEFAULT_REGRESSION_THRESHOLD,
+                 min_delta_sec: float = DEFAULT_MIN_DELTA_SEC):
+        self.runner = runner
+        self.profile_dir = profile_dir or DEFAULT_PROFILE_DIR
+        self.regression_threshold = regression_threshold
+        self.min_delta_sec = min_delta_sec
+        self.run_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.entries: List[Dict] = []
+        self._stats_dir = tempfile.mkdtemp(prefix="validation_profile_")
+
+    def child_env(self, script_path: str, dataset: str) -> Dict[str, str]:
+        """Переменные окружения дочернего валидатора: файл статистики его ClickHouse-сессии"""
+        name = f"{dataset.replace(':', '_').replace('/', '_')}__{os.path.basename(script_path)}.json"
+        return {STATS_FILE_ENV: os.path.join(self._stats_dir, name)}
+
+    def record(self, script_path: str, dataset: str, rc: int, wall_sec: float,
+               inv_ids: Optional[List[str]] = None, mode: str = "sql") -> None:
+        """Запуск валидатора; для mode='sql' статистика читается из файла child_env"""
+        entry = {
+            "validator": os.path.basename(script_path),
+            "dataset": dataset,
+            "inv_ids": "/".join(inv_ids or []),
+            "mode": mode,
+            "rc": rc,
+            "script_hash": validator_hash(script_path, in_memory=(mode == "in-memory"))[:12]
+            if os.path.exists(script_path) else "",
+            "wall_sec": round(wall_sec, 2),
+            "queries": 0, "query_sec": 0.0, "read_rows": 0, "read_bytes": 0, "peak_memory_bytes": None,
+            "query_ids": [],
+        }
+        if mode == "sql":
+            self._read_session_stats(entry, self.child_env(script_path, dataset)[STATS_FILE_ENV])
+        self.entries.append(entry)
+
+    @staticmethod
+    def _read_session_stats(entry: Dict, path: str) -> None:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+        except (OSError, ValueError):
+            # Валидатор упал до первого запроса или не использует ch_session
+            entry["queries"] = None
+            return
+        for stats in payload.get("stats", {}).values():
+            entry["queries"] += int(stats.get("queries", 0))
+            entry["query_sec"] = round(entry["query_sec"] + float(stats.get("seconds", 0.0)), 2)
+            entry["read_rows"] += int(stats.get("read_rows", 0))
+            entry["read_bytes"] += int(stats.get("read_bytes", 0))
+        entry["query_ids"] = payload.get("query_ids", [])
+
+    def _collect_memory(self, client) -> None:
+        """Пиковая memory_usage по валидаторам из system.query_log (без лога — «—» в таблице)"""
+        owners = {query_id: entry for entry in self.entries for query_id in entry["query_ids"]}
+        if not owners:
+            return
+        try:
+            try:
+                client.execute("SYSTEM FLUSH LOGS")
+            except Exception:
+                pass
+            rows = client.execute(
+                "SELECT query_id, memory_usage FROM system.query_log "
+                "WHERE type = 'QueryFinish' AND event_date >= yesterday() AND query_id IN %(ids)s",
+                {"ids": list(owners)},
+            )
+        except Exception as exc:
+            print(f"⚠️ system.query_log недоступен для профиля памяти: {exc}", file=sys.stderr)
+            return
+        for query_id, usage in rows:
+            entry = owners[query_id]
+            entry["peak_memory_bytes"] = max(entry["peak_memory_bytes"] or 0, int(usage))
+
+    def _previous_runs(self) -> Dict[Tuple[str, str, str], Dict]:
+        """Последняя строка истории по (раннер, датасет, валидатор)"""
+        history_path = os.path.join(self.profile_dir, "history.csv")
+        previous: Dict[Tuple[str, str, str], Dict] = {}
+        try:
+            with open(history_path, "r", encoding="utf-8", newline="") as f:
+                for row in csv.DictReader(f):
+                    previous[(row["runner"], row["dataset"], row["validator"])] = row
+        except OSError:
+            pass
+        return previous
+
+    def _flags(self, entry: Dict, before: Optional[Dict]) -> str:
+        if before is None or entry["mode"] != before.get("mode"):
+            return "new"
+        flags = []
+        if before.get("script_hash") != entry["script_hash"]:
+            flags.append("SQL CHANGED")
+        try:
+            before_wall = float(before.get("wall_sec") or 0)
+        except ValueError:
+            before_wall = 0.0
+        if before_wall > 0:
+            ratio = entry["wall_sec"] / before_wall
+            if ratio > 1 + self.regression_threshold and entry["wall_sec"] - before_wall > self.min_delta_sec:
+                flags.append(f"SLOWER x{ratio:.2f} (was {before_wall:.2f}s)")
+        return ", ".join(flags)
+
+    def finish(self, client=None) -> None:
+        """Таблица COST по убыванию wall-времени и дозапись истории"""
+        try:
+            if not self.entries:
+                return
+            if client is not None:
+                self._collect_memory(client)
+            previous = self._previous_runs()
+            self._print_report(previous)
+            self._append_history()
+        finally:
+            shutil.rmtree(self._stats_dir, ignore_errors=True)
+
+    def _print_report(self, previous: Dict[Tuple[str, str, str], Dict]) -> None:
+        def fmt(value, pattern):
+            return pattern.format(value) if value is not None else "—"
+
+        print("\n" + "=" * 80)
+        print(f"COST {self.runner} run_id={self.run_id} (sorted by wall time)")
+        print(
+            f"  {'dataset':<20} {'validator':<44} {'wall_s':>8} {'queries':>7} {'query_s':>8} "
+            f"{'read_rows':>14} {'read_MB':>9} {'peak_mem_MB':>11}  notes"
+        )
+        for entry in sorted(self.entries, key=lambda item: -item["wall_sec"]):
+            before = previous.get((self.runner, entry["dataset"], entry["validator"]))
+            notes = self._flags(entry, before)
+            if entry["mode"] != "sql":
+                notes = f"{entry['mode']}{', ' + notes if notes else ''}"
+            memory = entry["peak_memory_bytes"]
+            print(
+                f"  {entry['dataset'][:20]:<20} {entry['validator'][:44]:<44} {entry['wall_sec']:>8.2f} "
+                f"{fmt(entry['queries'], '{}'):>7} {entry['query_sec']:>8.2f} {entry['read_rows']:>14,} "
+                f"{entry['read_bytes'] / 2**20:>9.1f} {fmt(memory and memory / 2**20, '{:.1f}'):>11}  {notes}"
+            )
+        total_wall = sum(entry["wall_sec"] for entry in self.entries)
+        total_rows = sum(entry["read_rows"] for entry in self.entries)
+        print(f"  TOTAL wall_sum={total_wall:.2f}s read_rows={total_rows:,} validators={len(self.entries)}")
+        print(f"  history: {os.path.join(self.profile_dir, 'history.csv')}")
+        print("=" * 80)
+
+    def _append_history(self) -> None:
+        os.makedirs(self.profile_dir, exist_ok=True)
+        history_path = os.path.join(self.profile_dir, "history.csv")
+        write_header = not os.path.exists(history_path)
+        with open(history_path, "a", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=HISTORY_FIELDS, extrasaction="ignore")
+            if write_header:
+                writer.writeheader()
+            for entry in self.entries:
+                writer.writerow({"run_id": self.run_id, "runner": self.runner, **entry})
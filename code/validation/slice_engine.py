@@ -0,0 +1,961 @@
+#!/usr/bin/env python3
+"""
+Однопроходный движок валидации sim_masterv2_v9 (INV-1..12, TEMP-1/4/5).
+
+Срез (version_date, version_id, group_by IN (1, 2)) читается из ClickHouse один раз
+в колоночные NumPy-массивы, упорядоченные по (version_date, group_by,
+aircraft_number, day_u16). Все инварианты считаются векторно по этим массивам:
+lag/lead в окне агента, балансы по дням, ёмкость ремонта (INV-3 — отдельный
+срез sim_repairline_v9). Вердикты, счётчики и выборки нарушений повторяют
+SQL-валидаторы inv*/temp* (те же строки деталей, тот же порядок выборок);
+SQL-скрипты остаются эталоном.
+
+Запуск:
+    python3 code/validation/slice_engine.py --version-id <ID> --version-date <YYYYMMDD>
+
+Сверка с SQL-валидаторами на срезе (fixture-датасет):
+    python3 code/validation/slice_engine.py --version-id <ID> --version-date <YYYYMMDD> --parity-check
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ch_client import get_client
+from inv10_turnover_balance import format_table
+from inv2_ops_vs_target import load_mp4_targets
+
+
+SLICE_COLUMNS = (
+    "version_date",
+    "group_by",
+    "aircraft_number",
+    "idx",
+    "day_u16",
+    "status_id",
+    "pre_status_id",
+    "sne",
+    "ll",
+    "ppr",
+    "oh",
+    "daily_today_u32",
+    "daily_next_u32",
+    "limiter",
+    "repair_time",
+    "repair_days",
+    "commit_p2",
+    "commit_p3",
+    "repair_claim_source",
+    "repair_claim_line_id",
+    "repair_claim_start_day",
+    "repair_claim_end_day",
+)
+REPAIR_COLUMNS = ("version_date", "day_u16", "repair_time", "free_days")
+
+# Незаполненные поля claim (UInt16 max)
+CLAIM_SENTINEL = 65535
+# Переходы, разрешённые INV-10 (pre_status_id, status_id)
+ALLOWED_TRANSITIONS = {
+    (0, 2), (0, 3), (1, 2), (1, 4), (2, 3), (2, 6),
+    (2, 7), (3, 2), (4, 2), (4, 3), (7, 2), (7, 4),
+}
+TURNOVER_STATES = (1, 2, 3, 4, 6, 7)
+
+
+def validate_table_name(table: str) -> str:
+    if not re.match(r"^[A-Za-z0-9_]+(\.[A-Za-z0-9_]+)?$", table):
+        raise SystemExit(f"Некорректное имя таблицы: {table}")
+    return table
+
+
+@dataclass
+class CheckResult:
+    """Результат проверки в формате print_result SQL-валидатора"""
+
+    script: str
+    name: str
+    passed: bool
+    details: List[str]
+    # Строки, которые SQL-валидатор печатает до блока результата (INV-2)
+    preamble: List[str] = field(default_factory=list)
+
+    def render(self) -> str:
+        """Текст вывода, как у SQL-валидатора (preamble + блок print_result)"""
+        status = "PASS" if self.passed else "FAIL"
+        lines = self.preamble + ["=" * 80, f"{self.name}: {status}"] + self.details + ["=" * 80]
+        return "\n".join(lines) + "\n"
+
+    def print(self) -> None:
+        print(self.render(), end="")
+
+
+def _read_columnar(client, query: str, params: Dict, names: Sequence[str]) -> Dict[str, np.ndarray]:
+    data = client.execute(query, params, columnar=True)
+    if not data:
+        return {name: np.zeros(0, dtype=np.int64) for name in names}
+    columns = {}
+    for name, values in zip(names, data):
+        columns[name] = np.asarray(values, dtype=np.int64)
+    return columns
+
+
+def _top(mask: np.ndarray, order_keys: Sequence[np.ndarray], limit: int) -> np.ndarray:
+    """Индексы строк mask в порядке ORDER BY order_keys (первый ключ главный) LIMIT limit"""
+    rows = np.flatnonzero(mask)
+    if rows.size == 0 or not order_keys:
+        return rows[:limit]
+    order = np.lexsort(tuple(key[rows] for key in reversed(order_keys)))
+    return rows[order[:limit]]
+
+
+def _group_ids(*columns: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(уникальные ключи по строкам, номер группы каждой строки) — GROUP BY columns"""
+    if columns[0].size == 0:
+        return np.zeros((0, len(columns)), dtype=np.int64), np.zeros(0, dtype=np.int64)
+    keys, inverse = np.unique(np.stack(columns, axis=1), axis=0, return_inverse=True)
+    return keys, inverse.reshape(-1)
+
+
+def _count_by(mask: np.ndarray, *columns: np.ndarray) -> Dict[Tuple[int, ...], int]:
+    """{ключ: count()} для строк mask — GROUP BY columns"""
+    if not mask.any():
+        return {}
+    keys, counts = np.unique(np.stack([c[mask] for c in columns], axis=1), axis=0, return_counts=True)
+    return {tuple(k): int(n) for k, n in zip(keys.tolist(), counts.tolist())}
+
+
+def _rank_in_partition(pid: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """row_number() OVER (PARTITION BY агент ORDER BY day_u16) для отобранных строк"""
+    if rows.size == 0:
+        return rows
+    part = pid[rows]
+    position = np.arange(rows.size)
+    starts = np.r_[True, part[1:] != part[:-1]]
+    return position - np.maximum.accumulate(np.where(starts, position, 0)) + 1
+
+
+def _targets_for_days(targets: Dict[int, int], days: np.ndarray) -> np.ndarray:
+    """Векторный get_target_for_day: точный день, иначе ближайший предыдущий, иначе первый"""
+    keys = np.array(sorted(targets), dtype=np.int64)
+    values = np.array([targets[k] for k in keys.tolist()], dtype=np.int64)
+    position = np.searchsorted(keys, days, side="right") - 1
+    return values[np.clip(position, 0, None)]
+
+
+class ValidationSlice:
+    """Срез sim_masterv2_v9 одного датасета в колоночных массивах, по агенту и дню"""
+
+    def __init__(self, client, columns: Dict[str, np.ndarray], version_date: int, version_id: int,
+                 table_main: str, table_repair: str):
+        self.client = client
+        self.version_date = int(version_date)
+        self.version_id = int(version_id)
+        self.table_main = table_main
+        self.table_repair = table_repair
+        order = np.lexsort((
+            columns["idx"], columns["day_u16"], columns["aircraft_number"],
+            columns["group_by"], columns["version_date"],
+        ))
+        self.cols = {name: values[order] for name, values in columns.items()}
+        self.n = int(order.size)
+        # Начало окна PARTITION BY aircraft_number, group_by, version_date
+        self.first = np.ones(self.n, dtype=bool)
+        if self.n:
+            same = np.ones(self.n - 1, dtype=bool)
+            for name in ("version_date", "group_by", "aircraft_number"):
+                same &= self.cols[name][1:] == self.cols[name][:-1]
+            self.first[1:] = ~same
+        self.pid = np.cumsum(self.first) - 1
+        self._repair: Optional[Dict[str, np.ndarray]] = None
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.cols[name]
+
+    def lag(self, name: str, default: int = 0) -> np.ndarray:
+        """lagInFrame(name, 1, default) OVER (PARTITION BY aircraft_number, group_by, version_date ORDER BY day_u16)"""
+        values = self.cols[name]
+        out = np.empty_like(values)
+        out[1:] = values[:-1]
+        out[self.first] = default
+        return out
+
+    def rows(self, indices: np.ndarray, *columns) -> List[tuple]:
+        """Строки выборки: имена колонок среза или готовые массивы"""
+        arrays = [self.cols[c] if isinstance(c, str) else c for c in columns]
+        return list(zip(*(a[indices].tolist() for a in arrays)))
+
+    def sample(self, mask: np.ndarray, key: Sequence[np.ndarray], limit: int, *columns) -> List[tuple]:
+        """Выборка как SampleSpec: строки mask по (key…, columns…) LIMIT limit — колонки добивают порядок"""
+        arrays = [self.cols[c] if isinstance(c, str) else c for c in columns]
+        return self.rows(_top(mask, [*key, *arrays], limit), *arrays)
+
+    def warmup_days(self) -> int:
+        """max(repair_time) по срезу (0 для пустого среза)"""
+        return int(self.cols["repair_time"].max()) if self.n else 0
+
+    @property
+    def repair(self) -> Dict[str, np.ndarray]:
+        """Срез sim_repairline_v9 (читается при первом обращении)"""
+        if self._repair is None:
+            query = f"""
+            SELECT {', '.join(REPAIR_COLUMNS)}
+            FROM {self.table_repair}
+            WHERE version_id = %(vid)s AND version_date = %(vdate)s
+            """
+            params = {"vid": self.version_id, "vdate": self.version_date}
+            self._repair = _read_columnar(self.client, query, params, REPAIR_COLUMNS)
+        return self._repair
+
+
+def load_slice(client, version_id: int, version_date: int, table_main: str = "sim_masterv2_v9",
+               table_repair: str = "sim_repairline_v9") -> ValidationSlice:
+    """Один запрос: все колонки, нужные валидаторам, для (version_date, version_id)"""
+    query = f"""
+    SELECT {', '.join(SLICE_COLUMNS)}
+    FROM {table_main}
+    WHERE version_id = %(vid)s AND version_date = %(vdate)s
+      AND group_by IN (1, 2)
+    """
+    params = {"vid": int(version_id), "vdate": int(version_date)}
+    columns = _read_columnar(client, query, params, SLICE_COLUMNS)
+    return ValidationSlice(client, columns, version_date, version_id, table_main, table_repair)
+
+
+# --- Проверки (порядок строк деталей = SQL-валидаторы) ---------------------------------
+
+
+def check_inv1(s: ValidationSlice) -> CheckResult:
+    sne, ll = s["sne"], s["ll"]
+    mask = sne > ll
+    violations = int(mask.sum())
+    details = [f"violations={violations}"]
+    if violations:
+        exceed = sne - ll
+        details.append("top10 sample (acn, day, sne, ll, exceed, limiter, dt):")
+        for acn, day, sne_v, ll_v, exc, limiter, dt in s.sample(
+            mask, [-exceed], 10,
+            "aircraft_number", "day_u16", "sne", "ll", exceed, "limiter", "daily_today_u32",
+        ):
+            details.append(
+                f"  acn={acn}, day={day}, sne={sne_v}, ll={ll_v}, "
+                f"exceed={exc}, limiter={limiter}, dt={dt}"
+            )
+    return CheckResult("inv1_sne_le_ll.py", "INV-1 sne<=ll lifecycle", violations == 0, details)
+
+
+def check_inv2(s: ValidationSlice, tolerance: int = 0) -> CheckResult:
+    targets_mi8, targets_mi17, _ = load_mp4_targets(s.client, s.version_date)
+    targets = {1: targets_mi8, 2: targets_mi17}
+    group_names = {1: "Mi-8", 2: "Mi-17"}
+    preamble = [
+        f"MP4 targets loaded: Mi-8 unique={len(set(targets_mi8.values()))}, "
+        f"Mi-17 unique={len(set(targets_mi17.values()))}"
+    ]
+
+    warmup_days = s.warmup_days()
+    day, group_by = s["day_u16"], s["group_by"]
+    step_days = np.unique(day)
+    is_warmup = step_days <= warmup_days
+    ops = s["status_id"] == 2
+
+    warmup_violations = []
+    post_violations = []
+    for gb in (1, 2):
+        ops_days, ops_counts = np.unique(day[ops & (group_by == gb)], return_counts=True)
+        counts = np.zeros(step_days.size, dtype=np.int64)
+        counts[np.searchsorted(step_days, ops_days)] = ops_counts
+        target = _targets_for_days(targets[gb], step_days)
+        diff = counts - target
+        bad = np.abs(diff) > tolerance
+        for i in np.flatnonzero(bad).tolist():
+            entry = (gb, int(step_days[i]), int(counts[i]), int(target[i]), int(diff[i]))
+            (warmup_violations if is_warmup[i] else post_violations).append(entry)
+
+    warmup_steps = int(is_warmup.sum())
+    post_steps = int((~is_warmup).sum())
+    preamble.append("-" * 80)
+    preamble.append(f"Warmup period (day <= {warmup_days}): {warmup_steps} steps, "
+                    f"{len(warmup_violations)} deviations (INFO, not counted)")
+    for gb in (1, 2):
+        wv = [v for v in warmup_violations if v[0] == gb]
+        if wv:
+            max_dev = max(abs(v[4]) for v in wv)
+            preamble.append(f"  {group_names[gb]}: {len(wv)} deviations, max |diff|={max_dev}")
+            for _, d, ops_n, tgt, diff_v in wv[:5]:
+                sign = "+" if diff_v > 0 else ""
+                preamble.append(f"    day={d}: ops={ops_n}, target={tgt}, diff={sign}{diff_v}")
+            if len(wv) > 5:
+                preamble.append(f"    ... and {len(wv) - 5} more")
+    preamble.append("-" * 80)
+
+    details = [
+        f"warmup_days={warmup_days}",
+        f"tolerance={tolerance}",
+        f"post_warmup_steps={post_steps}",
+        f"Mi-8 target range: {min(targets_mi8.values())}..{max(targets_mi8.values())}",
+        f"Mi-17 target range: {min(targets_mi17.values())}..{max(targets_mi17.values())}",
+        f"warmup_deviations={len(warmup_violations)} (info only)",
+        f"post_warmup_violations={len(post_violations)}",
+    ]
+    if post_violations:
+        by_group = {gb: [v for v in post_violations if v[0] == gb] for gb in (1, 2)}
+        details.append(f"  Mi-8 violations: {len(by_group[1])}")
+        details.append(f"  Mi-17 violations: {len(by_group[2])}")
+        for gb in (1, 2):
+            if by_group[gb]:
+                details.append(f"  {group_names[gb]} sample (day, ops, target, diff):")
+                for _, d, ops_n, tgt, diff_v in by_group[gb][:5]:
+                    sign = "+" if diff_v > 0 else ""
+                    details.append(f"    day={d}: ops={ops_n}, target={tgt}, diff={sign}{diff_v}")
+
+    return CheckResult("inv2_ops_vs_target.py", "INV-2 ops vs target (dynamic MP4)",
+                       not post_violations, details, preamble)
+
+
+def check_inv3(s: ValidationSlice, repair_quota: int = 18) -> CheckResult:
+    r = s.repair
+    busy = (r["repair_time"] > 0) & (r["free_days"] < r["repair_time"])
+    keys, inverse = _group_ids(r["version_date"], r["day_u16"])
+    n = np.bincount(inverse, weights=busy.astype(np.float64), minlength=len(keys)).astype(np.int64)
+    max_concurrent = int(n.max()) if n.size else 0
+    over = n > repair_quota
+    violations = int(over.sum())
+    details = [
+        f"repair_quota={repair_quota}",
+        f"max_concurrent_repair={max_concurrent}",
+        f"violations={violations}",
+    ]
+    if violations:
+        vd, day = keys[:, 0], keys[:, 1]
+        details.append("top5 days (version_date, day, n):")
+        for i in _top(over, [-n, vd, day], 5).tolist():
+            details.append(f"  version_date={vd[i]}, day={day[i]}, n={n[i]}")
+    return CheckResult("inv3_repair_capacity.py", "INV-3 repair capacity", violations == 0, details)
+
+
+def check_inv4(s: ValidationSlice) -> CheckResult:
+    st, pre, day = s["status_id"], s["pre_status_id"], s["day_u16"]
+    transition = (pre != st) & (pre > 0)
+    exits = np.flatnonzero(transition & (pre == 2) & (st == 7))
+    returns = np.flatnonzero(transition & (st == 2) & ((pre == 4) | (pre == 7)))
+    # JOIN exits ↔ returns по агенту и порядковому номеру перехода
+    stride = s.n + 1
+    exit_keys = s.pid[exits] * stride + _rank_in_partition(s.pid, exits)
+    return_keys = s.pid[returns] * stride + _rank_in_partition(s.pid, returns)
+    _, ie, ir = np.intersect1d(exit_keys, return_keys, return_indices=True)
+    e, r = exits[ie], returns[ir]
+    gap = day[r] - day[e]
+    rt = s["repair_time"][r]
+    bad = (gap < rt) & (day[r] > day[e])
+    violations = int(bad.sum())
+    details = [f"violations={violations}"]
+    if violations:
+        details.append("top5 (acn, exit_day, return_day, gap, repair_time):")
+        for i in _top(bad, [gap, s["aircraft_number"][e], day[e], day[r], gap, rt], 5).tolist():
+            details.append(
+                f"  acn={s['aircraft_number'][e[i]]}, exit={day[e[i]]}, return={day[r[i]]}, "
+                f"gap={gap[i]}, repair_time={rt[i]}"
+            )
+    return CheckResult("inv4_unsvc_repair_time.py", "INV-4 unsvc repair time", violations == 0, details)
+
+
+def check_inv5(s: ValidationSlice) -> CheckResult:
+    st, pre, sne, dt = s["status_id"], s["pre_status_id"], s["sne"], s["daily_today_u32"]
+    prev_sne = s.lag("sne")
+    delta = sne - prev_sne
+    mismatch = (s.lag("day_u16") > 0) & (pre > 0) & (delta != dt)
+    artifact = mismatch & (pre == 2) & (st != 2) & (dt == 0)
+    real = mismatch & ~artifact
+    real_violations = int(real.sum())
+    details = [
+        f"real_violations={real_violations}",
+        f"transition_out_artifacts={int(artifact.sum())} (pre_st=2→st≠2, dt=0, sne incremented — RTC layer ordering)",
+    ]
+    if real_violations > 0:
+        diff = delta - dt
+        details.append("top5 real violations (acn, day, st, pre_st, sne, prev, dt, delta, diff):")
+        for acn, d, st_v, pst, sne_v, psne, dt_v, sd, diff_v in s.sample(
+            real, [-np.abs(diff)], 5,
+            "aircraft_number", "day_u16", "status_id", "pre_status_id", "sne", prev_sne,
+            "daily_today_u32", delta, diff,
+        ):
+            details.append(
+                f"  acn={acn}, day={d}, st={st_v}, pre_st={pst}, "
+                f"sne={sne_v}, prev={psne}, dt={dt_v}, delta={sd}, diff={diff_v}"
+            )
+    return CheckResult("inv5_balance_increments.py", "INV-5 balance increments", real_violations == 0, details)
+
+
+def check_inv6(s: ValidationSlice) -> CheckResult:
+    dt = s["daily_today_u32"]
+    mask = (s["status_id"] != 2) & (dt > 0)
+    violations = int(mask.sum())
+    details = [f"violations={violations}"]
+    if violations:
+        details.append("top10 sample (acn, day, status, pre_status, dt):")
+        for acn, day, status_id, pre_status_id, dt_v in s.sample(
+            mask, [-dt, s["day_u16"]], 10,
+            "aircraft_number", "day_u16", "status_id", "pre_status_id", "daily_today_u32",
+        ):
+            details.append(
+                f"  acn={acn}, day={day}, status_id={status_id}, "
+                f"pre_status_id={pre_status_id}, dt={dt_v}"
+            )
+    return CheckResult("inv6_dt_only_ops.py", "INV-6 dt only ops", violations == 0, details)
+
+
+def check_inv7(s: ValidationSlice) -> CheckResult:
+    sne, dt = s["sne"], s["daily_today_u32"]
+    prev_sne = s.lag("sne")
+    mask = ((s["status_id"] == 2) & (s["pre_status_id"] == 2)
+            & (s.lag("day_u16") > 0) & (s.lag("status_id") == 2)
+            & (sne != prev_sne + dt))
+    violations = int(mask.sum())
+    details = [f"violations={violations}"]
+    if violations:
+        actual_delta = sne - prev_sne
+        diff = actual_delta - dt
+        details.append("top5 (acn, day, sne, prev_sne, dt, actual_delta, diff):")
+        for acn, d, sne_v, psne, dt_v, ad, diff_v in s.sample(
+            mask, [-np.abs(diff)], 5,
+            "aircraft_number", "day_u16", "sne", prev_sne, "daily_today_u32", actual_delta, diff,
+        ):
+            details.append(
+                f"  acn={acn}, day={d}, sne={sne_v}, prev_sne={psne}, "
+                f"dt={dt_v}, actual_delta={ad}, diff={diff_v}"
+            )
+    return CheckResult("inv7_dt_eq_mp5.py", "INV-7 dt=mp5 (sne consistency)", violations == 0, details)
+
+
+def check_inv8(s: ValidationSlice) -> CheckResult:
+    prev_sne, prev_ppr = s.lag("sne"), s.lag("ppr")
+    mask = ((s["status_id"] == 6) & (s.lag("status_id") == 6) & (s.lag("day_u16") > 0)
+            & ((s["sne"] != prev_sne) | (s["ppr"] != prev_ppr)))
+    violations = int(mask.sum())
+    details = [f"violations={violations}"]
+    if violations:
+        details.append("top5 sample (acn, day, sne/prev_sne, ppr/prev_ppr):")
+        for acn, day, sne, psne, ppr, pppr in s.sample(
+            mask, [s["day_u16"]], 5,
+            "aircraft_number", "day_u16", "sne", prev_sne, "ppr", prev_ppr,
+        ):
+            details.append(f"  acn={acn}, day={day}, sne={sne}/{psne}, ppr={ppr}/{pppr}")
+    return CheckResult("inv8_storage_frozen.py", "INV-8 storage frozen", violations == 0, details)
+
+
+def check_inv9(s: ValidationSlice) -> CheckResult:
+    st, day = s["status_id"], s["day_u16"]
+    # Окно SQL: PARTITION BY idx, group_by, version_date ORDER BY day_u16 с рамкой по умолчанию
+    # (RANGE ... CURRENT ROW). leadInFrame не выходит за рамку, поэтому next_st берётся только
+    # из следующей строки того же дня (peer), иначе 0 — так же, как в inv9_limiter_exit.py.
+    order = np.lexsort((day, s["version_date"], s["group_by"], s["idx"]))
+    same = np.ones(max(s.n - 1, 0), dtype=bool)
+    for name in ("idx", "group_by", "version_date", "day_u16"):
+        sorted_values = s[name][order]
+        same &= sorted_values[1:] == sorted_values[:-1]
+    next_sorted = np.zeros(s.n, dtype=np.int64)
+    if s.n:
+        next_sorted[:-1] = np.where(same, st[order][1:], 0)
+    next_st = np.empty_like(next_sorted)
+    next_st[order] = next_sorted
+
+    dt_next = s["daily_next_u32"]
+    mask = ((st == 2) & (next_st == 2)
+            & ((s["sne"] + dt_next > s["ll"]) | (s["ppr"] + dt_next > s["oh"])))
+    violations = int(mask.sum())
+    details = [f"violations={violations}"]
+    if violations:
+        details.append(
+            "top5 sample (acn, gb, vd, day, sne, dt_next, ll, ppr, dt_next, oh, next_status):"
+        )
+        for acn, gb, vd, d, sne, dt_sne, ll, ppr, dt_ppr, oh, nst in s.sample(
+            mask, [day], 5,
+            "aircraft_number", "group_by", "version_date", "day_u16", "sne", "daily_next_u32", "ll",
+            "ppr", "daily_next_u32", "oh", next_st,
+        ):
+            details.append(
+                f"  acn={acn}, group_by={gb}, version_date={vd}, day={d}, "
+                f"sne={sne}+{dt_sne}>{ll}, ppr={ppr}+{dt_ppr}>{oh}, "
+                f"next_status={nst}"
+            )
+    return CheckResult("inv9_limiter_exit.py", "INV-9 ops look-ahead safety", violations == 0, details)
+
+
+def check_inv10(s: ValidationSlice) -> CheckResult:
+    vd, day, st, pre = s["version_date"], s["day_u16"], s["status_id"], s["pre_status_id"]
+    day_ranges = []
+    is_min = np.zeros(s.n, dtype=bool)
+    is_max = np.zeros(s.n, dtype=bool)
+    if s.n:
+        vd_keys, vd_inverse = np.unique(vd, return_inverse=True)
+        min_day = np.full(vd_keys.size, np.iinfo(np.int64).max)
+        max_day = np.full(vd_keys.size, -1)
+        np.minimum.at(min_day, vd_inverse, day)
+        np.maximum.at(max_day, vd_inverse, day)
+        day_ranges = list(zip(vd_keys.tolist(), min_day.tolist(), max_day.tolist()))
+        is_min = day == min_day[vd_inverse]
+        is_max = day == max_day[vd_inverse]
+
+    transition = (pre != st) & (pre > 0)
+    entries = _count_by(transition, vd, st)
+    spawn_entries = _count_by(pre == 0, vd, st)
+    exits = _count_by(transition, vd, pre)
+    initial_counts = _count_by(is_min & (pre > 0), vd, pre)
+    final_counts = _count_by(is_max, vd, st)
+
+    violations = 0
+    balance_rows = []
+    for version_date, _min_day, _max_day in day_ranges:
+        for state in TURNOVER_STATES:
+            key = (version_date, state)
+            initial = initial_counts.get(key, 0)
+            ent = entries.get(key, 0)
+            spawn = spawn_entries.get(key, 0)
+            ext = exits.get(key, 0)
+            final = final_counts.get(key, 0)
+            balance = (initial + ent + spawn) - (ext + final)
+            ok = balance == 0
+            balance_rows.append(
+                [version_date, state, initial, ent, spawn, ext, final, balance, "OK" if ok else "FAIL"]
+            )
+            if not ok:
+                violations += 1
+
+    illegal = 0
+    transitions_rows = []
+    for (version_date, pre_i, st_i), cnt in sorted(_count_by(pre != st, vd, pre, st).items()):
+        legal = (pre_i, st_i) in ALLOWED_TRANSITIONS
+        if not legal:
+            illegal += 1
+        transitions_rows.append([version_date, pre_i, st_i, cnt, "LEGAL" if legal else "ILLEGAL"])
+
+    details = []
+    if not day_ranges:
+        details.append(
+            "no rows for filters: version_id=%s, version_date=%s, group_by IN (1,2)"
+            % (s.version_id, s.version_date if s.version_date else "ANY")
+        )
+    details.append("day ranges:")
+    if day_ranges:
+        for version_date, min_d, max_d in day_ranges:
+            details.append(
+                "  version_date=%s, min_day=%s, max_day=%s" % (version_date, min_d, max_d)
+            )
+    else:
+        details.append("  none")
+    details.append("balance table:")
+    details.extend(format_table(
+        ["version_date", "status", "initial", "entries", "spawn", "exits", "final", "balance", "ok"],
+        balance_rows,
+    ))
+    details.append("transitions table:")
+    details.extend(format_table(["version_date", "pre", "status", "count", "legal"], transitions_rows))
+    details.append(f"illegal_transitions={illegal}")
+    return CheckResult("inv10_turnover_balance.py", "INV-10 turnover balance",
+                       violations == 0 and illegal == 0, details)
+
+
+def check_inv11(s: ValidationSlice) -> CheckResult:
+    from inv11_spawn_limit_saturation import prepare_env_arrays, to_date
+
+    details = [f"version_id={s.version_id}, table={s.table_main}"]
+    env_data = prepare_env_arrays(s.client, to_date(s.version_date))
+    deterministic_spawn_mi17 = int(env_data.get("deterministic_spawn_mi17", 0))
+    dynamic_reserve_mi17 = int(env_data.get("dynamic_reserve_mi17", 0))
+
+    mi17 = s["group_by"] == 2
+    total_spawned_mi17 = int(np.unique(s["idx"][mi17 & (s["pre_status_id"] == 0)]).size)
+    dynamic_spawned_mi17 = max(0, total_spawned_mi17 - deterministic_spawn_mi17)
+    saturated = dynamic_reserve_mi17 > 0 and dynamic_spawned_mi17 >= dynamic_reserve_mi17
+
+    warmup_days = s.warmup_days()
+    _, targets_mi17, _ = load_mp4_targets(s.client, s.version_date)
+    step_days = np.unique(s["day_u16"])
+    if step_days.size == 0:
+        raise SystemExit(f"В таблице нет day_u16 для version_date={s.version_date}")
+
+    ops_days, ops_counts = np.unique(s["day_u16"][mi17 & (s["status_id"] == 2)], return_counts=True)
+    counts = np.zeros(step_days.size, dtype=np.int64)
+    counts[np.searchsorted(step_days, ops_days)] = ops_counts
+    target = _targets_for_days(targets_mi17, step_days)
+    deficit_mask = (step_days > warmup_days) & (counts < target)
+    post_deficits = [
+        (int(step_days[i]), int(counts[i]), int(target[i]), int(target[i] - counts[i]))
+        for i in np.flatnonzero(deficit_mask).tolist()
+    ]
+    post_deficit_days = len(post_deficits)
+    max_post_deficit = max((d[3] for d in post_deficits), default=0)
+    violating_datasets = int(saturated and post_deficit_days > 0)
+
+    details.extend([
+        f"version_date={s.version_date}",
+        f"  deterministic_spawn_mi17={deterministic_spawn_mi17}",
+        f"  dynamic_reserve_mi17={dynamic_reserve_mi17}",
+        f"  total_spawned_mi17={total_spawned_mi17}",
+        f"  dynamic_spawned_mi17={dynamic_spawned_mi17}",
+        f"  saturated={'true' if saturated else 'false'}",
+        f"  warmup_days={warmup_days}",
+        f"  post_deficit_days={post_deficit_days}",
+        f"  max_post_deficit={max_post_deficit}",
+    ])
+    if post_deficits:
+        details.append("  post_deficit_sample (day, ops, target, deficit):")
+        for d, ops_n, tgt, deficit in post_deficits[:5]:
+            details.append(f"    day={d}: ops={ops_n}, target={tgt}, deficit={deficit}")
+        if len(post_deficits) > 5:
+            details.append(f"    ... and {len(post_deficits) - 5} more")
+    else:
+        details.append("  post_deficit_sample: none")
+    details.append(f"violating_datasets={violating_datasets}")
+    return CheckResult("inv11_spawn_limit_saturation.py", "INV-11 spawn limit saturation",
+                       violating_datasets == 0, details)
+
+
+def check_inv12(s: ValidationSlice) -> CheckResult:
+    ppr, oh = s["ppr"], s["oh"]
+    mask = ppr > oh
+    violations = int(mask.sum())
+    details = [f"violations={violations}"]
+    if violations:
+        exceed = ppr - oh
+        details.append(
+            "top10 sample (acn, group_by, status, day, "
+            "ppr, oh, exceed, limiter, dt):"
+        )
+        for acn, group_by, status_id, day, ppr_v, oh_v, exc, limiter, dt in s.sample(
+            mask, [-exceed], 10,
+            "aircraft_number", "group_by", "status_id", "day_u16", "ppr", "oh", exceed,
+            "limiter", "daily_today_u32",
+        ):
+            details.append(
+                f"  acn={acn}, group_by={group_by}, status={status_id}, day={day}, "
+                f"ppr={ppr_v}, oh={oh_v}, exceed={exc}, limiter={limiter}, dt={dt}"
+            )
+    return CheckResult("inv12_ppr_le_oh.py", "INV-12 ppr<=oh", violations == 0, details)
+
+
+def check_temp1(s: ValidationSlice, tolerance: int = 15) -> CheckResult:
+    name = "TEMP-1 repair duration"
+    if s.n == 0:
+        return CheckResult("temp1_repair_duration.py", name, True,
+                           [f"tolerance={tolerance} days", "no_data=1 (min_day is NULL)"])
+
+    day, st, pre = s["day_u16"], s["status_id"], s["pre_status_id"]
+    rd, rt = s["repair_days"], s["repair_time"]
+    min_day = int(day.min())
+    _, agent = _group_ids(s["version_date"], s["aircraft_number"], s["group_by"])
+
+    # Day0 repair agents: ещё в ремонте на min_day (pre_status=4 AND status=4)
+    day0_rows = np.flatnonzero((day == min_day) & (pre == 4) & (st == 4))
+    remaining = np.full(int(agent.max()) + 1, -1, dtype=np.int64)
+    remaining[agent[day0_rows]] = np.maximum(0, rt[day0_rows] - rd[day0_rows])
+    day0_agents = int(np.unique(agent[day0_rows]).size)
+
+    # Выходы из repair в порядке version_date, aircraft_number, group_by, day_u16
+    exit_rows = np.flatnonzero((pre == 4) & (st != 4))
+    exit_rows = exit_rows[np.lexsort((
+        day[exit_rows], s["group_by"][exit_rows], s["aircraft_number"][exit_rows],
+        s["version_date"][exit_rows],
+    ))]
+    exit_agent = agent[exit_rows]
+    first_exit = np.r_[True, exit_agent[1:] != exit_agent[:-1]] if exit_rows.size else np.zeros(0, dtype=bool)
+    # Первый выход day0-агента сверяется с оставшимся ремонтом, следующие — runtime
+    is_day0 = first_exit & (remaining[exit_agent] >= 0)
+    actual_duration = day[exit_rows] - min_day
+    exit_remaining = remaining[exit_agent]
+    day0_bad = is_day0 & (np.abs(actual_duration - exit_remaining) > tolerance)
+    runtime_bad = ~is_day0 & (rd[exit_rows] > tolerance)
+
+    day0_violations = int(day0_bad.sum())
+    runtime_exits = int((~is_day0).sum())
+    runtime_violations = int(runtime_bad.sum())
+    violations = day0_violations + runtime_violations
+    details = [
+        f"tolerance={tolerance} days",
+        f"day0_agents={day0_agents}, day0_violations={day0_violations}",
+        f"runtime_exits={runtime_exits}, runtime_violations={runtime_violations}",
+        f"total_violations={violations}",
+    ]
+    if day0_violations > 0:
+        details.append("day0 violations samples (acn, gb, exit_day, remaining, duration, new_status):")
+        for i in np.flatnonzero(day0_bad)[:5].tolist():
+            row = exit_rows[i]
+            details.append(
+                f"  version_date={s['version_date'][row]}, acn={s['aircraft_number'][row]}, "
+                f"gb={s['group_by'][row]}, exit_day={day[row]}, "
+                f"remaining_repair={exit_remaining[i]}, actual_duration={actual_duration[i]}, "
+                f"new_status={st[row]}"
+            )
+    if runtime_violations > 0:
+        details.append("runtime violations samples (acn, gb, day, repair_days, repair_time, new_status):")
+        for row in exit_rows[np.flatnonzero(runtime_bad)[:5]].tolist():
+            details.append(
+                f"  version_date={s['version_date'][row]}, acn={s['aircraft_number'][row]}, "
+                f"gb={s['group_by'][row]}, day={day[row]}, repair_days={rd[row]}, "
+                f"repair_time={rt[row]}, new_status={st[row]}"
+            )
+    return CheckResult("temp1_repair_duration.py", name, violations == 0, details)
+
+
+def check_temp4(s: ValidationSlice, max_repair_days: int = 210) -> CheckResult:
+    # Непрерывные отрезки status_id=4 внутри окна агента (lag по всем статусам, не только repair)
+    is_repair = (s["status_id"] == 4).astype(np.int64)
+    new_span = (is_repair == 1) & (s.lag("status_id") != 4)
+    span_id = np.cumsum(new_span)
+    repair_rows = np.flatnonzero(is_repair)
+    span_of_row = span_id[repair_rows]
+    starts = np.r_[True, span_of_row[1:] != span_of_row[:-1]] if repair_rows.size else np.zeros(0, dtype=bool)
+    first_rows = repair_rows[starts]
+    last_rows = repair_rows[np.r_[starts[1:], True]] if repair_rows.size else repair_rows
+    day = s["day_u16"]
+    span = day[last_rows] - day[first_rows]
+    long_spans = span > max_repair_days
+    violations = int(long_spans.sum())
+    details = [
+        f"max_repair_days={max_repair_days}",
+        f"violations={violations}",
+    ]
+    if violations:
+        details.append("top5 (acn, enter_day, last_day, span):")
+        order_keys = [-span, s["aircraft_number"][first_rows], day[first_rows], day[last_rows], span]
+        for i in _top(long_spans, order_keys, 5).tolist():
+            details.append(
+                f"  acn={s['aircraft_number'][first_rows[i]]}, enter={day[first_rows[i]]}, "
+                f"last={day[last_rows[i]]}, span={span[i]}"
+            )
+    return CheckResult("temp4_no_infinite_repair.py", "TEMP-4 no infinite repair", violations == 0, details)
+
+
+def check_temp5(s: ValidationSlice) -> CheckResult:
+    day, acn, gb = s["day_u16"], s["aircraft_number"], s["group_by"]
+    src, line = s["repair_claim_source"], s["repair_claim_line_id"]
+    start, end, rt = s["repair_claim_start_day"], s["repair_claim_end_day"], s["repair_time"]
+    c2, c3 = s["commit_p2"], s["commit_p3"]
+    length = end - start
+    length_match = length == rt
+    valid_claim = (((src == 1) | (src == 2))
+                   & (line != CLAIM_SENTINEL) & (start != CLAIM_SENTINEL) & (end != CLAIM_SENTINEL)
+                   & (end > start) & length_match)
+    claim_rows = (c2 == 1) | (c3 == 1)
+    transition_rows = (s["pre_status_id"] == 4) & (s["status_id"] == 2) & (day >= rt)
+    invalid = claim_rows & ~valid_claim
+    mismatch = transition_rows & ~valid_claim
+    bank = (src == 2) & ~length_match
+
+    # Пересечения интервалов claim на линии: max(end) по предыдущим claim той же линии
+    claims = np.flatnonzero(claim_rows & valid_claim)
+    claims = claims[np.lexsort((acn[claims], day[claims], end[claims], start[claims],
+                                line[claims], s["version_date"][claims], gb[claims]))]
+    prev_max_end = np.zeros(s.n, dtype=np.int64)
+    overlap = np.zeros(s.n, dtype=bool)
+    if claims.size:
+        _, group = _group_ids(gb[claims], s["version_date"][claims], line[claims])
+        # Группы идут подряд и возрастают: сдвиг по группе даёт накопленный max внутри группы
+        shift = (CLAIM_SENTINEL + 1) * group
+        running = np.maximum.accumulate(shift + end[claims]) - shift
+        prev = np.zeros(claims.size, dtype=np.int64)
+        same_group = group[1:] == group[:-1]
+        prev[1:] = np.where(same_group, running[:-1], 0)
+        prev_max_end[claims] = prev
+        overlap[claims] = prev > start[claims]
+
+    counts = {
+        "total_claim_events": int(claim_rows.sum()),
+        "total_valid_claim_events": int((claim_rows & valid_claim).sum()),
+        "total_transitions_4to2": int(transition_rows.sum()),
+        "invalid_claim_rows": int(invalid.sum()),
+        "transition_claim_mismatch": int(mismatch.sum()),
+        "overlap_violations": int(overlap.sum()),
+        "bank_underflow_suspicions": int(bank.sum()),
+    }
+    details = [f"table_main={s.table_main}"] + [f"{key}={value}" for key, value in counts.items()]
+
+    if counts["invalid_claim_rows"]:
+        details.append(
+            "top5 invalid_claim_rows (gb, day, acn, c2, c3, src, line, start, end, rt, len):"
+        )
+        for row in s.sample(invalid, [day, acn], 5, "group_by", "day_u16", "aircraft_number",
+                            "commit_p2", "commit_p3", "repair_claim_source", "repair_claim_line_id",
+                            "repair_claim_start_day", "repair_claim_end_day", "repair_time", length):
+            details.append(
+                "  gb={0}, day={1}, acn={2}, c2={3}, c3={4}, src={5}, line={6}, start={7}, "
+                "end={8}, rt={9}, len={10}".format(*row)
+            )
+    if counts["transition_claim_mismatch"]:
+        details.append(
+            "top5 transition_mismatch (gb, day, acn, pre, status, c2, c3, src, line, start, end, rt):"
+        )
+        for row in s.sample(mismatch, [day, acn], 5, "group_by", "day_u16", "aircraft_number",
+                            "pre_status_id", "status_id", "commit_p2", "commit_p3", "repair_claim_source",
+                            "repair_claim_line_id", "repair_claim_start_day", "repair_claim_end_day",
+                            "repair_time"):
+            details.append(
+                "  gb={0}, day={1}, acn={2}, pre={3}, status={4}, c2={5}, c3={6}, src={7}, "
+                "line={8}, start={9}, end={10}, rt={11}".format(*row)
+            )
+    if counts["overlap_violations"]:
+        details.append("top5 overlap_rows (gb, line, acn, day, start, end, prev_max_end):")
+        for row in s.sample(overlap, [gb, line, start], 5, "group_by", "repair_claim_line_id",
+                            "aircraft_number", "day_u16", "repair_claim_start_day",
+                            "repair_claim_end_day", prev_max_end):
+            details.append(
+                "  gb={0}, line={1}, acn={2}, day={3}, start={4}, end={5}, prev_max_end={6}".format(*row)
+            )
+    if counts["bank_underflow_suspicions"]:
+        details.append("top5 bank_underflow (gb, day, acn, start, end, rt, len):")
+        for row in s.sample(bank, [day, acn], 5, "group_by", "day_u16", "aircraft_number",
+                            "repair_claim_start_day", "repair_claim_end_day", "repair_time", length):
+            details.append("  gb={0}, day={1}, acn={2}, start={3}, end={4}, rt={5}, len={6}".format(*row))
+
+    passed = all(counts[key] == 0 for key in (
+        "invalid_claim_rows", "transition_claim_mismatch", "overlap_violations", "bank_underflow_suspicions",
+    ))
+    return CheckResult("temp5_repair_hybrid_vector.py", "TEMP-5 claim metadata", passed, details)
+
+
+# Проверки по имени SQL-валидатора (порядок run_all.py)
+CHECKS: Dict[str, Tuple[str, Callable[[ValidationSlice], CheckResult]]] = {
+    "inv1_sne_le_ll.py": ("INV-1", check_inv1),
+    "inv2_ops_vs_target.py": ("INV-2", check_inv2),
+    "inv3_repair_capacity.py": ("INV-3", check_inv3),
+    "inv4_unsvc_repair_time.py": ("INV-4", check_inv4),
+    "inv5_balance_increments.py": ("INV-5", check_inv5),
+    "inv6_dt_only_ops.py": ("INV-6", check_inv6),
+    "inv7_dt_eq_mp5.py": ("INV-7", check_inv7),
+    "inv8_storage_frozen.py": ("INV-8", check_inv8),
+    "inv9_limiter_exit.py": ("INV-9", check_inv9),
+    "inv10_turnover_balance.py": ("INV-10", check_inv10),
+    "inv11_spawn_limit_saturation.py": ("INV-11", check_inv11),
+    "inv12_ppr_le_oh.py": ("INV-12", check_inv12),
+    "temp1_repair_duration.py": ("TEMP-1", check_temp1),
+    "temp4_no_infinite_repair.py": ("TEMP-4", check_temp4),
+    "temp5_repair_hybrid_vector.py": ("TEMP-5", check_temp5),
+}
+
+
+def run_check(s: ValidationSlice, script: str) -> CheckResult:
+    """Проверка валидатора script; SystemExit/ошибка SQL-валидатора → FAIL с сообщением"""
+    inv_id, check = CHECKS[script]
+    try:
+        return check(s)
+    except SystemExit as exc:
+        return CheckResult(script, inv_id, False, [str(exc)])
+    except Exception as exc:
+        return CheckResult(script, inv_id, False, [f"error: {type(exc).__name__}: {exc}"])
+
+
+def _sql_result_block(output: str, name: str) -> Tuple[Optional[bool], List[str]]:
+    """(вердикт, строки деталей) блока print_result из вывода SQL-валидатора"""
+    lines = output.splitlines()
+    for i, line in enumerate(lines):
+        if line in (f"{name}: PASS", f"{name}: FAIL"):
+            end = next((j for j in range(i + 1, len(lines)) if lines[j] == "=" * 80), len(lines))
+            return line.endswith("PASS"), lines[i + 1:end]
+    return None, []
+
+
+def compare_with_sql(result: CheckResult, output: str) -> List[str]:
+    """Расхождения вердикта, счётчиков (строки без отступа) и выборок (строки с отступом)"""
+    sql_passed, sql_details = _sql_result_block(output, result.name)
+    if sql_passed is None:
+        return ["SQL-валидатор не вывел блок результата"]
+    issues = []
+    if sql_passed != result.passed:
+        issues.append(f"вердикт: sql={'PASS' if sql_passed else 'FAIL'}, "
+                      f"engine={'PASS' if result.passed else 'FAIL'}")
+    sql_summary = [line for line in sql_details if not line.startswith(" ")]
+    engine_summary = [line for line in result.details if not line.startswith(" ")]
+    for sql_line, engine_line in zip(sql_summary, engine_summary):
+        if sql_line != engine_line:
+            issues.append(f"sql: {sql_line!r} | engine: {engine_line!r}")
+    if len(sql_summary) != len(engine_summary):
+        issues.append(f"строк деталей: sql={len(sql_summary)}, engine={len(engine_summary)}")
+    sql_samples = Counter(line for line in sql_details if line.startswith(" "))
+    engine_samples = Counter(line for line in result.details if line.startswith(" "))
+    if sql_samples != engine_samples:
+        # Порядок строк с равным ключом ORDER BY в ClickHouse не определён — сверяем как множества
+        issues.append(
+            f"выборки: только sql={sum((sql_samples - engine_samples).values())}, "
+            f"только engine={sum((engine_samples - sql_samples).values())}"
+        )
+        for line in list((sql_samples - engine_samples).elements())[:3]:
+            issues.append(f"  sql:    {line.strip()}")
+        for line in list((engine_samples - sql_samples).elements())[:3]:
+            issues.append(f"  engine: {line.strip()}")
+    return issues
+
+
+def run_parity_check(s: ValidationSlice) -> bool:
+    """Сверка движка с SQL-валидаторами на срезе: вердикты, счётчики и выборки"""
+    from run_all_stream import build_validator_cmd
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    env = os.environ.copy()
+    env["PYTHONUNBUFFERED"] = "1"
+    mismatched = 0
+    for script in CHECKS:
+        cmd = build_validator_cmd(
+            os.path.join(base_dir, script), (s.version_date, s.version_id), s.table_main, s.table_repair
+        )
+        sql_start = time.time()
+        output = subprocess.run(cmd, capture_output=True, text=True, env=env, check=False).stdout
+        sql_seconds = time.time() - sql_start
+        engine_start = time.time()
+        result = run_check(s, script)
+        engine_seconds = time.time() - engine_start
+        issues = compare_with_sql(result, output)
+        status = "MATCH" if not issues else "MISMATCH"
+        print(f"{CHECKS[script][0]:<7} {status:<8} sql={sql_seconds:.2f}s engine={engine_seconds:.3f}s "
+              f"({'PASS' if result.passed else 'FAIL'})")
+        for issue in issues:
+            print(f"    {issue}")
+        if issues:
+            mismatched += 1
+    print(f"PARITY: {len(CHECKS) - mismatched}/{len(CHECKS)} MATCH")
+    return mismatched == 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Однопроходная валидация среза sim_masterv2_v9 (INV/TEMP в памяти)"
+    )
+    parser.add_argument("--version-id", required=True, type=int, help="version_id")
+    parser.add_argument("--version-date", required=True, type=int, help="version_date (YYYYMMDD)")
+    parser.add_argument("--table-main", default="sim_masterv2_v9")
+    parser.add_argument("--table-repair", default="sim_repairline_v9")
+    parser.add_argument(
+        "--parity-check",
+        action="store_true",
+        help="Сверить вердикты и выборки с SQL-валидаторами на этом срезе",
+    )
+    args = parser.parse_args()
+
+    start = time.time()
+    s = load_slice(
+        get_client(), args.version_id, args.version_date,
+        validate_table_name(args.table_main), validate_table_name(args.table_repair),
+    )
+    print(f"SLICE {args.version_date}:{args.version_id} rows={s.n} read={time.time() - start:.2f}s")
+
+    if args.parity_check:
+        return 0 if run_parity_check(s) else 1
+
+    failed = 0
+    for script in CHECKS:
+        result = run_check(s, script)
+        result.print()
+        if not result.passed:
+            failed += 1
+    print(f"TOTAL={len(CHECKS)} FAIL={failed}")
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
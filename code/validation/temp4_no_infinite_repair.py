@@ -10,6 +10,7 @@ import re
 import sys
 
 from ch_client import get_client
+from fused_sample import SampleSpec, count_and_sample
 
 
 def validate_table_name(table: str) -> str:
@@ -46,14 +47,13 @@ def main() -> int:
 
     # Нельзя фильтровать status_id=4 до lag: так склеиваются разные repair-отрезки через промежуточные статусы.
     # Находим непрерывные интервалы в repair для каждого агента и проверяем что длительность <= max_repair_days.
-    query = f"""
+    source_sql = f"""
     WITH repair_spans AS (
         SELECT
             aircraft_number, group_by, version_date,
             min(day_u16) AS enter_day,
-            max(day_u16) AS last_day_in_repair,
-            max(day_u16) - min(day_u16) AS span,
-            groupArray(day_u16) AS days
+            max(day_u16) AS last_day,
+            max(day_u16) - min(day_u16) AS span
         FROM (
             SELECT
                    aircraft_number,
@@ -88,65 +88,29 @@ def main() -> int:
         )
         GROUP BY aircraft_number, group_by, version_date, span_id
     )
-    SELECT count() FROM repair_spans
+    SELECT aircraft_number, enter_day, last_day, span
+    FROM repair_spans
     WHERE span > {args.max_repair_days}
     """
-    violations = client.execute(query, params)[0][0]
+    sample = count_and_sample(
+        client,
+        source_sql,
+        params,
+        SampleSpec(
+            where=None,
+            key=["-span"],
+            columns=["aircraft_number", "enter_day", "last_day", "span"],
+        ),
+    )
+    violations = sample.count
     details = [
         f"max_repair_days={args.max_repair_days}",
         f"violations={violations}",
     ]
 
     if violations:
-        sample = client.execute(f"""
-        WITH repair_spans AS (
-            SELECT
-                aircraft_number, group_by, version_date,
-                min(day_u16) AS enter_day,
-                max(day_u16) AS last_day,
-                max(day_u16) - min(day_u16) AS span
-            FROM (
-                SELECT
-                       aircraft_number,
-                       group_by,
-                       version_date,
-                       day_u16,
-                       is_repair,
-                       sum(new_span) OVER (PARTITION BY aircraft_number, group_by, version_date ORDER BY day_u16) AS span_id
-                FROM (
-                    SELECT
-                        aircraft_number,
-                        group_by,
-                        version_date,
-                        day_u16,
-                        is_repair,
-                        prev_is_repair,
-                        if(is_repair = 1 AND prev_is_repair = 0, 1, 0) AS new_span
-                    FROM (
-                        SELECT
-                            aircraft_number,
-                            group_by,
-                            version_date,
-                            day_u16,
-                            if(status_id = 4, 1, 0) AS is_repair,
-                            lagInFrame(if(status_id = 4, 1, 0), 1, 0) OVER w AS prev_is_repair
-                        FROM {table}
-                        WHERE version_id = %(vid)s{vd_filter} AND group_by IN (1, 2)
-                        WINDOW w AS (PARTITION BY aircraft_number, group_by, version_date ORDER BY day_u16)
-                    )
-                )
-                WHERE is_repair = 1
-            )
-            GROUP BY aircraft_number, group_by, version_date, span_id
-        )
-        SELECT aircraft_number, enter_day, last_day, span
-        FROM repair_spans
-        WHERE span > {args.max_repair_days}
-        ORDER BY span DESC
-        LIMIT 5
-        """, params)
         details.append("top5 (acn, enter_day, last_day, span):")
-        for acn, ed, ld, sp in sample:
+        for acn, ed, ld, sp in sample.rows:
             details.append(f"  acn={acn}, enter={ed}, last={ld}, span={sp}")
 
     passed = violations == 0
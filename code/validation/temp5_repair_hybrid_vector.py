@@ -13,6 +13,7 @@ import re
 import sys
 
 from ch_client import get_client
+from fused_sample import SampleSpec, count_and_sample, fused_count_sample
 
 
 def validate_table_name(table: str) -> str:
@@ -107,14 +108,6 @@ def main() -> int:
         FROM base
         WHERE commit_p2 = 1 OR commit_p3 = 1
     ),
-    transition_rows AS (
-        SELECT
-            *,
-            ({valid_claim_expr}) AS is_valid_claim
-        FROM base
-        WHERE pre_status_id = 4 AND status_id = 2
-          AND day_u16 >= repair_time
-    ),
     valid_claims AS (
         SELECT
             aircraft_number,
@@ -155,35 +148,80 @@ def main() -> int:
     )
     """
 
-    counts_query = base_cte + f"""
+    # Проверки по строкам base — один проход: счётчики событий и три выборки
+    rows_source = base_cte + f"""
     SELECT
-        (SELECT count() FROM claim_rows) AS total_claim_events,
-        (SELECT count() FROM claim_rows WHERE is_valid_claim = 1) AS total_valid_claim_events,
-        (SELECT count() FROM claim_rows WHERE is_valid_claim = 0) AS invalid_claim_rows,
-        (SELECT count() FROM transition_rows) AS total_transitions_4to2,
-        (SELECT count() FROM transition_rows WHERE is_valid_claim = 0) AS transition_claim_mismatch,
-        (
-            SELECT count()
-            FROM valid_claims_with_prev
-            WHERE prev_max_end > repair_claim_start_day
-        ) AS overlap_violations,
-        (
-            SELECT count()
-            FROM base
-            WHERE repair_claim_source = 2
-              AND NOT ({length_match_expr})
-        ) AS bank_underflow_suspicions
+        *,
+        (commit_p2 = 1 OR commit_p3 = 1) AS is_claim,
+        (pre_status_id = 4 AND status_id = 2 AND day_u16 >= repair_time) AS is_transition,
+        ({valid_claim_expr}) AS is_valid_claim,
+        (toInt32(repair_claim_end_day) - toInt32(repair_claim_start_day)) AS len_calc
+    FROM base
     """
-
+    claim_columns = [
+        "repair_claim_source",
+        "repair_claim_line_id",
+        "repair_claim_start_day",
+        "repair_claim_end_day",
+    ]
     (
         total_claim_events,
         total_valid_claim_events,
-        invalid_claim_rows,
         total_transitions_4to2,
-        transition_claim_mismatch,
-        overlap_violations,
-        bank_underflow_suspicions,
-    ) = client.execute(counts_query, params)[0]
+    ), (invalid_sample, transition_sample, bank_sample) = fused_count_sample(
+        client,
+        rows_source,
+        params,
+        [
+            SampleSpec(
+                where="is_claim AND NOT is_valid_claim",
+                key=["day_u16", "aircraft_number"],
+                columns=[
+                    "group_by", "day_u16", "aircraft_number", "commit_p2", "commit_p3",
+                    *claim_columns, "repair_time", "len_calc",
+                ],
+            ),
+            SampleSpec(
+                where="is_transition AND NOT is_valid_claim",
+                key=["day_u16", "aircraft_number"],
+                columns=[
+                    "group_by", "day_u16", "aircraft_number", "pre_status_id", "status_id",
+                    "commit_p2", "commit_p3", *claim_columns, "repair_time",
+                ],
+            ),
+            SampleSpec(
+                where=f"repair_claim_source = 2 AND NOT ({length_match_expr})",
+                key=["day_u16", "aircraft_number"],
+                columns=[
+                    "group_by", "day_u16", "aircraft_number", "repair_claim_start_day",
+                    "repair_claim_end_day", "repair_time", "len_calc",
+                ],
+            ),
+        ],
+        counts=[
+            "countIf(is_claim)",
+            "countIf(is_claim AND is_valid_claim)",
+            "countIf(is_transition)",
+        ],
+    )
+    # Пересечения интервалов требуют окна по линиям — отдельный fused-запрос
+    overlap_sample = count_and_sample(
+        client,
+        base_cte + "SELECT * FROM valid_claims_with_prev",
+        params,
+        SampleSpec(
+            where="prev_max_end > repair_claim_start_day",
+            key=["group_by", "repair_claim_line_id", "repair_claim_start_day"],
+            columns=[
+                "group_by", "repair_claim_line_id", "aircraft_number", "day_u16",
+                "repair_claim_start_day", "repair_claim_end_day", "prev_max_end",
+            ],
+        ),
+    )
+    invalid_claim_rows = invalid_sample.count
+    transition_claim_mismatch = transition_sample.count
+    overlap_violations = overlap_sample.count
+    bank_underflow_suspicions = bank_sample.count
 
     details = [
         f"table_main={table_main}",
@@ -197,29 +235,10 @@ def main() -> int:
     ]
 
     if invalid_claim_rows:
-        sample_query = base_cte + """
-        SELECT
-            group_by,
-            day_u16,
-            aircraft_number,
-            commit_p2,
-            commit_p3,
-            repair_claim_source,
-            repair_claim_line_id,
-            repair_claim_start_day,
-            repair_claim_end_day,
-            repair_time,
-            (toInt32(repair_claim_end_day) - toInt32(repair_claim_start_day)) AS len_calc
-        FROM claim_rows
-        WHERE is_valid_claim = 0
-        ORDER BY day_u16, aircraft_number
-        LIMIT 5
-        """
-        rows = client.execute(sample_query, params)
         details.append(
             "top5 invalid_claim_rows (gb, day, acn, c2, c3, src, line, start, end, rt, len):"
         )
-        for row in rows:
+        for row in invalid_sample.rows:
             (
                 gb,
                 day,
@@ -252,30 +271,10 @@ def main() -> int:
             )
 
     if transition_claim_mismatch:
-        transition_sample_query = base_cte + """
-        SELECT
-            group_by,
-            day_u16,
-            aircraft_number,
-            pre_status_id,
-            status_id,
-            commit_p2,
-            commit_p3,
-            repair_claim_source,
-            repair_claim_line_id,
-            repair_claim_start_day,
-            repair_claim_end_day,
-            repair_time
-        FROM transition_rows
-        WHERE is_valid_claim = 0
-        ORDER BY day_u16, aircraft_number
-        LIMIT 5
-        """
-        rows = client.execute(transition_sample_query, params)
         details.append(
             "top5 transition_mismatch (gb, day, acn, pre, status, c2, c3, src, line, start, end, rt):"
         )
-        for row in rows:
+        for row in transition_sample.rows:
             (
                 gb,
                 day,
@@ -310,25 +309,10 @@ def main() -> int:
             )
 
     if overlap_violations:
-        overlap_sample_query = base_cte + """
-        SELECT
-            group_by,
-            repair_claim_line_id,
-            aircraft_number,
-            day_u16,
-            repair_claim_start_day,
-            repair_claim_end_day,
-            prev_max_end
-        FROM valid_claims_with_prev
-        WHERE prev_max_end > repair_claim_start_day
-        ORDER BY group_by, repair_claim_line_id, repair_claim_start_day
-        LIMIT 5
-        """
-        rows = client.execute(overlap_sample_query, params)
         details.append(
             "top5 overlap_rows (gb, line, acn, day, start, end, prev_max_end):"
         )
-        for row in rows:
+        for row in overlap_sample.rows:
             (
                 gb,
                 line_id,
@@ -352,26 +336,10 @@ def main() -> int:
             )
 
     if bank_underflow_suspicions:
-        bank_sample_query = base_cte + f"""
-        SELECT
-            group_by,
-            day_u16,
-            aircraft_number,
-            repair_claim_start_day,
-            repair_claim_end_day,
-            repair_time,
-            (toInt32(repair_claim_end_day) - toInt32(repair_claim_start_day)) AS len_calc
-        FROM base
-        WHERE repair_claim_source = 2
-          AND NOT ({length_match_expr})
-        ORDER BY day_u16, aircraft_number
-        LIMIT 5
-        """
-        rows = client.execute(bank_sample_query, params)
         details.append(
             "top5 bank_underflow (gb, day, acn, start, end, rt, len):"
         )
-        for row in rows:
+        for row in bank_sample.rows:
             gb, day, acn, start_day, end_day, repair_time, length_calc = row
             details.append(
                 "  gb={gb}, day={day}, acn={acn}, start={start}, end={end}, "